@@ -0,0 +1,250 @@
+"""
+PIPELINE BENCHMARKS
+===================
+
+Times and memory-profiles each stage of the analysis on synthetic inputs
+(synthetic_inputs.py) at 1x, 100x and 10,000x the shipped file size:
+
+    ingest      load_inputs from the raw files, no ingest cache
+    panel       build_panel
+    did         run_did
+    iv          run_iv (both stages and the 2SLS engine)
+    emissions   compute_emissions
+    plot        plot_results to a PNG
+    export      export_tables to the columnar panel store
+
+Modules the stages import lazily (statsmodels, matplotlib, ...) are
+imported up front, so first-import cost is not charged to a stage.
+Seconds are the best of --repeat runs of the whole chain. Peak memory is
+measured in one extra run under tracemalloc, one stage at a time, so tracing
+does not slow the timed runs. It counts Python and NumPy allocations, not
+the interpreter or libraries already loaded.
+
+The default run covers 1x and 100x. The 10,000x wide StatsCan extract is
+read whole by the ingest and does not fit in 5 GB, so that scale is not
+measurable on a small machine. Ask for it with --scales 10000 on one with
+more memory.
+
+Every run appends one JSON line per (scale, stage) to benchmark_results.jsonl
+with the git commit, machine and library versions. The new numbers are
+compared with the last earlier run on the same machine. A stage is flagged
+when it is more than --tolerance times slower or heavier than before, and by
+more than the noise floor. With --check the exit status is 1 when anything
+is flagged, so a release script can stop on it:
+
+    python3 benchmark_pipeline.py --scales 1 100 --check
+    python3 benchmark_pipeline.py --scales 10000 --no-memory --label big-box
+
+Generated inputs are kept in .benchmark_data/ and reused across runs.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+import pandas as pd
+
+import pipeline_complete_analysis as pca
+from synthetic_inputs import SCALES, generate_inputs
+
+DATA_DIR = '.benchmark_data'
+RESULTS_FILE = 'benchmark_results.jsonl'
+STAGES = ['ingest', 'panel', 'did', 'iv', 'emissions', 'plot', 'export']
+DEFAULT_SCALES = [1, 100]
+TOLERANCE = 1.25
+NOISE_SECONDS = 0.05
+NOISE_MB = 1.0
+LAZY_IMPORTS = ['statsmodels.api', 'matplotlib.pyplot', 'price_ingest', 'iv_engine', 'intensity_schedules']
+
+
+# ===========================
+# STAGES
+# ===========================
+
+def stage_functions(paths, out_dir):
+    """[(stage, fn(results so far) -> result)] in run order."""
+    return [
+        ('ingest', lambda r: pca.load_inputs(paths['statcan'], paths['rail'], None, paths['start_year'],
+                                             paths['end_year'], price_files=[paths['prices']])),
+        ('panel', lambda r: pca.build_panel(r['ingest']['alberta'], r['ingest']['sask'],
+                                            r['ingest']['prices'], r['ingest']['rail'])),
+        ('did', lambda r: pca.run_did(r['panel'][0])),
+        ('iv', lambda r: pca.run_iv(r['panel'][1])),
+        ('emissions', lambda r: pca.compute_emissions(r['panel'][1])),
+        ('plot', lambda r: pca.plot_results(r['panel'][0], r['iv']['data'], r['emissions']['intensity_by_year'],
+                                            os.path.join(out_dir, 'figure.png'))),
+        ('export', lambda r: pca.export_tables(r['panel'][0], r['iv']['data'],
+                                               os.path.join(out_dir, 'panel'),
+                                               os.path.join(out_dir, 'alberta'))),
+    ]
+
+
+def _import_lazy_modules():
+    import importlib
+
+    for module in LAZY_IMPORTS:
+        importlib.import_module(module)
+
+
+def _chain(stages, memory=False):
+    """Run every stage once; returns {stage: seconds} or {stage: peak MB}."""
+    results, measured = {}, {}
+    for name, fn in stages:
+        if memory:
+            tracemalloc.start()
+            results[name] = fn(results)
+            measured[name] = tracemalloc.get_traced_memory()[1] / 2**20
+            tracemalloc.stop()
+        else:
+            start = time.perf_counter()
+            results[name] = fn(results)
+            measured[name] = time.perf_counter() - start
+    return measured
+
+
+def benchmark_scale(scale, shape, data_dir=DATA_DIR, repeat=1, memory=True):
+    """Rows (one per stage) for one scale: seconds, peak_mb and the input shape."""
+    n_geographies, n_months, n_series = shape
+    start = time.perf_counter()
+    paths = generate_inputs(os.path.join(data_dir, f'{n_geographies}x{n_months}x{n_series}'), *shape)
+    generate_seconds = time.perf_counter() - start
+
+    _import_lazy_modules()
+    with tempfile.TemporaryDirectory() as out_dir, warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        stages = stage_functions(paths, out_dir)
+        seconds = [_chain(stages) for _ in range(repeat)]
+        peak = _chain(stages, memory=True) if memory else {}
+
+    return [{
+        'scale': scale, 'geographies': n_geographies, 'months': n_months, 'series': n_series,
+        'statcan_mb': os.path.getsize(paths['statcan']) / 2**20, 'stage': name,
+        'seconds': min(s[name] for s in seconds), 'peak_mb': peak.get(name),
+        'generate_seconds': generate_seconds,
+    } for name in STAGES]
+
+
+# ===========================
+# RESULTS HISTORY
+# ===========================
+
+def run_info(label=None):
+    """Fields shared by every row of a run: id, commit, machine, versions."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'run': time.strftime('%Y-%m-%dT%H:%M:%S'), 'commit': commit, 'label': label,
+            'machine': platform.node(), 'python': platform.python_version(),
+            'numpy': np.__version__, 'pandas': pd.__version__}
+
+
+def load_history(path=RESULTS_FILE):
+    try:
+        with open(path) as f:
+            return pd.DataFrame([json.loads(line) for line in f if line.strip()])
+    except FileNotFoundError:
+        return pd.DataFrame()
+
+
+def save_rows(rows, path=RESULTS_FILE):
+    with open(path, 'a') as f:
+        for row in rows:
+            f.write(json.dumps(row) + '\n')
+
+
+def compare(current, history, tolerance=TOLERANCE):
+    """
+    current joined with the last earlier run on the same machine, per scale and
+    stage: base_seconds, base_peak_mb, ratios and a `regressed` flag.
+    """
+    current = current.copy()
+    for column in ['base_seconds', 'base_peak_mb']:
+        current[column] = np.nan
+    if len(history):
+        earlier = history[history['machine'] == current['machine'].iloc[0]]
+        for scale in current['scale'].unique():
+            rows = earlier[earlier['scale'] == scale]
+            if not len(rows):
+                continue
+            last = rows[rows['run'] == rows['run'].max()].set_index('stage')
+            mask = current['scale'] == scale
+            current.loc[mask, 'base_seconds'] = current.loc[mask, 'stage'].map(last['seconds']).to_numpy()
+            current.loc[mask, 'base_peak_mb'] = current.loc[mask, 'stage'].map(last['peak_mb']).to_numpy()
+
+    peak = current['peak_mb'].astype(float)
+    current['time_ratio'] = current['seconds'] / current['base_seconds']
+    current['memory_ratio'] = peak / current['base_peak_mb']
+    slower = (current['time_ratio'] > tolerance) & (current['seconds'] - current['base_seconds'] > NOISE_SECONDS)
+    heavier = (current['memory_ratio'] > tolerance) & (peak - current['base_peak_mb'] > NOISE_MB)
+    current['regressed'] = slower | heavier
+    return current
+
+
+# ===========================
+# REPORT
+# ===========================
+
+def report(table, tolerance):
+    print("=" * 80)
+    print("PIPELINE BENCHMARKS")
+    print("=" * 80)
+    for scale, rows in table.groupby('scale', sort=True):
+        first = rows.iloc[0]
+        print(f"\n{scale:,}x: {first['geographies']} geographies x {first['months']} months x "
+              f"{first['series']} series ({first['statcan_mb']:.1f} MB StatsCan file, "
+              f"generated in {first['generate_seconds']:.1f} s)")
+        print(f"  {'stage':<10} {'seconds':>9} {'vs last':>8} {'peak MB':>9} {'vs last':>8}")
+        for row in rows.itertuples():
+            time_change = f"{row.time_ratio:.2f}x" if np.isfinite(row.time_ratio) else ''
+            memory = f"{row.peak_mb:9.1f}" if row.peak_mb is not None and np.isfinite(row.peak_mb) else f"{'':>9}"
+            memory_change = f"{row.memory_ratio:.2f}x" if np.isfinite(row.memory_ratio) else ''
+            flag = '  ⚠ regression' if row.regressed else ''
+            print(f"  {row.stage:<10} {row.seconds:9.3f} {time_change:>8} {memory} {memory_change:>8}{flag}")
+        print(f"  {'total':<10} {rows['seconds'].sum():9.3f}")
+
+    regressed = table[table['regressed']]
+    if len(regressed):
+        print(f"\n⚠ {len(regressed)} stage(s) more than {tolerance:.2f}x slower or heavier than the last run")
+    elif table['base_seconds'].notna().any():
+        print(f"\n✓ No stage more than {tolerance:.2f}x slower or heavier than the last run")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time and memory-profile each pipeline stage on synthetic inputs")
+    parser.add_argument('--scales', type=int, nargs='+', default=DEFAULT_SCALES, choices=sorted(SCALES),
+                        help="input sizes relative to the shipped files (10000 needs well over 5 GB of memory)")
+    parser.add_argument('--repeat', type=int, default=1, help="timed runs per scale (best is kept)")
+    parser.add_argument('--no-memory', action='store_true', help="skip the tracemalloc run")
+    parser.add_argument('--data-dir', default=DATA_DIR, help="where generated inputs are kept")
+    parser.add_argument('--results', default=RESULTS_FILE, help="JSON lines file of past and new results")
+    parser.add_argument('--no-save', action='store_true', help="compare without appending to the results file")
+    parser.add_argument('--label', default=None, help="free-text tag stored with the run")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help="slowdown or growth ratio that counts as a regression")
+    parser.add_argument('--check', action='store_true', help="exit with status 1 if any stage regressed")
+    args = parser.parse_args(argv)
+
+    info = run_info(args.label)
+    rows = []
+    for scale in args.scales:
+        rows += [{**info, **row} for row in benchmark_scale(scale, SCALES[scale], args.data_dir,
+                                                              args.repeat, not args.no_memory)]
+    table = compare(pd.DataFrame(rows), load_history(args.results), args.tolerance)
+    report(table, args.tolerance)
+    if not args.no_save:
+        save_rows(rows, args.results)
+        print(f"✓ Saved: {args.results}")
+    return 1 if args.check and table['regressed'].any() else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,307 @@
+"""
+BOOTSTRAP INFERENCE FOR THE DiD AND 2SLS ESTIMATES
+==================================================
+
+HC1 errors ignore the autocorrelation in the monthly series. This module
+gives bootstrap standard errors and percentile intervals for
+
+    DiD:    line3_did, tmx_did                      (model_did)
+    2SLS:   pipeline_capacity_instrument            (model_first)
+            iv_price, the 2SLS price coefficient    (run_iv_engine's fit)
+            kb/d through the price mechanism, Line 3 and TMX
+
+The 2SLS is the engine's specification: the differential instrumented by
+capacity with a trend control. The two-step second stage of model_second
+also holds line3_post and tmx_post, of which the fitted differential is a
+combination; its differential_predicted coefficient is a minimum-norm
+artifact of that rank-deficient design and is not bootstrapped.
+
+Two schemes:
+
+    wild   - residuals multiplied by Rademacher or Webb six-point weights, one
+             weight per cluster (month by default). Two or fewer clusters are
+             refused: with the two provinces as clusters the DiD residuals sum
+             to zero within each province and period, so the draws do not move.
+    block  - moving blocks of consecutive months resampled with replacement;
+             all provinces in a month stay together.
+
+No draw refits anything. Every estimator here is a function of a few cross-
+product matrices. Wild draws change those matrices by (weights @ (X * u)),
+and block draws are a count-weighted sum of per-block cross-products
+(counts @ block Grams). The two-stage fit is then solved from those
+sufficient statistics for a whole chunk of draws at once. Memory is bounded
+by chunk_size x (number of cross-product entries), not by the number of
+observations.
+"""
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_REPS = 9_999
+DEFAULT_CHUNK = 10_000
+PINV_RCOND = 1e-10   # on cross-products, i.e. ~1e-5 on the design itself
+
+WEBB_POINTS = np.array([-np.sqrt(1.5), -1.0, -np.sqrt(0.5), np.sqrt(0.5), 1.0, np.sqrt(1.5)])
+
+DID_TERMS = ['const', 'treated', 'line3_post', 'tmx_post', 'line3_did', 'tmx_did', 'time_trend']
+FIRST_TERMS = ['const', 'pipeline_capacity_instrument', 'time_trend']
+SECOND_FIXED_TERMS = ['const', 'time_trend']
+MIN_CLUSTERS = 3
+
+
+# ===========================
+# DRAWS
+# ===========================
+
+def draw_weights(rng, size, kind='webb'):
+    """Wild bootstrap weights of the given shape."""
+    if kind == 'rademacher':
+        return rng.integers(0, 2, size=size) * 2.0 - 1.0
+    if kind == 'webb':
+        return WEBB_POINTS[rng.integers(0, 6, size=size)]
+    raise ValueError(f"unknown weight type '{kind}' (use 'rademacher' or 'webb')")
+
+
+def block_counts(rng, n_draws, n_periods, block_length):
+    """
+    Moving-block resampling as counts: how often each of the
+    n_periods - block_length + 1 blocks is drawn, (n_draws, n_blocks).
+    """
+    n_blocks = n_periods - block_length + 1
+    per_sample = int(np.ceil(n_periods / block_length))
+    starts = rng.integers(0, n_blocks, size=(n_draws, per_sample))
+    counts = np.zeros((n_draws, n_blocks))
+    np.add.at(counts, (np.repeat(np.arange(n_draws), per_sample), starts.ravel()), 1.0)
+    return counts
+
+
+def block_grams(M, period, block_length):
+    """
+    Cross-product M'M of every moving block of consecutive periods,
+    (n_blocks, p, p), from cumulative sums of the per-period Grams.
+    """
+    codes, index = np.unique(period, return_inverse=True)
+    per_period = np.zeros((len(codes), M.shape[1], M.shape[1]))
+    np.add.at(per_period, index, np.einsum('np,nq->npq', M, M))
+    cum = np.concatenate([np.zeros((1,) + per_period.shape[1:]), np.cumsum(per_period, axis=0)])
+    return cum[block_length:] - cum[:-block_length]
+
+
+def default_block_length(n_periods):
+    return max(2, int(round(n_periods ** (1 / 3))))
+
+
+# ===========================
+# SOLVERS ON CROSS-PRODUCTS
+# ===========================
+
+def solve_normal(XtX, Xty):
+    """Batched minimum-norm solve of X'X b = X'y (matches OLS's pinv on rank loss)."""
+    return np.einsum('...ij,...j->...i', np.linalg.pinv(XtX, rcond=PINV_RCOND, hermitian=True), Xty)
+
+
+def _two_stage(S, iF, i1, y1, y2):
+    """
+    First-stage and second-stage coefficients from Grams S (..., p, p) of the
+    stacked matrix [F, X1, y1, y2]. Second-stage regressors are F plus the
+    fitted first stage X1 @ pi, placed last. Returns (pi, beta).
+    """
+    pi = solve_normal(S[..., i1[:, None], i1], S[..., i1, y1])
+    S_FF = S[..., iF[:, None], iF]
+    S_Fd = np.einsum('...ij,...j->...i', S[..., iF[:, None], i1], pi)
+    S_dd = np.einsum('...i,...ij,...j->...', pi, S[..., i1[:, None], i1], pi)
+    S_Fy = S[..., iF, y2]
+    S_dy = np.einsum('...i,...i->...', pi, S[..., i1, y2])
+
+    k = len(iF) + 1
+    XtX = np.zeros(S_FF.shape[:-2] + (k, k))
+    XtX[..., :-1, :-1] = S_FF
+    XtX[..., :-1, -1] = S_Fd
+    XtX[..., -1, :-1] = S_Fd
+    XtX[..., -1, -1] = S_dd
+    Xty = np.concatenate([S_Fy, S_dy[..., None]], axis=-1)
+    return pi, solve_normal(XtX, Xty)
+
+
+# ===========================
+# DESIGNS
+# ===========================
+
+def _design(df, terms):
+    return np.column_stack([np.ones(len(df)) if t == 'const' else df[t].to_numpy(dtype=float)
+                            for t in terms])
+
+
+def _month_codes(df):
+    return (df['year'].to_numpy() * 12 + df['month'].to_numpy()).astype(np.int64)
+
+
+def _cluster_index(df, cluster):
+    """
+    Cluster codes 0..G-1; cluster=None or 'month' gives one cluster per month.
+    Fewer than MIN_CLUSTERS clusters is a ValueError (the draws are degenerate).
+    """
+    labels = _month_codes(df) if cluster in (None, 'month') else df[cluster].to_numpy()
+    groups, index = np.unique(labels, return_inverse=True)
+    if len(groups) < MIN_CLUSTERS:
+        raise ValueError(f"wild bootstrap by '{cluster}' has only {len(groups)} clusters; "
+                         f"cluster by month or use the block bootstrap")
+    return len(groups), index
+
+
+def _iv_stack(df_2sls):
+    """[F, X1, y1, y2] and the column index sets used by _two_stage."""
+    F = _design(df_2sls, SECOND_FIXED_TERMS)
+    X1 = _design(df_2sls, FIRST_TERMS)
+    y1 = df_2sls['wcs_wti_differential'].to_numpy(dtype=float)
+    y2 = df_2sls['production_kbpd'].to_numpy(dtype=float)
+    M = np.column_stack([F, X1, y1, y2])
+    iF = np.arange(F.shape[1])
+    i1 = np.arange(F.shape[1], F.shape[1] + X1.shape[1])
+    return M, iF, i1, M.shape[1] - 2, M.shape[1] - 1
+
+
+# ===========================
+# BOOTSTRAP DRIVERS
+# ===========================
+
+def _chunks(reps, chunk_size):
+    for start in range(0, reps, chunk_size):
+        yield min(chunk_size, reps - start)
+
+
+def bootstrap_did(df_panel, method='wild', reps=DEFAULT_REPS, weights='webb', cluster='month',
+                  block_length=None, chunk_size=DEFAULT_CHUNK, seed=0):
+    """
+    Bootstrap draws of the regression DiD coefficients, (valid draws, 7) in
+    DID_TERMS order, plus the point estimate.
+    """
+    rng = np.random.default_rng(seed)
+    X = _design(df_panel, DID_TERMS)
+    y = df_panel['production_kbpd'].to_numpy(dtype=float)
+    beta = solve_normal(X.T @ X, X.T @ y)
+
+    draws = []
+    if method == 'wild':
+        u = y - X @ beta
+        P = np.linalg.pinv(X.T @ X, rcond=PINV_RCOND, hermitian=True) @ X.T
+        n_groups, group_index = _cluster_index(df_panel, cluster)
+        Pu = (P * u[None, :]).T          # (n, k): each observation's pull on beta
+        for size in _chunks(reps, chunk_size):
+            w = draw_weights(rng, (size, n_groups), weights)[:, group_index]
+            draws.append(beta + w @ Pu)
+    elif method == 'block':
+        period = _month_codes(df_panel)
+        n_periods = len(np.unique(period))
+        block_length = block_length or default_block_length(n_periods)
+        G = block_grams(np.column_stack([X, y]), period, block_length)
+        G_flat = G.reshape(len(G), -1)
+        k = X.shape[1]
+        for size in _chunks(reps, chunk_size):
+            S = (block_counts(rng, size, n_periods, block_length) @ G_flat).reshape(size, k + 1, k + 1)
+            draws.append(solve_normal(S[:, :k, :k], S[:, :k, k]))
+    else:
+        raise ValueError(f"unknown bootstrap method '{method}' (use 'wild' or 'block')")
+
+    draws = np.concatenate(draws)
+    return beta, draws[np.isfinite(draws).all(axis=1)]
+
+
+def bootstrap_iv(df_2sls, method='wild', reps=DEFAULT_REPS, weights='webb', cluster=None,
+                 block_length=None, chunk_size=DEFAULT_CHUNK, seed=0):
+    """
+    Bootstrap draws of the 2SLS as two steps: returns (pi, beta, pi_draws,
+    beta_draws). pi is in FIRST_TERMS order; beta is SECOND_FIXED_TERMS
+    followed by the price coefficient. cluster=None clusters by month.
+    """
+    rng = np.random.default_rng(seed)
+    M, iF, i1, y1, y2 = _iv_stack(df_2sls)
+    S0 = M.T @ M
+    pi, beta = _two_stage(S0, iF, i1, y1, y2)
+
+    pi_draws, beta_draws = [], []
+    if method == 'wild':
+        X1 = M[:, i1]
+        F = M[:, iF]
+        d_hat = X1 @ pi
+        u1 = M[:, y1] - d_hat
+        u2 = M[:, y2] - np.column_stack([F, d_hat]) @ beta
+        n_groups, group_index = _cluster_index(df_2sls, cluster)
+
+        # y1* = X1 pi + u1 w and y2* = [F, d_hat] beta + u2 w only move the y columns of S
+        fitted_y1 = M[:, y1] - u1
+        fitted_y2 = M[:, y2] - u2
+        base = M.copy()
+        base[:, y1] = fitted_y1
+        base[:, y2] = fitted_y2
+        S_base = base.T @ base
+        pull1 = M * u1[:, None]
+        pull2 = M * u2[:, None]
+        for size in _chunks(reps, chunk_size):
+            w = draw_weights(rng, (size, n_groups), weights)[:, group_index]
+            S = np.broadcast_to(S_base, (size,) + S_base.shape).copy()
+            S[:, :, y1] = S_base[:, y1] + w @ pull1
+            S[:, :, y2] = S_base[:, y2] + w @ pull2
+            S[:, y1, :] = S[:, :, y1]
+            S[:, y2, :] = S[:, :, y2]
+            p, b = _two_stage(S, iF, i1, y1, y2)
+            pi_draws.append(p)
+            beta_draws.append(b)
+    elif method == 'block':
+        period = _month_codes(df_2sls)
+        n_periods = len(np.unique(period))
+        block_length = block_length or default_block_length(n_periods)
+        G = block_grams(M, period, block_length)
+        G_flat = G.reshape(len(G), -1)
+        p_cols = M.shape[1]
+        for size in _chunks(reps, chunk_size):
+            S = (block_counts(rng, size, n_periods, block_length) @ G_flat).reshape(size, p_cols, p_cols)
+            p, b = _two_stage(S, iF, i1, y1, y2)
+            pi_draws.append(p)
+            beta_draws.append(b)
+    else:
+        raise ValueError(f"unknown bootstrap method '{method}' (use 'wild' or 'block')")
+
+    pi_draws = np.concatenate(pi_draws)
+    beta_draws = np.concatenate(beta_draws)
+    ok = np.isfinite(pi_draws).all(axis=1) & np.isfinite(beta_draws).all(axis=1)
+    return pi, beta, pi_draws[ok], beta_draws[ok]
+
+
+def _summary_row(model, term, method, estimate, draws, alpha):
+    lo, hi = np.quantile(draws, [alpha / 2, 1 - alpha / 2]) if len(draws) else (np.nan, np.nan)
+    return {'model': model, 'term': term, 'method': method, 'estimate': estimate,
+            'boot_se': draws.std(ddof=1) if len(draws) > 1 else np.nan,
+            'ci_low': lo, 'ci_high': hi, 'draws': len(draws)}
+
+
+def bootstrap_summary(df_panel, df_2sls, method='wild', reps=DEFAULT_REPS, weights='webb',
+                      cluster='month', block_length=None, capacity_line3=590, capacity_tmx=590,
+                      alpha=0.05, chunk_size=DEFAULT_CHUNK, seed=0):
+    """
+    Bootstrap SEs and percentile intervals for the DiD terms, the first-stage
+    slope, the 2SLS price coefficient and the implied kb/d through the price
+    mechanism. One row per quantity. `cluster` applies to the DiD wild
+    draws; the Alberta-only 2SLS is always clustered by month.
+    """
+    beta_did, did_draws = bootstrap_did(df_panel, method, reps, weights, cluster,
+                                        block_length, chunk_size, seed)
+    pi, beta, pi_draws, beta_draws = bootstrap_iv(df_2sls, method, reps, weights, None,
+                                                  block_length, chunk_size, seed + 1)
+
+    rows = []
+    for term in ['line3_did', 'tmx_did']:
+        j = DID_TERMS.index(term)
+        rows.append(_summary_row('did', term, method, beta_did[j], did_draws[:, j], alpha))
+
+    j_cap = FIRST_TERMS.index('pipeline_capacity_instrument')
+    rows.append(_summary_row('first', 'pipeline_capacity_instrument', method, pi[j_cap],
+                             pi_draws[:, j_cap], alpha))
+    rows.append(_summary_row('iv', 'iv_price', method, beta[-1], beta_draws[:, -1], alpha))
+
+    for name, capacity in [('line3', capacity_line3), ('tmx', capacity_tmx)]:
+        estimate = capacity * pi[j_cap] / 100 * beta[-1]
+        draws = capacity * pi_draws[:, j_cap] / 100 * beta_draws[:, -1]
+        rows.append(_summary_row('price_mechanism', f'prod_increase_via_price_{name}', method,
+                                 estimate, draws, alpha))
+    return pd.DataFrame(rows)
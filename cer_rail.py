@@ -0,0 +1,97 @@
+"""
+CER CRUDE OIL EXPORTS BY RAIL INGEST
+====================================
+
+Loads the Canada Energy Regulator "Canadian Crude Oil Exports by Rail - Monthly
+Data" workbook into a tidy frame with one row per month (and per destination,
+when the workbook breaks exports out by PADD).
+
+Layout: title rows, then a header row containing 'Year' and 'Month', then data
+rows in reverse chronological order with the year written only on the first
+month of each year, then unit notes.
+
+The workbook is opened read-only and streamed with iter_rows limited to the
+header's column span, so no per-cell pandas indexing happens. Year forward-fill,
+month-name mapping and numeric conversion are done on whole columns.
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+MONTH_NUMBERS = {
+    'January': 1, 'February': 2, 'March': 3, 'April': 4, 'May': 5, 'June': 6,
+    'July': 7, 'August': 8, 'September': 9, 'October': 10, 'November': 11, 'December': 12
+}
+
+HEADER_SCAN_ROWS = 50
+
+
+def _column_name(label):
+    """'Volume\\n(m³ per day)' -> 'volume_m3_per_day'."""
+    text = str(label).replace('³', '3').lower()
+    return re.sub(r'[^0-9a-z]+', '_', text).strip('_')
+
+
+def _find_header(ws):
+    """Return (row number, {column index: name}) of the Year/Month header row."""
+    for r, row in enumerate(ws.iter_rows(max_row=HEADER_SCAN_ROWS, values_only=True), start=1):
+        labels = [str(v).strip() if v is not None else '' for v in row]
+        if 'Year' in labels and 'Month' in labels:
+            return r, {i: _column_name(v) for i, v in enumerate(labels) if v}
+    raise ValueError("no header row with 'Year' and 'Month' found in the rail workbook")
+
+
+def read_rail_workbook(path, sheet=0, start_year=None, end_year=None):
+    """
+    Parse the CER rail export workbook into a tidy monthly frame, sorted by
+    date (oldest first).
+
+    Columns: year, month, date, any text columns found in the header (e.g. a
+    destination PADD, kept as categoricals), every numeric volume/value column
+    under a normalised name (volume_m3, volume_bbl_per_day, ...), and
+    rail_kbpd = barrels per day / 1000 when a bbl-per-day column is present.
+    """
+    import openpyxl
+
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[sheet] if isinstance(sheet, int) else wb[sheet]
+        header_row, names = _find_header(ws)
+        lo, hi = min(names), max(names)
+        rows = list(ws.iter_rows(min_row=header_row + 1, min_col=lo + 1, max_col=hi + 1,
+                                 values_only=True))
+    finally:
+        wb.close()
+
+    raw = pd.DataFrame(rows, columns=[names.get(i, f"_unused{i}") for i in range(lo, hi + 1)])
+    raw = raw[[c for c in raw.columns if not c.startswith('_unused')]]
+
+    year = pd.to_numeric(raw.pop('year'), errors='coerce').ffill()
+    month = raw.pop('month').map(MONTH_NUMBERS)
+    keep = (month.notna() & year.notna()).to_numpy()
+    raw = raw[keep]
+
+    tidy = pd.DataFrame({'year': year[keep].astype(int).to_numpy(),
+                         'month': month[keep].astype(int).to_numpy()})
+    tidy['date'] = pd.to_datetime(tidy[['year', 'month']].assign(day=1))
+
+    keys = ['date']
+    for col in raw.columns:
+        values = pd.to_numeric(raw[col], errors='coerce')
+        if values.notna().any():
+            tidy[col] = values.to_numpy(dtype='float64')
+        else:
+            tidy[col] = pd.Categorical(raw[col].astype(str).str.strip())
+            keys.append(col)
+
+    if 'volume_bbl_per_day' in tidy:
+        tidy['rail_kbpd'] = tidy['volume_bbl_per_day'] / 1000
+
+    mask = np.ones(len(tidy), dtype=bool)
+    if start_year is not None:
+        mask &= tidy['year'].to_numpy() >= start_year
+    if end_year is not None:
+        mask &= tidy['year'].to_numpy() <= end_year
+    return tidy[mask].sort_values(keys, kind='stable').reset_index(drop=True)
@@ -0,0 +1,230 @@
+"""
+MONTE CARLO UNCERTAINTY FOR THE EMISSIONS ESTIMATES
+===================================================
+
+Part 3 multiplies period production by period intensity at point values. Here
+the inputs are drawn instead:
+
+    base intensity   Normal(base_intensity, base_intensity_sd), kg CO2e/bbl, >= 0
+    decline rate     Normal(decline_rate, decline_rate_sd), clipped to [0, 1)
+    DiD effects      line3_did, tmx_did ~ MVN(params, cov) from model_did
+    price channel    first-stage slope and the engine's 2SLS price coefficient
+                     ~ MVN, jointly (see price_channel_cov)
+
+and propagated to Mt CO2e/year for
+
+    line3_delta, tmx_delta, total_delta      observed period production x
+                                             drawn intensity (Part 3's deltas)
+    did_line3, did_tmx, did_total            DiD production effect x intensity
+    price_line3, price_tmx, price_total      production through the price
+                                             channel x intensity
+
+A period's mean intensity is base x sum_y w_y (1 - rate)^(y - start), where w_y
+is the share of the period's months in year y. Its emissions (the mean of
+monthly production x intensity, as in compute_emissions) use the same form
+with w_y = the period's year-y production / its number of months. Each draw
+therefore costs a few array operations, with no per-year loop.
+
+The slope and the price coefficient come from the same months, so they are
+correlated (about -0.5 on the shipped data). Their covariance stacks the two
+estimating equations, Z'(d - Z pi) = 0 and Z'(y - X beta) = 0 with Z =
+[const, capacity, trend] and X = [differential, const, trend], and takes the
+cross term from the two influence functions. The marginal variances are each
+fit's own reported ones; under HC1 the result is the stacked HC1 sandwich.
+
+Memory is bounded by chunk_size, not by n_draws. Chunks come from spawned
+seeds, so they can be regenerated. Pass 1 finds each output's range and
+moments. Pass 2 bins every draw into a fine histogram (BINS bins), and the
+quantiles are read off that histogram. They are accurate to range / BINS.
+"""
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_DRAWS = 1_000_000
+DEFAULT_CHUNK = 1_000_000
+BASE_INTENSITY_SD = 5.0     # kg CO2e/bbl
+DECLINE_RATE_SD = 0.005
+QUANTILES = (0.025, 0.05, 0.5, 0.95, 0.975)
+BINS = 1 << 16
+DAYS_PER_YEAR = 365.25
+
+OUTPUTS = ['line3_delta', 'tmx_delta', 'total_delta',
+           'did_line3', 'did_tmx', 'did_total',
+           'price_line3', 'price_tmx', 'price_total']
+
+
+# ===========================
+# MODEL INPUTS
+# ===========================
+
+def period_structure(df_alberta_full):
+    """
+    Mean production (kb/d) and year weights of the pre, post-Line 3 and
+    post-TMX periods, as in compute_emissions.
+    """
+    start_year = int(df_alberta_full['year'].min())
+    years = np.arange(start_year, int(df_alberta_full['year'].max()) + 1)
+    periods = {
+        'pre': df_alberta_full['line3_post'] == 0,
+        'post_line3': (df_alberta_full['line3_post'] == 1) & (df_alberta_full['tmx_post'] == 0),
+        'post_tmx': df_alberta_full['tmx_post'] == 1,
+    }
+    weights, production_weights = {}, {}
+    for name, mask in periods.items():
+        rows = df_alberta_full[mask]
+        by_year = rows.groupby('year')['production_kbpd'].agg(['size', 'sum']).reindex(years, fill_value=0)
+        weights[name] = by_year['size'].to_numpy(dtype=float) / len(rows)
+        production_weights[name] = by_year['sum'].to_numpy(dtype=float) / len(rows)
+    return {'years_since_start': years - start_year, 'weights': weights,
+            'production_weights': production_weights}
+
+
+def price_channel_cov(df_alberta_2sls, slope_sd, price_sd):
+    """
+    2 x 2 covariance of (first-stage slope, 2SLS price coefficient): the
+    correlation of their stacked influence functions, scaled to slope_sd and
+    price_sd.
+    """
+    d = df_alberta_2sls['wcs_wti_differential'].to_numpy(dtype=float)
+    y = df_alberta_2sls['production_kbpd'].to_numpy(dtype=float)
+    trend = df_alberta_2sls['time_trend'].to_numpy(dtype=float)
+    const = np.ones(len(y))
+    Z = np.column_stack([const, df_alberta_2sls['pipeline_capacity_instrument'].to_numpy(dtype=float), trend])
+    X = np.column_stack([d, const, trend])
+
+    pi = np.linalg.lstsq(Z, d, rcond=None)[0]
+    beta = np.linalg.solve(Z.T @ X, Z.T @ y)
+    slope_influence = (Z * (d - Z @ pi)[:, None]) @ np.linalg.inv(Z.T @ Z)[1]
+    price_influence = (Z * (y - X @ beta)[:, None]) @ np.linalg.inv(Z.T @ X)[0]
+    corr = slope_influence @ price_influence / np.sqrt((slope_influence @ slope_influence)
+                                                       * (price_influence @ price_influence))
+    sd = np.array([slope_sd, price_sd])
+    return np.outer(sd, sd) * np.array([[1.0, corr], [corr, 1.0]])
+
+
+def effect_inputs(model_did, iv):
+    """Means and covariances of the production effects from the fitted models."""
+    terms = ['line3_did', 'tmx_did']
+    fit = iv['engine']['fit']
+    slope_sd = iv['first'].bse['pipeline_capacity_instrument']
+    return {
+        'did_mean': model_did.params[terms].to_numpy(dtype=float),
+        'did_cov': model_did.cov_params().loc[terms, terms].to_numpy(dtype=float),
+        'price_channel_mean': np.array([iv['first'].params['pipeline_capacity_instrument'], fit['params'][0, 0]]),
+        'price_channel_cov': price_channel_cov(iv['data'], slope_sd, fit['bse'][0, 0]),
+        'capacity_line3': iv['capacity_line3'],
+        'capacity_tmx': iv['capacity_tmx'],
+    }
+
+
+# ===========================
+# DRAWS
+# ===========================
+
+def propagate(base, rate, did, via_price, periods, effects):
+    """
+    Outputs in Mt CO2e/year for arrays of base intensity, decline rate, DiD
+    effects (n, 2) and $/bbl narrowing x production response per kb/d
+    (via_price = slope / 100 x price coefficient).
+    """
+    path = (1 - rate)[:, None] ** periods['years_since_start'][None, :]
+    intensity = {p: base * (path @ w) for p, w in periods['weights'].items()}
+
+    scale = DAYS_PER_YEAR / 1_000_000
+    emissions = {p: base * (path @ w) * scale for p, w in periods['production_weights'].items()}
+
+    out = {
+        'line3_delta': emissions['post_line3'] - emissions['pre'],
+        'tmx_delta': emissions['post_tmx'] - emissions['post_line3'],
+        'total_delta': emissions['post_tmx'] - emissions['pre'],
+        'did_line3': did[:, 0] * intensity['post_line3'] * scale,
+        'did_tmx': did[:, 1] * intensity['post_tmx'] * scale,
+        'price_line3': effects['capacity_line3'] * via_price * intensity['post_line3'] * scale,
+        'price_tmx': effects['capacity_tmx'] * via_price * intensity['post_tmx'] * scale,
+    }
+    out['did_total'] = out['did_line3'] + out['did_tmx']
+    out['price_total'] = out['price_line3'] + out['price_tmx']
+    return out
+
+
+def emission_draws(rng, size, periods, effects, base_intensity, base_intensity_sd,
+                   decline_rate, decline_rate_sd):
+    """One chunk of draws of every output, {name: (size,) array}."""
+    base = np.maximum(base_intensity + base_intensity_sd * rng.standard_normal(size), 0.0)
+    rate = np.clip(decline_rate + decline_rate_sd * rng.standard_normal(size), 0.0, 1 - 1e-12)
+    did = effects['did_mean'] + rng.standard_normal((size, 2)) @ np.linalg.cholesky(effects['did_cov']).T
+    slope, price = (effects['price_channel_mean']
+                    + rng.standard_normal((size, 2)) @ np.linalg.cholesky(effects['price_channel_cov']).T).T
+    return propagate(base, rate, did, slope / 100 * price, periods, effects)
+
+
+def _chunk_streams(n_draws, chunk_size, seed):
+    sizes = [min(chunk_size, n_draws - start) for start in range(0, n_draws, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    return list(zip(sizes, seeds))
+
+
+def _histogram_quantiles(counts, lo, hi, quantiles):
+    """Quantiles from bin counts on [lo, hi], interpolating within the bin."""
+    if hi <= lo:
+        return np.full(len(quantiles), lo)
+    edges = np.linspace(lo, hi, len(counts) + 1)
+    cum = np.cumsum(counts)
+    result = []
+    for q in quantiles:
+        target = q * cum[-1]
+        i = int(np.searchsorted(cum, target))
+        before = cum[i - 1] if i else 0
+        frac = (target - before) / counts[i] if counts[i] else 0.0
+        result.append(edges[i] + frac * (edges[i + 1] - edges[i]))
+    return np.array(result)
+
+
+def simulate_emissions(df_alberta_full, model_did, iv, n_draws=DEFAULT_DRAWS,
+                       base_intensity=75.0, base_intensity_sd=BASE_INTENSITY_SD,
+                       decline_rate=0.02, decline_rate_sd=DECLINE_RATE_SD,
+                       quantiles=QUANTILES, chunk_size=DEFAULT_CHUNK, seed=0):
+    """
+    Monte Carlo distribution of every output in OUTPUTS. Returns one row per
+    output: point value (all inputs at their means), mean, sd and the requested
+    quantiles (columns q2.5, q50, ...).
+    """
+    periods = period_structure(df_alberta_full)
+    effects = effect_inputs(model_did, iv)
+    args = (periods, effects, base_intensity, base_intensity_sd, decline_rate, decline_rate_sd)
+    streams = _chunk_streams(n_draws, chunk_size, seed)
+
+    # Pass 1: range and moments
+    lo = {k: np.inf for k in OUTPUTS}
+    hi = {k: -np.inf for k in OUTPUTS}
+    total = dict.fromkeys(OUTPUTS, 0.0)
+    total_sq = dict.fromkeys(OUTPUTS, 0.0)
+    for size, stream in streams:
+        draws = emission_draws(np.random.default_rng(stream), size, *args)
+        for k in OUTPUTS:
+            lo[k] = min(lo[k], draws[k].min())
+            hi[k] = max(hi[k], draws[k].max())
+            total[k] += draws[k].sum()
+            total_sq[k] += np.square(draws[k]).sum()
+
+    # Pass 2: regenerate the same chunks into fixed histograms
+    counts = {k: np.zeros(BINS, dtype=np.int64) for k in OUTPUTS}
+    for size, stream in streams:
+        draws = emission_draws(np.random.default_rng(stream), size, *args)
+        for k in OUTPUTS:
+            width = (hi[k] - lo[k]) or 1.0
+            index = np.minimum(((draws[k] - lo[k]) / width * BINS).astype(np.int64), BINS - 1)
+            counts[k] += np.bincount(index, minlength=BINS)
+
+    point = propagate(np.array([base_intensity]), np.array([decline_rate]), effects['did_mean'][None, :],
+                      np.array([np.prod(effects['price_channel_mean']) / 100]), periods, effects)
+    rows = []
+    for k in OUTPUTS:
+        mean = total[k] / n_draws
+        var = max(total_sq[k] / n_draws - mean ** 2, 0.0) * n_draws / max(n_draws - 1, 1)
+        row = {'output': k, 'point': point[k][0], 'mean': mean, 'sd': np.sqrt(var)}
+        for q, value in zip(quantiles, _histogram_quantiles(counts[k], lo[k], hi[k], quantiles)):
+            row[f'q{q * 100:g}'] = value
+        rows.append(row)
+    return pd.DataFrame(rows)
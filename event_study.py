@@ -0,0 +1,257 @@
+"""
+EVENT STUDY: LEADS AND LAGS AROUND THE IN-SERVICE DATES
+=======================================================
+
+Replaces the post dummies with Alberta x relative-month indicators around each
+pipeline's first month in service:
+
+    y_it = a_i + d_t + sum_e sum_k b_ek 1[treated_i, t - t_e = k] + u_it
+
+    d_t         month fixed effects (controls='month_fe'), or the DiD's shared
+                design of const, treated and time_trend (controls='trend')
+    k           -leads .. lags, without the reference months (default -1),
+                which every b is measured against
+    binning     'bin': the end indicators also take every month beyond them
+                (k <= -leads, k >= lags)
+                'trim': months outside the window get no indicator and fall
+                into the reference group
+
+Both events' indicators enter one regression, so where Line 3's lags and TMX's
+leads overlap, each coefficient is net of the other event. Only the first
+event's far lead is binned. Binned at both ends, each event's indicators would
+cover every Alberta month, and together with the other event's they would be
+collinear; the later event's months before its window are its baseline
+instead. A month that both events index with single-month indicators cannot
+be split between them. Such coefficients, and those beyond the sample end, are
+NaN rather than an arbitrary split.
+
+Classical errors are the default. With two provinces and month fixed effects,
+a single-month indicator fits its Alberta month exactly (leverage one), so HC
+errors for it collapse towards zero. HC0/HC1 are offered for coarse designs
+(trend controls, wide bins).
+
+A sweep over lead/lag widths and binning choices is one batched solve. The
+controls are partialled out once with a shared QR, each spec's indicators are
+residualised against it, and all specs are stacked (padded with zero columns)
+into one batched pseudo-inverse with classical or HC errors. By Frisch-Waugh-Lovell
+these are the full regression's coefficients and errors.
+
+Pre-trends are tested per spec and event with a joint Wald test that every
+identified lead coefficient is zero.
+"""
+
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from permutation_inference import shared_factorization
+
+EVENT_DUMMIES = {'line3': 'line3_post', 'tmx': 'tmx_post'}
+LABELS = {'line3': 'Line 3', 'tmx': 'TMX'}
+BINNING = ['bin', 'trim']
+CONTROLS = ['month_fe', 'trend']
+COV_TYPES = ['nonrobust', 'HC0', 'HC1']
+ESTIMABLE_TOL = 1e-8
+PINV_RCOND = 1e-10
+
+
+# ===========================
+# DESIGN
+# ===========================
+
+def _month_codes(df_panel):
+    return (df_panel['year'].to_numpy() * 12 + df_panel['month'].to_numpy() - 1).astype(np.int64)
+
+
+def event_months(df_panel):
+    """{event: month code of its first post month} for events the panel covers."""
+    months = _month_codes(df_panel)
+    return {e: int(months[df_panel[d].to_numpy() == 1].min())
+            for e, d in EVENT_DUMMIES.items() if (df_panel[d] == 1).any()}
+
+
+def control_design(df_panel, controls='month_fe'):
+    """The regressors every spec shares."""
+    treated = df_panel['treated'].to_numpy(dtype=float)
+    if controls == 'month_fe':
+        codes, index = np.unique(_month_codes(df_panel), return_inverse=True)
+        return np.column_stack([np.eye(len(codes))[index], treated])
+    if controls == 'trend':
+        return np.column_stack([np.ones(len(df_panel)), treated,
+                                df_panel['time_trend'].to_numpy(dtype=float)])
+    raise ValueError(f"controls must be one of {CONTROLS}")
+
+
+def relative_terms(leads, lags, reference=(-1,)):
+    """Relative months that get an indicator."""
+    return [k for k in range(-leads, lags + 1) if k not in set(reference)]
+
+
+def event_columns(df_panel, events, leads, lags, binning='bin', reference=(-1,)):
+    """(n, p) indicators and their (event, rel_month, endpoint) labels for one spec."""
+    if binning not in BINNING:
+        raise ValueError(f"binning must be one of {BINNING}")
+    months = _month_codes(df_panel)
+    treated = df_panel['treated'].to_numpy() == 1
+    first = min(events.values()) if events else None
+    columns, labels = [], []
+    for event, start in events.items():
+        rel = months - start
+        for k in relative_terms(leads, lags, reference):
+            hit = rel == k
+            # A later event's far-lead bin would re-partition months the earlier
+            # event's indicators already cover; its pre-window months are its baseline
+            endpoint = binning == 'bin' and (k == lags or (k == -leads and start == first))
+            if endpoint:
+                hit = rel <= k if k == -leads else rel >= k
+            columns.append(treated & hit)
+            labels.append((event, k, endpoint))
+    return np.column_stack(columns).astype(float), labels
+
+
+def spec_table(leads=(12,), lags=(24,), binning=('bin',)):
+    """Cartesian product of the sweep as a frame with a spec id."""
+    rows = list(itertools.product(leads, lags, binning))
+    return pd.DataFrame(rows, columns=['leads', 'lags', 'binning']).rename_axis('spec').reset_index()
+
+
+# ===========================
+# BATCHED SOLVE
+# ===========================
+
+def fit_specs(y, C, designs, cov_type='nonrobust'):
+    """
+    Coefficients and covariances of y on [C, D_s] for every spec s, solved
+    for the D_s block after partialling out C. designs is a list of (n, p_s)
+    arrays. Returns params and bse (S, p_max), cov (S, p_max, p_max), the
+    estimable mask and df_resid (S,). Padding and unidentified entries are NaN.
+    """
+    if cov_type not in COV_TYPES:
+        raise ValueError(f"cov_type must be one of {COV_TYPES}")
+    n = len(y)
+    p_max = max(D.shape[1] for D in designs)
+    D = np.zeros((len(designs), n, p_max))
+    for s, Ds in enumerate(designs):
+        D[s, :, :Ds.shape[1]] = Ds
+
+    Q, y_res = shared_factorization(y, C)
+    D_res = D - np.einsum('nk,skp->snp', Q, np.einsum('nk,snp->skp', Q, D))
+    A = np.einsum('snp,snq->spq', D_res, D_res)
+    bread = np.linalg.pinv(A, rcond=PINV_RCOND, hermitian=True)
+    params = np.einsum('spq,snq,n->sp', bread, D_res, y_res)
+    estimable = np.abs(np.einsum('spq,sqp->sp', bread, A) - 1) < ESTIMABLE_TOL
+
+    rank_C = np.linalg.matrix_rank(C)
+    df_resid = n - rank_C - np.linalg.matrix_rank(A, hermitian=True)
+    resid = y_res[None, :] - np.einsum('snp,sp->sn', D_res, params)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if cov_type == 'nonrobust':
+            cov = ((resid ** 2).sum(axis=1) / df_resid)[:, None, None] * bread
+        else:
+            meat = np.einsum('snp,sn,snq->spq', D_res, resid ** 2, D_res)
+            cov = bread @ meat @ bread
+            if cov_type == 'HC1':
+                cov *= (n / df_resid)[:, None, None]
+    bse = np.sqrt(np.clip(np.einsum('spp->sp', cov), 0, None))
+    params[~estimable] = np.nan
+    bse[~estimable] = np.nan
+    return params, bse, cov, estimable, df_resid
+
+
+def _pretrend(b, V, df_resid, cov_type):
+    """Joint Wald test of b = 0: (statistic, df, p-value)."""
+    from scipy import stats
+
+    if not len(b):
+        return np.nan, 0, np.nan
+    V_inv = np.linalg.pinv(V, rcond=PINV_RCOND, hermitian=True)
+    rank = np.linalg.matrix_rank(V, hermitian=True)
+    stat = float(b @ V_inv @ b)
+    if cov_type == 'nonrobust':
+        return stat / rank, rank, float(stats.f.sf(stat / rank, rank, df_resid))
+    return stat, rank, float(stats.chi2.sf(stat, rank))
+
+
+def event_study(df_panel, leads=(12,), lags=(24,), binning=('bin',), reference=(-1,),
+                controls='month_fe', cov_type='nonrobust', alpha=0.05, y='production_kbpd'):
+    """
+    Event-study coefficients for every combination of leads x lags x binning.
+
+    Returns (specs, coefs, pretrends):
+        specs       spec, leads, lags, binning
+        coefs       spec, event, rel_month, endpoint, estimate, se, ci_low,
+                    ci_high, p_value (the reference months are rows with 0)
+        pretrends   spec, event, stat, df, p_value, mean_lead, mean_lag
+    """
+    from scipy import stats
+
+    specs = spec_table(leads, lags, binning)
+    events = event_months(df_panel)
+    C = control_design(df_panel, controls)
+    built = [event_columns(df_panel, events, s.leads, s.lags, s.binning, reference)
+             for s in specs.itertuples()]
+    params, bse, cov, estimable, df_resid = fit_specs(
+        df_panel[y].to_numpy(dtype=float), C, [D for D, _ in built], cov_type)
+
+    rows, tests = [], []
+    for s, (_, labels) in enumerate(built):
+        if cov_type == 'nonrobust':
+            crit = stats.t.ppf(1 - alpha / 2, df_resid[s])
+            p_values = 2 * stats.t.sf(np.abs(params[s] / bse[s]), df_resid[s])
+        else:
+            crit = stats.norm.ppf(1 - alpha / 2)
+            p_values = 2 * stats.norm.sf(np.abs(params[s] / bse[s]))
+        for j, (event, k, endpoint) in enumerate(labels):
+            rows.append((s, event, k, endpoint, params[s, j], bse[s, j],
+                         params[s, j] - crit * bse[s, j], params[s, j] + crit * bse[s, j], p_values[j]))
+        for event in events:
+            rows.extend((s, event, k, False, 0.0, 0.0, 0.0, 0.0, np.nan) for k in reference)
+            leads_j = [j for j, (e, k, _) in enumerate(labels) if e == event and k < 0 and estimable[s, j]]
+            lags_j = [j for j, (e, k, _) in enumerate(labels) if e == event and k >= 0 and estimable[s, j]]
+            stat, df, p = _pretrend(params[s, leads_j], cov[s][np.ix_(leads_j, leads_j)],
+                                    df_resid[s], cov_type)
+            tests.append({'spec': s, 'event': event, 'stat': stat, 'df': df, 'p_value': p,
+                          'mean_lead': np.mean(params[s, leads_j]) if leads_j else np.nan,
+                          'mean_lag': np.mean(params[s, lags_j]) if lags_j else np.nan})
+
+    coefs = pd.DataFrame(rows, columns=['spec', 'event', 'rel_month', 'endpoint', 'estimate', 'se',
+                                        'ci_low', 'ci_high', 'p_value'])
+    coefs = coefs.sort_values(['spec', 'event', 'rel_month'], kind='stable').reset_index(drop=True)
+    return specs, coefs, pd.DataFrame(tests)
+
+
+# ===========================
+# FIGURE
+# ===========================
+
+def plot_event_study(coefs, spec=0, path='event_study.png', dpi=150):
+    """Coefficient plot of one spec: one panel per event, 95% intervals as bars."""
+    import matplotlib.pyplot as plt
+
+    data = coefs[coefs['spec'] == spec]
+    events = list(dict.fromkeys(data['event']))
+    fig, axes = plt.subplots(1, len(events), figsize=(7 * len(events), 5), squeeze=False)
+    for ax, event in zip(axes[0], events):
+        rows = data[(data['event'] == event) & data['estimate'].notna()]
+        inner = rows[~rows['endpoint']]
+        ax.errorbar(inner['rel_month'], inner['estimate'],
+                    yerr=[inner['estimate'] - inner['ci_low'], inner['ci_high'] - inner['estimate']],
+                    fmt='o', color='navy', markersize=4, capsize=2, linewidth=1)
+        ends = rows[rows['endpoint']]
+        ax.errorbar(ends['rel_month'], ends['estimate'],
+                    yerr=[ends['estimate'] - ends['ci_low'], ends['ci_high'] - ends['estimate']],
+                    fmt='s', color='darkorange', markersize=6, capsize=3, linewidth=1,
+                    label='binned endpoint' if len(ends) else None)
+        ax.axhline(0, color='gray', linewidth=1)
+        ax.axvline(-0.5, color='red', linestyle='--', linewidth=1.5, alpha=0.7)
+        ax.set_xlabel('Months relative to in-service', fontweight='bold')
+        ax.set_ylabel('Alberta vs Saskatchewan (kb/d)', fontweight='bold')
+        ax.set_title(f'Event Study: {LABELS[event]}', fontweight='bold')
+        ax.grid(True, alpha=0.3)
+        if len(ends):
+            ax.legend(fontsize=9)
+    plt.tight_layout()
+    plt.savefig(path, dpi=dpi, bbox_inches='tight')
+    plt.close(fig)
+    return path
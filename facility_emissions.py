@@ -0,0 +1,191 @@
+"""
+FACILITY-LEVEL EMISSIONS INTENSITY
+==================================
+
+Part 3 assumes a single provincial intensity path. Facility reports, which give
+production and emissions for each oil sands facility and month, provide the
+observed path. This module reads those reports into a compact columnar frame
+and aggregates them into the provincial monthly series
+
+    intensity_m = sum_f emissions_fm / sum_f production_fm      (kg CO2e/bbl)
+
+This is the production-weighted mean of the facility intensities.
+
+Input is a CSV with one row per facility and month:
+
+    facility_id     any label
+    year, month     integers
+    production_bbl  barrels produced in the month (or production_m3, in m3)
+    emissions_t     tonnes CO2e emitted in the month
+    facility_type   optional, e.g. in_situ / mining
+
+Rows are parsed in chunks directly into compact dtypes: categorical IDs and
+types, int16 year, int8 month and float32 values. That is about 16 bytes a
+row, so tens of millions of facility-months take a few hundred MB. With an
+IngestCache the compact frame is stored as memory-mapped .npy columns. The
+aggregation walks the rows in slices and sums them with np.bincount on a
+month (x type) code, accumulating in float64, so only one slice of
+temporaries exists at a time.
+
+    monthly = facility_intensity('facility_reports.csv')
+    schedule = observed_schedule(monthly)      # an intensity_schedules spec
+"""
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+CHUNK_ROWS = 1_000_000
+BBL_PER_M3 = 6.289811
+
+KEY_COLUMNS = ['facility_id', 'year', 'month']
+PRODUCTION_COLUMNS = {'production_bbl': 1.0, 'production_m3': BBL_PER_M3}
+DTYPES = {
+    'facility_id': 'category',
+    'facility_type': 'category',
+    'year': 'int16',
+    'month': 'int8',
+    'production_bbl': 'float32',
+    'production_m3': 'float32',
+    'emissions_t': 'float32',
+}
+TOTALS = ['facilities', 'production_bbl', 'emissions_t']
+
+
+# ===========================
+# INGEST
+# ===========================
+
+def _usecols(path):
+    header = pd.read_csv(path, nrows=0).columns.tolist()
+    missing = [c for c in KEY_COLUMNS + ['emissions_t'] if c not in header]
+    production = [c for c in PRODUCTION_COLUMNS if c in header]
+    if missing or not production:
+        raise ValueError(f"{path}: facility reports need {KEY_COLUMNS}, emissions_t and "
+                         f"production_bbl or production_m3 (missing {missing or 'production'})")
+    optional = ['facility_type'] if 'facility_type' in header else []
+    return KEY_COLUMNS + [production[0], 'emissions_t'] + optional, production[0]
+
+
+def read_facility_chunks(path, chunksize=CHUNK_ROWS):
+    """Yield the facility-month records in compact chunks, production in barrels."""
+    usecols, production = _usecols(path)
+    reader = pd.read_csv(path, usecols=usecols, dtype={c: DTYPES[c] for c in usecols},
+                         chunksize=chunksize)
+    for chunk in reader:
+        if production != 'production_bbl':
+            chunk['production_bbl'] = chunk.pop(production) * np.float32(PRODUCTION_COLUMNS[production])
+        yield chunk[[c if c != production else 'production_bbl' for c in usecols]]
+
+
+def _concat_compact(chunks):
+    """Concatenate chunks column by column, merging the categories of each chunk."""
+    if not chunks:
+        raise ValueError("no facility records")
+    columns = {}
+    for name in chunks[0].columns:
+        if isinstance(chunks[0][name].dtype, pd.CategoricalDtype):
+            columns[name] = union_categoricals([c[name] for c in chunks])
+        else:
+            columns[name] = np.concatenate([c[name].to_numpy() for c in chunks])
+    return pd.DataFrame(columns, copy=False)
+
+
+def load_facility_records(path, cache=None, chunksize=CHUNK_ROWS):
+    """All facility-month records as one compact frame (memory-mapped when cached)."""
+    def build():
+        return _concat_compact(list(read_facility_chunks(path, chunksize)))
+
+    return cache.frame('facilities', [path], build) if cache else build()
+
+
+# ===========================
+# AGGREGATION
+# ===========================
+
+def aggregate_monthly(records, by=None, slice_rows=CHUNK_ROWS):
+    """
+    Provincial monthly totals and production-weighted intensity.
+
+    Returns one row per month with records, or one per month and `by` group
+    (e.g. by='facility_type'). The columns are year, month, [by,] facilities,
+    production_bbl, emissions_t and intensity (kg CO2e/bbl). Rows with missing
+    production or emissions are left out of every sum.
+    """
+    if len(records) == 0:
+        raise ValueError("no facility records")
+    year = records['year'].to_numpy()
+    month = records['month'].to_numpy()
+    production = records['production_bbl'].to_numpy()
+    emissions = records['emissions_t'].to_numpy()
+
+    origin = int(year.min()) * 12
+    n_months = (int(year.max()) + 1) * 12 - origin
+    if by is None:
+        codes, groups = None, [None]
+    else:
+        codes = records[by].cat.codes.to_numpy()
+        groups = list(records[by].cat.categories)
+    size = n_months * len(groups)
+
+    count = np.zeros(size, dtype=np.int64)
+    production_sum = np.zeros(size)
+    emissions_sum = np.zeros(size)
+    for start in range(0, len(records), slice_rows):
+        rows = slice(start, start + slice_rows)
+        key = year[rows].astype(np.int64) * 12 + month[rows] - 1 - origin
+        ok = np.isfinite(production[rows]) & np.isfinite(emissions[rows])
+        if codes is not None:
+            key = key * len(groups) + codes[rows]
+            ok &= codes[rows] >= 0
+        key = key[ok]
+        count += np.bincount(key, minlength=size)
+        production_sum += np.bincount(key, weights=production[rows][ok], minlength=size)
+        emissions_sum += np.bincount(key, weights=emissions[rows][ok], minlength=size)
+
+    months = np.repeat(np.arange(n_months) + origin, len(groups))
+    monthly = pd.DataFrame({'year': months // 12, 'month': months % 12 + 1})
+    if by is not None:
+        monthly[by] = pd.Categorical(np.tile(groups, n_months), categories=groups)
+    monthly['facilities'] = count
+    monthly['production_bbl'] = production_sum
+    monthly['emissions_t'] = emissions_sum
+    monthly = monthly[count > 0].reset_index(drop=True)
+    return _with_intensity(monthly)
+
+
+def _with_intensity(monthly):
+    production = monthly['production_bbl'].to_numpy()
+    monthly['intensity'] = np.divide(monthly['emissions_t'].to_numpy() * 1000, production,
+                                     out=np.full(len(monthly), np.nan), where=production > 0)
+    return monthly
+
+
+def provincial_series(monthly):
+    """One row per month from an aggregate, summing any groups (e.g. by facility_type)."""
+    totals = monthly.groupby(['year', 'month'], as_index=False)[TOTALS].sum()
+    return _with_intensity(totals)
+
+
+def facility_intensity(path, cache=None, by=None):
+    """Read a facility report file and aggregate it (see aggregate_monthly)."""
+    return aggregate_monthly(load_facility_records(path, cache), by=by)
+
+
+# ===========================
+# PART 3 INPUT
+# ===========================
+
+def observed_schedule(monthly):
+    """
+    Intensity schedule spec (see intensity_schedules) through the observed
+    monthly intensity. Months without reports are interpolated, and the first
+    and last observed values are held outside the reported range.
+    """
+    series = provincial_series(monthly)
+    series = series[np.isfinite(series['intensity'])]
+    if series.empty:
+        raise ValueError("facility reports have no month with positive production")
+    points = {f"{y}-{m:02d}": float(v)
+              for y, m, v in zip(series['year'], series['month'], series['intensity'])}
+    return {'type': 'interpolated', 'points': points}
@@ -0,0 +1,321 @@
+"""
+INFLUENCE DIAGNOSTICS: LEAVE-ONE-OUT, LEAVE-ONE-YEAR-OUT, LEAVE-ONE-PROVINCE-OUT
+================================================================================
+
+Do a few months drive the estimates (the April 2020 crash, the 2019
+curtailment, a single odd differential)? Every deletion estimate is computed
+in closed form from the full-sample fit. Nothing is refitted row by row.
+
+    single rows (OLS)   hat matrix: with A = (X'X)^+, h_i = x_i'A x_i and
+                        residual e_i,
+                            b - b_(i) = A x_i e_i / (1 - h_i)
+                            SSR_(i)   = SSR - e_i^2 / (1 - h_i)
+    blocks (a year, a   downdate of the cross-products:
+    province)               b_(G) = (X'X - X_G'X_G)^+ (X'y - X_G'y_G)
+
+The second stage uses the first stage's fitted differential, so deleting rows
+changes its regressor as well. As in the incremental refresh, its design is a
+transform W M(g) of the base columns W (IV_BASE_COLUMNS), where M depends on
+the first-stage coefficients g; the caller passes the transform
+(second_stage_transform in pipeline_complete_analysis). Each deletion
+takes g_(G) from the first stage's own downdate, rebuilds M and solves the
+downdated second stage, so the two-step estimate is exact.
+
+Per deleted row or block this reports, for each term of interest:
+
+    dfbeta      b - b_(G), the estimate's drop when G is left out
+    dfbetas     dfbeta / (s_(G) sqrt(A_jj)), with s_(G) the residual standard
+                error without G (statsmodels' dfbetas for single rows)
+    cooks_d     (b - b_(G))' X'X (b - b_(G)) / (rank s^2)
+
+Rows are flagged when |dfbetas| > 2 / sqrt(n) or cooks_d > 4 / n (the usual
+size-adjusted cut-offs). Everything is O(n k^2) plus one small pseudo-inverse
+per block, so panels with every province and decades of months stay instant.
+Blocks whose deletion leaves a term unidentified (e.g. dropping the control
+province) give NaN.
+
+The second stage as specified is rank-deficient: the instrument is a
+combination of line3_post and tmx_post, which are also in the stage. Like
+statsmodels, its coefficients are the minimum-norm solution, and so are the
+deletion estimates. They are reported with identified=False and never
+flagged. The price effect the script reports is the 2SLS with the trend as
+the only control (model 'iv'). Its deletions come from the same downdated
+cross-products of W, which also holds the differential, solved as a 2SLS
+(iv_engine.iv_from_moments). For the 2SLS, the hat matrix is the one of
+Xhat = Z Pi, and the residuals are the structural y - X b.
+"""
+
+import numpy as np
+import pandas as pd
+
+from iv_engine import iv_from_moments
+
+COV_TYPES = ['nonrobust', 'HC0', 'HC1']
+TERMS = {'did': ['line3_did', 'tmx_did'], 'first': ['pipeline_capacity_instrument'],
+         'second': ['differential_predicted'], 'iv': ['wcs_wti_differential']}
+ESTIMABLE_TOL = 1e-8
+PINV_RCOND = 1e-10
+
+
+# ===========================
+# FULL-SAMPLE FITS
+# ===========================
+
+def ols(X, y, cov_type='HC1'):
+    """
+    Coefficients, bread A = (X'X)^+, residuals, rank and covariance of y on X,
+    plus which coefficients are identified (the rest are minimum-norm values,
+    as statsmodels reports them).
+    """
+    if cov_type not in COV_TYPES:
+        raise ValueError(f"cov_type must be one of {COV_TYPES}")
+    A = np.linalg.pinv(X.T @ X, rcond=PINV_RCOND, hermitian=True)
+    params = A @ (X.T @ y)
+    resid = y - X @ params
+    rank = np.linalg.matrix_rank(X)
+    df_resid = len(y) - rank
+    if cov_type == 'nonrobust':
+        cov = resid @ resid / df_resid * A
+    else:
+        cov = A @ (X.T * resid ** 2) @ X @ A
+        if cov_type == 'HC1':
+            cov *= len(y) / df_resid
+    identified = np.abs(np.diag(A @ X.T @ X) - 1) < ESTIMABLE_TOL
+    return {'params': params, 'bread': A, 'resid': resid, 'rank': rank, 'cov': cov,
+            'ssr': float(resid @ resid), 'nobs': len(y), 'identified': identified}
+
+
+def iv(W, y, columns, cov_type='HC1'):
+    """
+    The 2SLS of y on the columns (endog, exog, instruments) of W, as ols()
+    returns it. The bread is (Xhat'Xhat)^+, and 'design' holds Xhat.
+    """
+    if cov_type not in COV_TYPES:
+        raise ValueError(f"cov_type must be one of {COV_TYPES}")
+    endog, exog, instruments = columns
+    params, A, Pi, identified = iv_from_moments(W.T @ W, W.T @ y, endog, exog, instruments)
+    X_hat = W[:, list(instruments) + list(exog)] @ Pi
+    resid = y - W[:, list(endog) + list(exog)] @ np.nan_to_num(params)
+    rank = X_hat.shape[1]
+    df_resid = len(y) - rank
+    if cov_type == 'nonrobust':
+        cov = resid @ resid / df_resid * A
+    else:
+        cov = A @ (X_hat.T * resid ** 2) @ X_hat @ A
+        if cov_type == 'HC1':
+            cov *= len(y) / df_resid
+    return {'params': params, 'bread': A, 'resid': resid, 'rank': rank, 'cov': cov,
+            'ssr': float(resid @ resid), 'nobs': len(y), 'identified': identified, 'design': X_hat}
+
+
+# ===========================
+# DELETION FORMULAS
+# ===========================
+
+def drop_rows(X, fit):
+    """Hat-matrix deletion of each row: (leverage, b_(i) (n, k), SSR_(i))."""
+    h = np.einsum('ni,ij,nj->n', X, fit['bread'], X)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scale = fit['resid'] / (1 - h)
+        params = fit['params'][None, :] - (X @ fit['bread']) * scale[:, None]
+        ssr = fit['ssr'] - fit['resid'] * scale
+    # A row with leverage one is the only support of some coefficient
+    alone = np.isclose(h, 1)
+    params[alone] = np.nan
+    ssr[alone] = np.nan
+    return h, params, ssr
+
+
+def drop_groups(W, y, codes, n_groups, transform=None, identified=None):
+    """
+    Block-downdate deletion of each group of rows: b_(g) of y on W M_g fitted
+    without group g, for codes in 0..n_groups-1. transform is None (M = I) or
+    (n_groups, k, p). Returns (params (G, p), SSR_(g), nobs_(g), rank_(g));
+    coefficients that the full sample identifies (identified, default all)
+    but the rest of the rows do not are NaN.
+    """
+    counts = np.bincount(codes, minlength=n_groups)
+    gram, cross, yty = _downdated(W, y, codes, n_groups)
+    if transform is not None:
+        gram = np.einsum('gki,gkl,glj->gij', transform, gram, transform)
+        cross = np.einsum('gki,gk->gi', transform, cross)
+
+    bread = np.linalg.pinv(gram, rcond=PINV_RCOND, hermitian=True)
+    params = np.einsum('gij,gj->gi', bread, cross)
+    ssr = yty - np.einsum('gi,gi->g', params, cross)
+    rank = np.linalg.matrix_rank(gram, hermitian=True)
+    estimable = np.abs(np.einsum('gij,gji->gi', bread, gram) - 1) < ESTIMABLE_TOL
+    if identified is not None:
+        estimable |= ~identified
+    params[~estimable] = np.nan
+    return params, ssr, len(y) - counts, rank
+
+
+def _downdated(W, y, codes, n_groups):
+    """W'W (G, k, k), W'y (G, k) and y'y (G,) of all rows but each group's."""
+    gram = np.zeros((n_groups,) + (W.shape[1],) * 2)
+    cross = np.zeros((n_groups, W.shape[1]))
+    np.add.at(gram, codes, np.einsum('ni,nj->nij', W, W))
+    np.add.at(cross, codes, W * y[:, None])
+    yty = np.bincount(codes, weights=y * y, minlength=n_groups)
+    return gram.sum(axis=0) - gram, cross.sum(axis=0) - cross, yty.sum() - yty
+
+
+def drop_groups_iv(W, y, codes, n_groups, columns):
+    """
+    drop_groups for the 2SLS of y on the columns (endog, exog, instruments)
+    of W: params (G, p + k) on endog + exog, NaN where the rest of the rows do
+    not identify them, and the structural SSR_(g).
+    """
+    endog, exog, instruments = columns
+    x = list(endog) + list(exog)
+    gram, cross, yty = _downdated(W, y, codes, n_groups)
+    params = iv_from_moments(gram, cross, endog, exog, instruments)[0]
+    b = np.zeros(cross.shape)
+    b[:, x] = np.nan_to_num(params)
+    ssr = yty - 2 * np.einsum('gi,gi->g', b, cross) + np.einsum('gi,gij,gj->g', b, gram, b)
+    return params, ssr, len(y) - np.bincount(codes, minlength=n_groups), np.full(n_groups, len(x))
+
+
+def _drop_second(W, y, codes, n_groups, g, transform, identified):
+    """Second-stage deletions given the first-stage b_(g); NaN where g is."""
+    missing = np.isnan(g).any(axis=1)
+    params, ssr, nobs, rank = drop_groups(W, y, codes, n_groups, transform(np.nan_to_num(g)), identified)
+    params[missing] = np.nan
+    ssr[missing] = np.nan
+    return params, ssr, nobs, rank
+
+
+def _influence(fit, X, params, ssr, nobs, rank):
+    """dfbeta, dfbetas and Cook's distance of deletions with b_(G) = params."""
+    dfbeta = fit['params'][None, :] - params
+    with np.errstate(divide='ignore', invalid='ignore'):
+        s = np.sqrt(ssr / (nobs - rank))
+        dfbetas = dfbeta / (s[:, None] * np.sqrt(np.diag(fit['bread']))[None, :])
+        s2 = fit['ssr'] / (fit['nobs'] - fit['rank'])
+        cooks_d = np.einsum('gi,ij,gj->g', dfbeta, X.T @ X, dfbeta) / (fit['rank'] * s2)
+    return dfbeta, dfbetas, cooks_d
+
+
+# ===========================
+# MODELS
+# ===========================
+
+def _design(df, columns):
+    return np.column_stack([np.ones(len(df))] + [df[c].to_numpy(dtype=float) for c in columns])
+
+
+def influence_diagnostics(df_panel, df_alberta_full, did_regressors, first_regressors,
+                          second_regressors, base_columns, transform, iv_terms=None, cov_type='HC1'):
+    """
+    Deletion diagnostics for the DiD, both two-step stages and, with iv_terms
+    (endog, exog, instruments: lists of base column names), the 2SLS.
+    transform(g) maps first-stage coefficients to M with (base columns) M =
+    second-stage design.
+
+    Returns (rows, groups):
+        rows     one row per model, term and observation: province, date,
+                 leverage, resid, estimate (the full-sample b), identified,
+                 loo_estimate, dfbeta, dfbetas, cooks_d, flagged
+        groups   one row per model, term and deleted year or province: kind,
+                 group, dropped (rows left out), estimate, identified,
+                 loo_estimate, dfbeta, dfbetas, shift_se (dfbeta in
+                 full-sample standard errors)
+    """
+    df_2sls = df_alberta_full.dropna(subset=['wcs_wti_differential'])
+    frames = {'did': df_panel, 'first': df_2sls, 'second': df_2sls}
+    names = {'did': ['const'] + list(did_regressors), 'first': ['const'] + list(first_regressors),
+             'second': ['const'] + list(second_regressors)}
+    if iv_terms is not None:
+        frames['iv'] = df_2sls
+        names['iv'] = list(iv_terms[0]) + list(iv_terms[1])
+        iv_columns = [[base_columns.index(c) for c in terms] for terms in iv_terms]
+    W = _design(df_2sls, base_columns[1:])
+    y2 = df_2sls['production_kbpd'].to_numpy(dtype=float)
+
+    X = {'did': _design(df_panel, did_regressors), 'first': _design(df_2sls, first_regressors)}
+    y = {'did': df_panel['production_kbpd'].to_numpy(dtype=float),
+         'first': df_2sls['wcs_wti_differential'].to_numpy(dtype=float)}
+    fits = {m: ols(X[m], y[m], cov_type) for m in X}
+    X['second'] = W @ transform(fits['first']['params'])
+    y['second'] = y2
+    fits['second'] = ols(X['second'], y2, cov_type)
+    if iv_terms is not None:
+        fits['iv'] = iv(W, y2, iv_columns, cov_type)
+        X['iv'] = fits['iv']['design']
+
+    # Single rows: hat matrix for the OLS models, downdate with M_(i) for the second stage
+    deleted = {}
+    for m in ['did', 'first']:
+        h, params, ssr = drop_rows(X[m], fits[m])
+        deleted[m] = (h, params, ssr, np.full(len(h), fits[m]['nobs'] - 1), np.full(len(h), fits[m]['rank']))
+    n2 = len(y2)
+    if iv_terms is not None:
+        h_iv = np.einsum('ni,ij,nj->n', X['iv'], fits['iv']['bread'], X['iv'])
+        deleted['iv'] = (h_iv,) + drop_groups_iv(W, y2, np.arange(n2), n2, iv_columns)
+    params, ssr, nobs, rank = _drop_second(W, y2, np.arange(n2), n2, deleted['first'][1], transform,
+                                           fits['second']['identified'])
+    h2 = np.einsum('ni,ij,nj->n', X['second'], fits['second']['bread'], X['second'])
+    deleted['second'] = (h2, params, ssr, nobs, rank)
+
+    rows = []
+    for m, (h, params, ssr, nobs, rank) in deleted.items():
+        dfbeta, dfbetas, cooks_d = _influence(fits[m], X[m], params, ssr, nobs, rank)
+        n = fits[m]['nobs']
+        for term in TERMS[m]:
+            j = names[m].index(term)
+            rows.append(pd.DataFrame({
+                'model': m, 'term': term,
+                'province': frames[m]['province'].to_numpy(), 'date': frames[m]['date'].to_numpy(),
+                'leverage': h, 'resid': fits[m]['resid'],
+                'estimate': fits[m]['params'][j], 'identified': fits[m]['identified'][j],
+                'loo_estimate': params[:, j], 'dfbeta': dfbeta[:, j], 'dfbetas': dfbetas[:, j],
+                'cooks_d': cooks_d,
+                'flagged': fits[m]['identified'][j] & ((np.abs(dfbetas[:, j]) > 2 / np.sqrt(n))
+                                                       | (cooks_d > 4 / n)),
+            }))
+
+    # Blocks: each year, and each province where the model has more than one
+    groups = []
+    for kind in ['year', 'province']:
+        blocks = {}
+        for m, df in frames.items():
+            labels, codes = np.unique(df[kind].to_numpy(), return_inverse=True)
+            if len(labels) > 1:
+                blocks[m] = (labels, codes)
+        for m, (labels, codes) in blocks.items():
+            if m == 'second':
+                g = drop_groups(X['first'], y['first'], codes, len(labels),
+                                identified=fits['first']['identified'])[0]
+                result = _drop_second(W, y2, codes, len(labels), g, transform, fits['second']['identified'])
+            elif m == 'iv':
+                result = drop_groups_iv(W, y2, codes, len(labels), iv_columns)
+            else:
+                result = drop_groups(X[m], y[m], codes, len(labels), identified=fits[m]['identified'])
+            params = result[0]
+            dfbeta, dfbetas, _ = _influence(fits[m], X[m], *result)
+            se = np.sqrt(np.diag(fits[m]['cov']))
+            for term in TERMS[m]:
+                j = names[m].index(term)
+                groups.append(pd.DataFrame({
+                    'model': m, 'term': term, 'kind': kind, 'group': labels.astype(str),
+                    'dropped': np.bincount(codes, minlength=len(labels)),
+                    'estimate': fits[m]['params'][j], 'identified': fits[m]['identified'][j],
+                    'loo_estimate': params[:, j], 'dfbeta': dfbeta[:, j], 'dfbetas': dfbetas[:, j],
+                    'shift_se': dfbeta[:, j] / se[j],
+                }))
+    return pd.concat(rows, ignore_index=True), pd.concat(groups, ignore_index=True)
+
+
+def flagged_months(rows):
+    """Months with a flagged row in any model: the models/terms and the largest |dfbetas|."""
+    flagged = rows[rows['flagged']].assign(abs_dfbetas=lambda d: d['dfbetas'].abs())
+    if flagged.empty:
+        return pd.DataFrame(columns=['date', 'flags', 'max_abs_dfbetas', 'worst'])
+    worst = flagged.sort_values('abs_dfbetas', ascending=False).drop_duplicates('date')
+    summary = flagged.groupby('date').agg(
+        flags=('term', lambda t: ', '.join(sorted(set(t)))),
+        max_abs_dfbetas=('abs_dfbetas', 'max'))
+    summary['worst'] = worst.set_index('date').apply(
+        lambda r: f"{r['term']} ({r['province']}) {r['dfbeta']:+.3g}", axis=1)
+    return summary.sort_values('max_abs_dfbetas', ascending=False).reset_index()
@@ -0,0 +1,195 @@
+"""
+CONTENT-HASHED INGEST CACHE
+===========================
+
+Parsed input frames (StatsCan production, CER rail, prices) are stored on disk
+keyed by a hash of the source files' bytes plus the parameters used to build
+them. A cached frame is one .npy file per column plus a meta.json, so later runs
+memory-map the columns instead of re-parsing the workbook or CSV.
+
+    cache = IngestCache()
+    df_rail = cache.frame('rail', ['canadian-crude-oil-exports-rail-monthly-data.xlsx'],
+                          build=lambda: parse_rail(...), params={'start': 2018})
+
+Invalidation is automatic: editing a source file changes its hash and so the
+key. Source hashes are memoised by (size, mtime) so unchanged files are not
+re-read. The cache is bounded by max_bytes; least-recently-used entries are
+evicted after every store.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_CACHE_DIR = '.ingest_cache'
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+CACHE_FORMAT = 1
+
+INDEX_FILE = 'index.json'
+META_FILE = 'meta.json'
+HASH_BLOCK = 1 << 20
+
+
+def file_digest(path):
+    """blake2b hex digest of a file's contents, read in 1 MB blocks."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _column_to_array(series):
+    """Return (array, column meta) for one column in a mmap-friendly dtype."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        categories = series.cat.categories
+        return (np.asarray(series.cat.codes.to_numpy()),
+                {'kind': 'category', 'categories': categories.astype(str).tolist()})
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series.to_numpy(dtype='datetime64[ns]'), {'kind': 'datetime'}
+    if pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+        return series.to_numpy(), {'kind': 'numeric'}
+    # Strings and other objects: fixed-width unicode keeps them mmap-able
+    return series.astype(str).to_numpy(dtype=str), {'kind': 'string'}
+
+
+def _array_to_column(array, meta):
+    if meta['kind'] == 'category':
+        return pd.Categorical.from_codes(array, categories=meta['categories'])
+    if meta['kind'] == 'string':
+        return array.astype(object)
+    return array
+
+
+def write_frame(frame, directory):
+    """Store a DataFrame as one .npy per column plus meta.json."""
+    columns = []
+    for i, name in enumerate(frame.columns):
+        array, meta = _column_to_array(frame[name])
+        filename = f"c{i}.npy"
+        np.save(os.path.join(directory, filename), array, allow_pickle=False)
+        columns.append({'name': str(name), 'file': filename, **meta})
+    with open(os.path.join(directory, META_FILE), 'w') as f:
+        json.dump({'format': CACHE_FORMAT, 'rows': len(frame), 'columns': columns}, f)
+
+
+def read_frame(directory, mmap=True):
+    """Load a frame written by write_frame; numeric columns stay memory-mapped."""
+    with open(os.path.join(directory, META_FILE)) as f:
+        meta = json.load(f)
+    mode = 'r' if mmap else None
+    data = {}
+    for col in meta['columns']:
+        array = np.load(os.path.join(directory, col['file']), mmap_mode=mode, allow_pickle=False)
+        data[col['name']] = _array_to_column(array, col)
+    return pd.DataFrame(data, copy=False)
+
+
+class IngestCache:
+    """Size-bounded, content-addressed store of parsed input frames."""
+
+    def __init__(self, root=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, mmap=True):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.mmap = mmap
+        self.stats = {'hits': 0, 'misses': 0}
+        os.makedirs(root, exist_ok=True)
+        self._index_path = os.path.join(root, INDEX_FILE)
+        self._index = self._load_index()
+
+    # ---- index bookkeeping ----
+
+    def _load_index(self):
+        try:
+            with open(self._index_path) as f:
+                index = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            index = {}
+        index.setdefault('entries', {})
+        index.setdefault('sources', {})
+        return index
+
+    def _save_index(self):
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix='.json')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self._index, f)
+        os.replace(tmp, self._index_path)
+
+    def source_digest(self, path):
+        """Content digest of a source file, memoised by (size, mtime_ns)."""
+        st = os.stat(path)
+        stamp = [st.st_size, st.st_mtime_ns]
+        key = os.path.abspath(path)
+        known = self._index['sources'].get(key)
+        if known is not None and known['stamp'] == stamp:
+            return known['digest']
+        digest = file_digest(path)
+        self._index['sources'][key] = {'stamp': stamp, 'digest': digest}
+        return digest
+
+    def key(self, name, sources=(), params=None):
+        h = hashlib.blake2b(digest_size=16)
+        h.update(f"{CACHE_FORMAT}:{name}".encode())
+        for path in sources:
+            h.update(self.source_digest(path).encode())
+        h.update(json.dumps(params or {}, sort_keys=True, default=str).encode())
+        return f"{name}-{h.hexdigest()}"
+
+    # ---- public API ----
+
+    def frame(self, name, sources, build, params=None):
+        """
+        Return the cached frame for (name, source contents, params), calling
+        build() and storing its result on a miss.
+        """
+        key = self.key(name, sources, params)
+        directory = os.path.join(self.root, key)
+        entry = self._index['entries'].get(key)
+
+        if entry is not None and os.path.isdir(directory):
+            entry['atime'] = time.time()
+            self.stats['hits'] += 1
+            self._save_index()
+            return read_frame(directory, mmap=self.mmap)
+
+        self.stats['misses'] += 1
+        frame = build()
+        self._store(key, frame)
+        return frame
+
+    def _store(self, key, frame):
+        directory = os.path.join(self.root, key)
+        staging = tempfile.mkdtemp(dir=self.root, prefix='.tmp-')
+        try:
+            write_frame(frame, staging)
+            shutil.rmtree(directory, ignore_errors=True)
+            os.replace(staging, directory)
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        size = sum(os.path.getsize(os.path.join(directory, f)) for f in os.listdir(directory))
+        self._index['entries'][key] = {'bytes': size, 'atime': time.time()}
+        self._evict()
+        self._save_index()
+
+    def _evict(self):
+        entries = self._index['entries']
+        total = sum(e['bytes'] for e in entries.values())
+        for key in sorted(entries, key=lambda k: entries[k]['atime']):
+            if total <= self.max_bytes:
+                break
+            total -= entries[key]['bytes']
+            shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
+            del entries[key]
+
+    def clear(self):
+        for key in list(self._index['entries']):
+            shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
+        self._index = {'entries': {}, 'sources': {}}
+        self._save_index()
@@ -0,0 +1,158 @@
+"""
+MONTHLY EMISSIONS-INTENSITY SCHEDULES AND SCENARIO MATRIX
+=========================================================
+
+A schedule gives an intensity (kg CO2e/bbl) for every month of the analysis.
+It is described by a plain dict, so scenario sets can live in JSON:
+
+    {"type": "geometric", "base": 75, "decline_rate": 0.02}
+        base x (1 - rate)^(years since start); "compounding": "monthly" for a
+        smooth monthly decline instead of annual steps
+    {"type": "piecewise", "points": {"2018-01": 75, "2022-01": 68}}
+        step function: each value holds from its month until the next point
+    {"type": "interpolated", "points": {"2018-01": 75, "2024-12": 62}}
+        linear in time between points, flat outside them
+    {"type": "monthly", "values": [...]}
+        one value per month of the analysis
+    {"type": "mix", "components": {"sagd": {...}, "mining": {...}},
+                    "shares": {"sagd": 0.55, "mining": {"2018-01": 0.45, "2024-12": 0.40}}}
+        weighted average of component schedules. A share is a constant or an
+        interpolated path, and shares are renormalised every month.
+    a number
+        constant intensity
+
+Many named scenarios are stacked into an intensity matrix S (scenarios x
+months). Every scenario's period emissions then come from one matrix product,
+
+    (S * production) @ P,
+
+where P (months x periods) averages the months of each period. That gives the
+mean of production x intensity over the period's months.
+"""
+
+import json
+
+import numpy as np
+import pandas as pd
+
+DAYS_PER_YEAR = 365.25
+PERIODS = ['pre', 'post_line3', 'post_tmx']
+
+
+# ===========================
+# SCHEDULES
+# ===========================
+
+def month_index(df):
+    """Months since year 0 for each row (year * 12 + month - 1)."""
+    return (df['year'].to_numpy() * 12 + df['month'].to_numpy() - 1).astype(np.int64)
+
+
+def _parse_month(key):
+    if isinstance(key, str):
+        year, month = key.split('-')
+        return int(year) * 12 + int(month) - 1
+    year, month = key
+    return int(year) * 12 + int(month) - 1
+
+
+def _points(points):
+    knots = sorted((_parse_month(k), float(v)) for k, v in points.items())
+    return np.array([k for k, _ in knots]), np.array([v for _, v in knots])
+
+
+def _path(value, months):
+    """A constant or an interpolated {month: value} path over months."""
+    if isinstance(value, dict):
+        x, y = _points(value)
+        return np.interp(months, x, y)
+    return np.full(len(months), float(value))
+
+
+def build_schedule(spec, months):
+    """Intensity for each of `months` (from month_index) from one schedule spec."""
+    months = np.asarray(months)
+    if isinstance(spec, (int, float)):
+        return np.full(len(months), float(spec))
+
+    kind = spec.get('type')
+    if kind == 'geometric':
+        start = months.min()
+        if spec.get('compounding', 'annual') == 'monthly':
+            years_since_start = (months - start) / 12
+        else:
+            years_since_start = months // 12 - start // 12
+        return spec['base'] * (1 - spec['decline_rate']) ** years_since_start
+    if kind == 'piecewise':
+        x, y = _points(spec['points'])
+        return y[np.clip(np.searchsorted(x, months, side='right') - 1, 0, len(y) - 1)]
+    if kind == 'interpolated':
+        return _path(spec['points'], months)
+    if kind == 'monthly':
+        values = np.asarray(spec['values'], dtype=float)
+        if len(values) != len(months):
+            raise ValueError(f"monthly schedule has {len(values)} values for {len(months)} months")
+        return values
+    if kind == 'mix':
+        names = list(spec['components'])
+        components = np.stack([build_schedule(spec['components'][n], months) for n in names])
+        shares = np.stack([_path(spec['shares'][n], months) for n in names])
+        return (components * shares).sum(axis=0) / shares.sum(axis=0)
+    raise ValueError(f"unknown schedule type '{kind}' "
+                     "(use geometric, piecewise, interpolated, monthly or mix)")
+
+
+def scenario_matrix(scenarios, months):
+    """(names, S) with S[i] the monthly intensity of scenario names[i]."""
+    names = list(scenarios)
+    return names, np.stack([build_schedule(scenarios[n], months) for n in names])
+
+
+def load_scenarios(path):
+    """Named schedule specs from a JSON file ({name: spec})."""
+    with open(path) as f:
+        return json.load(f)
+
+
+# ===========================
+# EVALUATION
+# ===========================
+
+def period_matrix(df_alberta_full):
+    """Months x periods matrix whose columns average the months of pre / post-Line 3 / post-TMX."""
+    line3 = df_alberta_full['line3_post'].to_numpy() == 1
+    tmx = df_alberta_full['tmx_post'].to_numpy() == 1
+    P = np.column_stack([~line3, line3 & ~tmx, tmx]).astype(float)
+    counts = P.sum(axis=0)
+    return np.divide(P, counts, out=np.full_like(P, np.nan), where=counts > 0)
+
+
+def evaluate_scenarios(df_alberta_full, scenarios):
+    """
+    Period emissions and deltas (Mt CO2e/year) for every scenario in one pass.
+
+    Returns a frame indexed by scenario name with pre, post_line3, post_tmx,
+    line3_delta, tmx_delta and total_delta.
+    """
+    names, S = scenario_matrix(scenarios, month_index(df_alberta_full))
+    production = df_alberta_full['production_kbpd'].to_numpy(dtype=float)
+    E = (S * production[None, :]) @ period_matrix(df_alberta_full) * DAYS_PER_YEAR / 1_000_000
+
+    result = pd.DataFrame(E, index=pd.Index(names, name='scenario'), columns=PERIODS)
+    result['line3_delta'] = result['post_line3'] - result['pre']
+    result['tmx_delta'] = result['post_tmx'] - result['post_line3']
+    result['total_delta'] = result['post_tmx'] - result['pre']
+    return result
+
+
+def default_scenarios(base_intensity=75.0, constant_intensity=67.0):
+    """A small comparison set around the script's assumptions."""
+    return {
+        'constant': constant_intensity,
+        'decline_0%': {'type': 'geometric', 'base': base_intensity, 'decline_rate': 0.0},
+        'decline_1.3%': {'type': 'geometric', 'base': base_intensity, 'decline_rate': 0.013},
+        'decline_2%': {'type': 'geometric', 'base': base_intensity, 'decline_rate': 0.02},
+        'decline_2%_monthly': {'type': 'geometric', 'base': base_intensity, 'decline_rate': 0.02,
+                               'compounding': 'monthly'},
+        'decline_3%': {'type': 'geometric', 'base': base_intensity, 'decline_rate': 0.03},
+    }
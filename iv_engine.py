@@ -0,0 +1,304 @@
+"""
+BATCHED 2SLS / LIML ENGINE
+==========================
+
+Instrumental-variables estimates for many outcomes or instrument definitions
+at once:
+
+    y = endog @ beta + exog @ gamma + u,    endog instrumented by [exog, instruments]
+
+The included exogenous regressors (constant, trend, ...) are QR-factored once
+and partialled out of everything (Frisch-Waugh-Lovell). Each batch then only
+needs the QR of its few partialled instruments. Coefficients, standard errors
+and diagnostics are all computed from those factors:
+
+    method      '2sls' (k = 1) or 'liml' (k = smallest root of the LIML
+                eigenproblem)
+    cov_type    'nonrobust', 'HC0', 'HC1', 'HC2', 'HC3' or 'HAC' (Newey-West
+                with a Bartlett kernel; rows must be in time order). The errors
+                use the structural residuals y - endog @ beta, not the
+                second-stage residuals of a plug-in two-step fit.
+    first_f     first-stage F of the excluded instruments, per endogenous
+                regressor
+    kp_rk       Kleibergen-Paap rk Wald statistic for underidentification,
+                chi2(l - p + 1), and kp_f = kp_rk / l
+    ar          Anderson-Rubin test of beta = beta0 (robust to weak
+                instruments)
+
+The statistics use the chosen cov_type. Inputs may be stacked: y (b, n),
+endog (b, n, p) and instruments (b, n, l) broadcast against each other. Every
+result has a leading batch axis, with b = 1 when nothing is stacked.
+
+Excluded instruments that lie in the span of the exogenous regressors leave
+the model unidentified. Those batches come back with identified=False and NaN
+estimates; no pseudo-inverse answer is made up.
+
+iv_from_moments gives the same 2SLS from the cross-products W'W and W'y of a
+design W holding the endogenous, exogenous and instrument columns, for callers
+that keep those instead of the rows (the incremental refresh, the block
+deletions of the influence diagnostics).
+"""
+
+import numpy as np
+
+COV_TYPES = ('nonrobust', 'HC0', 'HC1', 'HC2', 'HC3', 'HAC')
+RANK_TOL = 1e-8   # partialled instrument norm relative to the raw instrument
+MOMENT_RCOND = 1e-10
+ESTIMABLE_TOL = 1e-8
+
+
+# ===========================
+# SHARED PIECES
+# ===========================
+
+def exog_factor(exog):
+    """Thin QR of the included exogenous regressors: (Q, R)."""
+    exog = np.asarray(exog, dtype=float)
+    if exog.ndim == 1:
+        exog = exog[:, None]
+    return np.linalg.qr(exog)
+
+
+def _partial(Q, A):
+    """A (b, n, m) with the column space of Q (n, k) removed."""
+    return A - np.einsum('nk,bkm->bnm', Q, np.einsum('nk,bnm->bkm', Q, A))
+
+
+def _batched(a, columns):
+    a = np.asarray(a, dtype=float)
+    if columns:
+        if a.ndim == 1:
+            a = a[:, None]
+        return a[None] if a.ndim == 2 else a
+    return a[None, :, None] if a.ndim == 1 else a[:, :, None]
+
+
+def hac_lags(n):
+    """Newey-West rule of thumb, floor(4 (n/100)^(2/9))."""
+    return int(np.floor(4 * (n / 100) ** (2 / 9)))
+
+
+def _meat(scores, cov_type, lags):
+    """Sum of score outer products (b, m, m), with Bartlett-weighted autocovariances for HAC."""
+    meat = np.einsum('bni,bnj->bij', scores, scores)
+    if cov_type == 'HAC':
+        for j in range(1, lags + 1):
+            gamma = np.einsum('bni,bnj->bij', scores[:, j:], scores[:, :-j])
+            meat += (1 - j / (lags + 1)) * (gamma + np.swapaxes(gamma, 1, 2))
+    return meat
+
+
+def _cov(bread, regressors, resid, leverage, sigma_dof, cov_type, lags):
+    """
+    Covariance of coefficients whose estimating equations are
+    regressors' resid = 0, with bread (b, m, m) = (regressors' X)^-1.
+    """
+    n = resid.shape[1]
+    if cov_type == 'nonrobust':
+        sigma2 = (resid ** 2).sum(axis=1) / sigma_dof
+        return bread @ np.einsum('bni,bnj->bij', regressors, regressors) @ np.swapaxes(bread, 1, 2) \
+            * sigma2[:, None, None]
+    if cov_type not in COV_TYPES:
+        raise ValueError(f"unsupported cov_type '{cov_type}' (use one of {', '.join(COV_TYPES)})")
+
+    u = resid
+    if cov_type == 'HC2':
+        u = resid / np.sqrt(1 - leverage)
+    elif cov_type == 'HC3':
+        u = resid / (1 - leverage)
+    cov = bread @ _meat(regressors * u[:, :, None], cov_type, lags) @ np.swapaxes(bread, 1, 2)
+    if cov_type == 'HC1':
+        cov = cov * (n / sigma_dof)[:, None, None]
+    return cov
+
+
+def _wald_on_instruments(Zt, r, leverage, dof, cov_type, lags):
+    """Wald statistic that all coefficients of r (b, n) on Zt (b, n, l) are zero."""
+    ZZ_inv = np.linalg.pinv(np.einsum('bni,bnj->bij', Zt, Zt))
+    coef = np.einsum('bij,bnj,bn->bi', ZZ_inv, Zt, r)
+    e = r - np.einsum('bnl,bl->bn', Zt, coef)
+    cov = _cov(ZZ_inv, Zt, e, leverage, dof, cov_type, lags)
+    return np.einsum('bi,bij,bj->b', coef, np.linalg.pinv(cov), coef)
+
+
+def _sqrt_psd(A):
+    w, v = np.linalg.eigh(A)
+    return np.einsum('bij,bj,bkj->bik', v, np.sqrt(np.clip(w, 0, None)), v)
+
+
+def _inv_sqrt_psd(A):
+    w, v = np.linalg.eigh(A)
+    return np.einsum('bij,bj,bkj->bik', v, 1 / np.sqrt(w), v)
+
+
+def kleibergen_paap(Zt, Xt, leverage, dof, cov_type, lags):
+    """
+    Kleibergen-Paap (2006) rk Wald statistic for rank(Pi) = p - 1 in the first
+    stage Xt = Zt Pi + V, with Theta = (Z'Z/n)^(1/2) Pi (V'V/n)^(-1/2).
+    """
+    b, n, l = Zt.shape
+    p = Xt.shape[-1]
+    q = p - 1
+    ZZ = np.einsum('bni,bnj->bij', Zt, Zt)
+    ZZ_inv = np.linalg.pinv(ZZ)
+    Pi = ZZ_inv @ np.einsum('bni,bnj->bij', Zt, Xt)
+    V = Xt - Zt @ Pi
+
+    # Covariance of vec(Pi) (columns stacked): bread I_p (x) (Z'Z)^-1, scores v_i (x) z_i
+    bread = np.einsum('pq,bij->bpiqj', np.eye(p), ZZ_inv).reshape(b, p * l, p * l)
+    if cov_type == 'nonrobust':
+        S_vv = np.einsum('bni,bnj->bij', V, V) / dof[:, None, None]
+        cov_pi = np.einsum('bpq,bij->bpiqj', S_vv, ZZ_inv).reshape(b, p * l, p * l)
+    else:
+        scores = np.einsum('bnp,bnl->bnpl', V, Zt).reshape(b, n, p * l)
+        if cov_type == 'HC2':
+            scores = scores / np.sqrt(1 - leverage)[:, :, None]
+        elif cov_type == 'HC3':
+            scores = scores / (1 - leverage)[:, :, None]
+        cov_pi = bread @ _meat(scores, cov_type, lags) @ bread
+        if cov_type == 'HC1':
+            cov_pi = cov_pi * (n / dof)[:, None, None]
+
+    G = np.swapaxes(np.linalg.cholesky(ZZ / n), 1, 2)
+    F = _inv_sqrt_psd(np.einsum('bni,bnj->bij', V, V) / n)
+    Theta = G @ Pi @ np.swapaxes(F, 1, 2)
+    U, _, Vt = np.linalg.svd(Theta)
+    W = np.swapaxes(Vt, 1, 2)
+
+    U12, U22 = U[:, :q, q:], U[:, q:, q:]
+    V12, V22 = W[:, :q, q:], W[:, q:, q:]
+    A_perp = np.concatenate([U12, U22], axis=1) @ np.linalg.inv(U22) @ _sqrt_psd(U22 @ np.swapaxes(U22, 1, 2))
+    B_perp_t = (_sqrt_psd(V22 @ np.swapaxes(V22, 1, 2)) @ np.linalg.inv(np.swapaxes(V22, 1, 2))
+                @ np.concatenate([np.swapaxes(V12, 1, 2), np.swapaxes(V22, 1, 2)], axis=2))
+
+    # lambda = A' Theta B = K vec(Pi) with K = (B' (x) A')(F (x) G)
+    K = np.einsum('bij,bkl->bikjl', B_perp_t, np.swapaxes(A_perp, 1, 2))
+    K = K.reshape(b, B_perp_t.shape[1] * A_perp.shape[2], p * l)
+    K = K @ np.einsum('bij,bkl->bikjl', F, G).reshape(b, p * l, p * l)
+    lam = np.einsum('bij,bj->bi', K, np.swapaxes(Pi, 1, 2).reshape(b, p * l))
+    omega = K @ cov_pi @ np.swapaxes(K, 1, 2)
+    return np.einsum('bi,bij,bj->b', lam, np.linalg.pinv(omega), lam)
+
+
+# ===========================
+# ESTIMATOR
+# ===========================
+
+def fit_iv(y, endog, exog, instruments, method='2sls', cov_type='HC1', lags=None,
+           beta0=0.0, factor=None):
+    """
+    Batched k-class IV fit. exog is the (n, k) included exogenous design; pass
+    factor=exog_factor(exog) to reuse its QR across calls.
+
+    Returns a dict of arrays with a leading batch axis: params, bse, pvalues
+    (endogenous coefficients), exog_params, kappa, identified, first_f,
+    first_f_p, kp_rk, kp_rk_p, kp_f, ar_stat, ar_p, plus n, df_resid, lags,
+    method and cov_type.
+    """
+    from scipy import stats
+
+    if method not in ('2sls', 'liml'):
+        raise ValueError(f"unknown method '{method}' (use '2sls' or 'liml')")
+    if cov_type not in COV_TYPES:
+        raise ValueError(f"unsupported cov_type '{cov_type}' (use one of {', '.join(COV_TYPES)})")
+
+    Qw, Rw = factor if factor is not None else exog_factor(exog)
+    Y = _batched(y, columns=False)
+    X = _batched(endog, columns=True)
+    Z = _batched(instruments, columns=True)
+    b = max(len(Y), len(X), len(Z))
+    Y, X, Z = (np.broadcast_to(a, (b,) + a.shape[1:]) for a in (Y, X, Z))
+    n, k = Qw.shape
+    p, l = X.shape[-1], Z.shape[-1]
+    lags = hac_lags(n) if lags is None else lags
+
+    Yt, Xt, Zt = _partial(Qw, Y), _partial(Qw, X), _partial(Qw, Z)
+    raw = np.linalg.norm(Z, axis=1).max(axis=1)
+    smallest = np.linalg.svd(Zt, compute_uv=False).min(axis=1)
+    identified = (smallest > RANK_TOL * raw) & (l >= p)
+    Zt = np.where(identified[:, None, None], Zt, 0.0)
+    Qz, _ = np.linalg.qr(Zt)
+    Qz = np.where(identified[:, None, None], Qz, 0.0)
+    PX = np.einsum('bnl,blp->bnp', Qz, np.einsum('bnl,bnp->blp', Qz, Xt))
+
+    if method == 'liml':
+        Ybar = np.concatenate([Yt, Xt], axis=-1)
+        S0 = np.einsum('bni,bnj->bij', Ybar, Ybar)
+        MY = Ybar - np.einsum('bnl,blj->bnj', Qz, np.einsum('bnl,bnj->blj', Qz, Ybar))
+        L = np.linalg.cholesky(np.einsum('bni,bnj->bij', MY, MY))
+        L_inv = np.linalg.inv(L)
+        kappa = np.linalg.eigvalsh(L_inv @ S0 @ np.swapaxes(L_inv, 1, 2))[:, 0]
+    else:
+        kappa = np.ones(b)
+
+    H = Xt - kappa[:, None, None] * (Xt - PX)
+    A = np.einsum('bnp,bnq->bpq', H, Xt)
+    identified &= np.linalg.matrix_rank(A) == p
+    bread = np.linalg.pinv(A)
+    params = np.einsum('bpq,bnq,bn->bp', bread, H, Yt[:, :, 0])
+    resid = Yt[:, :, 0] - np.einsum('bnp,bp->bn', Xt, params)
+    exog_params = np.linalg.solve(Rw, np.einsum('nk,bn->kb', Qw, Y[:, :, 0] - np.einsum('bnp,bp->bn', X, params))).T
+
+    df_resid = np.full(b, n - k - p, dtype=float)
+    leverage = (Qw ** 2).sum(axis=1)[None, :] + (Qz ** 2).sum(axis=2)
+    cov = _cov(bread, H, resid, leverage, df_resid, cov_type, lags)
+    bse = np.sqrt(np.clip(np.diagonal(cov, axis1=1, axis2=2), 0, None))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = np.abs(params / bse)
+    pvalues = 2 * (stats.t.sf(z, df_resid[:, None]) if cov_type == 'nonrobust' else stats.norm.sf(z))
+
+    # Diagnostics, all on the partialled first stage / reduced form
+    first_dof = np.full(b, n - k - l, dtype=float)
+    first_f = np.stack([_wald_on_instruments(Zt, Xt[:, :, j], leverage, first_dof, cov_type, lags) / l
+                        for j in range(p)], axis=1)
+    ar_wald = _wald_on_instruments(Zt, Yt[:, :, 0] - Xt @ np.broadcast_to(beta0, (p,)), leverage,
+                                   first_dof, cov_type, lags)
+    kp_rk = np.full(b, np.nan)
+    ok = np.flatnonzero(identified)
+    if len(ok):
+        kp_rk[ok] = kleibergen_paap(Zt[ok], Xt[ok], leverage[ok], first_dof[ok], cov_type, lags)
+    if cov_type == 'nonrobust':
+        first_f_p = stats.f.sf(first_f, l, first_dof[:, None])
+        ar_p = stats.f.sf(ar_wald / l, l, first_dof)
+    else:
+        first_f_p = stats.chi2.sf(first_f * l, l)
+        ar_p = stats.chi2.sf(ar_wald, l)
+
+    out = {
+        'params': params, 'bse': bse, 'pvalues': pvalues, 'exog_params': exog_params,
+        'kappa': kappa, 'identified': identified,
+        'first_f': first_f, 'first_f_p': first_f_p,
+        'kp_rk': kp_rk, 'kp_rk_p': stats.chi2.sf(kp_rk, l - p + 1), 'kp_f': kp_rk / l,
+        'ar_stat': ar_wald / l, 'ar_p': ar_p,
+    }
+    for key in ['params', 'bse', 'pvalues', 'exog_params', 'kappa', 'first_f', 'first_f_p',
+                'ar_stat', 'ar_p']:
+        out[key] = np.where(identified.reshape((b,) + (1,) * (out[key].ndim - 1)), out[key], np.nan)
+    out.update({'n': n, 'df_resid': df_resid, 'lags': lags if cov_type == 'HAC' else None,
+                'method': method, 'cov_type': cov_type})
+    return out
+
+
+# ===========================
+# FROM CROSS-PRODUCTS
+# ===========================
+
+def iv_from_moments(gram, cross, endog, exog, instruments):
+    """
+    2SLS from gram = W'W (..., m, m) and cross = W'y (..., m), with endog,
+    exog and instruments column indices into W. Returns (params, bread, Pi,
+    estimable): params on the columns endog + exog, bread = (Xhat'Xhat)^+,
+    Pi with Xhat = Z Pi for Z = instruments + exog, and which coefficients are
+    identified. The others are NaN.
+    """
+    x = list(endog) + list(exog)
+    z = list(instruments) + list(exog)
+    gram = np.asarray(gram, dtype=float)
+    S_zx = gram[..., z, :][..., :, x]
+    Pi = np.linalg.pinv(gram[..., z, :][..., :, z], rcond=MOMENT_RCOND, hermitian=True) @ S_zx
+    A = np.swapaxes(S_zx, -1, -2) @ Pi
+    bread = np.linalg.pinv(A, rcond=MOMENT_RCOND, hermitian=True)
+    params = (bread @ np.swapaxes(Pi, -1, -2) @ np.asarray(cross, dtype=float)[..., z, None])[..., 0]
+    estimable = np.abs(np.diagonal(bread @ A, axis1=-2, axis2=-1) - 1) < ESTIMABLE_TOL
+    params = np.where(estimable, params, np.nan)
+    return params, bread, Pi, estimable
@@ -0,0 +1,273 @@
+"""
+COMPACT PANEL SCHEMA AND COLUMNAR EXPORT
+========================================
+
+The panel frames (df_panel, df_alberta_2sls) carry object province strings
+and int64/float64 everywhere. compact_panel narrows them to:
+
+    province                categorical
+    year, time_trend        int16
+    month                   int8
+    treated, *_post, *_did  int8
+    date                    month start (datetime64[M] on disk; pandas holds
+                            it as datetime64[s], its coarsest unit)
+    measures                float64, or float32 with float32=True
+
+write_panel stores a compact frame as a columnar dataset, partitioned by
+province and year:
+
+    parquet / feather       through pyarrow, when it is installed; hive-style
+                            directories, province=Alberta/year=2021/
+    npy                     one .npy per column, rows grouped by partition and
+                            each partition's row range in the header; no extra
+                            dependency, read back memory-mapped
+    auto                    parquet if pyarrow imports, else npy
+
+Every dataset has a _schema.json header at its root: format name, schema
+version, engine, rows, column dtypes, province categories and the partition
+list. Parquet and Feather files also carry the header in their schema
+metadata. read_panel checks the header and returns the compact frame,
+optionally only some provinces and years, without parsing any text.
+
+The analysis itself keeps its float64 frames, so the estimates do not
+depend on the export format.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+FORMAT_NAME = 'pipeline-panel'
+SCHEMA_VERSION = 1
+SCHEMA_FILE = '_schema.json'
+ENGINES = ['auto', 'parquet', 'feather', 'npy']
+PARTITION_COLUMNS = ['province', 'year']
+FLAG_COLUMNS = ['treated', 'line3_post', 'tmx_post', 'line3_did', 'tmx_did']
+INTEGER_COLUMNS = {'year': 'int16', 'month': 'int8', 'time_trend': 'int16', **{c: 'int8' for c in FLAG_COLUMNS}}
+DATE_DISK = 'datetime64[M]'
+DATE_MEMORY = 'datetime64[s]'
+ARROW_METADATA_KEY = b'pipeline_panel_schema'
+
+
+# ===========================
+# SCHEMA
+# ===========================
+
+def compact_panel(df, float32=False, categories=None):
+    """The frame with the compact schema above; values are range-checked, not clipped."""
+    out = {}
+    for name in df.columns:
+        column = df[name]
+        if name == 'province':
+            values = column.astype(str)
+            out[name] = pd.Categorical(values, categories=categories or sorted(set(values)))
+        elif name == 'date':
+            out[name] = pd.to_datetime(column).to_numpy().astype('datetime64[M]').astype(DATE_MEMORY)
+        elif name in INTEGER_COLUMNS:
+            dtype = np.dtype(INTEGER_COLUMNS[name])
+            values = column.to_numpy()
+            info = np.iinfo(dtype)
+            if len(values) and (values.min() < info.min or values.max() > info.max):
+                raise ValueError(f"{name} does not fit {dtype}")
+            out[name] = values.astype(dtype)
+        elif float32 and pd.api.types.is_float_dtype(column):
+            out[name] = column.to_numpy(dtype=np.float32)
+        else:
+            out[name] = column.to_numpy()
+    return pd.DataFrame(out, index=pd.RangeIndex(len(df)))
+
+
+def _dtype_name(name, series):
+    if name == 'date':
+        return DATE_DISK
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return 'category'
+    return str(series.dtype)
+
+
+def schema_header(frame, engine, partitions):
+    return {
+        'format': FORMAT_NAME,
+        'schema_version': SCHEMA_VERSION,
+        'engine': engine,
+        'rows': int(len(frame)),
+        'partitioning': PARTITION_COLUMNS,
+        'columns': [{'name': str(c), 'dtype': _dtype_name(c, frame[c])} for c in frame.columns],
+        'categories': {'province': frame['province'].cat.categories.tolist()},
+        'partitions': partitions,
+    }
+
+
+def read_schema(path):
+    """The _schema.json header of a dataset, checked for format and version."""
+    with open(os.path.join(path, SCHEMA_FILE)) as f:
+        header = json.load(f)
+    if header.get('format') != FORMAT_NAME:
+        raise ValueError(f"{path} is not a {FORMAT_NAME} dataset")
+    if header.get('schema_version', 0) > SCHEMA_VERSION:
+        raise ValueError(f"{path} has schema version {header['schema_version']}; "
+                         f"this code reads up to {SCHEMA_VERSION}")
+    return header
+
+
+def _partitions(frame):
+    """[(province, year, row positions)] in sorted order."""
+    keys = frame[PARTITION_COLUMNS].copy()
+    keys['province'] = keys['province'].astype(str)
+    groups = keys.groupby(PARTITION_COLUMNS, sort=True).indices
+    return [(province, int(year), rows) for (province, year), rows in groups.items()]
+
+
+def _partition_dir(province, year):
+    return os.path.join(f'province={province}', f'year={year}')
+
+
+# ===========================
+# WRITE
+# ===========================
+
+def resolve_engine(engine='auto'):
+    if engine not in ENGINES:
+        raise ValueError(f"engine must be one of {ENGINES}")
+    if engine != 'auto':
+        return engine
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return 'npy'
+    return 'parquet'
+
+
+def _write_npy(frame, directory, parts):
+    # One file per column with rows grouped by partition; the header records
+    # each partition's row range, so there is no directory per partition
+    order = np.concatenate([rows for _, _, rows in parts]) if parts else np.arange(0)
+    for name in frame.columns:
+        if name in PARTITION_COLUMNS:
+            continue
+        values = frame[name].to_numpy()[order]
+        if name == 'date':
+            values = values.astype(DATE_DISK)
+        np.save(os.path.join(directory, f'{name}.npy'), values, allow_pickle=False)
+    partitions, start = [], 0
+    for province, year, rows in parts:
+        partitions.append({'province': province, 'year': year, 'start': start, 'rows': int(len(rows))})
+        start += len(rows)
+    return partitions
+
+
+def _write_arrow(frame, directory, parts, engine, header):
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    table = table.set_column(table.schema.get_field_index('date'), 'date', table['date'].cast(pa.date32()))
+    table = table.replace_schema_metadata({ARROW_METADATA_KEY: json.dumps(header).encode()})
+    ds.write_dataset(table, directory, format='parquet' if engine == 'parquet' else 'feather',
+                     partitioning=PARTITION_COLUMNS, partitioning_flavor='hive',
+                     existing_data_behavior='overwrite_or_ignore')
+    return [{'province': province, 'year': year, 'rows': int(len(rows)), 'path': _partition_dir(province, year)}
+            for province, year, rows in parts]
+
+
+def write_panel(df, path, engine='auto', float32=False):
+    """
+    Write a panel frame (compacted first) as a partitioned columnar dataset
+    at directory `path`, replacing what was there. Returns the path.
+    """
+    engine = resolve_engine(engine)
+    frame = compact_panel(df, float32)
+    parts = _partitions(frame)
+
+    # Built next to the target and swapped in, so readers never see half a dataset
+    parent = os.path.dirname(os.path.abspath(path))
+    staging = tempfile.mkdtemp(dir=parent, prefix='.panel-')
+    try:
+        if engine == 'npy':
+            partitions = _write_npy(frame, staging, parts)
+        else:
+            partitions = _write_arrow(frame, staging, parts, engine, schema_header(frame, engine, []))
+        with open(os.path.join(staging, SCHEMA_FILE), 'w') as f:
+            json.dump(schema_header(frame, engine, partitions), f, indent=1)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
+        os.replace(staging, path)
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return path
+
+
+# ===========================
+# READ
+# ===========================
+
+def _selected(header, provinces, years):
+    return [p for p in header['partitions']
+            if (provinces is None or p['province'] in provinces) and (years is None or p['year'] in years)]
+
+
+def _read_npy(path, header, parts, names, mmap):
+    categories = header['categories']['province']
+    counts = [p['rows'] for p in parts]
+    # A run of adjacent partitions is a view of the memory map; anything else is copied
+    contiguous = all(a['start'] + a['rows'] == b['start'] for a, b in zip(parts, parts[1:]))
+    data = {}
+    for name in names:
+        if name == 'province':
+            codes = np.repeat([categories.index(p['province']) for p in parts], counts)
+            data[name] = pd.Categorical.from_codes(codes, categories=categories)
+        elif name == 'year':
+            data[name] = np.repeat(np.array([p['year'] for p in parts], dtype=np.int16), counts)
+        else:
+            values = np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r' if mmap else None,
+                             allow_pickle=False)
+            if contiguous:
+                values = values[parts[0]['start']:parts[-1]['start'] + parts[-1]['rows']]
+            else:
+                values = np.concatenate([values[p['start']:p['start'] + p['rows']] for p in parts])
+            data[name] = values.astype(DATE_MEMORY) if name == 'date' else values
+    return pd.DataFrame(data, copy=False)
+
+
+def _read_arrow(path, header, provinces, years):
+    import pyarrow.dataset as ds
+
+    # _schema.json is skipped: files starting with '_' are not data
+    dataset = ds.dataset(path, format='parquet' if header['engine'] == 'parquet' else 'feather',
+                         partitioning='hive')
+    condition = None
+    if provinces is not None:
+        condition = ds.field('province').isin(list(provinces))
+    if years is not None:
+        by_year = ds.field('year').isin([int(y) for y in years])
+        condition = by_year if condition is None else condition & by_year
+    return dataset.to_table(filter=condition).to_pandas(date_as_object=False)
+
+
+def read_panel(path, provinces=None, years=None, columns=None, mmap=True):
+    """
+    The compact frame from a write_panel dataset, in the written column order
+    and sorted by province, year and month. provinces / years keep only those
+    partitions; columns keeps only those columns.
+    """
+    header = read_schema(path)
+    names = [c['name'] for c in header['columns'] if columns is None or c['name'] in columns]
+    parts = _selected(header, provinces, years)
+    if not parts:
+        return compact_panel(pd.DataFrame({n: [] for n in names}), categories=header['categories']['province'])
+    if header['engine'] == 'npy':
+        # Partitions are stored in (province, year) order, rows in written order
+        return _read_npy(path, header, parts, names, mmap)
+
+    # Arrow hands partition keys and dates back in its own types
+    frame = compact_panel(_read_arrow(path, header, provinces, years)[names],
+                          categories=header['categories']['province'])
+    order = [c for c in ['province', 'year', 'month'] if c in frame]
+    return frame.sort_values(order, kind='stable').reset_index(drop=True) if order else frame
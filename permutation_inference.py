@@ -0,0 +1,248 @@
+"""
+RANDOMIZATION INFERENCE FOR THE DiD ESTIMATES
+=============================================
+
+HC1 p-values on ~168 serially correlated monthly observations are not
+trustworthy, so line3_did and tmx_did are also judged against their placebo
+distributions:
+
+    placebo dates        - the event is moved to every month of its own
+                           pre-period (keeping min_window months on each side)
+                           and the DiD is re-estimated on pre-event data only
+    placebo assignments  - the treated label is moved to every other set of
+                           provinces of the same size (needs > 2 provinces to
+                           be informative)
+
+The exact permutation p-value is (1 + #{|placebo| >= |actual|}) / (1 + P).
+
+All placebo fits share the regressors that do not change between them (the
+constant, the trend, ...). Those are QR-factored once, and by Frisch-Waugh-
+Lovell each placebo only needs its few varying columns residualised and a
+small batched solve. Chunks of placebos can be spread over a process pool;
+the shared factorization is shipped to each worker once.
+"""
+
+import itertools
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+CHUNK_ELEMENTS = 1 << 23   # ~64 MB of float64 per design chunk
+DEFAULT_MIN_WINDOW = 6
+MAX_ASSIGNMENTS = 10_000
+
+_SHARED = {}
+
+
+# ===========================
+# BATCHED LEAST-SQUARES CORE
+# ===========================
+
+def shared_factorization(y, W):
+    """QR of the shared regressors and y with them partialled out."""
+    Q, _ = np.linalg.qr(W)
+    return Q, y - Q @ (Q.T @ y)
+
+
+def partial_solve(Q, y_res, D):
+    """
+    Coefficients on the varying columns D (batch, n, m) after partialling out
+    the shared columns spanned by Q. Returns (coef (batch, m), full_rank (batch,)).
+    """
+    D_res = D - np.einsum('nk,bkm->bnm', Q, np.einsum('nk,bnm->bkm', Q, D))
+    A = np.einsum('bnm,bnl->bml', D_res, D_res)
+    c = np.einsum('bnm,n->bm', D_res, y_res)
+    full_rank = np.linalg.matrix_rank(A) == A.shape[-1]
+    coef = np.einsum('bml,bl->bm', np.linalg.pinv(A), c)
+    coef[~full_rank] = np.nan
+    return coef, full_rank
+
+
+def _init_worker(shared):
+    _SHARED.clear()
+    _SHARED.update(shared)
+
+
+def _solve_chunk(builder, chunk):
+    D = builder(_SHARED, chunk)
+    return partial_solve(_SHARED['Q'], _SHARED['y_res'], D)
+
+
+def run_batched(shared, builder, params, chunk_size=None, workers=1):
+    """
+    Solve every placebo described by `params` (one entry per placebo). The
+    builder turns a chunk of params into its (chunk, n, m) varying design from
+    the shared arrays, so only small parameter arrays cross process boundaries.
+    By default chunks are sized to about CHUNK_ELEMENTS design entries.
+    """
+    if chunk_size is None:
+        n_cols = builder(shared, params[:1]).shape[-1] if len(params) else 1
+        chunk_size = max(1, CHUNK_ELEMENTS // (len(shared['y_res']) * n_cols))
+    chunks = [params[i:i + chunk_size] for i in range(0, len(params), chunk_size)]
+    if not chunks:
+        return np.empty((0, 0)), np.empty(0, dtype=bool)
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1 or len(chunks) == 1:
+        _init_worker(shared)
+        parts = [_solve_chunk(builder, chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(shared,)) as pool:
+            parts = list(pool.map(_solve_chunk, itertools.repeat(builder), chunks))
+
+    return np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts])
+
+
+# ===========================
+# PLACEBO DESIGNS
+# ===========================
+
+def _month_index(df):
+    return (df['year'].to_numpy() * 12 + df['month'].to_numpy() - 1).astype(np.int64)
+
+
+def _date_design(shared, event_months):
+    post = (shared['t'][None, :] >= np.asarray(event_months)[:, None]).astype(float)
+    return np.stack([post, post * shared['treated'][None, :]], axis=-1)
+
+
+def _assignment_design(shared, masks):
+    treated = np.asarray(masks)[:, shared['unit']].astype(float)
+    return np.stack([treated] + [treated * shared[c][None, :] for c in shared['post_columns']], axis=-1)
+
+
+def exact_p_value(actual, placebos):
+    placebos = placebos[np.isfinite(placebos)]
+    return (1 + np.sum(np.abs(placebos) >= abs(actual))) / (1 + len(placebos))
+
+
+def placebo_dates(df_panel, event='line3', min_window=DEFAULT_MIN_WINDOW,
+                  chunk_size=None, workers=1):
+    """
+    In-time placebo distribution for one event ('line3' or 'tmx').
+
+    The sample is cut at the real event date. The fake event is placed at each
+    month that leaves min_window months on both sides, and the DiD on
+    treated x fake-post is re-estimated with the same trend (and, for TMX, the
+    real Line 3 terms) as controls. Returns (placebo months, estimates).
+    """
+    post_col = f'{event}_post'
+    t = _month_index(df_panel)
+    event_month = t[df_panel[post_col].to_numpy() == 1].min()
+    sample = t < event_month
+    df = df_panel[sample]
+    t = t[sample]
+
+    shared_cols = ['treated', 'time_trend']
+    if event == 'tmx':
+        shared_cols += ['line3_post', 'line3_did']
+    W = np.column_stack([np.ones(len(df))] + [df[c].to_numpy(dtype=float) for c in shared_cols])
+    Q, y_res = shared_factorization(df['production_kbpd'].to_numpy(dtype=float), W)
+
+    candidates = np.arange(t.min() + min_window, t.max() - min_window + 2)
+    if event == 'tmx':
+        # A fake TMX date on the Line 3 date would duplicate the Line 3 terms
+        line3_month = _month_index(df_panel)[df_panel['line3_post'].to_numpy() == 1].min()
+        candidates = candidates[candidates != line3_month]
+
+    shared = {'Q': Q, 'y_res': y_res, 't': t, 'treated': df['treated'].to_numpy(dtype=float)}
+    coef, _ = run_batched(shared, _date_design, candidates, chunk_size, workers)
+    estimates = coef[:, 1] if len(coef) else np.empty(0)
+    return candidates, estimates
+
+
+def placebo_assignments(df_panel, max_assignments=MAX_ASSIGNMENTS, seed=0,
+                        chunk_size=None, workers=1):
+    """
+    In-space placebo distribution: every other set of provinces of the same
+    size as the treated set takes the treated label in the full DiD. If there
+    are more than max_assignments such sets, a random sample is used.
+
+    Returns (list of treated province tuples, estimates (P, 2) for
+    line3_did and tmx_did).
+    """
+    units = pd.Categorical(df_panel['province'])
+    names = list(units.categories)
+    unit = units.codes.astype(np.int64)
+    treated_units = set(df_panel.loc[df_panel['treated'] == 1, 'province'])
+    n_treated = len(treated_units)
+
+    actual = tuple(sorted(names.index(u) for u in treated_units))
+    if math.comb(len(names), n_treated) - 1 <= max_assignments:
+        combos = [c for c in itertools.combinations(range(len(names)), n_treated) if c != actual]
+    else:
+        # Too many to enumerate: draw distinct assignments at random
+        rng = np.random.default_rng(seed)
+        seen = {actual}
+        combos = []
+        while len(combos) < max_assignments:
+            c = tuple(sorted(rng.choice(len(names), n_treated, replace=False).tolist()))
+            if c not in seen:
+                seen.add(c)
+                combos.append(c)
+
+    masks = np.zeros((len(combos), len(names)), dtype=bool)
+    for row, combo in enumerate(combos):
+        masks[row, list(combo)] = True
+
+    W = np.column_stack([np.ones(len(df_panel))] + [df_panel[c].to_numpy(dtype=float)
+                                                    for c in ['line3_post', 'tmx_post', 'time_trend']])
+    Q, y_res = shared_factorization(df_panel['production_kbpd'].to_numpy(dtype=float), W)
+    shared = {'Q': Q, 'y_res': y_res, 'unit': unit,
+              'post_columns': ['line3_post', 'tmx_post'],
+              'line3_post': df_panel['line3_post'].to_numpy(dtype=float),
+              'tmx_post': df_panel['tmx_post'].to_numpy(dtype=float)}
+    coef, _ = run_batched(shared, _assignment_design, masks, chunk_size, workers)
+    estimates = coef[:, 1:3] if len(coef) else np.empty((0, 2))
+    return [tuple(names[i] for i in c) for c in combos], estimates
+
+
+def permutation_inference(df_panel, model_did=None, min_window=DEFAULT_MIN_WINDOW,
+                          max_assignments=MAX_ASSIGNMENTS, chunk_size=None,
+                          workers=1, seed=0):
+    """
+    Exact permutation p-values for line3_did and tmx_did.
+
+    The actual estimates come from model_did when given (the regression DiD),
+    otherwise from the same batched core. Returns (summary, distributions):
+    summary has one row per (effect, mode) with estimate, placebos and p_value;
+    distributions maps (effect, mode) to the placebo estimates.
+    """
+    if model_did is not None:
+        actual = {'line3_did': model_did.params['line3_did'], 'tmx_did': model_did.params['tmx_did']}
+    else:
+        W = np.column_stack([np.ones(len(df_panel))] + [df_panel[c].to_numpy(dtype=float)
+                                                        for c in ['treated', 'line3_post', 'tmx_post', 'time_trend']])
+        Q, y_res = shared_factorization(df_panel['production_kbpd'].to_numpy(dtype=float), W)
+        D = df_panel[['line3_did', 'tmx_did']].to_numpy(dtype=float)[None]
+        coef, _ = partial_solve(Q, y_res, D)
+        actual = {'line3_did': coef[0, 0], 'tmx_did': coef[0, 1]}
+
+    distributions = {}
+    for event in ['line3', 'tmx']:
+        _, estimates = placebo_dates(df_panel, event, min_window, chunk_size, workers)
+        distributions[(f'{event}_did', 'dates')] = estimates
+
+    if df_panel['province'].nunique() > 2:
+        _, estimates = placebo_assignments(df_panel, max_assignments, seed, chunk_size, workers)
+        distributions[('line3_did', 'assignments')] = estimates[:, 0]
+        distributions[('tmx_did', 'assignments')] = estimates[:, 1]
+
+    rows = []
+    for (effect, mode), placebos in distributions.items():
+        finite = placebos[np.isfinite(placebos)]
+        rows.append({
+            'effect': effect,
+            'mode': mode,
+            'estimate': actual[effect],
+            'placebos': len(finite),
+            'placebo_mean': finite.mean() if len(finite) else np.nan,
+            'placebo_sd': finite.std(ddof=1) if len(finite) > 1 else np.nan,
+            'p_value': exact_p_value(actual[effect], finite),
+        })
+    return pd.DataFrame(rows), distributions
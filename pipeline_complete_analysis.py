@@ -12,165 +12,88 @@ REQUIRED FILES:
 2. 2510006301-noSymbol.csv (StatsCan - has BOTH provinces now)
 
 TO RUN:
-    python3 pipeline_complete_analysis.py
+    python3 pipeline_complete_analysis.py              # full analysis, figure and panel tables
+    python3 pipeline_complete_analysis.py ingest       # load and cache inputs only
+    python3 pipeline_complete_analysis.py did          # Part 1: difference-in-differences
+    python3 pipeline_complete_analysis.py iv           # Part 2: two-stage least squares
+    python3 pipeline_complete_analysis.py emissions    # Part 3: emissions
+    python3 pipeline_complete_analysis.py plot         # figure and panel table export
+    python3 pipeline_complete_analysis.py permute      # placebo/permutation p-values for the DiD
+    python3 pipeline_complete_analysis.py bootstrap    # wild / block bootstrap intervals
+    python3 pipeline_complete_analysis.py grid         # specification curve over the analysis choices
+    python3 pipeline_complete_analysis.py uncertainty  # Monte Carlo bands for the emissions
+    python3 pipeline_complete_analysis.py scenarios    # emissions under many intensity schedules
+    python3 pipeline_complete_analysis.py event        # event study: leads, lags and pre-trend tests
+    python3 pipeline_complete_analysis.py rolling      # DiD effect paths over rolling/expanding windows
+    python3 pipeline_complete_analysis.py breaks       # estimated break dates vs the in-service dates
+    python3 pipeline_complete_analysis.py influence    # leave-one-out / year / province influence
+    python3 pipeline_complete_analysis.py synth        # synthetic Alberta from every producing province
+    python3 pipeline_complete_analysis.py refresh --end-year 2025  # fold a new release into the stored regressions
+    python3 pipeline_complete_analysis.py --facilities reports.csv   # Part 3 on observed facility intensity
+    python3 pipeline_complete_analysis.py --prices wcs_wti_*.csv     # differential from daily price files
+    python3 pipeline_complete_analysis.py throughput --throughput cer_throughput_*.csv   # daily CER key-point flows
+    python3 pipeline_complete_analysis.py --throughput cer_throughput_*.csv   # observed capacity as the instrument
+    python3 pipeline_complete_analysis.py iv --profile iv --trace-memory      # per-stage timing/memory in the run report
+    python3 pipeline_complete_analysis.py plot --table-format csv             # panel tables as CSV instead of columnar
+    python3 pipeline_complete_analysis.py serve --port 8765                   # HTTP/JSON scenario queries on localhost
+
+Every command also writes pipeline_run_report.json: wall and CPU time, peak
+memory, row counts and cache hits for each stage (see run_report.py).
+
+The panel tables are written as compact columnar datasets partitioned by
+province and year (Parquet with pyarrow, else memory-mappable .npy; see
+panel_store.py). Read them back with panel_store.read_panel.
+
+AS A LIBRARY:
+    Every stage is a function (load_inputs, build_panel, run_did, run_iv,
+    compute_emissions, plot_results, export_tables). statsmodels and matplotlib
+    are imported inside the stages that use them, so importing this module or
+    running `ingest`/`emissions` does not pay for them.
 
 REQUIRES:
     pip install pandas numpy statsmodels matplotlib openpyxl --break-system-packages
 """
 
-import pandas as pd
-import numpy as np
+import argparse
+import os
 import sys
 
-try:
-    import statsmodels.api as sm
-    from statsmodels.regression.linear_model import OLS
-    from statsmodels.sandbox.regression.gmm import IV2SLS
-    import matplotlib.pyplot as plt
-    import matplotlib.dates as mdates
-except ImportError:
-    print("ERROR: Required packages not installed")
-    sys.exit(1)
-
-print("="*80)
-print("COMPLETE PIPELINE ANALYSIS - ALL METHODOLOGICAL IMPROVEMENTS")
-print("="*80)
-
-# ===========================
-# 1. LOAD PRODUCTION DATA (BOTH PROVINCES)
-# ===========================
-
-print("\n[1/6] Loading production data (Alberta + Saskatchewan)...")
-
-try:
-    df_raw = pd.read_csv('2510006301-noSymbol.csv', skiprows=9, header=None)
-except FileNotFoundError:
-    print("ERROR: 2510006301-noSymbol.csv not found")
-    sys.exit(1)
-
-# The file has both provinces - structure:
-# Row 0 (index 0): Month headers starting at column 2
-# Row 2 (index 2): Saskatchewan production in BARRELS starting at column 2
-# Row 2 (index 2): Alberta production in BARRELS starting at column 120
-
-months_row = df_raw.iloc[0, 2:]  # Month headers
-production_sask_row = df_raw.iloc[2, 2:120]  # Saskatchewan barrels (columns 2-119)
-production_alberta_row = df_raw.iloc[2, 120:]  # Alberta barrels (columns 120+)
-
-# Parse Saskatchewan data
-sask_data = []
-for i in range(len(production_sask_row)):
-    if i >= len(months_row) or pd.isna(months_row.iloc[i]):
-        continue
-    
-    month_str = months_row.iloc[i]
-    try:
-        date = pd.to_datetime(month_str, format='%B %Y')
-        if date.year < 2018 or date.year > 2024:
-            continue
-        
-        prod_val = production_sask_row.iloc[i]
-        if pd.notna(prod_val) and prod_val != '..':
-            days_in_month = date.days_in_month
-            prod_kbpd = float(str(prod_val).replace(',', '')) / days_in_month / 1000
-            
-            sask_data.append({
-                'year': date.year,
-                'month': date.month,
-                'production_kbpd': prod_kbpd,
-                'province': 'Saskatchewan'
-            })
-    except:
-        continue
-
-# Parse Alberta data
-alberta_data = []
-for i in range(len(production_alberta_row)):
-    if i >= len(months_row) or pd.isna(months_row.iloc[i]):
-        continue
-    
-    month_str = months_row.iloc[i]
-    try:
-        date = pd.to_datetime(month_str, format='%B %Y')
-        if date.year < 2018 or date.year > 2024:
-            continue
-        
-        prod_val = production_alberta_row.iloc[i]
-        if pd.notna(prod_val) and prod_val != '..':
-            days_in_month = date.days_in_month
-            prod_kbpd = float(str(prod_val).replace(',', '')) / days_in_month / 1000
-            
-            alberta_data.append({
-                'year': date.year,
-                'month': date.month,
-                'production_kbpd': prod_kbpd,
-                'province': 'Alberta'
-            })
-    except:
-        continue
-
-df_sask = pd.DataFrame(sask_data)
-df_alberta = pd.DataFrame(alberta_data)
-
-print(f"✓ Saskatchewan: {len(df_sask)} months")
-print(f"✓ Alberta:      {len(df_alberta)} months")
+import numpy as np
+import pandas as pd
 
-# ===========================
-# 2. LOAD RAIL DATA
-# ===========================
+from cer_rail import read_rail_workbook
+from ingest_cache import IngestCache
+from stage_graph import COMPUTED, DISK, StageGraph
+from statcan_ingest import read_statcan, production_kbpd
 
-print("\n[2/6] Loading CER rail export data...")
-print("NOTE: Rail data is NATIONAL (not by province)")
-print("      ~80% of Canadian oil is from Alberta, so rail mostly reflects Alberta constraints")
+STATCAN_FILE = '2510006301-noSymbol.csv'
+RAIL_FILE = 'canadian-crude-oil-exports-rail-monthly-data.xlsx'
+FIGURE_FILE = 'pipeline_complete_analysis.png'
+PANEL_TABLE = 'pipeline_complete_panel'
+ALBERTA_2SLS_TABLE = 'pipeline_alberta_2sls'
+TABLE_FORMATS = ['auto', 'parquet', 'feather', 'npy', 'csv']
+INCREMENTAL_STATE = '.incremental_state.npz'
+RUN_REPORT_FILE = 'pipeline_run_report.json'
 
-try:
-    df_rail_raw = pd.read_excel('canadian-crude-oil-exports-rail-monthly-data.xlsx', 
-                                 sheet_name=0, header=None)
-except FileNotFoundError:
-    print("ERROR: canadian-crude-oil-exports-rail-monthly-data.xlsx not found")
-    sys.exit(1)
+START_YEAR = 2018
+END_YEAR = 2024
 
-month_map = {
-    'January': 1, 'February': 2, 'March': 3, 'April': 4, 'May': 5, 'June': 6,
-    'July': 7, 'August': 8, 'September': 9, 'October': 10, 'November': 11, 'December': 12
-}
+# In-service dates (year, month) and nameplate capacity (kb/d)
+LINE3_START = (2021, 10)
+TMX_START = (2024, 5)
+CAPACITY_LINE3 = 590
+CAPACITY_TMX = 590
 
-rail_data = []
-current_year = None
-
-for i in range(len(df_rail_raw)):
-    year_cell = df_rail_raw.iloc[i, 1]
-    month_cell = df_rail_raw.iloc[i, 2]
-    bbl_day = df_rail_raw.iloc[i, 6]
-    
-    if pd.notna(year_cell) and isinstance(year_cell, (int, float)):
-        try:
-            current_year = int(year_cell)
-        except:
-            pass
-    
-    if pd.notna(month_cell) and month_cell in month_map and current_year is not None:
-        if pd.notna(bbl_day):
-            try:
-                kb_day = float(bbl_day) / 1000
-                rail_data.append({
-                    'year': current_year,
-                    'month': month_map[month_cell],
-                    'rail_kbpd': kb_day
-                })
-            except:
-                pass
-
-df_rail = pd.DataFrame(rail_data)
-df_rail = df_rail[(df_rail['year'] >= 2018) & (df_rail['year'] <= 2024)]
-
-print(f"✓ Loaded {len(df_rail)} months of rail data (national)")
+BASE_INTENSITY = 75.0       # kg CO2e/bbl in START_YEAR
+DECLINE_RATE = 0.02         # annual intensity decline
+CONSTANT_INTENSITY = 67.0   # kg CO2e/bbl, the old constant assumption
 
-# ===========================
-# 3. PRICE DATA
-# ===========================
+# Table totals that contain the provinces; never a donor or a unit
+AGGREGATE_GEOGRAPHIES = ['Canada']
 
-print("\n[3/6] Loading WCS-WTI price differential data...")
+DID_REGRESSORS = ['treated', 'line3_post', 'tmx_post', 'line3_did', 'tmx_did', 'time_trend']
+FIRST_STAGE_REGRESSORS = ['pipeline_capacity_instrument', 'time_trend']
+SECOND_STAGE_REGRESSORS = ['differential_predicted', 'line3_post', 'tmx_post', 'time_trend']
 
 price_data = {
     2018: {1: 21.17, 2: 24.51, 3: 27.20, 4: 25.78, 5: 16.73, 6: 15.77, 7: 18.15, 8: 19.51, 9: 29.86, 10: 29.60, 11: 45.93, 12: 43.55},
@@ -182,299 +105,1529 @@ price_data = {
     2024: {1: 20.38, 2: 19.42, 3: 20.00, 4: 16.70, 5: 14.43, 6: 12.94, 7: 14.31, 8: 15.31, 9: 14.34, 10: 14.13, 11: 12.39, 12: 12.36}
 }
 
-price_rows = []
-for year, months in price_data.items():
-    for month, diff in months.items():
-        price_rows.append({'year': year, 'month': month, 'wcs_wti_differential': diff})
-
-df_prices = pd.DataFrame(price_rows)
-
-print(f"✓ Loaded {len(df_prices)} months of price data")
 
 # ===========================
-# 4. CREATE PANEL DATASET
+# 1-3. LOAD INPUT DATA
 # ===========================
 
-print("\n[4/6] Creating panel dataset and instruments...")
+def load_production(path=STATCAN_FILE, cache=None, start_year=START_YEAR, end_year=END_YEAR):
+    """Alberta and Saskatchewan monthly production (kb/d) as (df_alberta, df_sask)."""
+    filters = {'geographies': ['Alberta', 'Saskatchewan'],
+               'series': 'Crude oil production', 'uom': 'Barrels',
+               'start': start_year, 'end': end_year}
+
+    # Accepts the trimmed wide extract or the full long-format table download;
+    # only Alberta/Saskatchewan barrels for the window are kept either way
+    def build():
+        return read_statcan(path, **filters)
+
+    df_production = cache.frame('production', [path], build, params=filters) if cache else build()
+    df_alberta = production_kbpd(df_production, 'Alberta', start_year, end_year)
+    df_sask = production_kbpd(df_production, 'Saskatchewan', start_year, end_year)
+    return df_alberta, df_sask
+
+
+def load_unit_production(path=STATCAN_FILE, cache=None, start_year=START_YEAR, end_year=END_YEAR,
+                         geographies=None):
+    """Tidy production rows for every geography in the table (or those given), national total excluded."""
+    filters = {'geographies': geographies, 'series': 'Crude oil production', 'uom': 'Barrels',
+               'start': start_year, 'end': end_year}
+
+    def build():
+        return read_statcan(path, **filters)
+
+    tidy = cache.frame('production_units', [path], build, params=filters) if cache else build()
+    return tidy[~tidy['geography'].isin(AGGREGATE_GEOGRAPHIES)]
+
+
+def load_rail(path=RAIL_FILE, cache=None, start_year=START_YEAR, end_year=END_YEAR):
+    """National rail exports (kb/d) by month for the analysis window."""
+    def build():
+        return read_rail_workbook(path)
+
+    # Full CER history (all volume columns) is cached; the panel uses the window
+    df_rail_all = cache.frame('rail', [path], build) if cache else build()
+    return df_rail_all.loc[(df_rail_all['year'] >= start_year) & (df_rail_all['year'] <= end_year),
+                           ['year', 'month', 'rail_kbpd']]
 
-# Combine provinces
-df_panel = pd.concat([df_alberta, df_sask], ignore_index=True)
-df_panel['date'] = pd.to_datetime(df_panel[['year', 'month']].assign(day=1))
 
-# Treatment indicators
-df_panel['treated'] = (df_panel['province'] == 'Alberta').astype(int)
-df_panel['line3_post'] = (((df_panel['year'] == 2021) & (df_panel['month'] >= 10)) | (df_panel['year'] > 2021)).astype(int)
-df_panel['tmx_post'] = (((df_panel['year'] == 2024) & (df_panel['month'] >= 5)) | (df_panel['year'] > 2024)).astype(int)
+def build_price_frame(prices=None):
+    price_rows = []
+    for year, months in (prices or price_data).items():
+        for month, diff in months.items():
+            price_rows.append({'year': year, 'month': month, 'wcs_wti_differential': diff})
+    return pd.DataFrame(price_rows)
 
-# DiD interactions
-df_panel['line3_did'] = df_panel['treated'] * df_panel['line3_post']
-df_panel['tmx_did'] = df_panel['treated'] * df_panel['tmx_post']
 
-df_panel['time_trend'] = df_panel.groupby('province').cumcount()
+def load_prices(cache=None, price_files=None, statistic='mean', start_year=START_YEAR, end_year=END_YEAR):
+    """
+    Monthly WCS-WTI differential ($/bbl): from daily or tick price files when
+    given (statistic: mean, median or vw), else the table above.
+    """
+    if price_files:
+        from price_ingest import STATISTICS, load_price_files
 
-# CRITICAL: Create PIPELINE CAPACITY instrument
-# This is exogenous (construction completion dates) and affects differential
-df_panel['pipeline_capacity_instrument'] = 0.0
-df_panel.loc[df_panel['line3_post'] == 1, 'pipeline_capacity_instrument'] += 590  # Line 3 capacity
-df_panel.loc[df_panel['tmx_post'] == 1, 'pipeline_capacity_instrument'] += 590   # TMX capacity
+        monthly = load_price_files(price_files, cache)
+        monthly = monthly[(monthly['year'] >= start_year) & (monthly['year'] <= end_year)]
+        return pd.DataFrame({'year': monthly['year'].to_numpy(), 'month': monthly['month'].to_numpy(),
+                             'wcs_wti_differential': monthly[STATISTICS[statistic]].to_numpy()})
 
-# Add prices to Alberta data only (WCS-WTI is Alberta-specific)
-df_alberta_full = df_panel[df_panel['province'] == 'Alberta'].copy()
-df_alberta_full = pd.merge(df_alberta_full, df_prices, on=['year', 'month'], how='left')
-df_alberta_full = pd.merge(df_alberta_full, df_rail, on=['year', 'month'], how='left')
+    # The price table lives in this file, so it is its own cache key
+    if cache:
+        return cache.frame('prices', [], build_price_frame, params={'price_data': price_data})
+    return build_price_frame()
+
+
+def load_capacity(throughput_files=None):
+    """
+    Observed monthly export capacity (kb/d) from daily CER key-point throughput
+    files, or None to keep the step instrument from the in-service dates.
+    """
+    if not throughput_files:
+        return None
+    from throughput_store import capacity_instrument, open_store
+
+    return capacity_instrument(open_store(throughput_files).monthly())
+
+
+def load_inputs(statcan_path=STATCAN_FILE, rail_path=RAIL_FILE, cache=None,
+                start_year=START_YEAR, end_year=END_YEAR, price_files=None, price_statistic='mean',
+                throughput_files=None):
+    """Run all loaders; returns a dict of alberta, sask, rail, prices and capacity frames."""
+    df_alberta, df_sask = load_production(statcan_path, cache, start_year, end_year)
+    return {
+        'alberta': df_alberta,
+        'sask': df_sask,
+        'rail': load_rail(rail_path, cache, start_year, end_year),
+        'prices': load_prices(cache, price_files, price_statistic, start_year, end_year),
+        'capacity': load_capacity(throughput_files),
+    }
 
-print(f"✓ Panel dataset: {len(df_panel)} observations (2 provinces)")
-print(f"✓ Alberta dataset with prices: {len(df_alberta_full)} observations")
 
 # ===========================
-# 5. ANALYSIS PART 1: TRUE DiD
+# 4. CREATE PANEL DATASET
 # ===========================
 
-print("\n" + "="*80)
-print("PART 1: DIFFERENCE-IN-DIFFERENCES (Saskatchewan Control)")
-print("="*80)
+def _on_or_after(df, start):
+    year, month = start
+    return (((df['year'] == year) & (df['month'] >= month)) | (df['year'] > year)).astype(int)
+
+
+def _add_event_flags(df, treated, line3_start, tmx_start, dtype=int):
+    """Treated, post and DiD flags, shared by the two-province and N-unit panels."""
+    df['treated'] = treated.astype(dtype)
+    df['line3_post'] = _on_or_after(df, line3_start).astype(dtype)
+    df['tmx_post'] = _on_or_after(df, tmx_start).astype(dtype)
+    df['line3_did'] = df['treated'] * df['line3_post']
+    df['tmx_did'] = df['treated'] * df['tmx_post']
+
+
+def build_panel(df_alberta, df_sask, df_prices, df_rail, line3_start=LINE3_START,
+                tmx_start=TMX_START, capacity_line3=CAPACITY_LINE3, capacity_tmx=CAPACITY_TMX,
+                df_capacity=None):
+    """
+    Two-province DiD panel plus the Alberta-only frame with prices and rail.
+    With df_capacity (load_capacity) the instrument is the observed export
+    capacity added since the first month instead of the nameplate steps.
+
+    Returns (df_panel, df_alberta_full).
+    """
+    # Combine provinces
+    df_panel = pd.concat([df_alberta, df_sask], ignore_index=True)
+    df_panel['date'] = pd.to_datetime(df_panel[['year', 'month']].assign(day=1))
+
+    # Treatment indicators and DiD interactions
+    _add_event_flags(df_panel, df_panel['province'] == 'Alberta', line3_start, tmx_start)
+
+    df_panel['time_trend'] = df_panel.groupby('province').cumcount()
+
+    # CRITICAL: Create PIPELINE CAPACITY instrument
+    # This is exogenous (construction completion dates) and affects differential
+    df_panel['pipeline_capacity_instrument'] = 0.0
+    df_panel.loc[df_panel['line3_post'] == 1, 'pipeline_capacity_instrument'] += capacity_line3
+    df_panel.loc[df_panel['tmx_post'] == 1, 'pipeline_capacity_instrument'] += capacity_tmx
+    if df_capacity is not None:
+        observed = df_panel[['year', 'month']].merge(df_capacity, on=['year', 'month'], how='left')['capacity_kbpd']
+        if observed.isna().any():
+            missing = df_panel.loc[observed.isna().to_numpy(), 'date'].nunique()
+            raise ValueError(f"throughput files do not cover {missing} panel months")
+        first = (df_panel['date'] == df_panel['date'].min()).to_numpy()
+        df_panel['pipeline_capacity_instrument'] = observed.to_numpy() - observed[first].iloc[0]
+
+    # Add prices to Alberta data only (WCS-WTI is Alberta-specific)
+    df_alberta_full = df_panel[df_panel['province'] == 'Alberta'].copy()
+    df_alberta_full = pd.merge(df_alberta_full, df_prices, on=['year', 'month'], how='left')
+    df_alberta_full = pd.merge(df_alberta_full, df_rail, on=['year', 'month'], how='left')
+
+    return df_panel, df_alberta_full
+
+
+def build_unit_panel(tidy, treated=('Alberta',), line3_start=LINE3_START, tmx_start=TMX_START):
+    """
+    N-unit production panel from tidy StatsCan rows, indexed by (geography,
+    year, month) with a categorical geography and int16 year/month. Columns
+    are production_kbpd and int8 treated, post and DiD flags. Units missing a
+    month of the window, or that produce nothing in it, are dropped so the
+    panel is balanced.
+
+    The DiD and 2SLS keep build_panel: they need the Alberta price and rail
+    merge and the per-province trend, and must keep any month either province
+    reports. Both builders set their flags with the same helper.
+    """
+    rows = tidy[['geography', 'year', 'month']].copy()
+    rows['production_kbpd'] = tidy['value_per_day'].to_numpy() / 1000
+    wide = rows.pivot_table(index=['year', 'month'], columns='geography', values='production_kbpd',
+                            observed=True)
+    keep = wide.notna().all() & (wide.fillna(0) != 0).any()
+    df = wide.loc[:, keep].stack().rename('production_kbpd').reset_index()
+
+    geography = df['geography'].astype(str)
+    df['geography'] = pd.Categorical(geography, categories=sorted(set(geography)))
+    df['year'] = df['year'].astype(np.int16)
+    df['month'] = df['month'].astype(np.int16)
+    _add_event_flags(df, df['geography'].isin(treated), line3_start, tmx_start, dtype=np.int8)
+    return df.set_index(['geography', 'year', 'month']).sort_index()
 
-# Descriptive DiD
-alberta_pre = df_panel[(df_panel['province'] == 'Alberta') & (df_panel['line3_post'] == 0)]['production_kbpd'].mean()
-alberta_post_line3 = df_panel[(df_panel['province'] == 'Alberta') & (df_panel['line3_post'] == 1) & (df_panel['tmx_post'] == 0)]['production_kbpd'].mean()
-alberta_post_tmx = df_panel[(df_panel['province'] == 'Alberta') & (df_panel['tmx_post'] == 1)]['production_kbpd'].mean()
 
-sask_pre = df_panel[(df_panel['province'] == 'Saskatchewan') & (df_panel['line3_post'] == 0)]['production_kbpd'].mean()
-sask_post_line3 = df_panel[(df_panel['province'] == 'Saskatchewan') & (df_panel['line3_post'] == 1) & (df_panel['tmx_post'] == 0)]['production_kbpd'].mean()
-sask_post_tmx = df_panel[(df_panel['province'] == 'Saskatchewan') & (df_panel['tmx_post'] == 1)]['production_kbpd'].mean()
+# ===========================
+# 5. ANALYSIS PART 1: TRUE DiD
+# ===========================
 
-print("\n### DESCRIPTIVE DiD ###")
-print(f"\nLine 3 Effect:")
-print(f"  Alberta:      {alberta_pre:.0f} → {alberta_post_line3:.0f} kb/d (Δ = {alberta_post_line3 - alberta_pre:+.0f})")
-print(f"  Saskatchewan: {sask_pre:.0f} → {sask_post_line3:.0f} kb/d (Δ = {sask_post_line3 - sask_pre:+.0f})")
-print(f"  → DiD Estimate: {(alberta_post_line3 - alberta_pre) - (sask_post_line3 - sask_pre):+.0f} kb/d")
-print(f"     (Alberta grew {abs((alberta_post_line3 - alberta_pre) - (sask_post_line3 - sask_pre)):.0f} kb/d MORE than Saskatchewan)")
+def descriptive_did(df_panel):
+    """Period means by province and the descriptive DiD estimates (kb/d)."""
+    means = {}
+    for province, key in [('Alberta', 'alberta'), ('Saskatchewan', 'sask')]:
+        rows = df_panel[df_panel['province'] == province]
+        means[f'{key}_pre'] = rows[rows['line3_post'] == 0]['production_kbpd'].mean()
+        means[f'{key}_post_line3'] = rows[(rows['line3_post'] == 1) & (rows['tmx_post'] == 0)]['production_kbpd'].mean()
+        means[f'{key}_post_tmx'] = rows[rows['tmx_post'] == 1]['production_kbpd'].mean()
 
-print(f"\nTMX Effect:")
-print(f"  Alberta:      {alberta_post_line3:.0f} → {alberta_post_tmx:.0f} kb/d (Δ = {alberta_post_tmx - alberta_post_line3:+.0f})")
-print(f"  Saskatchewan: {sask_post_line3:.0f} → {sask_post_tmx:.0f} kb/d (Δ = {sask_post_tmx - sask_post_line3:+.0f})")
-print(f"  → DiD Estimate: {(alberta_post_tmx - alberta_post_line3) - (sask_post_tmx - sask_post_line3):+.0f} kb/d")
+    means['line3_did'] = ((means['alberta_post_line3'] - means['alberta_pre'])
+                          - (means['sask_post_line3'] - means['sask_pre']))
+    means['tmx_did'] = ((means['alberta_post_tmx'] - means['alberta_post_line3'])
+                        - (means['sask_post_tmx'] - means['sask_post_line3']))
+    return means
 
-# Regression DiD
-print("\n### REGRESSION DiD (Controls for Trends) ###")
 
-X_did = df_panel[['treated', 'line3_post', 'tmx_post', 'line3_did', 'tmx_did', 'time_trend']]
-X_did = sm.add_constant(X_did)
-y_did = df_panel['production_kbpd']
+def fit_ols(y, X, cov_type='HC1'):
+    """statsmodels OLS with a constant; imported lazily."""
+    from statsmodels.regression.linear_model import OLS
+    from statsmodels.tools.tools import add_constant
+
+    return OLS(y, add_constant(X)).fit(cov_type=cov_type)
 
-model_did = OLS(y_did, X_did).fit(cov_type='HC1')
 
-print(f"\nLine 3 DiD:  {model_did.params['line3_did']:+7.1f} kb/d (p={model_did.pvalues['line3_did']:.4f}) {'✓✓✓' if model_did.pvalues['line3_did'] < 0.001 else '✓✓' if model_did.pvalues['line3_did'] < 0.01 else '✓' if model_did.pvalues['line3_did'] < 0.05 else ''}")
-print(f"TMX DiD:     {model_did.params['tmx_did']:+7.1f} kb/d (p={model_did.pvalues['tmx_did']:.4f}) {'✓✓✓' if model_did.pvalues['tmx_did'] < 0.001 else '✓✓' if model_did.pvalues['tmx_did'] < 0.01 else '✓' if model_did.pvalues['tmx_did'] < 0.05 else ''}")
-print(f"R²:          {model_did.rsquared:.3f}")
+def run_did(df_panel, cov_type='HC1'):
+    """Regression DiD with a shared linear trend; returns the fitted model."""
+    return fit_ols(df_panel['production_kbpd'], df_panel[DID_REGRESSORS], cov_type=cov_type)
 
-print("\n→ TRUE CAUSAL ESTIMATES: Saskatchewan control differences out common shocks")
 
 # ===========================
 # 6. ANALYSIS PART 2: 2SLS FOR ENDOGENEITY
 # ===========================
 
-print("\n" + "="*80)
-print("PART 2: TWO-STAGE LEAST SQUARES (Addresses WCS-WTI Endogeneity)")
-print("="*80)
+def run_iv(df_alberta_full, capacity_line3=CAPACITY_LINE3, capacity_tmx=CAPACITY_TMX,
+           cov_type='HC1'):
+    """
+    Two-stage estimate of the price mechanism on the Alberta frame.
+
+    Returns a dict with the first/second stage models, the 2SLS frame (with
+    differential_predicted), the 2SLS engine fit and the implied totals
+    through the price channel (first-stage narrowing x the 2SLS coefficient).
+    The two-step second stage also holds the direct Line 3/TMX effects, so its
+    price coefficient is not identified and is not used for the totals.
+    """
+    # Prepare Alberta data for 2SLS
+    df_alberta_2sls = df_alberta_full.dropna(subset=['wcs_wti_differential']).copy()
+
+    # First Stage: Pipeline Capacity → WCS-WTI Differential
+    model_first = fit_ols(df_alberta_2sls['wcs_wti_differential'],
+                          df_alberta_2sls[FIRST_STAGE_REGRESSORS], cov_type=cov_type)
+
+    # Get predicted differential
+    df_alberta_2sls['differential_predicted'] = model_first.fittedvalues
+
+    # Second Stage: Predicted Differential → Production
+    model_second = fit_ols(df_alberta_2sls['production_kbpd'],
+                           df_alberta_2sls[SECOND_STAGE_REGRESSORS], cov_type=cov_type)
+
+    # Calculate total effect
+    slope = model_first.params['pipeline_capacity_instrument']
+    diff_narrowing_line3 = capacity_line3 * slope / 100
+    diff_narrowing_tmx = capacity_tmx * slope / 100
+
+    # Proper 2SLS: structural residuals for the errors, plus instrument diagnostics.
+    # With line3_post/tmx_post as controls the instrument (a combination of them)
+    # is not excluded, so that version is only checked for identification.
+    engine = run_iv_engine(df_alberta_2sls, cov_type)
+    price = engine['fit']['params'][0, 0]
+
+    return {
+        'first': model_first,
+        'second': model_second,
+        'data': df_alberta_2sls,
+        'capacity_line3': capacity_line3,
+        'capacity_tmx': capacity_tmx,
+        'diff_narrowing_line3': diff_narrowing_line3,
+        'diff_narrowing_tmx': diff_narrowing_tmx,
+        'prod_increase_via_price_line3': diff_narrowing_line3 * price,
+        'prod_increase_via_price_tmx': diff_narrowing_tmx * price,
+        'engine': engine,
+    }
+
+
+def run_iv_engine(df_alberta_2sls, cov_type='HC1'):
+    """
+    2SLS of production on the WCS-WTI differential instrumented by pipeline
+    capacity, controlling for the trend; with cov_type and HAC errors, and
+    whether the model is identified once the direct Line 3/TMX effects are
+    added as controls.
+    """
+    from iv_engine import exog_factor, fit_iv
+
+    y = df_alberta_2sls['production_kbpd'].to_numpy(dtype=float)
+    x = df_alberta_2sls['wcs_wti_differential'].to_numpy(dtype=float)
+    z = df_alberta_2sls['pipeline_capacity_instrument'].to_numpy(dtype=float)
+    exog = np.column_stack([np.ones(len(y)), df_alberta_2sls['time_trend'].to_numpy(dtype=float)])
+    factor = exog_factor(exog)
+    # An event outside the window has an all-zero dummy, which is left out
+    events = [c for c in ['line3_post', 'tmx_post'] if df_alberta_2sls[c].nunique() > 1]
+    direct = np.column_stack([exog, df_alberta_2sls[events].to_numpy(dtype=float)])
+    return {
+        'fit': fit_iv(y, x, exog, z, cov_type=cov_type, factor=factor),
+        'hac': fit_iv(y, x, exog, z, cov_type='HAC', factor=factor),
+        'identified_with_direct': bool(fit_iv(y, x, direct, z, cov_type=cov_type)['identified'][0]),
+    }
 
-print("\nPROBLEM: WCS-WTI differential is endogenous")
-print("  - Pipelines narrow the differential (capacity relief)")
-print("  - Differential affects production (bottleneck signal)")
-print("  → Including both creates 'circular logic'")
 
-print("\nSOLUTION: Use Pipeline Capacity as Instrumental Variable")
-print("  - Instrument: Pipeline capacity (590 kb/d Line 3 + 590 kb/d TMX)")
-print("  - First stage: Capacity → WCS-WTI differential")
-print("  - Second stage: Predicted differential → Production")
-print("  → Isolates causal effect through price mechanism")
+# ===========================
+# 6b. INCREMENTAL REFRESH
+# ===========================
 
-# Prepare Alberta data for 2SLS
-df_alberta_2sls = df_alberta_full.dropna(subset=['wcs_wti_differential'])
+# Second-stage base design: differential_predicted is a combination of the
+# first-stage columns, so the stage is a transform of these cross-products.
+# With the differential itself they also give the 2SLS of run_iv_engine
+# (endogenous, exogenous and excluded-instrument columns in IV_TERMS)
+IV_BASE_COLUMNS = ['const', 'pipeline_capacity_instrument', 'time_trend', 'line3_post', 'tmx_post',
+                   'wcs_wti_differential']
+IV_TERMS = (['wcs_wti_differential'], ['const', 'time_trend'], ['pipeline_capacity_instrument'])
+
+
+def second_stage_transform(g):
+    """
+    M with W M = the second-stage design, ['const'] + SECOND_STAGE_REGRESSORS,
+    for W in IV_BASE_COLUMNS order and first-stage coefficients g in
+    ['const'] + FIRST_STAGE_REGRESSORS order; g may be (..., k) for a batch of M.
+    """
+    g = np.asarray(g, dtype=float)
+    first = ['const'] + FIRST_STAGE_REGRESSORS
+    second = ['const'] + SECOND_STAGE_REGRESSORS
+    M = np.zeros(g.shape[:-1] + (len(IV_BASE_COLUMNS), len(second)))
+    for j, name in enumerate(second):
+        if name == 'differential_predicted':
+            for i, term in enumerate(first):
+                M[..., IV_BASE_COLUMNS.index(term), j] = g[..., i]
+        else:
+            M[..., IV_BASE_COLUMNS.index(name), j] = 1
+    return M
+
+
+def incremental_rows(df_panel, df_alberta_full):
+    """{model: (keys, X, y)} for the DiD, the first stage and the second-stage base design."""
+    def keys(df):
+        return [f"{p}:{y}-{m:02d}" for p, y, m in zip(df['province'], df['year'], df['month'])]
+
+    def design(df, columns):
+        X = df[[c for c in columns if c != 'const']].to_numpy(dtype=float)
+        return np.column_stack([np.ones(len(df)), X])
+
+    df_2sls = df_alberta_full.dropna(subset=['wcs_wti_differential'])
+    return {
+        'did': (keys(df_panel), design(df_panel, DID_REGRESSORS),
+                df_panel['production_kbpd'].to_numpy(dtype=float)),
+        'first': (keys(df_2sls), design(df_2sls, FIRST_STAGE_REGRESSORS),
+                  df_2sls['wcs_wti_differential'].to_numpy(dtype=float)),
+        'second': (keys(df_2sls), design(df_2sls, IV_BASE_COLUMNS[1:]),
+                   df_2sls['production_kbpd'].to_numpy(dtype=float)),
+    }
+
+
+def refresh_incremental(df_panel, df_alberta_full, path=INCREMENTAL_STATE, cov_type='HC1'):
+    """
+    Fold the current panel into the stored sufficient statistics (rank-one
+    updates for new months, downdates for revised or dropped ones) and refit
+    the DiD, both stages and the 2SLS from them. The state is written back to
+    path.
+    """
+    from recursive_ls import RowStore, load_stores, save_stores
+
+    rows = incremental_rows(df_panel, df_alberta_full)
+    stores = load_stores(path) if os.path.exists(path) else {}
+    names = {'did': ['const'] + DID_REGRESSORS, 'first': ['const'] + FIRST_STAGE_REGRESSORS,
+             'second': IV_BASE_COLUMNS}
+    changes = {}
+    for model, (keys, X, y) in rows.items():
+        if model not in stores or stores[model].model.names != names[model]:
+            stores[model] = RowStore(names[model])
+        changes[model] = stores[model].sync(keys, X, y)
+    save_stores(stores, path)
+
+    did = stores['did'].model.fit(cov_type)
+    first = stores['first'].model.fit(cov_type)
+    M = second_stage_transform([first['params'][name] for name in ['const'] + FIRST_STAGE_REGRESSORS])
+    second = stores['second'].model.fit(cov_type, transform=M, names=['const'] + SECOND_STAGE_REGRESSORS)
+    iv = stores['second'].model.fit_iv(*IV_TERMS, cov_type=cov_type)
+    return {'did': did, 'first': first, 'second': second, 'iv': iv, 'changes': changes, 'path': path}
 
-# First Stage: Pipeline Capacity → WCS-WTI Differential
-print("\n### FIRST STAGE: Pipeline Capacity → WCS-WTI Differential ###")
 
-X_first = df_alberta_2sls[['pipeline_capacity_instrument', 'time_trend']]
-X_first = sm.add_constant(X_first)
-y_first = df_alberta_2sls['wcs_wti_differential']
+# ===========================
+# 7. DECLINING EMISSIONS INTENSITY
+# ===========================
 
-model_first = OLS(y_first, X_first).fit(cov_type='HC1')
+def intensity_schedule(base_intensity=BASE_INTENSITY, decline_rate=DECLINE_RATE,
+                       start_year=START_YEAR, end_year=END_YEAR):
+    """Year-specific intensity (kg CO2e/bbl) declining geometrically from start_year."""
+    intensity_by_year = {}
+    for year in range(start_year, end_year + 1):
+        years_since_start = year - start_year
+        intensity_by_year[year] = base_intensity * ((1 - decline_rate) ** years_since_start)
+    return intensity_by_year
+
+
+def compute_emissions(df_alberta_full, base_intensity=BASE_INTENSITY, decline_rate=DECLINE_RATE,
+                      constant_intensity=CONSTANT_INTENSITY, observed_intensity=None):
+    """
+    Period emissions (Mt CO2e/year) under declining and constant intensity.
+    observed_intensity (a schedule spec, e.g. from facility reports) replaces
+    the declining path when given.
+    """
+    from intensity_schedules import build_schedule, evaluate_scenarios, month_index
+
+    start_year = int(df_alberta_full['year'].min())
+    end_year = int(df_alberta_full['year'].max())
+    declining = {'type': 'geometric', 'base': base_intensity, 'decline_rate': decline_rate}
+    if observed_intensity is not None:
+        declining = observed_intensity
+
+    df = df_alberta_full.copy()
+    df['intensity'] = build_schedule(declining, month_index(df))
+    if observed_intensity is None:
+        intensity_by_year = intensity_schedule(base_intensity, decline_rate, start_year, end_year)
+    else:
+        # Production-weighted annual mean of the observed monthly path
+        weighted = (df['intensity'] * df['production_kbpd']).groupby(df['year']).sum()
+        intensity_by_year = (weighted / df.groupby('year')['production_kbpd'].sum()).to_dict()
+
+    # Period emissions are the mean of monthly production x intensity;
+    # both assumptions come out of one scenario pass
+    periods = evaluate_scenarios(df, {'declining': declining, 'constant': constant_intensity})
+    pre_emissions = periods.loc['declining', 'pre']
+    post_line3_emissions = periods.loc['declining', 'post_line3']
+    post_tmx_emissions = periods.loc['declining', 'post_tmx']
+
+    # Compare to constant
+    const_line3 = periods.loc['constant', 'line3_delta']
+    const_tmx = periods.loc['constant', 'tmx_delta']
+
+    return {
+        'intensity_by_year': intensity_by_year,
+        'data': df,
+        'decline_rate': decline_rate,
+        'observed': observed_intensity is not None,
+        'pre_emissions': pre_emissions,
+        'post_line3_emissions': post_line3_emissions,
+        'post_tmx_emissions': post_tmx_emissions,
+        'line3_delta': post_line3_emissions - pre_emissions,
+        'tmx_delta': post_tmx_emissions - post_line3_emissions,
+        'total_delta': post_tmx_emissions - pre_emissions,
+        'constant_intensity': constant_intensity,
+        'const_line3': const_line3,
+        'const_tmx': const_tmx,
+    }
 
-print(f"\nPipeline Capacity: {model_first.params['pipeline_capacity_instrument']:+.4f} $/bbl per 100 kb/d capacity")
-print(f"                    (p={model_first.pvalues['pipeline_capacity_instrument']:.4f})")
-print(f"F-statistic: {model_first.fvalue:.2f}")
 
-if model_first.fvalue > 10:
-    print("✓ Strong instrument (F > 10)")
-else:
-    print("⚠ Weak instrument (F < 10) - results may be unreliable")
+# ===========================
+# 8. SAVE AND VISUALIZE
+# ===========================
 
-# Get predicted differential
-df_alberta_2sls['differential_predicted'] = model_first.predict(X_first)
+def plot_results(df_panel, df_alberta_2sls, intensity_by_year, path=FIGURE_FILE,
+                 line3_start=LINE3_START, tmx_start=TMX_START,
+                 constant_intensity=CONSTANT_INTENSITY, dpi=300, observed=False):
+    """Three-panel figure: DiD comparison, first stage, intensity path."""
+    import matplotlib.pyplot as plt
+    import matplotlib.dates as mdates
+
+    line3_date = pd.Timestamp(year=line3_start[0], month=line3_start[1], day=1)
+    tmx_date = pd.Timestamp(year=tmx_start[0], month=tmx_start[1], day=1)
+    start_year = min(intensity_by_year)
+    end_year = max(intensity_by_year)
+    x_min = pd.Timestamp(f'{start_year}-01-01')
+    x_max = pd.Timestamp(f'{end_year + 1}-01-01')
+
+    fig, axes = plt.subplots(3, 1, figsize=(14, 10))
+
+    # Filter to the analysis window only
+    df_panel_viz = df_panel[df_panel['year'] >= start_year].copy()
+    df_alberta_viz = df_alberta_2sls[df_alberta_2sls['year'] >= start_year].copy().sort_values('date')
+
+    # Plot 1: DiD comparison
+    for province, color in [('Alberta', 'blue'), ('Saskatchewan', 'green')]:
+        data = df_panel_viz[df_panel_viz['province'] == province].sort_values('date')
+        axes[0].plot(data['date'], data['production_kbpd'], color=color, linewidth=2.5, label=province, alpha=0.85)
+
+    axes[0].axvline(line3_date, color='red', linestyle='--', linewidth=2, alpha=0.7, label='Line 3')
+    axes[0].axvline(tmx_date, color='orange', linestyle='--', linewidth=2, alpha=0.7, label='TMX')
+    axes[0].set_ylabel('Production (kb/d)', fontsize=12, fontweight='bold')
+    axes[0].set_title('Difference-in-Differences: Alberta (Treated) vs Saskatchewan (Control)', fontsize=14, fontweight='bold')
+    axes[0].legend(loc='upper left', fontsize=10)
+    axes[0].grid(True, alpha=0.3)
+    axes[0].set_xlim(x_min, x_max)
+    axes[0].xaxis.set_major_formatter(mdates.DateFormatter('%Y'))
+    axes[0].xaxis.set_major_locator(mdates.YearLocator())
+
+    # Plot 2: First stage (capacity → differential)
+    axes[1].plot(df_alberta_viz['date'], df_alberta_viz['wcs_wti_differential'], 'purple', linewidth=2, label='Actual WCS-WTI', alpha=0.7)
+    axes[1].plot(df_alberta_viz['date'], df_alberta_viz['differential_predicted'], 'orange', linewidth=2, linestyle='--', label='Predicted (First Stage)', alpha=0.8)
+    axes[1].axvline(line3_date, color='red', linestyle='--', linewidth=2, alpha=0.7)
+    axes[1].axvline(tmx_date, color='orange', linestyle='--', linewidth=2, alpha=0.7)
+    axes[1].set_ylabel('Differential ($/bbl)', fontsize=12, fontweight='bold')
+    axes[1].set_title('2SLS First Stage: Pipeline Capacity → WCS-WTI Differential', fontsize=12, fontweight='bold')
+    axes[1].legend(loc='upper right', fontsize=10)
+    axes[1].grid(True, alpha=0.3)
+    axes[1].set_xlim(x_min, x_max)
+    axes[1].xaxis.set_major_formatter(mdates.DateFormatter('%Y'))
+    axes[1].xaxis.set_major_locator(mdates.YearLocator())
+
+    # Plot 3: Declining (or observed) intensity
+    years = list(range(start_year, end_year + 1))
+    intensities = [intensity_by_year[y] for y in years]
+    label = 'Observed Intensity (facility reports)' if observed else 'Declining Intensity'
+    axes[2].plot(years, intensities, 'green', linewidth=3, marker='o', markersize=8, label=label)
+    axes[2].axhline(constant_intensity, color='gray', linestyle=':', linewidth=2, label=f'Old Constant ({constant_intensity:.0f} kg/bbl)')
+    axes[2].set_ylabel('Emissions Intensity\n(kg CO2e/bbl)', fontsize=12, fontweight='bold')
+    axes[2].set_xlabel('Year', fontsize=12, fontweight='bold')
+    title = 'Production-Weighted Facility Intensity' if observed else '~2% Annual Decline'
+    axes[2].set_title(f'Emissions Intensity: {title}', fontsize=12, fontweight='bold')
+    axes[2].legend(loc='upper right', fontsize=10)
+    axes[2].grid(True, alpha=0.3)
+    axes[2].set_xlim(start_year - 0.5, end_year + 0.5)
+    axes[2].set_xticks(years)
+
+    plt.tight_layout()
+    plt.savefig(path, dpi=dpi, bbox_inches='tight')
+    plt.close(fig)
+    return path
+
+
+def table_paths(table_format='auto'):
+    """Default (panel, alberta) output paths: CSV files, or dataset directories."""
+    if table_format == 'csv':
+        return f'{PANEL_TABLE}.csv', f'{ALBERTA_2SLS_TABLE}.csv'
+    return PANEL_TABLE, ALBERTA_2SLS_TABLE
+
+
+def export_tables(df_panel, df_alberta_2sls, panel_path=PANEL_TABLE, alberta_path=ALBERTA_2SLS_TABLE,
+                  table_format='auto', float32=False):
+    """
+    Write both panels as compact columnar datasets partitioned by province and
+    year (panel_store.write_panel), or as CSV with table_format='csv'.
+    float32 narrows the measures in the columnar datasets only.
+    """
+    if table_format == 'csv':
+        df_panel.to_csv(panel_path, index=False)
+        df_alberta_2sls.to_csv(alberta_path, index=False)
+        return panel_path, alberta_path
+
+    from panel_store import write_panel
+    write_panel(df_panel, panel_path, table_format, float32)
+    write_panel(df_alberta_2sls, alberta_path, table_format, float32)
+    return panel_path, alberta_path
+
+
+# ===========================
+# CONSOLE REPORTS
+# ===========================
+
+def _stars(p):
+    return '✓✓✓' if p < 0.001 else '✓✓' if p < 0.01 else '✓' if p < 0.05 else ''
 
-# Second Stage: Predicted Differential → Production
-print("\n### SECOND STAGE: Predicted WCS-WTI → Production ###")
 
-X_second = df_alberta_2sls[['differential_predicted', 'line3_post', 'tmx_post', 'time_trend']]
-X_second = sm.add_constant(X_second)
-y_second = df_alberta_2sls['production_kbpd']
+def _banner(title):
+    print("\n" + "="*80)
+    print(title)
+    print("="*80)
+
+
+def report_inputs(inputs):
+    print("\n[1/6] Loading production data (Alberta + Saskatchewan)...")
+    print(f"✓ Saskatchewan: {len(inputs['sask'])} months")
+    print(f"✓ Alberta:      {len(inputs['alberta'])} months")
+
+    print("\n[2/6] Loading CER rail export data...")
+    print("NOTE: Rail data is NATIONAL (not by province)")
+    print("      ~80% of Canadian oil is from Alberta, so rail mostly reflects Alberta constraints")
+    print(f"✓ Loaded {len(inputs['rail'])} months of rail data (national)")
+
+    print("\n[3/6] Loading WCS-WTI price differential data...")
+    print(f"✓ Loaded {len(inputs['prices'])} months of price data")
+
+
+def report_panel(df_panel, df_alberta_full):
+    print("\n[4/6] Creating panel dataset and instruments...")
+    print(f"✓ Panel dataset: {len(df_panel)} observations ({df_panel['province'].nunique()} provinces)")
+    print(f"✓ Alberta dataset with prices: {len(df_alberta_full)} observations")
+
+
+def report_did(did, model_did):
+    _banner("PART 1: DIFFERENCE-IN-DIFFERENCES (Saskatchewan Control)")
+
+    print("\n### DESCRIPTIVE DiD ###")
+    print(f"\nLine 3 Effect:")
+    print(f"  Alberta:      {did['alberta_pre']:.0f} → {did['alberta_post_line3']:.0f} kb/d (Δ = {did['alberta_post_line3'] - did['alberta_pre']:+.0f})")
+    print(f"  Saskatchewan: {did['sask_pre']:.0f} → {did['sask_post_line3']:.0f} kb/d (Δ = {did['sask_post_line3'] - did['sask_pre']:+.0f})")
+    print(f"  → DiD Estimate: {did['line3_did']:+.0f} kb/d")
+    print(f"     (Alberta grew {abs(did['line3_did']):.0f} kb/d MORE than Saskatchewan)")
+
+    print(f"\nTMX Effect:")
+    print(f"  Alberta:      {did['alberta_post_line3']:.0f} → {did['alberta_post_tmx']:.0f} kb/d (Δ = {did['alberta_post_tmx'] - did['alberta_post_line3']:+.0f})")
+    print(f"  Saskatchewan: {did['sask_post_line3']:.0f} → {did['sask_post_tmx']:.0f} kb/d (Δ = {did['sask_post_tmx'] - did['sask_post_line3']:+.0f})")
+    print(f"  → DiD Estimate: {did['tmx_did']:+.0f} kb/d")
+
+    # Regression DiD
+    print("\n### REGRESSION DiD (Controls for Trends) ###")
+    print(f"\nLine 3 DiD:  {model_did.params['line3_did']:+7.1f} kb/d (p={model_did.pvalues['line3_did']:.4f}) {_stars(model_did.pvalues['line3_did'])}")
+    print(f"TMX DiD:     {model_did.params['tmx_did']:+7.1f} kb/d (p={model_did.pvalues['tmx_did']:.4f}) {_stars(model_did.pvalues['tmx_did'])}")
+    print(f"R²:          {model_did.rsquared:.3f}")
+
+    print("\n→ TRUE CAUSAL ESTIMATES: Saskatchewan control differences out common shocks")
+
+
+def report_iv(iv):
+    model_first = iv['first']
+    model_second = iv['second']
+
+    _banner("PART 2: TWO-STAGE LEAST SQUARES (Addresses WCS-WTI Endogeneity)")
+
+    print("\nPROBLEM: WCS-WTI differential is endogenous")
+    print("  - Pipelines narrow the differential (capacity relief)")
+    print("  - Differential affects production (bottleneck signal)")
+    print("  → Including both creates 'circular logic'")
+
+    print("\nSOLUTION: Use Pipeline Capacity as Instrumental Variable")
+    print(f"  - Instrument: Pipeline capacity ({iv['capacity_line3']:.0f} kb/d Line 3 + {iv['capacity_tmx']:.0f} kb/d TMX)")
+    print("  - First stage: Capacity → WCS-WTI differential")
+    print("  - Second stage: Predicted differential → Production")
+    print("  → Isolates causal effect through price mechanism")
+
+    print("\n### FIRST STAGE: Pipeline Capacity → WCS-WTI Differential ###")
+    print(f"\nPipeline Capacity: {model_first.params['pipeline_capacity_instrument']:+.4f} $/bbl per 100 kb/d capacity")
+    print(f"                    (p={model_first.pvalues['pipeline_capacity_instrument']:.4f})")
+    print(f"F-statistic: {model_first.fvalue:.2f}")
+
+    if model_first.fvalue > 10:
+        print("✓ Strong instrument (F > 10)")
+    else:
+        print("⚠ Weak instrument (F < 10) - results may be unreliable")
+
+    print("\n### SECOND STAGE (two-step, with direct effects): Predicted WCS-WTI → Production ###")
+    print(f"\nPredicted WCS-WTI: {model_second.params['differential_predicted']:+7.2f} kb/d per $/bbl (p={model_second.pvalues['differential_predicted']:.4f})")
+    print(f"Line 3 (direct):   {model_second.params['line3_post']:+7.1f} kb/d (p={model_second.pvalues['line3_post']:.4f})")
+    print(f"TMX (direct):      {model_second.params['tmx_post']:+7.1f} kb/d (p={model_second.pvalues['tmx_post']:.4f})")
+    print(f"R²:                {model_second.rsquared:.3f}")
+
+    fit, hac = iv['engine']['fit'], iv['engine']['hac']
+    print("\n### INTERPRETATION ###")
+    print(f"• Price mechanism effect: {fit['params'][0, 0]:.1f} kb/d per $/bbl differential (2SLS below)")
+    print(f"• This is the CAUSAL effect of capacity relief working through prices")
+    print(f"• Direct treatment effects capture any non-price mechanisms")
+
+    print(f"\n### TOTAL EFFECTS (Through Price Mechanism, 2SLS) ###")
+    print(f"Line 3: {iv['capacity_line3']:.0f} kb/d capacity → {iv['diff_narrowing_line3']:.2f} $/bbl narrowing → {iv['prod_increase_via_price_line3']:.0f} kb/d production")
+    print(f"TMX:    {iv['capacity_tmx']:.0f} kb/d capacity → {iv['diff_narrowing_tmx']:.2f} $/bbl narrowing → {iv['prod_increase_via_price_tmx']:.0f} kb/d production")
+
+    print("\n### 2SLS WITH IV STANDARD ERRORS (capacity → differential → production, trend control) ###")
+    print(f"\nWCS-WTI (2SLS): {fit['params'][0, 0]:+7.2f} kb/d per $/bbl")
+    print(f"  {fit['cov_type']} se: {fit['bse'][0, 0]:6.2f} (p={fit['pvalues'][0, 0]:.4f})")
+    print(f"  HAC se: {hac['bse'][0, 0]:6.2f} (p={hac['pvalues'][0, 0]:.4f}, {hac['lags']} lags)")
+    print(f"First-stage F: {fit['first_f'][0, 0]:.2f} ({fit['cov_type']}), {hac['first_f'][0, 0]:.2f} (HAC)")
+    print(f"Kleibergen-Paap rk Wald F: {fit['kp_f'][0]:.2f} (p={fit['kp_rk_p'][0]:.4f})")
+    print(f"Anderson-Rubin test of no price effect: p={fit['ar_p'][0]:.4f} ({fit['cov_type']}), {hac['ar_p'][0]:.4f} (HAC)")
+    if min(fit['first_f'][0, 0], hac['first_f'][0, 0]) < 10:
+        print("⚠ Weak instrument (F < 10) - rely on the Anderson-Rubin test rather than the t-test")
+    if not iv['engine']['identified_with_direct']:
+        print("⚠ With the direct Line 3/TMX effects as controls the capacity instrument is a")
+        print("  combination of them and is not excluded: that 2SLS is not identified, and the")
+        print("  two-step second stage above is a pseudo-inverse solution")
+
+
+def report_emissions(em):
+    if em.get('observed'):
+        _banner("PART 3: EMISSIONS WITH OBSERVED FACILITY INTENSITY")
+        print("\nEmissions Intensity (production-weighted facility reports):")
+    else:
+        _banner(f"PART 3: EMISSIONS WITH DECLINING INTENSITY (~{em['decline_rate'] * 100:g}%/year)")
+        print("\nEmissions Intensity (Technological Improvement):")
+    for year, intensity in em['intensity_by_year'].items():
+        print(f"  {year}: {intensity:.1f} kg CO2e/bbl")
+
+    kind = 'Observed' if em.get('observed') else 'Declining'
+    print(f"\n### EMISSIONS CHANGES ({kind} Intensity) ###")
+    print(f"Line 3: {em['line3_delta']:+.1f} Mt CO2e/year")
+    print(f"TMX:    {em['tmx_delta']:+.1f} Mt CO2e/year")
+    print(f"Total:  {em['total_delta']:+.1f} Mt CO2e/year")
+
+    print(f"\nWith CONSTANT intensity ({em['constant_intensity']:.0f} kg/bbl): {em['const_line3'] + em['const_tmx']:+.1f} Mt/year")
+    print(f"{'With ' + kind.upper() + ' intensity:':<38}{em['total_delta']:+.1f} Mt/year")
+    print(f"Difference: {em['total_delta'] - (em['const_line3'] + em['const_tmx']):.1f} Mt/year")
+    if not em.get('observed'):
+        print("→ Technology improvements partially offset production growth")
+
+
+def report_permutation(summary):
+    _banner("RANDOMIZATION INFERENCE: PLACEBO DATES AND ASSIGNMENTS")
+
+    print("\nExact permutation p-values (share of placebo effects at least as large):")
+    for _, row in summary.iterrows():
+        label = 'Line 3 DiD' if row['effect'] == 'line3_did' else 'TMX DiD'
+        print(f"  {label:<11} vs {row['placebos']:>5} placebo {row['mode']:<11}: "
+              f"{row['estimate']:+7.1f} kb/d (placebo mean {row['placebo_mean']:+6.1f}, "
+              f"sd {row['placebo_sd']:5.1f})  p={row['p_value']:.4f} {_stars(row['p_value'])}")
+
+
+def report_bootstrap(summary, reps):
+    method = summary['method'].iloc[0]
+    _banner(f"BOOTSTRAP INFERENCE: {method.upper()} ({reps:,} replications)")
+
+    labels = {
+        'line3_did': 'Line 3 DiD (kb/d)',
+        'tmx_did': 'TMX DiD (kb/d)',
+        'pipeline_capacity_instrument': 'First stage ($/bbl per kb/d)',
+        'iv_price': '2SLS price (kb/d per $/bbl)',
+        'prod_increase_via_price_line3': 'Line 3 via price (kb/d)',
+        'prod_increase_via_price_tmx': 'TMX via price (kb/d)',
+    }
+    print("\n95% percentile intervals:")
+    for _, row in summary.iterrows():
+        print(f"  {labels[row['term']]:<31} {row['estimate']:>10.4f}  se={row['boot_se']:<9.4f} "
+              f"[{row['ci_low']:>10.4f}, {row['ci_high']:>10.4f}]  ({row['draws']:,} valid draws)")
+
+
+def report_uncertainty(summary, n_draws):
+    _banner(f"EMISSIONS UNCERTAINTY ({n_draws:,} Monte Carlo draws)")
+
+    labels = {
+        'line3_delta': 'Line 3 (observed production)',
+        'tmx_delta': 'TMX (observed production)',
+        'total_delta': 'Total (observed production)',
+        'did_line3': 'Line 3 (DiD effect)',
+        'did_tmx': 'TMX (DiD effect)',
+        'did_total': 'Total (DiD effect)',
+        'price_line3': 'Line 3 (via price, 2SLS)',
+        'price_tmx': 'TMX (via price, 2SLS)',
+        'price_total': 'Total (via price, 2SLS)',
+    }
+    print(f"\n{'Mt CO2e/year':<31} {'point':>7} {'median':>7} {'90% band':>17} {'95% band':>17}")
+    for _, row in summary.iterrows():
+        print(f"{labels[row['output']]:<31} {row['point']:+7.2f} {row['q50']:+7.2f} "
+              f"[{row['q5']:+6.2f}, {row['q95']:+6.2f}] [{row['q2.5']:+6.2f}, {row['q97.5']:+6.2f}]")
+
+
+def report_scenarios(result):
+    _banner(f"EMISSIONS UNDER {len(result)} INTENSITY SCENARIOS (Mt CO2e/year)")
+
+    print(f"\n{'Scenario':<24} {'Line 3':>8} {'TMX':>8} {'Total':>8}")
+    for name, row in result.iterrows():
+        print(f"{name:<24} {row['line3_delta']:+8.2f} {row['tmx_delta']:+8.2f} {row['total_delta']:+8.2f}")
+
+
+def report_refresh(result):
+    _banner("INCREMENTAL REFRESH FROM STORED SUFFICIENT STATISTICS")
+
+    print()
+    for model, c in result['changes'].items():
+        print(f"  {model:<7} {c['added']:>4} rows added, {c['revised']:>4} revised, {c['removed']:>4} removed "
+              f"({result[model]['nobs']} held)")
+    print(f"✓ Saved: {result['path']}")
+
+    print(f"\n{'Coefficient':<31} {'estimate':>10} {'se':>9} {'p':>7}   ({result['did']['cov_type']})")
+    for model, term, label in [('did', 'line3_did', 'Line 3 DiD (kb/d)'),
+                               ('did', 'tmx_did', 'TMX DiD (kb/d)'),
+                               ('first', 'pipeline_capacity_instrument', 'First stage ($/bbl per kb/d)'),
+                               ('iv', 'wcs_wti_differential', '2SLS price (kb/d per $/bbl)')]:
+        fit = result[model]
+        p = fit['pvalues'][term]
+        if np.isnan(fit['params'][term]):
+            print(f"{label:<31} {'not identified':>18}")
+            continue
+        print(f"{label:<31} {fit['params'][term]:>10.4f} {fit['bse'][term]:>9.4f} {p:>7.4f} {_stars(p)}")
+    if np.isnan(result['second']['params']['differential_predicted']):
+        print("(The two-step second stage keeps the Line 3/TMX dummies, so its price term is not identified)")
+
+
+def report_rolling(paths, figure):
+    _banner(f"ROLLING AND EXPANDING DiD ({paths[['kind', 'length', 'start']].drop_duplicates().shape[0]} windows)")
+
+    labels = {'line3_did': 'Line 3', 'tmx_did': 'TMX'}
+    print(f"\n{'Windows':<24} {'Effect':<7} {'fitted':>6} {'median':>8} {'range':>19} {'latest':>8} {'95% CI':>19}")
+    names = paths['kind'].map({'rolling': 'rolling {} months', 'expanding': 'expanding',
+                               'event': 'event +-{} months'})
+    paths = paths.assign(windows=[n.format(L) for n, L in zip(names, paths['length'])])
+    for (name, effect), group in paths.groupby(['windows', 'effect'], sort=False):
+        valid = group.dropna(subset=['estimate'])
+        if valid.empty:
+            print(f"{name:<24} {labels[effect]:<7} {0:>6}   (not identified in any window)")
+            continue
+        last = valid.iloc[-1]
+        print(f"{name:<24} {labels[effect]:<7} {len(valid):>6} {valid['estimate'].median():+8.1f} "
+              f"[{valid['estimate'].min():+7.1f}, {valid['estimate'].max():+7.1f}] {last['estimate']:+8.1f} "
+              f"[{last['ci_low']:+7.1f}, {last['ci_high']:+7.1f}]")
+    print(f"✓ Saved: {figure}")
+
+
+def report_event_study(specs, coefs, pretrends, figure):
+    _banner(f"EVENT STUDY: {len(specs)} LEAD/LAG SPECIFICATIONS")
+
+    print(f"\n{'Spec':<22} {'Event':<7} {'mean lead':>10} {'mean lag':>10} {'pre-trend test':>22} {'not identified':>15}")
+    for spec in specs.itertuples():
+        name = f"-{spec.leads}..+{spec.lags} {spec.binning}"
+        for t in pretrends[pretrends['spec'] == spec.spec].itertuples():
+            rows = coefs[(coefs['spec'] == spec.spec) & (coefs['event'] == t.event)]
+            test = f"p={t.p_value:.3f} (df {t.df})" if t.df else "no leads identified"
+            print(f"{name:<22} {t.event:<7} {t.mean_lead:+10.1f} {t.mean_lag:+10.1f} {test:>22} "
+                  f"{rows['estimate'].isna().sum():>15}")
+    print("Mean lead/lag: average identified coefficient before/after in-service (kb/d vs the month before)")
+    print(f"✓ Saved: {figure} (spec {specs.iloc[0]['leads']}/{specs.iloc[0]['lags']} {specs.iloc[0]['binning']})")
+
+
+def report_breaks(breaks, reps, level):
+    from structural_breaks import SERIES
+
+    _banner("STRUCTURAL BREAKS: ESTIMATED VS ASSUMED DATES")
+
+    for name, group in breaks.groupby('series', sort=False):
+        print(f"\n{SERIES[name]}")
+        print(f"  {'Test':<12} {'F':>8} {'p':>7} {'':<3} {'Break':<7}  {f'{level:.0%} CI':<18} {'Nearest in-service':>22}")
+        for row in group.itertuples():
+            print(f"  {row.test:<12} {row.statistic:>8.2f} {row.p_value:>7.3f} {_stars(row.p_value):<3} "
+                  f"{row.date:%Y-%m}  [{row.ci_low:%Y-%m}, {row.ci_high:%Y-%m}] "
+                  f"{f'{row.nearest} {row.months_off:+.0f} months':>22}")
+    print(f"p-values: AR(1) sieve bootstrap, {reps:,} replications")
+
+
+def report_influence(rows, groups, flagged, top):
+    _banner("INFLUENCE: LEAVE-ONE-OUT, LEAVE-ONE-YEAR-OUT, LEAVE-ONE-PROVINCE-OUT")
+
+    labels = {'line3_did': 'Line 3 DiD', 'tmx_did': 'TMX DiD', 'pipeline_capacity_instrument': 'First stage',
+              'wcs_wti_differential': '2SLS price', 'differential_predicted': 'Two-step'}
+    print(f"\n{'Term':<13} {'estimate':>10} {'leave-one-out range':>23} {'flagged':>9}   most influential")
+    for (model, term), group in rows.groupby(['model', 'term'], sort=False):
+        if not group['identified'].iloc[0]:
+            print(f"{labels[term]:<13} {'not identified':>10}  (pseudo-inverse value {group['estimate'].iloc[0]:.4g}; "
+                  f"not flagged)")
+            continue
+        valid = group.dropna(subset=['loo_estimate'])
+        worst = valid.loc[valid['dfbetas'].abs().idxmax()]
+        print(f"{labels[term]:<13} {group['estimate'].iloc[0]:>10.4g} "
+              f"[{valid['loo_estimate'].min():>10.4g}, {valid['loo_estimate'].max():>10.4g}] "
+              f"{group['flagged'].sum():>4}/{len(group):<4}   {worst['date']:%Y-%m} {worst['province']} "
+              f"(dfbetas {worst['dfbetas']:+.2f})")
+
+    groups = groups[groups['identified']]
+    years = groups[groups['kind'] == 'year'].pivot(index='group', columns='term', values='loo_estimate')
+    years = years[[t for t in labels if t in years.columns]]
+    print(f"\nWithout year  " + "".join(f"{labels[t]:>14}" for t in years.columns))
+    for year, values in years.iterrows():
+        print(f"{year:<13} " + "".join(f"{v:>14.4g}" for v in values))
+
+    provinces = groups[groups['kind'] == 'province']
+    if len(provinces):
+        print()
+    for row in provinces.itertuples():
+        estimate = 'not identified' if np.isnan(row.loo_estimate) else f"{row.loo_estimate:.4g}"
+        print(f"Without {row.group:<13} {labels[row.term]:<13} {estimate}")
+
+    print(f"\nFlagged months (|dfbetas| > 2/sqrt(n) or Cook's D > 4/n): {len(flagged)}")
+    for row in flagged.head(top).itertuples():
+        print(f"  {row.date:%Y-%m}  max |dfbetas| {row.max_abs_dfbetas:5.2f}  {row.worst}   [{row.flags}]")
+
+
+def report_synth(result, treated, figure):
+    units = result['units']
+    _banner(f"SYNTHETIC CONTROL: {treated.upper()} FROM {len(result['weights'])} DONORS ({result['fit']} fit)")
+
+    print(f"\n{'Donor':<28} {'weight':>8}")
+    for donor, weight in result['weights'].sort_values(ascending=False).items():
+        if weight > 1e-4:
+            print(f"{donor:<28} {weight:>8.3f}")
+
+    own = units[~units['placebo']].iloc[0]
+    print(f"\nPre-period RMSPE:  {own['pre_rmspe']:.1f} kb/d")
+    for event, label in [('line3', 'Line 3'), ('tmx', 'TMX')]:
+        if f'{event}_gap' in units:
+            print(f"Mean gap after {label + ':':<8} {own[f'{event}_gap']:+.1f} kb/d (actual - synthetic)")
+    placebos = units['placebo'].sum()
+    if placebos:
+        print(f"Post/pre RMSPE ratio {own['ratio']:.2f}: rank p-value {result['p_value']:.3f} "
+              f"among {len(units)} units ({placebos} placebos)")
+    else:
+        print("⚠ No placebo has a donor pool; add provinces (full-table download) for inference")
+    print(f"✓ Saved: {figure}")
+
+
+def report_throughput(monthly, capacity):
+    _banner(f"CER KEY-POINT THROUGHPUT: {monthly['pipeline'].nunique()} PIPELINES, "
+            f"{len(monthly[['pipeline', 'key_point']].drop_duplicates())} KEY POINTS")
+
+    print(f"\n{'Pipeline / key point':<48} {'days':>6} {'kb/d':>8} {'cap':>8} {'util':>6} {'apport':>7}")
+    for (pipeline, point), rows in monthly.groupby(['pipeline', 'key_point'], sort=False):
+        apportioned = rows['apportionment'].mean()
+        print(f"{(pipeline + ' / ' + point)[:48]:<48} {rows['days'].sum():>6} "
+              f"{rows['throughput_kbpd'].mean():>8.0f} {rows['capacity_kbpd'].mean():>8.0f} "
+              f"{rows['utilization'].mean():>6.1%} {'' if np.isnan(apportioned) else f'{apportioned:.1%}':>7}")
+
+    first, last = capacity.iloc[0], capacity.iloc[-1]
+    print(f"\nObserved export capacity: {first['capacity_kbpd']:,.0f} kb/d ({int(first['year'])}-{int(first['month']):02d})"
+          f" -> {last['capacity_kbpd']:,.0f} kb/d ({int(last['year'])}-{int(last['month']):02d})")
+    print(f"Utilization over the period: {capacity['utilization'].min():.1%} - {capacity['utilization'].max():.1%}")
+    print("With --throughput, the 2SLS instrument is this capacity less its first panel month")
+
+
+def report_service(service, host, port):
+    _banner("SCENARIO QUERY SERVICE")
+    grid = service.cube.grid
+    status = "built" if service.built else "loaded"
+    print(f"\n✓ Results cube {status}: {len(service.cube.tables['did'])} window/date cells, "
+          f"{len(grid['capacity_line3']) * len(grid['capacity_tmx'])} capacity pairs, "
+          f"{len(grid['base_intensity']) * len(grid['decline_rate'])} intensity paths")
+    print(f"Listening on http://{host}:{port}/  (Ctrl-C to stop)")
+    print(f"  GET  /scenario?capacity_tmx=890&decline_rate=0.013")
+    print(f"  POST /scenario  {{\"line3_start\": \"2021-11\", \"exact\": true}}")
+    print(f"  GET  /grid, /health")
+
+
+def report_outputs(paths):
+    print("\n[5/6] Creating visualizations...")
+    print(f"✓ Saved: {FIGURE_FILE}")
+    print(f"✓ Saved: {paths[0]}, {paths[1]}")
+
+
+def report_summary(did, iv, em):
+    _banner("ANALYSIS COMPLETE - ALL IMPROVEMENTS IMPLEMENTED")
+
+    print("\n### SUMMARY OF IMPROVEMENTS ###")
+    print("\n1. TRUE DiD (Saskatchewan Control):")
+    print(f"   • Line 3 causal effect: {did['line3_did']:+.0f} kb/d")
+    print(f"   • TMX causal effect: {did['tmx_did']:+.0f} kb/d")
+    print("   • Control group differences out COVID, prices, policies")
+
+    print("\n2. Two-Stage Least Squares (WCS-WTI Endogeneity):")
+    print(f"   • Pipeline capacity is EXOGENOUS instrument")
+    print(f"   • Isolates price mechanism: {iv['engine']['fit']['params'][0, 0]:.1f} kb/d per $/bbl")
+    print(f"   • No circular logic - proper causal inference")
+
+    kind = 'Observed' if em.get('observed') else 'Declining'
+    gap = em['total_delta'] - (em['const_line3'] + em['const_tmx'])
+    print(f"\n3. {kind} Emissions Intensity:")
+    print(f"   • Total emissions: {em['total_delta']:.1f} Mt/year")
+    print(f"   • {abs(gap):.1f} Mt/year {'higher' if gap > 0 else 'lower'} than constant assumption")
+    if em.get('observed'):
+        print("   • Uses facility-reported intensity")
+    else:
+        print("   • Accounts for technological progress")
+
+    print("\n### READY FOR ECCC CONSULTATION ###")
+    print("✓ Causal inference (DiD with control)")
+    print("✓ Proper instrumentation (2SLS for endogeneity)")
+    if em.get('observed'):
+        print("✓ Observed intensity (facility reports)")
+    else:
+        print("✓ Realistic assumptions (declining intensity)")
+    print("✓ Addresses all major critiques")
 
-model_second = OLS(y_second, X_second).fit(cov_type='HC1')
 
-print(f"\nPredicted WCS-WTI: {model_second.params['differential_predicted']:+7.2f} kb/d per $/bbl (p={model_second.pvalues['differential_predicted']:.4f})")
-print(f"Line 3 (direct):   {model_second.params['line3_post']:+7.1f} kb/d (p={model_second.pvalues['line3_post']:.4f})")
-print(f"TMX (direct):      {model_second.params['tmx_post']:+7.1f} kb/d (p={model_second.pvalues['tmx_post']:.4f})")
-print(f"R²:                {model_second.rsquared:.3f}")
+# ===========================
+# STAGE GRAPH
+# ===========================
 
-print("\n### INTERPRETATION ###")
-print(f"• Price mechanism effect: {model_second.params['differential_predicted']:.1f} kb/d per $/bbl differential")
-print(f"• This is the CAUSAL effect of capacity relief working through prices")
-print(f"• Direct treatment effects capture any non-price mechanisms")
+DEFAULT_PARAMS = {
+    'statcan': STATCAN_FILE,
+    'rail': RAIL_FILE,
+    'start_year': START_YEAR,
+    'end_year': END_YEAR,
+    'line3_start': LINE3_START,
+    'tmx_start': TMX_START,
+    'capacity_line3': CAPACITY_LINE3,
+    'capacity_tmx': CAPACITY_TMX,
+    'cov_type': 'HC1',
+    'base_intensity': BASE_INTENSITY,
+    'decline_rate': DECLINE_RATE,
+    'constant_intensity': CONSTANT_INTENSITY,
+    'facilities': None,
+    'prices': None,
+    'price_statistic': 'mean',
+    'throughput': None,
+    'figure': FIGURE_FILE,
+    'panel_table': PANEL_TABLE,
+    'alberta_table': ALBERTA_2SLS_TABLE,
+    'table_format': 'auto',
+    'float32': False,
+}
 
-# Calculate total effect
-capacity_line3 = 590
-capacity_tmx = 590
-diff_narrowing_line3 = capacity_line3 * model_first.params['pipeline_capacity_instrument'] / 100
-diff_narrowing_tmx = capacity_tmx * model_first.params['pipeline_capacity_instrument'] / 100
 
-prod_increase_via_price_line3 = diff_narrowing_line3 * model_second.params['differential_predicted']
-prod_increase_via_price_tmx = diff_narrowing_tmx * model_second.params['differential_predicted']
+def run_params(**overrides):
+    """DEFAULT_PARAMS with overrides applied; unknown names are rejected."""
+    unknown = set(overrides) - set(DEFAULT_PARAMS)
+    if unknown:
+        raise KeyError(f"unknown run parameters: {sorted(unknown)}")
+    return {**DEFAULT_PARAMS, **overrides}
+
+
+def build_graph(ingest_cache=None, persist=True, observer=None):
+    """
+    The analysis as a StageGraph. Each stage declares the run parameters it
+    reads, so changing one assumption only re-runs the stages downstream of it.
+    observer (a RunReport) is told how long each stage took.
+    """
+    graph = StageGraph(persist=persist, observer=observer)
+
+    def inputs(statcan, rail, start_year, end_year, prices, price_statistic, throughput):
+        return load_inputs(statcan, rail, ingest_cache, start_year, end_year, prices, price_statistic,
+                           throughput)
+
+    def panel(inputs, line3_start, tmx_start, capacity_line3, capacity_tmx):
+        return build_panel(inputs['alberta'], inputs['sask'], inputs['prices'], inputs['rail'],
+                           line3_start, tmx_start, capacity_line3, capacity_tmx, inputs['capacity'])
+
+    def did(panel, cov_type):
+        return run_did(panel[0], cov_type)
+
+    def iv(panel, capacity_line3, capacity_tmx, cov_type):
+        return run_iv(panel[1], capacity_line3, capacity_tmx, cov_type)
+
+    def facility_intensity(facilities):
+        if facilities is None:
+            return None
+        from facility_emissions import facility_intensity
+        return facility_intensity(facilities, ingest_cache)
+
+    def emissions(panel, facility_intensity, base_intensity, decline_rate, constant_intensity):
+        observed = None
+        if facility_intensity is not None:
+            from facility_emissions import observed_schedule
+            observed = observed_schedule(facility_intensity)
+        return compute_emissions(panel[1], base_intensity, decline_rate, constant_intensity, observed)
+
+    def outputs(panel, iv, emissions, figure, panel_table, alberta_table, table_format, float32,
+                line3_start, tmx_start, constant_intensity):
+        plot_results(panel[0], iv['data'], emissions['intensity_by_year'], figure,
+                     line3_start, tmx_start, constant_intensity, observed=emissions['observed'])
+        return export_tables(panel[0], iv['data'], panel_table, alberta_table, table_format, float32)
+
+    graph.add('inputs', inputs, params=['statcan', 'rail', 'start_year', 'end_year', 'prices', 'price_statistic',
+                                        'throughput'],
+              sources=['statcan', 'rail', 'prices', 'throughput'])
+    graph.add('panel', panel, deps=['inputs'],
+              params=['line3_start', 'tmx_start', 'capacity_line3', 'capacity_tmx'])
+    graph.add('descriptive_did', lambda panel: descriptive_did(panel[0]), deps=['panel'])
+    graph.add('did', did, deps=['panel'], params=['cov_type'])
+    graph.add('iv', iv, deps=['panel'], params=['capacity_line3', 'capacity_tmx', 'cov_type'], version=3)
+    graph.add('facility_intensity', facility_intensity, params=['facilities'], sources=['facilities'])
+    graph.add('emissions', emissions, deps=['panel', 'facility_intensity'],
+              params=['base_intensity', 'decline_rate', 'constant_intensity'], version=3)
+    graph.add('outputs', outputs, deps=['panel', 'iv', 'emissions'],
+              params=['figure', 'panel_table', 'alberta_table', 'table_format', 'float32',
+                      'line3_start', 'tmx_start', 'constant_intensity'],
+              outputs=['figure', 'panel_table', 'alberta_table'], version=2)
+    return graph
 
-print(f"\n### TOTAL EFFECTS (Through Price Mechanism) ###")
-print(f"Line 3: {capacity_line3} kb/d capacity → {diff_narrowing_line3:.2f} $/bbl narrowing → {prod_increase_via_price_line3:.0f} kb/d production")
-print(f"TMX:    {capacity_tmx} kb/d capacity → {diff_narrowing_tmx:.2f} $/bbl narrowing → {prod_increase_via_price_tmx:.0f} kb/d production")
 
 # ===========================
-# 7. DECLINING EMISSIONS INTENSITY
+# COMMAND LINE
 # ===========================
 
-print("\n" + "="*80)
-print("PART 3: EMISSIONS WITH DECLINING INTENSITY (~2%/year)")
-print("="*80)
+def _ingest_cache(args):
+    """The command's IngestCache (None with --no-cache), counted in the run report."""
+    ingest_cache = None if args.no_cache else IngestCache()
+    run_report = getattr(args, 'run_report', None)
+    if run_report is not None and ingest_cache is not None:
+        run_report.counters['ingest_cache'] = lambda: ingest_cache.stats
+    return ingest_cache
 
-# Year-specific intensity
-base_intensity = 75.0
-decline_rate = 0.02
 
-intensity_by_year = {}
-for year in range(2018, 2025):
-    years_since_2018 = year - 2018
-    intensity_by_year[year] = base_intensity * ((1 - decline_rate) ** years_since_2018)
+def _stage(args, name, func, inputs=None, status=COMPUTED):
+    """
+    func() as stage `name` of the run report, for commands that do not go
+    through the StageGraph. inputs ({name: value}) only feed the row counts;
+    status may be a function of the result (e.g. computed vs loaded).
+    """
+    run_report = getattr(args, 'run_report', None)
+    if run_report is None:
+        return func()
+    with run_report.measure(name):
+        result = func()
+    run_report.finish(name, status(result) if callable(status) else status, None, inputs, result)
+    return result
 
-print("\nEmissions Intensity (Technological Improvement):")
-for year, intensity in intensity_by_year.items():
-    print(f"  {year}: {intensity:.1f} kg CO2e/bbl")
 
-df_alberta_full['intensity'] = df_alberta_full['year'].map(intensity_by_year)
+def _run(args, targets):
+    ingest_cache = _ingest_cache(args)
+    run_report = getattr(args, 'run_report', None)
+    graph = build_graph(ingest_cache, persist=not args.no_cache, observer=run_report)
+    params = run_params(statcan=args.statcan, rail=args.rail,
+                        start_year=args.start_year, end_year=args.end_year,
+                        capacity_line3=args.capacity_line3, capacity_tmx=args.capacity_tmx,
+                        base_intensity=args.base_intensity, decline_rate=args.decline_rate,
+                        constant_intensity=args.constant_intensity, facilities=args.facilities,
+                        prices=args.prices, price_statistic=args.price_statistic, throughput=args.throughput)
+    params['panel_table'], params['alberta_table'] = table_paths(args.table_format)
+    params.update(table_format=args.table_format, float32=args.float32)
+    args.graph = graph
+    return graph.run(targets, params)
 
-# Calculate by period
-pre_data = df_alberta_full[df_alberta_full['line3_post'] == 0]
-post_line3_data = df_alberta_full[(df_alberta_full['line3_post'] == 1) & (df_alberta_full['tmx_post'] == 0)]
-post_tmx_data = df_alberta_full[df_alberta_full['tmx_post'] == 1]
 
-pre_emissions = pre_data['production_kbpd'].mean() * pre_data['intensity'].mean() * 365.25 / 1_000_000
-post_line3_emissions = post_line3_data['production_kbpd'].mean() * post_line3_data['intensity'].mean() * 365.25 / 1_000_000
-post_tmx_emissions = post_tmx_data['production_kbpd'].mean() * post_tmx_data['intensity'].mean() * 365.25 / 1_000_000
+def cmd_ingest(args):
+    report_inputs(_run(args, ['inputs'])['inputs'])
 
-print(f"\n### EMISSIONS CHANGES (Declining Intensity) ###")
-print(f"Line 3: {post_line3_emissions - pre_emissions:+.1f} Mt CO2e/year")
-print(f"TMX:    {post_tmx_emissions - post_line3_emissions:+.1f} Mt CO2e/year")
-print(f"Total:  {post_tmx_emissions - pre_emissions:+.1f} Mt CO2e/year")
 
-# Compare to constant
-constant_intensity = 67.0
-const_line3 = (post_line3_data['production_kbpd'].mean() - pre_data['production_kbpd'].mean()) * constant_intensity * 365.25 / 1_000_000
-const_tmx = (post_tmx_data['production_kbpd'].mean() - post_line3_data['production_kbpd'].mean()) * constant_intensity * 365.25 / 1_000_000
+def cmd_did(args):
+    r = _run(args, ['descriptive_did', 'did'])
+    report_did(r['descriptive_did'], r['did'])
 
-print(f"\nWith CONSTANT intensity (67 kg/bbl): {const_line3 + const_tmx:+.1f} Mt/year")
-print(f"With DECLINING intensity:             {post_tmx_emissions - pre_emissions:+.1f} Mt/year")
-print(f"Difference: {(post_tmx_emissions - pre_emissions) - (const_line3 + const_tmx):.1f} Mt/year")
-print("→ Technology improvements partially offset production growth")
 
-# ===========================
-# 8. SAVE AND VISUALIZE
-# ===========================
+def cmd_iv(args):
+    report_iv(_run(args, ['iv'])['iv'])
+
+
+def cmd_emissions(args):
+    report_emissions(_run(args, ['emissions'])['emissions'])
+
+
+def cmd_plot(args):
+    report_outputs(_run(args, ['outputs'])['outputs'])
 
-print("\n[5/6] Creating visualizations...")
-
-fig, axes = plt.subplots(3, 1, figsize=(14, 10))
-
-# Filter to 2018-2024 only
-df_panel_viz = df_panel[df_panel['year'] >= 2018].copy()
-df_alberta_viz = df_alberta_2sls[df_alberta_2sls['year'] >= 2018].copy().sort_values('date')
-
-# Plot 1: DiD comparison
-for province, color in [('Alberta', 'blue'), ('Saskatchewan', 'green')]:
-    data = df_panel_viz[df_panel_viz['province'] == province].sort_values('date')
-    axes[0].plot(data['date'], data['production_kbpd'], color=color, linewidth=2.5, label=province, alpha=0.85)
-
-axes[0].axvline(pd.Timestamp('2021-10-01'), color='red', linestyle='--', linewidth=2, alpha=0.7, label='Line 3')
-axes[0].axvline(pd.Timestamp('2024-05-01'), color='orange', linestyle='--', linewidth=2, alpha=0.7, label='TMX')
-axes[0].set_ylabel('Production (kb/d)', fontsize=12, fontweight='bold')
-axes[0].set_title('Difference-in-Differences: Alberta (Treated) vs Saskatchewan (Control)', fontsize=14, fontweight='bold')
-axes[0].legend(loc='upper left', fontsize=10)
-axes[0].grid(True, alpha=0.3)
-axes[0].set_xlim(pd.Timestamp('2018-01-01'), pd.Timestamp('2025-01-01'))
-axes[0].xaxis.set_major_formatter(mdates.DateFormatter('%Y'))
-axes[0].xaxis.set_major_locator(mdates.YearLocator())
-
-# Plot 2: First stage (capacity → differential)
-axes[1].plot(df_alberta_viz['date'], df_alberta_viz['wcs_wti_differential'], 'purple', linewidth=2, label='Actual WCS-WTI', alpha=0.7)
-axes[1].plot(df_alberta_viz['date'], df_alberta_viz['differential_predicted'], 'orange', linewidth=2, linestyle='--', label='Predicted (First Stage)', alpha=0.8)
-axes[1].axvline(pd.Timestamp('2021-10-01'), color='red', linestyle='--', linewidth=2, alpha=0.7)
-axes[1].axvline(pd.Timestamp('2024-05-01'), color='orange', linestyle='--', linewidth=2, alpha=0.7)
-axes[1].set_ylabel('Differential ($/bbl)', fontsize=12, fontweight='bold')
-axes[1].set_title('2SLS First Stage: Pipeline Capacity → WCS-WTI Differential', fontsize=12, fontweight='bold')
-axes[1].legend(loc='upper right', fontsize=10)
-axes[1].grid(True, alpha=0.3)
-axes[1].set_xlim(pd.Timestamp('2018-01-01'), pd.Timestamp('2025-01-01'))
-axes[1].xaxis.set_major_formatter(mdates.DateFormatter('%Y'))
-axes[1].xaxis.set_major_locator(mdates.YearLocator())
-
-# Plot 3: Declining intensity
-years = list(range(2018, 2025))
-intensities = [intensity_by_year[y] for y in years]
-axes[2].plot(years, intensities, 'green', linewidth=3, marker='o', markersize=8, label='Declining Intensity')
-axes[2].axhline(67, color='gray', linestyle=':', linewidth=2, label='Old Constant (67 kg/bbl)')
-axes[2].set_ylabel('Emissions Intensity\n(kg CO2e/bbl)', fontsize=12, fontweight='bold')
-axes[2].set_xlabel('Year', fontsize=12, fontweight='bold')
-axes[2].set_title('Emissions Intensity: ~2% Annual Decline', fontsize=12, fontweight='bold')
-axes[2].legend(loc='upper right', fontsize=10)
-axes[2].grid(True, alpha=0.3)
-axes[2].set_xlim(2017.5, 2024.5)
-axes[2].set_xticks(years)
-
-plt.tight_layout()
-plt.savefig('pipeline_complete_analysis.png', dpi=300, bbox_inches='tight')
-print("✓ Saved: pipeline_complete_analysis.png")
-
-df_panel.to_csv('pipeline_complete_panel.csv', index=False)
-df_alberta_2sls.to_csv('pipeline_alberta_2sls.csv', index=False)
-print("✓ Saved: pipeline_complete_panel.csv, pipeline_alberta_2sls.csv")
-
-print("\n" + "="*80)
-print("ANALYSIS COMPLETE - ALL IMPROVEMENTS IMPLEMENTED")
-print("="*80)
-
-print("\n### SUMMARY OF IMPROVEMENTS ###")
-print("\n1. TRUE DiD (Saskatchewan Control):")
-print(f"   • Line 3 causal effect: {(alberta_post_line3 - alberta_pre) - (sask_post_line3 - sask_pre):+.0f} kb/d")
-print(f"   • TMX causal effect: {(alberta_post_tmx - alberta_post_line3) - (sask_post_tmx - sask_post_line3):+.0f} kb/d")
-print("   • Control group differences out COVID, prices, policies")
-
-print("\n2. Two-Stage Least Squares (WCS-WTI Endogeneity):")
-print(f"   • Pipeline capacity is EXOGENOUS instrument")
-print(f"   • Isolates price mechanism: {model_second.params['differential_predicted']:.1f} kb/d per $/bbl")
-print(f"   • No circular logic - proper causal inference")
-
-print("\n3. Declining Emissions Intensity:")
-print(f"   • Total emissions: {post_tmx_emissions - pre_emissions:.1f} Mt/year")
-print(f"   • {abs((post_tmx_emissions - pre_emissions) - (const_line3 + const_tmx)):.1f} Mt/year lower than constant assumption")
-print("   • Accounts for technological progress")
-
-print("\n### READY FOR ECCC CONSULTATION ###")
-print("✓ Causal inference (DiD with control)")
-print("✓ Proper instrumentation (2SLS for endogeneity)")
-print("✓ Realistic assumptions (declining intensity)")
-print("✓ Addresses all major critiques")
+
+def cmd_permute(args):
+    from permutation_inference import permutation_inference
+
+    r = _run(args, ['panel', 'did'])
+    summary, _ = _stage(args, 'permutation',
+                        lambda: permutation_inference(r['panel'][0], r['did'], min_window=args.min_window,
+                                                      max_assignments=args.max_assignments, workers=args.workers),
+                        {'panel': r['panel'][0]})
+    report_permutation(summary)
+
+
+def cmd_bootstrap(args):
+    from bootstrap_inference import bootstrap_summary
+
+    r = _run(args, ['panel', 'iv'])
+    try:
+        summary = _stage(args, 'bootstrap',
+                         lambda: bootstrap_summary(r['panel'][0], r['iv']['data'], method=args.method,
+                                                   reps=args.reps, weights=args.weights, cluster=args.cluster,
+                                                   block_length=args.block_length,
+                                                   capacity_line3=args.capacity_line3,
+                                                   capacity_tmx=args.capacity_tmx, seed=args.seed),
+                         {'panel': r['panel'][0], 'iv': r['iv']['data']})
+    except ValueError as e:
+        print(f"⚠ {e}")
+        return
+    report_bootstrap(summary, args.reps)
+
+
+def cmd_uncertainty(args):
+    from emissions_uncertainty import simulate_emissions
+
+    r = _run(args, ['panel', 'did', 'iv'])
+    summary = _stage(args, 'uncertainty',
+                     lambda: simulate_emissions(r['panel'][1], r['did'], r['iv'], n_draws=args.draws,
+                                                base_intensity=args.base_intensity,
+                                                base_intensity_sd=args.base_intensity_sd,
+                                                decline_rate=args.decline_rate,
+                                                decline_rate_sd=args.decline_rate_sd, seed=args.seed),
+                     {'panel': r['panel'][1]})
+    report_uncertainty(summary, args.draws)
+
+
+def cmd_scenarios(args):
+    from intensity_schedules import default_scenarios, evaluate_scenarios, load_scenarios
+
+    r = _run(args, ['panel', 'facility_intensity'])
+    scenarios = (load_scenarios(args.file) if args.file
+                 else default_scenarios(args.base_intensity, args.constant_intensity))
+    if r['facility_intensity'] is not None:
+        from facility_emissions import observed_schedule
+        scenarios['observed'] = observed_schedule(r['facility_intensity'])
+    report_scenarios(_stage(args, 'scenarios', lambda: evaluate_scenarios(r['panel'][1], scenarios),
+                            {'panel': r['panel'][1]}))
+
+
+def cmd_refresh(args):
+    if args.rebuild and os.path.exists(args.state):
+        os.remove(args.state)
+    r = _run(args, ['panel'])
+    report_refresh(_stage(args, 'refresh', lambda: refresh_incremental(*r['panel'], path=args.state),
+                          {'panel': r['panel'][0]}))
+
+
+def cmd_rolling(args):
+    from rolling_did import effect_paths, plot_effect_paths
+
+    r = _run(args, ['panel'])
+    paths = _stage(args, 'rolling', lambda: effect_paths(r['panel'][0], kinds=args.kinds, lengths=args.lengths,
+                                                         half_widths=args.half_widths, min_side=args.min_side),
+                   {'panel': r['panel'][0]})
+    line3_date = pd.Timestamp(year=LINE3_START[0], month=LINE3_START[1], day=1)
+    tmx_date = pd.Timestamp(year=TMX_START[0], month=TMX_START[1], day=1)
+
+    def outputs():
+        plot_effect_paths(paths, args.figure, line3_date, tmx_date)
+        if args.csv:
+            paths.to_csv(args.csv, index=False)
+
+    _stage(args, 'outputs', outputs, {'rolling': paths})
+    report_rolling(paths, args.figure)
+    if args.csv:
+        print(f"✓ Saved: {args.csv}")
+
+
+def cmd_event(args):
+    from event_study import event_study, plot_event_study
+
+    r = _run(args, ['panel'])
+    specs, coefs, pretrends = _stage(args, 'event_study',
+                                     lambda: event_study(r['panel'][0], leads=args.leads, lags=args.lags,
+                                                         binning=args.binning, reference=args.reference,
+                                                         controls=args.controls, cov_type=args.cov_type),
+                                     {'panel': r['panel'][0]})
+
+    def outputs():
+        plot_event_study(coefs, 0, args.figure)
+        if args.csv:
+            coefs.merge(specs, on='spec').to_csv(args.csv, index=False)
+
+    _stage(args, 'outputs', outputs, {'event_study': coefs})
+    report_event_study(specs, coefs, pretrends, args.figure)
+    if args.csv:
+        print(f"✓ Saved: {args.csv}")
+
+
+def cmd_breaks(args):
+    from structural_breaks import structural_breaks
+
+    r = _run(args, ['panel'])
+    breaks = _stage(args, 'breaks', lambda: structural_breaks(*r['panel'], series=args.series, regime=args.regime,
+                                                              trim=args.trim, reps=args.reps, level=args.level,
+                                                              seed=args.seed),
+                    {'panel': r['panel'][0]})
+    report_breaks(breaks, args.reps, args.level)
+    if args.csv:
+        _stage(args, 'outputs', lambda: breaks.to_csv(args.csv, index=False), {'breaks': breaks})
+        print(f"✓ Saved: {args.csv}")
+
+
+def cmd_influence(args):
+    from influence import flagged_months, influence_diagnostics
+
+    r = _run(args, ['panel'])
+    rows, groups = _stage(args, 'influence',
+                          lambda: influence_diagnostics(*r['panel'], DID_REGRESSORS, FIRST_STAGE_REGRESSORS,
+                                                        SECOND_STAGE_REGRESSORS, IV_BASE_COLUMNS,
+                                                        second_stage_transform, iv_terms=IV_TERMS,
+                                                        cov_type=args.cov_type),
+                          {'panel': r['panel'][0]})
+    report_influence(rows, groups, flagged_months(rows), args.top)
+    if args.csv:
+        _stage(args, 'outputs', lambda: rows.to_csv(args.csv, index=False), {'influence': rows})
+        print(f"✓ Saved: {args.csv}")
+
+
+def cmd_synth(args):
+    from synthetic_control import plot_synthetic_control, synthetic_control
+
+    ingest_cache = _ingest_cache(args)
+    tidy = _stage(args, 'inputs', lambda: load_unit_production(args.statcan, ingest_cache,
+                                                               geographies=args.geographies))
+    unit_panel = _stage(args, 'panel', lambda: build_unit_panel(tidy, treated=[args.treated]), {'inputs': tidy})
+    result = _stage(args, 'synth', lambda: synthetic_control(unit_panel, treated=args.treated, fit=args.fit),
+                    {'panel': unit_panel})
+    _stage(args, 'outputs', lambda: plot_synthetic_control(result, args.treated, args.figure), {'synth': result})
+    report_synth(result, args.treated, args.figure)
+    if args.csv:
+        result['paths'].to_csv(args.csv, index=False)
+        print(f"✓ Saved: {args.csv}")
+
+
+def cmd_throughput(args):
+    from throughput_store import capacity_instrument, open_store
+
+    if not args.throughput:
+        print("⚠ Pass the CER key-point throughput CSVs with --throughput")
+        return
+    monthly = _stage(args, 'inputs', lambda: open_store(args.throughput).monthly())
+    capacity = _stage(args, 'capacity', lambda: capacity_instrument(monthly), {'inputs': monthly})
+    report_throughput(monthly, capacity)
+    if args.csv:
+        monthly.to_csv(args.csv, index=False)
+        print(f"✓ Saved: {args.csv}")
+
+
+def _year_month(text):
+    year, month = text.split('-')
+    return int(year), int(month)
+
+
+def cmd_grid(args):
+    from spec_grid import run_spec_grid, spec_grid, write_spec_table, plot_spec_curve
+
+    if args.throughput:
+        print("⚠ grid varies the nameplate capacity steps in the instrument; --throughput (observed capacity) "
+              "does not apply to it")
+        return
+    grid = spec_grid(args.start_years, args.end_years,
+                     [_year_month(d) for d in args.line3_dates], [_year_month(d) for d in args.tmx_dates],
+                     args.line3_capacities, args.tmx_capacities, args.trends, args.cov_types)
+    ingest_cache = _ingest_cache(args)
+    inputs = _stage(args, 'inputs', lambda: load_inputs(args.statcan, args.rail, ingest_cache,
+                                                        start_year=min(args.start_years),
+                                                        end_year=max(args.end_years), price_files=args.prices,
+                                                        price_statistic=args.price_statistic))
+    df_panel, df_alberta_full = _stage(args, 'panel', lambda: build_panel(inputs['alberta'], inputs['sask'],
+                                                                          inputs['prices'], inputs['rail']),
+                                       {'inputs': inputs})
+
+    results = _stage(args, 'grid', lambda: run_spec_grid(df_panel, df_alberta_full, grid, workers=args.workers),
+                     {'panel': df_panel})
+    _banner(f"SPECIFICATION CURVE: {len(results):,} SPECIFICATIONS")
+    print(f"✓ Saved: {_stage(args, 'outputs', lambda: write_spec_table(results, args.table), {'grid': results})}")
+    for term in ['line3_did', 'tmx_did', 'iv_price']:
+        values = results[term].dropna()
+        if len(values):
+            share = (results.loc[values.index, f'{term}_p'] < 0.05).mean()
+            print(f"  {term:<13} median {values.median():+9.2f}  range [{values.min():+9.2f}, {values.max():+9.2f}]  "
+                  f"p<0.05 in {share:.0%} of {len(values):,}")
+    unidentified = len(results) - results['line3_did'].notna().sum()
+    if unidentified:
+        print(f"⚠ {unidentified:,} specs have a treatment date outside their window (DiD not identified)")
+    print("  second_price is the two-step pseudo-inverse coefficient, not identified (second_full_rank is "
+          "False); iv_price is the 2SLS")
+    if args.curve:
+        print(f"✓ Saved: {plot_spec_curve(results, args.curve_term, args.curve)}")
+
+
+def cmd_serve(args):
+    from scenario_service import GRID, ScenarioService, serve
+
+    ingest_cache = _ingest_cache(args)
+    defaults = {'start_year': START_YEAR, 'end_year': END_YEAR, 'line3_start': LINE3_START, 'tmx_start': TMX_START,
+                'capacity_line3': args.capacity_line3, 'capacity_tmx': args.capacity_tmx,
+                'base_intensity': args.base_intensity, 'decline_rate': args.decline_rate,
+                'constant_intensity': args.constant_intensity, 'cov_type': 'HC1'}
+    # Loaded once over every window in the grid; each scenario cuts its own
+    inputs = _stage(args, 'inputs', lambda: load_inputs(args.statcan, args.rail, ingest_cache,
+                                                        start_year=min(GRID['start_year'] + [START_YEAR]),
+                                                        end_year=max(GRID['end_year'] + [END_YEAR]),
+                                                        price_files=args.prices,
+                                                        price_statistic=args.price_statistic,
+                                                        throughput_files=args.throughput))
+    observed = None
+    if args.facilities:
+        from facility_emissions import facility_intensity, observed_schedule
+        observed = _stage(args, 'facility_intensity',
+                          lambda: observed_schedule(facility_intensity(args.facilities, ingest_cache)))
+    sources = {'statcan': [args.statcan], 'rail': [args.rail], 'prices': args.prices or [],
+               'throughput': args.throughput or [], 'facilities': [args.facilities] if args.facilities else []}
+
+    service = _stage(args, 'cube', lambda: ScenarioService(inputs, defaults, observed, sources,
+                                                           {'price_statistic': args.price_statistic},
+                                                           path=args.cube,
+                                                           workers=args.workers or os.cpu_count() or 1,
+                                                           rebuild=args.rebuild),
+                     {'inputs': inputs}, status=lambda service: COMPUTED if service.built else DISK)
+    report_service(service, args.host, args.port)
+    serve(service, args.host, args.port, quiet=args.quiet)
+
+
+def cmd_all(args):
+    print("="*80)
+    print("COMPLETE PIPELINE ANALYSIS - ALL METHODOLOGICAL IMPROVEMENTS")
+    print("="*80)
+
+    r = _run(args, ['inputs', 'panel', 'descriptive_did', 'did', 'iv', 'emissions', 'outputs'])
+    report_inputs(r['inputs'])
+    report_panel(*r['panel'])
+    report_did(r['descriptive_did'], r['did'])
+    report_iv(r['iv'])
+    report_emissions(r['emissions'])
+    report_outputs(r['outputs'])
+    report_summary(r['descriptive_did'], r['iv'], r['emissions'])
+
+
+WORKERS_OPTION = (['--workers'], {'type': int, 'default': 1, 'help': "worker processes (0 = all cores)"})
+
+# name: (handler, help, extra options as (flags, add_argument kwargs))
+COMMANDS = {
+    'all': (cmd_all, "full analysis, figure and panel table export (default)", []),
+    'ingest': (cmd_ingest, "load and cache the StatsCan, CER and price inputs", []),
+    'did': (cmd_did, "Part 1: difference-in-differences", []),
+    'iv': (cmd_iv, "Part 2: two-stage least squares", []),
+    'emissions': (cmd_emissions, "Part 3: emissions with declining intensity", []),
+    'plot': (cmd_plot, "write the figure and the panel tables", []),
+    'permute': (cmd_permute, "permutation p-values for the DiD from placebo dates and assignments", [
+        WORKERS_OPTION,
+        (['--min-window'], {'type': int, 'default': 6, 'help': "months kept on each side of a placebo date"}),
+        (['--max-assignments'], {'type': int, 'default': 10_000, 'help': "cap on placebo treated/control assignments"}),
+    ]),
+    'bootstrap': (cmd_bootstrap, "wild or moving-block bootstrap intervals for the DiD and 2SLS", [
+        (['--method'], {'choices': ['wild', 'block'], 'default': 'wild', 'help': "bootstrap scheme"}),
+        (['--reps'], {'type': int, 'default': 9_999, 'help': "bootstrap replications"}),
+        (['--weights'], {'choices': ['webb', 'rademacher'], 'default': 'webb', 'help': "wild bootstrap weights"}),
+        (['--cluster'], {'choices': ['province', 'month'], 'default': 'month', 'help': "wild bootstrap clusters for the DiD (needs 3 or more)"}),
+        (['--block-length'], {'type': int, 'default': None, 'help': "months per block (default: T^(1/3))"}),
+        (['--seed'], {'type': int, 'default': 0, 'help': "random seed"}),
+    ]),
+    'uncertainty': (cmd_uncertainty, "Monte Carlo bands for the emissions deltas", [
+        (['--draws'], {'type': int, 'default': 1_000_000, 'help': "Monte Carlo draws"}),
+        (['--base-intensity-sd'], {'type': float, 'default': 5.0, 'help': "sd of the base intensity, kg CO2e/bbl"}),
+        (['--decline-rate-sd'], {'type': float, 'default': 0.005, 'help': "sd of the annual decline rate"}),
+        (['--seed'], {'type': int, 'default': 0, 'help': "random seed"}),
+    ]),
+    'scenarios': (cmd_scenarios, "emissions under many intensity schedules in one pass", [
+        (['--file'], {'default': None, 'help': "JSON file of named intensity schedules (see intensity_scenarios.json)"}),
+    ]),
+    'refresh': (cmd_refresh, "update the stored regressions with a new release (rank-one updates)", [
+        (['--state'], {'default': INCREMENTAL_STATE, 'help': "file holding the sufficient statistics"}),
+        (['--rebuild'], {'action': 'store_true', 'help': "discard the stored state and start over"}),
+    ]),
+    'rolling': (cmd_rolling, "Line 3 and TMX DiD effects over rolling, expanding and event windows", [
+        (['--kinds'], {'nargs': '+', 'default': ['rolling', 'expanding', 'event'], 'choices': ['rolling', 'expanding', 'event'], 'help': "window kinds"}),
+        (['--lengths'], {'type': int, 'nargs': '+', 'default': [36, 48, 60], 'help': "rolling window lengths, months"}),
+        (['--half-widths'], {'type': int, 'nargs': '+', 'default': [12, 24, 36], 'help': "months on each side of an in-service date"}),
+        (['--min-side'], {'type': int, 'default': 6, 'help': "months needed on each side of an event to report its effect"}),
+        (['--figure'], {'default': 'rolling_did.png', 'help': "effect path figure"}),
+        (['--csv'], {'default': None, 'help': "also write every window's estimates to this CSV"}),
+    ]),
+    'event': (cmd_event, "event study with leads and lags around each in-service date", [
+        (['--leads'], {'type': int, 'nargs': '+', 'default': [12], 'help': "months before in-service (one spec per value)"}),
+        (['--lags'], {'type': int, 'nargs': '+', 'default': [24], 'help': "months after in-service (one spec per value)"}),
+        (['--binning'], {'nargs': '+', 'default': ['bin'], 'choices': ['bin', 'trim'], 'help': "pool months beyond the window into the end indicators, or not"}),
+        (['--reference'], {'type': int, 'nargs': '+', 'default': [-1], 'help': "omitted relative months"}),
+        (['--controls'], {'default': 'month_fe', 'choices': ['month_fe', 'trend'], 'help': "month fixed effects or the DiD's shared trend"}),
+        (['--cov-type'], {'default': 'nonrobust', 'choices': ['nonrobust', 'HC0', 'HC1'], 'help': "covariance estimator"}),
+        (['--figure'], {'default': 'event_study.png', 'help': "coefficient plot of the first spec"}),
+        (['--csv'], {'default': None, 'help': "also write every coefficient to this CSV"}),
+    ]),
+    'breaks': (cmd_breaks, "sup-F and Bai-Perron break dates for the production gap and the differential", [
+        (['--series'], {'nargs': '+', 'default': ['gap', 'differential'], 'choices': ['gap', 'differential'], 'help': "series to search"}),
+        (['--regime'], {'default': 'trend', 'choices': ['level', 'trend'], 'help': "what changes at a break: the level, or the level and trend"}),
+        (['--trim'], {'type': float, 'default': 0.15, 'help': "minimum regime length as a share of the sample"}),
+        (['--reps'], {'type': int, 'default': 999, 'help': "bootstrap replications for the p-values"}),
+        (['--level'], {'type': float, 'default': 0.95, 'choices': [0.90, 0.95, 0.99], 'help': "break-date interval coverage"}),
+        (['--seed'], {'type': int, 'default': 0, 'help': "random seed"}),
+        (['--csv'], {'default': None, 'help': "also write the table to this CSV"}),
+    ]),
+    'influence': (cmd_influence, "closed-form leave-one-out, -year and -province influence for the DiD and 2SLS", [
+        (['--cov-type'], {'default': 'HC1', 'choices': ['nonrobust', 'HC0', 'HC1'], 'help': "covariance for the shift in standard errors"}),
+        (['--top'], {'type': int, 'default': 10, 'help': "flagged months to list"}),
+        (['--csv'], {'default': None, 'help': "also write the per-observation table to this CSV"}),
+    ]),
+    'synth': (cmd_synth, "synthetic control from every producing province, with in-space placebos", [
+        (['--treated'], {'default': 'Alberta', 'help': "treated geography"}),
+        (['--geographies'], {'nargs': '+', 'default': None, 'help': "units to use (default: every geography in the table)"}),
+        (['--fit'], {'default': 'demeaned', 'choices': ['demeaned', 'level'], 'help': "match pre-period paths after removing means, or levels"}),
+        (['--figure'], {'default': 'synthetic_control.png', 'help': "actual vs synthetic and placebo gap figure"}),
+        (['--csv'], {'default': None, 'help': "also write every unit's actual, synthetic and gap paths to this CSV"}),
+    ]),
+    'throughput': (cmd_throughput, "daily CER key-point throughput: monthly utilization, apportionment and observed capacity", [
+        (['--csv'], {'default': None, 'help': "also write the monthly key-point table to this CSV"}),
+    ]),
+    'serve': (cmd_serve, "local HTTP/JSON scenario queries answered from a precomputed results cube", [
+        WORKERS_OPTION,
+        (['--host'], {'default': '127.0.0.1', 'help': "address to listen on"}),
+        (['--port'], {'type': int, 'default': 8765, 'help': "port to listen on"}),
+        (['--cube'], {'default': '.scenario_cube.pkl', 'help': "where the precomputed results cube is kept"}),
+        (['--rebuild'], {'action': 'store_true', 'help': "recompute the cube even if the saved one is current"}),
+        (['--quiet'], {'action': 'store_true', 'help': "do not log each request"}),
+    ]),
+    'grid': (cmd_grid, "specification curve over windows, dates, capacities, trends and covariances", [
+        WORKERS_OPTION,
+        (['--start-years'], {'type': int, 'nargs': '+', 'default': [START_YEAR], 'help': "first sample years"}),
+        (['--end-years'], {'type': int, 'nargs': '+', 'default': [END_YEAR], 'help': "last sample years"}),
+        (['--line3-dates'], {'nargs': '+', 'default': ['%d-%02d' % LINE3_START], 'help': "Line 3 in-service months, YYYY-MM"}),
+        (['--tmx-dates'], {'nargs': '+', 'default': ['%d-%02d' % TMX_START], 'help': "TMX in-service months, YYYY-MM"}),
+        (['--line3-capacities'], {'type': float, 'nargs': '+', 'default': [CAPACITY_LINE3], 'help': "Line 3 capacities, kb/d"}),
+        (['--tmx-capacities'], {'type': float, 'nargs': '+', 'default': [CAPACITY_TMX], 'help': "TMX capacities, kb/d"}),
+        (['--trends'], {'nargs': '+', 'default': ['linear'], 'choices': ['linear', 'by_province', 'quadratic', 'none'], 'help': "time trend specifications"}),
+        (['--cov-types'], {'nargs': '+', 'default': ['HC1'], 'choices': ['nonrobust', 'HC0', 'HC1', 'HC2', 'HC3'], 'help': "covariance estimators"}),
+        (['--table'], {'default': 'spec_curve.sqlite', 'help': "results table (.sqlite or .csv)"}),
+        (['--curve'], {'default': None, 'help': "also plot the specification curve to this PNG"}),
+        (['--curve-term'], {'default': 'line3_did', 'help': "estimate to plot (line3_did, tmx_did, iv_price, ...)"}),
+    ]),
+}
+
+
+def build_parser():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--statcan', default=STATCAN_FILE, help="StatsCan 25-10-0063 extract (wide or long format)")
+    common.add_argument('--rail', default=RAIL_FILE, help="CER crude oil exports by rail workbook")
+    common.add_argument('--start-year', type=int, default=START_YEAR, help="first year of the sample window")
+    common.add_argument('--end-year', type=int, default=END_YEAR, help="last year of the sample window (raise it to take in newly released months)")
+    common.add_argument('--no-cache', action='store_true', help="recompute everything, ignoring the ingest and stage caches")
+    common.add_argument('--explain', action='store_true', help="list which stages were computed or loaded from cache")
+    common.add_argument('--report', default=RUN_REPORT_FILE, help="JSON run report with per-stage time, memory, rows and cache hits ('' to skip)")
+    common.add_argument('--trace-memory', action='store_true', help="also trace per-stage peak allocations in the run report (slower)")
+    common.add_argument('--profile', nargs='+', default=[], metavar='STAGE', help="sample these stages' stacks into the run report (inputs, panel, did, iv, emissions, ...)")
+    common.add_argument('--capacity-line3', type=float, default=CAPACITY_LINE3, help="Line 3 capacity, kb/d")
+    common.add_argument('--capacity-tmx', type=float, default=CAPACITY_TMX, help="TMX capacity, kb/d")
+    common.add_argument('--base-intensity', type=float, default=BASE_INTENSITY, help="kg CO2e/bbl in the first year")
+    common.add_argument('--decline-rate', type=float, default=DECLINE_RATE, help="annual intensity decline (0.02 = 2%%)")
+    common.add_argument('--constant-intensity', type=float, default=CONSTANT_INTENSITY, help="comparison constant intensity, kg CO2e/bbl")
+    common.add_argument('--prices', nargs='+', default=None, help="daily or tick WCS/WTI price CSVs (timestamp, benchmark, price[, volume]); replaces the built-in monthly table")
+    common.add_argument('--price-statistic', default='mean', choices=['mean', 'median', 'vw'], help="monthly differential from the price files: mean, median or WCS-volume-weighted")
+    common.add_argument('--throughput', nargs='+', default=None, help="daily CER key-point throughput CSVs (date, pipeline, key point, throughput, capacity); the instrument becomes observed export capacity")
+    common.add_argument('--table-format', default='auto', choices=TABLE_FORMATS, help="panel table export: columnar dataset partitioned by province/year (auto = parquet if pyarrow is installed, else npy) or csv")
+    common.add_argument('--float32', action='store_true', help="store the panel measures as float32 in the columnar export")
+    common.add_argument('--facilities', default=None, help="facility-month production and emissions reports (CSV); Part 3 then uses their observed intensity")
+
+    parser = argparse.ArgumentParser(description="Pipeline capacity, production and emissions analysis")
+    subparsers = parser.add_subparsers(dest='command')
+    for name, (_, help_text, options) in COMMANDS.items():
+        sub = subparsers.add_parser(name, parents=[common], help=help_text)
+        for flags, kwargs in options:
+            sub.add_argument(*flags, **kwargs)
+    return parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    # No subcommand means the full analysis, as before the CLI existed
+    if not argv or (argv[0].startswith('-') and argv[0] not in ('-h', '--help')):
+        argv = ['all'] + argv
+    args = build_parser().parse_args(argv)
+    if getattr(args, 'workers', 1) == 0:
+        args.workers = None
+
+    if args.report:
+        from run_report import RunReport
+        args.run_report = RunReport(trace_memory=args.trace_memory, profile=args.profile)
+
+    outcome = 'error'
+    try:
+        COMMANDS[args.command][0](args)
+        outcome = 'ok'
+        if args.explain and getattr(args, 'graph', None) is not None:
+            print("\nStages: " + ", ".join(f"{name}={status}" for name, status in args.graph.last_run.items()))
+    except FileNotFoundError as e:
+        print(f"ERROR: {e.filename} not found")
+        sys.exit(1)
+    except ImportError as e:
+        print(f"ERROR: Required packages not installed ({e.name})")
+        sys.exit(1)
+    finally:
+        if args.report:
+            options = {k: v for k, v in vars(args).items() if k not in ('graph', 'run_report')}
+            args.run_report.write(args.report, command=args.command, status=outcome, options=options)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""
+WCS-WTI PRICE INGEST
+====================
+
+Builds the monthly WCS-WTI differential from daily or tick-level price files
+instead of the hand-typed table. Input is one or more CSV files (e.g. one per
+year) with one row per print:
+
+    timestamp   date or date-time of the print (date is also accepted)
+    benchmark   WCS or WTI (other benchmarks are skipped)
+    price       $/bbl
+    volume      optional, barrels or contracts traded
+
+Files are streamed in chunks and reduced at once to per-benchmark daily
+accumulators (sum of prices, prints, sum of price x volume, volume), keyed by
+day number. Only those few arrays per day stay in memory, never the raw
+history. Each benchmark's daily price is its volume-weighted mean where
+volume is given and the mean of its prints otherwise.
+
+WCS and WTI trade on different calendars (Canadian and US holidays), so the
+differential WTI - WCS is only formed on days both benchmarks printed. The
+monthly frame then has, from those common days:
+
+    wcs_wti_differential    mean of the daily differentials
+    differential_median     median of the daily differentials
+    differential_vw         daily differentials weighted by WCS volume
+                            (NaN where the files carry no volume)
+    trading_days            common days; wcs_days / wti_days per benchmark
+
+    monthly = load_price_files(['wcs_wti_2018.csv', 'wcs_wti_2019.csv'], cache)
+"""
+
+import numpy as np
+import pandas as pd
+
+CHUNK_ROWS = 2_000_000
+BENCHMARKS = ['WCS', 'WTI']
+STATISTICS = {'mean': 'wcs_wti_differential', 'median': 'differential_median', 'vw': 'differential_vw'}
+REQUIRED = ['timestamp', 'benchmark', 'price']
+DAILY_FIELDS = ['price_sum', 'prints', 'pv_sum', 'volume']
+
+
+# ===========================
+# STREAMING DAILY ACCUMULATION
+# ===========================
+
+class DailyAccumulator:
+    """Per-benchmark daily sums over a growing range of day numbers."""
+
+    def __init__(self):
+        self.origin = None
+        self.sums = np.zeros((len(BENCHMARKS), len(DAILY_FIELDS), 0))
+
+    def _cover(self, first, last):
+        if self.origin is None:
+            self.origin = first
+        if first < self.origin:
+            pad = self.origin - first
+            self.sums = np.concatenate([np.zeros(self.sums.shape[:2] + (pad,)), self.sums], axis=2)
+            self.origin = first
+        need = last - self.origin + 1 - self.sums.shape[2]
+        if need > 0:
+            self.sums = np.concatenate([self.sums, np.zeros(self.sums.shape[:2] + (need,))], axis=2)
+
+    def add(self, day, benchmark, price, volume):
+        """Fold in prints: int day numbers, benchmark codes (index into BENCHMARKS)."""
+        if not len(day):
+            return
+        self._cover(int(day.min()), int(day.max()))
+        size = self.sums.shape[2]
+        key = benchmark * size + (day - self.origin)
+        length = len(BENCHMARKS) * size
+        values = [price, np.ones(len(price)), price * volume, volume]
+        for f, v in enumerate(values):
+            self.sums[:, f, :] += np.bincount(key, weights=v, minlength=length).reshape(len(BENCHMARKS), size)
+
+    def daily(self):
+        """Days with a print of either benchmark: date, <B>_price, <B>_volume, <B>_prints."""
+        if self.origin is None:
+            raise ValueError("no WCS or WTI prints in the price files")
+        price_sum, prints, pv_sum, volume = (self.sums[:, f, :] for f in range(len(DAILY_FIELDS)))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            price = np.where(volume > 0, pv_sum / volume, price_sum / prints)
+        price[prints == 0] = np.nan
+        seen = (prints > 0).any(axis=0)
+        frame = {'date': pd.to_datetime(np.arange(self.origin, self.origin + prints.shape[1])[seen], unit='D')}
+        for b, name in enumerate(BENCHMARKS):
+            frame[f'{name.lower()}_price'] = price[b, seen]
+            frame[f'{name.lower()}_volume'] = volume[b, seen]
+            frame[f'{name.lower()}_prints'] = prints[b, seen].astype(np.int64)
+        return pd.DataFrame(frame)
+
+
+def _check_columns(path):
+    header = pd.read_csv(path, nrows=0).columns.tolist()
+    missing = [c for c in REQUIRED if c not in header]
+    if missing:
+        raise ValueError(f"{path}: price files need {REQUIRED} (missing {missing})")
+    return REQUIRED + (['volume'] if 'volume' in header else [])
+
+
+def accumulate_prices(paths, chunksize=CHUNK_ROWS):
+    """Stream every file once into a DailyAccumulator."""
+    accumulator = DailyAccumulator()
+    for path in [paths] if isinstance(paths, str) else paths:
+        usecols = _check_columns(path)
+        reader = pd.read_csv(path, usecols=usecols, chunksize=chunksize,
+                             dtype={'benchmark': 'category', 'price': 'float64', 'volume': 'float64'})
+        for chunk in reader:
+            names = chunk['benchmark'].cat.categories.astype(str).str.strip().str.upper()
+            lookup = np.array([BENCHMARKS.index(n) if n in BENCHMARKS else -1 for n in names] + [-1])
+            code = lookup[chunk['benchmark'].cat.codes.to_numpy()]
+            price = chunk['price'].to_numpy()
+            volume = chunk['volume'].fillna(0).to_numpy() if 'volume' in chunk else np.zeros(len(chunk))
+            day = pd.to_datetime(chunk['timestamp']).to_numpy().astype('datetime64[D]').astype(np.int64)
+            ok = (code >= 0) & np.isfinite(price)
+            accumulator.add(day[ok], code[ok], price[ok], volume[ok])
+    return accumulator
+
+
+# ===========================
+# CALENDAR ALIGNMENT AND MONTHLY STATISTICS
+# ===========================
+
+def daily_differential(daily):
+    """Common trading days only, with differential = WTI - WCS."""
+    common = daily.dropna(subset=['wcs_price', 'wti_price']).copy()
+    common['differential'] = common['wti_price'] - common['wcs_price']
+    return common.reset_index(drop=True)
+
+
+def monthly_differential(daily):
+    """Monthly mean, median and WCS-volume-weighted differential from the daily frame."""
+    common = daily_differential(daily)
+    days = daily.assign(year=daily['date'].dt.year, month=daily['date'].dt.month)
+    common = common.assign(year=common['date'].dt.year, month=common['date'].dt.month,
+                           weighted=common['differential'] * common['wcs_volume'])
+    monthly = common.groupby(['year', 'month']).agg(
+        wcs_wti_differential=('differential', 'mean'),
+        differential_median=('differential', 'median'),
+        weighted=('weighted', 'sum'),
+        weight=('wcs_volume', 'sum'),
+        trading_days=('differential', 'size'))
+    monthly['differential_vw'] = (monthly.pop('weighted') / monthly.pop('weight')).where(lambda v: np.isfinite(v))
+    per_benchmark = days.groupby(['year', 'month']).agg(
+        wcs_days=('wcs_price', 'count'), wti_days=('wti_price', 'count'))
+    monthly = monthly.join(per_benchmark, how='left').reset_index()
+    return monthly[['year', 'month', 'wcs_wti_differential', 'differential_median', 'differential_vw',
+                    'trading_days', 'wcs_days', 'wti_days']]
+
+
+def load_price_files(paths, cache=None, chunksize=CHUNK_ROWS):
+    """The monthly differential frame from the price files (cached on their contents)."""
+    paths = [paths] if isinstance(paths, str) else list(paths)
+
+    def build():
+        return monthly_differential(accumulate_prices(paths, chunksize).daily())
+
+    return cache.frame('price_monthly', paths, build) if cache else build()
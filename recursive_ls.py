@@ -0,0 +1,305 @@
+"""
+RECURSIVE LEAST SQUARES FOR MONTHLY RELEASES
+============================================
+
+Each StatsCan release adds a month and revises a few earlier ones. Rather than
+refitting from scratch, every model keeps its sufficient statistics
+
+    n, X'X, X'y, y'y                    coefficients and classical covariance
+    sum y^2 xx', sum y x(x)x(x)x,       the robust (HC0/HC1) meat at any
+    sum x(x)x(x)x(x)x                   coefficient vector b:
+        sum (y - x'b)^2 xx' = S2 - 2 S3.b + S4.b.b
+
+together with the upper Cholesky factor R of X'X (R'R = X'X). A new row is a
+rank-one update of R and a removed or revised row is a rank-one downdate, both
+O(k^2). The coefficients then come from two triangular solves. The robust meat
+costs O(k^4) per row because it must stay exact for coefficients that have not
+been fitted yet; for k <= 7 that is a few thousand flops.
+
+A model can also be fitted on a linear transform X = W M of the stored design W
+(`transform=M`). The second stage uses this: its regressor, the predicted
+differential, is re-predicted every time the first stage changes. Transformed
+and rank-deficient fits use a pseudo-inverse of M'W'WM, as statsmodels does,
+but coefficients that the rows do not identify (an event dummy that is zero
+in every held month, a column collinear with the others) come back as NaN
+rather than as minimum-norm values.
+
+fit_iv reads a 2SLS off the same statistics when the stored design holds the
+endogenous regressor and the instrument (iv_engine.iv_from_moments); the
+meat of its robust errors is the stored one at the structural residuals.
+
+RowStore keeps the rows a model holds, by key, so a new release is folded in by
+diffing: new keys are added, changed rows are downdated and re-added, and
+vanished keys are removed.
+"""
+
+import numpy as np
+import pandas as pd
+
+COV_TYPES = ['nonrobust', 'HC0', 'HC1']
+PINV_RCOND = 1e-10
+ESTIMABLE_TOL = 1e-8
+
+
+# ===========================
+# CHOLESKY UPDATES
+# ===========================
+
+def chol_update(R, x):
+    """Upper R1 with R1'R1 = R'R + xx', in O(k^2)."""
+    R = R.copy()
+    x = np.array(x, dtype=float)
+    for i in range(len(x)):
+        r = np.hypot(R[i, i], x[i])
+        c, s = r / R[i, i], x[i] / R[i, i]
+        R[i, i] = r
+        R[i, i + 1:] = (R[i, i + 1:] + s * x[i + 1:]) / c
+        x[i + 1:] = c * x[i + 1:] - s * R[i, i + 1:]
+    return R
+
+
+def chol_downdate(R, x):
+    """Upper R1 with R1'R1 = R'R - xx'; LinAlgError if that is not positive definite."""
+    R = R.copy()
+    x = np.array(x, dtype=float)
+    for i in range(len(x)):
+        r2 = R[i, i] ** 2 - x[i] ** 2
+        if not r2 > 0:
+            raise np.linalg.LinAlgError("downdate leaves X'X singular")
+        r = np.sqrt(r2)
+        c, s = r / R[i, i], x[i] / R[i, i]
+        R[i, i] = r
+        R[i, i + 1:] = (R[i, i + 1:] - s * x[i + 1:]) / c
+        x[i + 1:] = c * x[i + 1:] - s * R[i, i + 1:]
+    return R
+
+
+# ===========================
+# SUFFICIENT STATISTICS
+# ===========================
+
+class RecursiveLS:
+    """Sufficient statistics of one regression of y on X, updated row by row."""
+
+    STATS = ['xtx', 'xty', 'yty', 'm2', 'm3', 'm4']
+
+    def __init__(self, names):
+        k = len(names)
+        self.names = list(names)
+        self.n = 0
+        self.xtx = np.zeros((k, k))
+        self.xty = np.zeros(k)
+        self.yty = 0.0
+        self.m2 = np.zeros((k, k))
+        self.m3 = np.zeros((k, k, k))
+        self.m4 = np.zeros((k, k, k, k))
+        self.R = None
+
+    def add(self, X, y, sign=1):
+        """Fold rows in (sign=1) or out (sign=-1)."""
+        X = np.atleast_2d(np.asarray(X, dtype=float))
+        y = np.atleast_1d(np.asarray(y, dtype=float))
+        self.n += sign * len(y)
+        self.xtx += sign * X.T @ X
+        self.xty += sign * X.T @ y
+        self.yty += sign * y @ y
+        self.m2 += sign * np.einsum('n,ni,nj->ij', y * y, X, X)
+        self.m3 += sign * np.einsum('n,ni,nj,nl->ijl', y, X, X, X)
+        self.m4 += sign * np.einsum('ni,nj,nl,nm->ijlm', X, X, X, X)
+
+        # Rank-one steps for a few rows; a fresh factorization for a block
+        if self.R is None or len(y) > len(self.names):
+            self.R = None
+            return
+        try:
+            for x in X:
+                self.R = chol_update(self.R, x) if sign > 0 else chol_downdate(self.R, x)
+        except np.linalg.LinAlgError:
+            self.R = None
+
+    def remove(self, X, y):
+        self.add(X, y, sign=-1)
+
+    def factor(self):
+        """Cholesky factor of X'X, or None while X'X is singular."""
+        if self.R is None and self.n >= len(self.names):
+            try:
+                self.R = np.linalg.cholesky(self.xtx).T
+            except np.linalg.LinAlgError:
+                return None
+        return self.R
+
+    def meat(self, b):
+        """sum of (y - x'b)^2 xx' for coefficients b."""
+        return (self.m2 - 2 * np.einsum('ijl,l->ij', self.m3, b)
+                + np.einsum('ijlm,l,m->ij', self.m4, b, b))
+
+    def fit(self, cov_type='HC1', transform=None, names=None):
+        """
+        Coefficients, standard errors and p-values as in statsmodels OLS with
+        that cov_type. transform=M fits y on X M (k x p), with `names` for the p
+        columns.
+        """
+        from scipy.linalg import solve_triangular
+
+        _check_cov_type(cov_type)
+        R = self.factor() if transform is None else None
+        if R is not None:
+            params = solve_triangular(R, solve_triangular(R, self.xty, trans='T'))
+            R_inv = solve_triangular(R, np.eye(len(R)))
+            bread = R_inv @ R_inv.T
+            rank = len(R)
+            b = params
+            M = np.eye(len(R))
+            estimable = np.ones(len(R), dtype=bool)
+        else:
+            M = np.eye(len(self.names)) if transform is None else np.asarray(transform, dtype=float)
+            xtx = M.T @ self.xtx @ M
+            bread = np.linalg.pinv(xtx, rcond=PINV_RCOND, hermitian=True)
+            params = bread @ (M.T @ self.xty)
+            rank = np.linalg.matrix_rank(xtx, hermitian=True)
+            b = M @ params
+            estimable = np.abs(np.diag(bread @ xtx) - 1) < ESTIMABLE_TOL
+
+        df_resid = self.n - rank
+        cov = self._cov(b, bread, M, df_resid, cov_type)
+        return _result(np.where(estimable, params, np.nan), cov, estimable, self.n, df_resid, cov_type,
+                       names or self.names)
+
+    def fit_iv(self, endog, exog, instruments, cov_type='HC1'):
+        """
+        2SLS of y on endog + exog, instrumented by instruments + exog, all
+        names of stored columns. Errors as fit_iv (iv_engine) gives them for
+        cov_type; coefficients the rows do not identify are NaN.
+        """
+        from iv_engine import iv_from_moments
+
+        _check_cov_type(cov_type)
+        x = [self.names.index(c) for c in list(endog) + list(exog)]
+        z = [self.names.index(c) for c in list(instruments) + list(exog)]
+        params, bread, Pi, estimable = iv_from_moments(self.xtx, self.xty, x[:len(endog)], x[len(endog):],
+                                                       z[:len(instruments)])
+        # Structural residuals y - X b, and Xhat = Z Pi picks the meat's instrument block
+        b = np.zeros(len(self.names))
+        b[x] = np.nan_to_num(params)
+        M = np.zeros((len(self.names), len(x)))
+        M[z] = Pi
+        df_resid = self.n - len(x)
+        cov = self._cov(b, bread, M, df_resid, cov_type)
+        return _result(params, cov, estimable, self.n, df_resid, cov_type, list(endog) + list(exog))
+
+    def _cov(self, b, bread, M, df_resid, cov_type):
+        """Covariance of coefficients with residuals y - x'b and scores M'x."""
+        if cov_type == 'nonrobust':
+            ssr = self.yty - 2 * b @ self.xty + b @ self.xtx @ b
+            return max(ssr, 0.0) / df_resid * bread
+        cov = bread @ (M.T @ self.meat(b) @ M) @ bread
+        if cov_type == 'HC1':
+            cov *= self.n / df_resid
+        return cov
+
+    # ---- persistence ----
+
+    def state(self, prefix):
+        arrays = {f'{prefix}.{s}': getattr(self, s) for s in self.STATS}
+        arrays[f'{prefix}.n'] = np.array(self.n)
+        arrays[f'{prefix}.names'] = np.array(self.names)
+        if self.R is not None:
+            arrays[f'{prefix}.R'] = self.R
+        return arrays
+
+    @classmethod
+    def from_state(cls, arrays, prefix):
+        model = cls(arrays[f'{prefix}.names'].tolist())
+        for s in cls.STATS:
+            setattr(model, s, np.array(arrays[f'{prefix}.{s}']))
+        model.yty = float(model.yty)
+        model.n = int(arrays[f'{prefix}.n'])
+        model.R = np.array(arrays[f'{prefix}.R']) if f'{prefix}.R' in arrays else None
+        return model
+
+
+def _check_cov_type(cov_type):
+    if cov_type not in COV_TYPES:
+        raise ValueError(f"cov_type must be one of {COV_TYPES} (leverage-based errors need the rows)")
+
+
+def _result(params, cov, estimable, nobs, df_resid, cov_type, index):
+    from scipy import stats
+
+    bse = np.where(estimable, np.sqrt(np.clip(np.diag(cov), 0, None)), np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = np.abs(params / bse)
+    pvalues = 2 * (stats.t.sf(z, df_resid) if cov_type == 'nonrobust' else stats.norm.sf(z))
+    return {'params': pd.Series(params, index=index), 'bse': pd.Series(bse, index=index),
+            'pvalues': pd.Series(pvalues, index=index), 'cov': cov,
+            'nobs': nobs, 'df_resid': df_resid, 'cov_type': cov_type}
+
+
+# ===========================
+# KEYED ROWS
+# ===========================
+
+class RowStore:
+    """A RecursiveLS plus the keyed rows it currently holds."""
+
+    def __init__(self, names):
+        self.model = RecursiveLS(names)
+        self.rows = {}
+
+    def sync(self, keys, X, y):
+        """
+        Make the held rows equal to (keys, X, y): add new keys, downdate and
+        re-add changed rows, remove keys that are gone. Returns the counts.
+        """
+        X = np.asarray(X, dtype=float)
+        y = np.asarray(y, dtype=float)
+        incoming = {key: i for i, key in enumerate(keys)}
+        added = [i for key, i in incoming.items() if key not in self.rows]
+        revised = [i for key, i in incoming.items() if key in self.rows
+                   and not (np.array_equal(self.rows[key][0], X[i]) and self.rows[key][1] == y[i])]
+        removed = [key for key in self.rows if key not in incoming]
+
+        old = [self.rows[keys[i]] for i in revised] + [self.rows[key] for key in removed]
+        if old:
+            self.model.remove(np.array([x for x, _ in old]), np.array([v for _, v in old]))
+        new = added + revised
+        if new:
+            self.model.add(X[new], y[new])
+        for key in removed:
+            del self.rows[key]
+        for i in new:
+            self.rows[keys[i]] = (X[i].copy(), float(y[i]))
+        return {'added': len(added), 'revised': len(revised), 'removed': len(removed)}
+
+    def state(self, prefix):
+        arrays = self.model.state(prefix)
+        keys = list(self.rows)
+        arrays[f'{prefix}.keys'] = np.array(keys, dtype=str)
+        arrays[f'{prefix}.X'] = np.array([self.rows[k][0] for k in keys]).reshape(len(keys), len(self.model.names))
+        arrays[f'{prefix}.y'] = np.array([self.rows[k][1] for k in keys])
+        return arrays
+
+    @classmethod
+    def from_state(cls, arrays, prefix):
+        store = cls.__new__(cls)
+        store.model = RecursiveLS.from_state(arrays, prefix)
+        store.rows = {str(k): (x, float(v)) for k, x, v in
+                      zip(arrays[f'{prefix}.keys'], arrays[f'{prefix}.X'], arrays[f'{prefix}.y'])}
+        return store
+
+
+def save_stores(stores, path):
+    """Write {name: RowStore} to one .npz file."""
+    arrays = {}
+    for name, store in stores.items():
+        arrays.update(store.state(name))
+    np.savez(path, **arrays)
+
+
+def load_stores(path):
+    """Read {name: RowStore} written by save_stores."""
+    with np.load(path, allow_pickle=False) as arrays:
+        data = dict(arrays)
+    names = sorted({key.split('.')[0] for key in data})
+    return {name: RowStore.from_state(data, name) for name in names}
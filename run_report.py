@@ -0,0 +1,247 @@
+"""
+RUN REPORT: PER-STAGE INSTRUMENTATION
+=====================================
+
+Records where a run spends its time and memory, stage by stage, and writes
+it as one JSON document for an orchestrator to parse (the console output is
+unchanged and stays for people).
+
+For every StageGraph stage the report holds:
+
+    status          computed, memory or disk (memory/disk are cache hits)
+    fingerprint     the stage's cache key
+    wall_s, cpu_s   wall-clock and process CPU time (cache loads included)
+    max_rss_mb      process peak RSS after the stage
+    rss_growth_mb   how much the stage raised that peak
+    traced_peak_mb  peak Python/NumPy allocation within the stage
+                    (only with trace_memory, which slows the run)
+    input_rows      rows of the upstream results it was given
+    output_rows     rows of its result
+    counters        change in named counters while it ran, e.g. the ingest
+                    cache's hits and misses
+    profile         for stages listed in `profile`, the hottest functions of
+                    a sampling profiler, by own and by inclusive samples
+
+Commands that do not use the StageGraph (synth, grid, serve, throughput)
+report their steps the same way through measure() and finish(), with no
+fingerprint. So do the steps that the other commands (permute, bootstrap,
+uncertainty, scenarios, refresh, rolling, event, breaks, influence) run
+after loading their graph stages.
+
+The sampler is a thread that looks at the main thread's stack every
+`interval` seconds, so it needs nothing installed and costs little.
+Other profilers plug in through `hooks`, {stage: factory(stage) -> context
+manager}, entered around the stage.
+
+    report = RunReport(profile=['iv'], counters={'ingest_cache': lambda: cache.stats})
+    graph = StageGraph(observer=report)
+    graph.run(['iv'], params)
+    report.write('pipeline_run_report.json')
+"""
+
+import json
+import os
+import platform
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from stage_graph import COMPUTED
+
+PROFILE_INTERVAL = 0.005
+PROFILE_TOP = 15
+
+
+# ===========================
+# MEASUREMENTS
+# ===========================
+
+def max_rss_mb():
+    """Peak resident set size of this process (None where unavailable)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss / 2**20 if sys.platform == 'darwin' else rss / 2**10
+
+
+def count_rows(value):
+    """
+    Rows in a stage input or result: frames and arrays by length, fitted
+    models by nobs, containers by the frames directly inside them.
+    """
+    if value is None:
+        return None
+    if hasattr(value, 'shape') and len(getattr(value, 'shape', ())) > 0:
+        return int(value.shape[0])
+    if hasattr(value, 'nobs'):
+        return int(value.nobs)
+    children = list(value.values()) if isinstance(value, dict) else \
+        list(value) if isinstance(value, (list, tuple)) else []
+    frames = [c for c in children if hasattr(c, 'shape') and len(getattr(c, 'shape', ())) > 0]
+    if frames:
+        return int(sum(f.shape[0] for f in frames))
+    counts = [count_rows(c) for c in children if hasattr(c, 'nobs')]
+    return int(sum(counts)) if counts else None
+
+
+class SamplingProfiler:
+    """Samples one thread's stack on a timer; counts own and inclusive hits per function."""
+
+    def __init__(self, interval=PROFILE_INTERVAL, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id or threading.main_thread().ident
+        self.own = Counter()
+        self.inclusive = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def _label(frame):
+        code = frame.f_code
+        return f"{os.path.basename(code.co_filename)}:{code.co_name}:{code.co_firstlineno}"
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            self.samples += 1
+            self.own[self._label(frame)] += 1
+            seen = set()
+            while frame is not None:
+                label = self._label(frame)
+                if label not in seen:
+                    self.inclusive[label] += 1
+                    seen.add(label)
+                frame = frame.f_back
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+    def summary(self, top=PROFILE_TOP):
+        return {
+            'interval_s': self.interval,
+            'samples': self.samples,
+            'own': [[label, n] for label, n in self.own.most_common(top)],
+            'inclusive': [[label, n] for label, n in self.inclusive.most_common(top)],
+        }
+
+
+# ===========================
+# REPORT
+# ===========================
+
+class RunReport:
+    """StageGraph observer collecting per-stage measurements; see the module docstring."""
+
+    def __init__(self, trace_memory=False, profile=(), interval=PROFILE_INTERVAL, hooks=None, counters=None):
+        self.trace_memory = trace_memory
+        self.profile = set(profile or ())
+        self.interval = interval
+        self.hooks = dict(hooks or {})
+        self.counters = dict(counters or {})
+        self.stages = {}
+        self.meta = {'argv': sys.argv[1:], 'python': platform.python_version(), 'platform': platform.platform(),
+                     'pid': os.getpid(), 'started': time.strftime('%Y-%m-%dT%H:%M:%S%z')}
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+
+    def _record(self, name):
+        if name not in self.stages:
+            self.stages[name] = {'stage': name, 'status': None, 'fingerprint': None, 'wall_s': 0.0, 'cpu_s': 0.0,
+                                 'max_rss_mb': None, 'rss_growth_mb': 0.0, 'traced_peak_mb': None,
+                                 'input_rows': None, 'output_rows': None, 'counters': {}}
+        return self.stages[name]
+
+    def _counter_values(self):
+        return {key: dict(read()) for key, read in self.counters.items()}
+
+    @contextmanager
+    def measure(self, name):
+        """Time, memory and counters for one stretch of a stage; stretches add up."""
+        record = self._record(name)
+        tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            traced_base = tracemalloc.get_traced_memory()[0]
+        counters = self._counter_values()
+        rss = max_rss_mb()
+        wall, cpu = time.perf_counter(), time.process_time()
+        profiler = None
+        with ExitStack() as stack:
+            if name in self.profile:
+                profiler = stack.enter_context(SamplingProfiler(self.interval))
+            if name in self.hooks:
+                stack.enter_context(self.hooks[name](name))
+            try:
+                yield record
+            finally:
+                record['wall_s'] += time.perf_counter() - wall
+                record['cpu_s'] += time.process_time() - cpu
+                after = max_rss_mb()
+                record['max_rss_mb'] = after
+                if after is not None:
+                    record['rss_growth_mb'] += after - rss
+                if self.trace_memory:
+                    peak = (tracemalloc.get_traced_memory()[1] - traced_base) / 2**20
+                    record['traced_peak_mb'] = max(record['traced_peak_mb'] or 0.0, peak)
+                    if tracing:
+                        tracemalloc.stop()
+                for key, values in self._counter_values().items():
+                    changes = {k: v - counters[key].get(k, 0) for k, v in values.items()
+                               if isinstance(v, (int, float))}
+                    totals = record['counters'].setdefault(key, {})
+                    for k, v in changes.items():
+                        totals[k] = totals.get(k, 0) + v
+        if profiler is not None:
+            record['profile'] = profiler.summary()
+
+    def finish(self, name, status, fingerprint, inputs, result):
+        """Called by StageGraph once a stage is loaded or computed."""
+        # Stages are listed in the order they finished, upstream first
+        record = self.stages.pop(name, None) or self._record(name)
+        self.stages[name] = record
+        record['status'] = status
+        record['cache_hit'] = status != COMPUTED
+        record['fingerprint'] = fingerprint
+        if inputs:
+            counts = [count_rows(v) for v in inputs.values()]
+            counts = [c for c in counts if c is not None]
+            record['input_rows'] = int(sum(counts)) if counts else None
+        record['output_rows'] = count_rows(result)
+
+    def to_dict(self, **extra):
+        """The report as plain JSON types; extra keys go to the top level."""
+        stages = list(self.stages.values())
+        return {
+            **self.meta,
+            'finished': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'wall_s': time.perf_counter() - self._wall,
+            'cpu_s': time.process_time() - self._cpu,
+            'max_rss_mb': max_rss_mb(),
+            'stages_wall_s': sum(s['wall_s'] for s in stages),
+            'cache_hits': sum(bool(s.get('cache_hit')) for s in stages),
+            'stages': stages,
+            **extra,
+        }
+
+    def write(self, path, **extra):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(**extra), f, indent=2, default=str)
+        return path
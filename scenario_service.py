@@ -0,0 +1,584 @@
+"""
+SCENARIO QUERY SERVICE
+======================
+
+Answers "what if" questions about the analysis over HTTP/JSON on localhost,
+without rerunning the script for each one:
+
+    GET  /scenario?capacity_tmx=890&decline_rate=0.013
+    POST /scenario  {"capacity_tmx": 890, "line3_start": "2021-11"}
+    GET  /grid      the precomputed dimensions and the defaults
+    GET  /health    counts of lookups, interpolations and computed points
+
+A scenario is any mix of
+
+    start_year, end_year            sample window
+    line3_start, tmx_start          in-service dates, "YYYY-MM"
+    capacity_line3, capacity_tmx    nameplate capacity in the instrument (kb/d)
+    base_intensity, decline_rate    declining emissions intensity
+    constant_intensity, cov_type    held fixed in the cube
+
+with the rest taken from the defaults. The response holds the numbers the
+script prints for Parts 1-3 (descriptive and regression DiD, both 2SLS
+stages and the engine's IV diagnostics, intensities and emissions), plus
+where each part came from.
+
+The cube is precomputed over GRID with the script's own functions (build_panel,
+descriptive_did, run_did, run_iv, compute_emissions). Each part is stored
+only over the dimensions it depends on:
+
+    did         window x dates
+    iv          window x dates x capacities
+    emissions   window x dates x base intensity x decline rate
+
+A query on the grid is a lookup. Capacities, base intensity and decline rate
+between grid values are interpolated multilinearly (exact for the base
+intensity, which emissions are linear in). Only point estimates are
+interpolated. Standard errors, p-values and test statistics (INFERENCE) are
+null in an interpolated answer, since a blend of the corners' p-values is not
+the p-value of anything. The price-channel totals are products of estimates,
+so they are recomputed from the interpolated slope and 2SLS coefficient
+(DERIVED) instead of blended. Anything else (a window or date
+off the grid, a value outside it, a different constant intensity or
+covariance, or exact=true) is computed on a process pool and kept for the
+next time. The cube is saved to .scenario_cube.pkl and rebuilt only when the
+grid, the fixed parameters or the input files change.
+
+    python3 pipeline_complete_analysis.py serve --port 8765 --workers 2
+"""
+
+import hashlib
+import itertools
+import json
+import os
+import pickle
+import threading
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+import pipeline_complete_analysis as pca
+from ingest_cache import file_digest
+
+CUBE_FILE = '.scenario_cube.pkl'
+CUBE_FORMAT = 2
+HOST = '127.0.0.1'
+PORT = 8765
+COMPUTE_TIMEOUT = 300
+MAX_POINTS = 4096
+
+GRID = {
+    'start_year': [2017, 2018, 2019],
+    'end_year': [2024, 2025],
+    'line3_start': [(2021, 9), (2021, 10), (2021, 11)],
+    'tmx_start': [(2024, 4), (2024, 5), (2024, 6)],
+    'capacity_line3': [390.0, 490.0, 590.0, 690.0, 790.0],
+    'capacity_tmx': [390.0, 490.0, 590.0, 690.0, 790.0, 890.0],
+    'base_intensity': [65.0, 70.0, 75.0, 80.0, 85.0],
+    'decline_rate': [0.0, 0.005, 0.01, 0.015, 0.02, 0.025, 0.03, 0.04],
+}
+CELL = ['start_year', 'end_year', 'line3_start', 'tmx_start']
+# part: (continuous dimensions it varies over, fixed parameters it depends on)
+PARTS = {
+    'did': ([], ['cov_type']),
+    'iv': (['capacity_line3', 'capacity_tmx'], ['cov_type']),
+    'emissions': (['base_intensity', 'decline_rate'], ['constant_intensity']),
+}
+FIXED = ['constant_intensity', 'cov_type']
+# Fields that are not point estimates: null when a part is interpolated
+INFERENCE_SUFFIXES = ('_p', '_se')
+INFERENCE = {'first_f', 'second_r_squared', 'iv_first_f', 'iv_first_f_hac', 'kp_f', 'identified_with_direct'}
+DATES = ['line3_start', 'tmx_start']
+YEARS = ['start_year', 'end_year']
+
+_WORKER = {}
+
+
+# ===========================
+# NUMBERS THE SCRIPT PRINTS
+# ===========================
+
+def did_numbers(means, model):
+    """report_did's numbers: period means, descriptive and regression DiD."""
+    numbers = {k: float(v) for k, v in means.items() if k not in ('line3_did', 'tmx_did')}
+    numbers.update({
+        'descriptive_line3_did': float(means['line3_did']),
+        'descriptive_tmx_did': float(means['tmx_did']),
+        'line3_did': float(model.params['line3_did']),
+        'line3_did_p': float(model.pvalues['line3_did']),
+        'tmx_did': float(model.params['tmx_did']),
+        'tmx_did_p': float(model.pvalues['tmx_did']),
+        'r_squared': float(model.rsquared),
+    })
+    return numbers
+
+
+def iv_numbers(iv):
+    """report_iv's numbers: both stages, price-channel totals and the 2SLS engine."""
+    first, second = iv['first'], iv['second']
+    fit, hac = iv['engine']['fit'], iv['engine']['hac']
+    return {
+        'capacity_line3': float(iv['capacity_line3']),
+        'capacity_tmx': float(iv['capacity_tmx']),
+        'first_slope': float(first.params['pipeline_capacity_instrument']),
+        'first_slope_p': float(first.pvalues['pipeline_capacity_instrument']),
+        'first_f': float(first.fvalue),
+        'second_price': float(second.params['differential_predicted']),
+        'second_price_p': float(second.pvalues['differential_predicted']),
+        'second_line3': float(second.params['line3_post']),
+        'second_line3_p': float(second.pvalues['line3_post']),
+        'second_tmx': float(second.params['tmx_post']),
+        'second_tmx_p': float(second.pvalues['tmx_post']),
+        'second_r_squared': float(second.rsquared),
+        'diff_narrowing_line3': float(iv['diff_narrowing_line3']),
+        'diff_narrowing_tmx': float(iv['diff_narrowing_tmx']),
+        'prod_increase_via_price_line3': float(iv['prod_increase_via_price_line3']),
+        'prod_increase_via_price_tmx': float(iv['prod_increase_via_price_tmx']),
+        'iv_price': float(fit['params'][0, 0]),
+        'iv_price_se': float(fit['bse'][0, 0]),
+        'iv_price_p': float(fit['pvalues'][0, 0]),
+        'iv_price_hac_se': float(hac['bse'][0, 0]),
+        'iv_price_hac_p': float(hac['pvalues'][0, 0]),
+        'hac_lags': float(hac['lags']),
+        'iv_first_f': float(fit['first_f'][0, 0]),
+        'iv_first_f_hac': float(hac['first_f'][0, 0]),
+        'kp_f': float(fit['kp_f'][0]),
+        'kp_rk_p': float(fit['kp_rk_p'][0]),
+        'ar_p': float(fit['ar_p'][0]),
+        'ar_p_hac': float(hac['ar_p'][0]),
+        'identified_with_direct': float(iv['engine']['identified_with_direct']),
+    }
+
+
+def emissions_numbers(em):
+    """report_emissions' numbers: intensity by year, period emissions and the constant comparison."""
+    const_total = em['const_line3'] + em['const_tmx']
+    numbers = {f'intensity_{year}': float(value) for year, value in em['intensity_by_year'].items()}
+    numbers.update({k: float(em[k]) for k in ['pre_emissions', 'post_line3_emissions', 'post_tmx_emissions',
+                                              'line3_delta', 'tmx_delta', 'total_delta', 'const_line3',
+                                              'const_tmx', 'decline_rate', 'constant_intensity']})
+    numbers.update({'const_total': float(const_total), 'difference': float(em['total_delta'] - const_total),
+                    'observed': float(em['observed'])})
+    return numbers
+
+
+def is_inference(name):
+    """Whether a field is a standard error, p-value or test statistic rather than an estimate."""
+    return name.endswith(INFERENCE_SUFFIXES) or name in INFERENCE
+
+
+def derive(part, numbers):
+    """Recompute a part's products of estimates from the (interpolated) estimates, as run_iv does."""
+    if part == 'iv':
+        for event in ['line3', 'tmx']:
+            narrowing = numbers[f'capacity_{event}'] * numbers['first_slope'] / 100
+            numbers[f'diff_narrowing_{event}'] = narrowing
+            numbers[f'prod_increase_via_price_{event}'] = narrowing * numbers['iv_price']
+    return numbers
+
+
+def _response_part(part, numbers):
+    """Interpolatable floats back to the types a reader expects."""
+    out = {k: (None if isinstance(v, float) and not np.isfinite(v) else v) for k, v in numbers.items()}
+    if part == 'iv':
+        if out['identified_with_direct'] is not None:
+            out['identified_with_direct'] = bool(round(out['identified_with_direct']))
+        out['hac_lags'] = int(round(out['hac_lags']))
+    elif part == 'emissions':
+        out['observed'] = bool(round(out['observed']))
+        out['intensity_by_year'] = {int(k.split('_')[1]): out.pop(k) for k in list(out) if k.startswith('intensity_')}
+    return out
+
+
+# ===========================
+# EVALUATION (WORKER PROCESSES)
+# ===========================
+
+def window_inputs(inputs, start_year, end_year):
+    """load_inputs frames cut to a window, as load_inputs would have read them."""
+    out = dict(inputs)
+    for name in ['alberta', 'sask', 'rail', 'prices']:
+        frame = inputs[name]
+        out[name] = frame[(frame['year'] >= start_year) & (frame['year'] <= end_year)].reset_index(drop=True)
+    return out
+
+
+def _init_worker(inputs, observed):
+    # The stages import these lazily; paying for it here keeps it off the first miss
+    import intensity_schedules  # noqa: F401
+    import iv_engine  # noqa: F401
+    import statsmodels.api  # noqa: F401
+
+    _WORKER.clear()
+    _WORKER.update(inputs=inputs, observed=observed)
+
+
+def _panel(scenario, capacity_line3, capacity_tmx):
+    inputs = window_inputs(_WORKER['inputs'], scenario['start_year'], scenario['end_year'])
+    return pca.build_panel(inputs['alberta'], inputs['sask'], inputs['prices'], inputs['rail'],
+                           scenario['line3_start'], scenario['tmx_start'], capacity_line3, capacity_tmx,
+                           inputs['capacity'])
+
+
+def _did(panel, scenario):
+    return did_numbers(pca.descriptive_did(panel[0]), pca.run_did(panel[0], scenario['cov_type']))
+
+
+def _iv(scenario):
+    panel = _panel(scenario, scenario['capacity_line3'], scenario['capacity_tmx'])
+    return iv_numbers(pca.run_iv(panel[1], scenario['capacity_line3'], scenario['capacity_tmx'],
+                                 scenario['cov_type']))
+
+
+def _emissions(panel, scenario):
+    return emissions_numbers(pca.compute_emissions(panel[1], scenario['base_intensity'], scenario['decline_rate'],
+                                                   scenario['constant_intensity'], _WORKER['observed']))
+
+
+def evaluate(scenario):
+    """Every part of one scenario, computed with the script's functions."""
+    # statsmodels re-enables its own warnings on import, so they are silenced per call
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        panel = _panel(scenario, scenario['capacity_line3'], scenario['capacity_tmx'])
+        return {'did': _did(panel, scenario), 'iv': _iv(scenario), 'emissions': _emissions(panel, scenario)}
+
+
+def _table(rows):
+    """Dicts on a grid -> (names, array with the numbers on the last axis)."""
+    names = list(rows.flat[0])
+    return names, np.array([[row[n] for n in names] for row in rows.flat]).reshape(rows.shape + (len(names),))
+
+
+def cube_cell(task):
+    """(cell, {part: (names, array)}) over all grid points of one (window, dates) cell."""
+    cell, grid, fixed = task
+    scenario = {**dict(zip(CELL, cell)), **fixed}
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        return cell, _cell_tables(scenario, grid)
+
+
+def _cell_tables(scenario, grid):
+    panel = _panel(scenario, pca.CAPACITY_LINE3, pca.CAPACITY_TMX)
+
+    tables = {'did': _table(np.array([_did(panel, scenario)], dtype=object).reshape(()))}
+    ivs = np.empty((len(grid['capacity_line3']), len(grid['capacity_tmx'])), dtype=object)
+    for (i, c3), (j, ct) in itertools.product(enumerate(grid['capacity_line3']), enumerate(grid['capacity_tmx'])):
+        ivs[i, j] = _iv({**scenario, 'capacity_line3': c3, 'capacity_tmx': ct})
+    tables['iv'] = _table(ivs)
+    ems = np.empty((len(grid['base_intensity']), len(grid['decline_rate'])), dtype=object)
+    for (i, base), (j, rate) in itertools.product(enumerate(grid['base_intensity']),
+                                                  enumerate(grid['decline_rate'])):
+        ems[i, j] = _emissions(panel, {**scenario, 'base_intensity': base, 'decline_rate': rate})
+    tables['emissions'] = _table(ems)
+    return tables
+
+
+# ===========================
+# CUBE
+# ===========================
+
+def scenario_grid(defaults, grid=None):
+    """GRID (or grid) with the default scenario's values added to every dimension."""
+    grid = {name: list(values) for name, values in (grid or GRID).items()}
+    for name in grid:
+        grid[name] = sorted(set(grid[name]) | {defaults[name]})
+    return grid
+
+
+def _cells(grid):
+    return [cell for cell in itertools.product(*(grid[name] for name in CELL))
+            if cell[0] <= cell[1] and cell[2] < cell[3]]
+
+
+def cube_fingerprint(grid, fixed, sources, settings=None):
+    """Digest of the grid, the fixed parameters, other input settings and the input files' contents."""
+    digests = {name: [file_digest(p) for p in paths] for name, paths in sources.items()}
+    if not sources.get('prices'):
+        digests['price_data'] = pca.price_data
+    payload = json.dumps({'format': CUBE_FORMAT, 'grid': grid, 'fixed': fixed, 'settings': settings,
+                          'sources': digests},
+                         sort_keys=True, default=str)
+    return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+
+class ScenarioCube:
+    """Precomputed parts over the grid; lookup and multilinear interpolation."""
+
+    def __init__(self, grid, fixed, tables, fingerprint=None):
+        self.grid = grid
+        self.fixed = fixed
+        self.tables = tables            # {part: {cell: (names, array)}}
+        self.fingerprint = fingerprint
+        self._axes = {name: np.asarray(grid[name], dtype=float) for part in PARTS for name in PARTS[part][0]}
+
+    @classmethod
+    def build(cls, grid, fixed, pool, fingerprint=None):
+        tables = {part: {} for part in PARTS}
+        tasks = [(cell, grid, fixed) for cell in _cells(grid)]
+        for cell, parts in pool.map(cube_cell, tasks):
+            for part, table in parts.items():
+                tables[part][cell] = table
+        return cls(grid, fixed, tables, fingerprint)
+
+    @classmethod
+    def load(cls, path, fingerprint):
+        """The saved cube if it was built for this fingerprint, else None."""
+        try:
+            with open(path, 'rb') as f:
+                saved = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        if saved.get('format') != CUBE_FORMAT or saved.get('fingerprint') != fingerprint:
+            return None
+        return cls(saved['grid'], saved['fixed'], saved['tables'], fingerprint)
+
+    def save(self, path):
+        temporary = f'{path}.tmp'
+        with open(temporary, 'wb') as f:
+            pickle.dump({'format': CUBE_FORMAT, 'fingerprint': self.fingerprint, 'grid': self.grid,
+                         'fixed': self.fixed, 'tables': self.tables}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, path)
+        return path
+
+    def _weights(self, name, value):
+        """[(index, weight)] bracketing value on a dimension, or None outside it."""
+        axis = self._axes[name]
+        if value < axis[0] or value > axis[-1]:
+            return None
+        i = int(np.searchsorted(axis, value))
+        if axis[i] == value:
+            return [(i, 1.0)]
+        w = (value - axis[i - 1]) / (axis[i] - axis[i - 1])
+        return [(i - 1, 1 - w), (i, w)]
+
+    def lookup(self, part, scenario, interpolate=True):
+        """(numbers, 'lookup' | 'interpolated') for one part, or None when the cube cannot answer."""
+        dims, fixed = PARTS[part]
+        if any(scenario[name] != self.fixed[name] for name in fixed):
+            return None
+        table = self.tables[part].get(tuple(scenario[name] for name in CELL))
+        if table is None:
+            return None
+        names, values = table
+        brackets = [self._weights(name, scenario[name]) for name in dims]
+        if any(b is None for b in brackets):
+            return None
+        on_grid = all(len(b) == 1 for b in brackets)
+        if not on_grid and not interpolate:
+            return None
+        total = np.zeros(len(names))
+        for corner in itertools.product(*brackets):
+            index = tuple(i for i, _ in corner)
+            total += np.prod([w for _, w in corner]) * values[index]
+        numbers = dict(zip(names, total.tolist()))
+        if on_grid:
+            return numbers, 'lookup'
+        # Inputs of the part are the query's values, not the blend of the corners
+        for name in dims:
+            if name in numbers:
+                numbers[name] = float(scenario[name])
+        for name in numbers:
+            if is_inference(name):
+                numbers[name] = float('nan')
+        return derive(part, numbers), 'interpolated'
+
+
+# ===========================
+# SERVICE
+# ===========================
+
+def _year_month(value):
+    if isinstance(value, (list, tuple)):
+        return int(value[0]), int(value[1])
+    year, month = str(value).split('-')
+    return int(year), int(month)
+
+
+def parse_scenario(query, defaults):
+    """
+    The full scenario from query values (strings from a URL, or JSON values)
+    over the defaults, and the exact flag. Raises ValueError on bad input.
+    """
+    query = dict(query)
+    exact = str(query.pop('exact', 'false')).lower() in ('1', 'true', 'yes')
+    unknown = set(query) - set(defaults)
+    if unknown:
+        raise ValueError(f"unknown scenario parameters: {sorted(unknown)}")
+    scenario = dict(defaults)
+    scenario.update(query)
+    for name, value in scenario.items():
+        try:
+            if name in DATES:
+                scenario[name] = _year_month(value)
+            elif name in YEARS:
+                scenario[name] = int(value)
+            elif name == 'cov_type':
+                scenario[name] = str(value)
+            else:
+                scenario[name] = float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"bad value for {name}: {value!r}")
+    if scenario['start_year'] > scenario['end_year']:
+        raise ValueError("start_year is after end_year")
+    if scenario['line3_start'] >= scenario['tmx_start']:
+        raise ValueError("tmx_start must be after line3_start")
+    return scenario, exact
+
+
+def _scenario_json(scenario):
+    return {k: (f'{v[0]}-{v[1]:02d}' if k in DATES else v) for k, v in scenario.items()}
+
+
+class ScenarioService:
+    """The cube, a process pool for misses and the exact points computed so far."""
+
+    def __init__(self, inputs, defaults, observed=None, sources=None, settings=None, grid=None,
+                 path=CUBE_FILE, workers=1, rebuild=False):
+        self.defaults = defaults
+        self.pool = ProcessPoolExecutor(max_workers=max(1, workers), initializer=_init_worker,
+                                        initargs=(inputs, observed))
+        # Workers start (and import the stages' modules) now, not on the first miss
+        self.pool.submit(os.getpid)
+        self.points = {}
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.counts = {'lookup': 0, 'interpolated': 0, 'computed': 0, 'cached': 0}
+
+        grid = scenario_grid(defaults, grid)
+        fixed = {name: defaults[name] for name in FIXED}
+        fingerprint = cube_fingerprint(grid, fixed, sources or {},
+                                       {**(settings or {}), 'observed': observed is not None})
+        self.cube = None if rebuild else ScenarioCube.load(path, fingerprint)
+        self.built = self.cube is None
+        if self.cube is None:
+            self.cube = ScenarioCube.build(grid, fixed, self.pool, fingerprint)
+            self.cube.save(path)
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+    def _compute(self, scenario):
+        """Exact parts of an off-cube scenario; concurrent identical queries share one computation."""
+        key = tuple(sorted(scenario.items()))
+        with self.lock:
+            if key in self.points:
+                self.counts['cached'] += 1
+                return self.points[key], 'cached'
+            future = self.pending.get(key)
+            if future is None:
+                future = self.pending[key] = self.pool.submit(evaluate, scenario)
+        try:
+            parts = future.result(timeout=COMPUTE_TIMEOUT)
+        finally:
+            with self.lock:
+                self.pending.pop(key, None)
+        with self.lock:
+            if key not in self.points:
+                self.counts['computed'] += 1
+                if len(self.points) >= MAX_POINTS:
+                    self.points.pop(next(iter(self.points)))
+                self.points[key] = parts
+        return parts, 'computed'
+
+    def query(self, values):
+        """The JSON response for one scenario query (a dict of parameter values)."""
+        start = time.perf_counter()
+        scenario, exact = parse_scenario(values, self.defaults)
+        parts, source = {}, {}
+        for part in PARTS:
+            hit = self.cube.lookup(part, scenario, interpolate=not exact)
+            if hit is not None:
+                parts[part], source[part] = hit
+        if len(parts) < len(PARTS):
+            computed, how = self._compute(scenario)
+            for part in PARTS:
+                if part not in parts:
+                    parts[part], source[part] = computed[part], how
+        with self.lock:
+            for how in source.values():
+                if how in ('lookup', 'interpolated'):
+                    self.counts[how] += 1
+        response = {'scenario': _scenario_json(scenario), 'source': {part: source[part] for part in PARTS}}
+        response.update({part: _response_part(part, parts[part]) for part in PARTS})
+        response['elapsed_ms'] = (time.perf_counter() - start) * 1000
+        return response
+
+    def describe(self):
+        grid = {k: [f'{v[0]}-{v[1]:02d}' for v in values] if k in DATES else values
+                for k, values in self.cube.grid.items()}
+        return {'grid': grid, 'fixed': self.cube.fixed, 'defaults': _scenario_json(self.defaults),
+                'parts': {part: dims for part, (dims, _) in PARTS.items()},
+                'cells': len(self.cube.tables['did'])}
+
+    def health(self):
+        with self.lock:
+            return {'status': 'ok', 'points': len(self.points), 'pending': len(self.pending), **self.counts}
+
+
+class ScenarioHandler(BaseHTTPRequestHandler):
+    """GET/POST /scenario, GET /grid and /health; the service is self.server.service."""
+
+    def _send(self, status, body):
+        data = json.dumps(body, default=str).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _answer(self, values):
+        try:
+            self._send(200, self.server.service.query(values))
+        except ValueError as e:
+            self._send(400, {'error': str(e)})
+        except Exception as e:
+            self._send(500, {'error': f'{type(e).__name__}: {e}'})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/scenario':
+            self._answer({k: v[-1] for k, v in parse_qs(url.query).items()})
+        elif url.path in ('/', '/grid'):
+            self._send(200, self.server.service.describe())
+        elif url.path == '/health':
+            self._send(200, self.server.service.health())
+        else:
+            self._send(404, {'error': f'no route {url.path}'})
+
+    def do_POST(self):
+        if urlparse(self.path).path != '/scenario':
+            self._send(404, {'error': f'no route {self.path}'})
+            return
+        try:
+            values = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        except json.JSONDecodeError as e:
+            self._send(400, {'error': f'invalid JSON: {e}'})
+            return
+        if not isinstance(values, dict):
+            self._send(400, {'error': 'expected a JSON object of scenario parameters'})
+            return
+        self._answer(values)
+
+    def log_message(self, format, *args):
+        if not getattr(self.server, 'quiet', False):
+            super().log_message(format, *args)
+
+
+def serve(service, host=HOST, port=PORT, quiet=False):
+    """Serve until interrupted; the pool is shut down on the way out."""
+    server = ThreadingHTTPServer((host, port), ScenarioHandler)
+    server.service = service
+    server.quiet = quiet
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
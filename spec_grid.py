@@ -0,0 +1,390 @@
+"""
+SPECIFICATION-CURVE GRID
+========================
+
+Re-estimates the DiD and the two-stage price model over the Cartesian product
+of the analysis choices that are otherwise hard-coded:
+
+    start_year, end_year        sample window
+    line3_start, tmx_start      in-service dates (year, month)
+    capacity_line3/_tmx         nameplate capacity in the instrument (kb/d)
+    trend                       'linear' (shared), 'by_province', 'quadratic', 'none'
+    cov_type                    'nonrobust', 'HC0', 'HC1', 'HC2', 'HC3'
+
+Each specification is one row of a table (SQLite or CSV) for specification-curve
+plots and ad-hoc queries.
+
+Specs are grouped by sample, i.e. window and trend. A sample's fixed regressors
+(the constant, treated, the trend terms) are QR-factored once. Every treatment-
+date pair and capacity pair in it is then a batched Frisch-Waugh-Lovell solve
+on the few columns that change. All covariance types come from the same fit.
+The second stage is solved with the batched pseudo-inverse, as statsmodels does.
+Its regressors are collinear by construction (the fitted differential is a
+combination of the post dummies and the trend), so the table records
+second_full_rank. The iv_* columns hold the proper 2SLS of the same
+instrument with trend controls only (iv_engine), batched over the instrument
+definitions of the sample. Samples are spread over a process pool.
+"""
+
+import itertools
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from iv_engine import exog_factor, fit_iv
+from permutation_inference import CHUNK_ELEMENTS, shared_factorization
+
+TRENDS = ('linear', 'by_province', 'quadratic', 'none')
+COV_TYPES = ('nonrobust', 'HC0', 'HC1', 'HC2', 'HC3')
+DIMENSIONS = ['start_year', 'end_year', 'line3_start', 'tmx_start',
+              'capacity_line3', 'capacity_tmx', 'trend', 'cov_type']
+DEFAULT_TABLE = 'spec_curve.sqlite'
+TABLE_NAME = 'specs'
+
+_SHARED = {}
+
+
+# ===========================
+# BATCHED FITS WITH ALL COVARIANCE TYPES
+# ===========================
+
+def _p_values(coef, se, df_resid, cov_type):
+    # statsmodels: t for the classical covariance, normal for the robust ones
+    from scipy import stats
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = np.abs(coef / se)
+    if cov_type == 'nonrobust':
+        return 2 * stats.t.sf(z, np.asarray(df_resid)[:, None])
+    return 2 * stats.norm.sf(z)
+
+
+def _sandwich(bread, R, u, h, n_obs, rank, cov_type):
+    """
+    Standard errors for each batch from bread (b, m, m), the residualised or
+    raw regressors R (b, n, m), residuals u (b, n) and leverages h (b, n).
+    """
+    df_resid = n_obs - rank
+    if cov_type == 'nonrobust':
+        sigma2 = (u ** 2).sum(axis=1) / df_resid
+        cov = bread * sigma2[:, None, None]
+    else:
+        omega = u ** 2
+        if cov_type == 'HC1':
+            omega = omega * (n_obs / df_resid)[:, None]
+        elif cov_type == 'HC2':
+            omega = omega / (1 - h)
+        elif cov_type == 'HC3':
+            omega = omega / (1 - h) ** 2
+        elif cov_type != 'HC0':
+            raise ValueError(f"unsupported cov_type '{cov_type}' (use one of {', '.join(COV_TYPES)})")
+        meat = np.einsum('bnm,bn,bnl->bml', R, omega, R)
+        cov = bread @ meat @ bread
+    return np.sqrt(np.clip(np.diagonal(cov, axis1=1, axis2=2), 0, None))
+
+
+def fwl_fit(Q, y_res, D, n_shared, cov_types):
+    """
+    Coefficients on the varying columns D (b, n, m) with the shared regressors
+    (orthonormal basis Q, n_shared columns) partialled out, and their standard
+    errors / p-values for every cov_type. Rank-deficient batches are NaN.
+    """
+    D_res = D - np.einsum('nk,bkm->bnm', Q, np.einsum('nk,bnm->bkm', Q, D))
+    A = np.einsum('bnm,bnl->bml', D_res, D_res)
+    full_rank = np.linalg.matrix_rank(A) == A.shape[-1]
+    A_inv = np.linalg.pinv(A)
+    coef = np.einsum('bml,bnl,n->bm', A_inv, D_res, y_res)
+    u = y_res[None, :] - np.einsum('bnm,bm->bn', D_res, coef)
+    h = (Q ** 2).sum(axis=1)[None, :] + np.einsum('bnm,bml,bnl->bn', D_res, A_inv, D_res)
+
+    n_obs = len(y_res)
+    rank = np.full(len(D), n_shared + D.shape[-1])
+    coef[~full_rank] = np.nan
+    out = {'coef': coef}
+    for cov_type in cov_types:
+        se = _sandwich(A_inv, D_res, u, h, n_obs, rank, cov_type)
+        se[~full_rank] = np.nan
+        out[cov_type] = (se, _p_values(coef, se, n_obs - rank, cov_type))
+    return out
+
+
+def pinv_fit(X, y, cov_types):
+    """
+    Minimum-norm OLS for a batch of designs X (b, n, k) and outcomes y (b, n),
+    matching statsmodels' pseudo-inverse fit on rank-deficient designs.
+    """
+    P = np.linalg.pinv(X, rcond=1e-15)
+    coef = np.einsum('bkn,bn->bk', P, y)
+    u = y - np.einsum('bnk,bk->bn', X, coef)
+    bread = P @ np.swapaxes(P, 1, 2)
+    h = np.einsum('bnk,bkl,bnl->bn', X, bread, X)
+    rank = np.linalg.matrix_rank(X)
+
+    out = {'coef': coef, 'rank': rank}
+    for cov_type in cov_types:
+        se = _sandwich(bread, X, u, h, X.shape[1], rank, cov_type)
+        out[cov_type] = (se, _p_values(coef, se, X.shape[1] - rank, cov_type))
+    return out
+
+
+# ===========================
+# SPECIFICATIONS
+# ===========================
+
+def spec_grid(start_years, end_years, line3_starts, tmx_starts, capacities_line3,
+              capacities_tmx, trends=('linear',), cov_types=('HC1',)):
+    """
+    Cartesian product of the choices as a DataFrame (one row per spec), minus
+    empty windows and TMX dates that are not after Line 3.
+    """
+    for trend in trends:
+        if trend not in TRENDS:
+            raise ValueError(f"unknown trend '{trend}' (use one of {', '.join(TRENDS)})")
+    rows = [dict(zip(DIMENSIONS, values)) for values in itertools.product(
+        start_years, end_years, [tuple(d) for d in line3_starts], [tuple(d) for d in tmx_starts],
+        capacities_line3, capacities_tmx, trends, cov_types)]
+    grid = pd.DataFrame(rows, columns=DIMENSIONS)
+    keep = (grid['start_year'] <= grid['end_year']) & (grid['line3_start'] < grid['tmx_start'])
+    return grid[keep].reset_index(drop=True)
+
+
+def _trend_terms(t, treated, trend):
+    if trend == 'none':
+        return []
+    if trend == 'linear':
+        return [t]
+    if trend == 'by_province':
+        return [t] if treated is None else [t, t * treated]
+    return [t, t ** 2]
+
+
+def _month_number(date):
+    return date[0] * 12 + date[1] - 1
+
+
+def _init_worker(shared):
+    _SHARED.clear()
+    _SHARED.update(shared)
+
+
+def _sample_arrays(start_year, end_year):
+    """Panel and Alberta-with-prices rows of one window, with its trend index."""
+    s = _SHARED
+    panel = (s['year'] >= start_year) & (s['year'] <= end_year)
+    t = (s['t'] - _month_number((start_year, 1))).astype(float)
+    t = t - t[panel].min()   # time_trend starts at 0 in the first month of the window
+    iv = panel & s['alberta'] & np.isfinite(s['differential'])
+    return panel, iv, t
+
+
+def _fit_sample(task):
+    """All date pairs and capacity pairs of one (window, trend) sample."""
+    start_year, end_year, trend, date_pairs, capacity_pairs, cov_types = task
+    s = _SHARED
+    panel, iv, t = _sample_arrays(start_year, end_year)
+    l3 = np.array([_month_number(d[0]) for d in date_pairs])
+    tmx = np.array([_month_number(d[1]) for d in date_pairs])
+    caps = np.asarray(capacity_pairs, dtype=float)
+
+    # DiD: shared [const, treated, trend terms], varying [line3_post, tmx_post, line3_did, tmx_did]
+    treated = s['treated'][panel]
+    tp = t[panel]
+    W = np.column_stack([np.ones(panel.sum()), treated] + _trend_terms(tp, treated, trend))
+    Q, y_res = shared_factorization(s['production'][panel], W)
+    post3 = (s['t'][panel][None, :] >= l3[:, None]).astype(float)
+    posttmx = (s['t'][panel][None, :] >= tmx[:, None]).astype(float)
+    did = fwl_fit(Q, y_res, np.stack([post3, posttmx, post3 * treated, posttmx * treated], axis=-1),
+                  W.shape[1], cov_types)
+
+    # 2SLS on the Alberta rows with prices: batch = date pairs x capacity pairs
+    ti = t[iv]
+    n_iv = iv.sum()
+    trend_iv = _trend_terms(ti, None, trend)
+    post3 = (s['t'][iv][None, :] >= l3[:, None]).astype(float)
+    posttmx = (s['t'][iv][None, :] >= tmx[:, None]).astype(float)
+    instrument = (caps[None, :, 0, None] * post3[:, None, :]
+                  + caps[None, :, 1, None] * posttmx[:, None, :]).reshape(-1, n_iv)
+    W1 = np.column_stack([np.ones(n_iv)] + trend_iv)
+    y1 = s['differential'][iv]
+    Q1, y1_res = shared_factorization(y1, W1)
+    first = fwl_fit(Q1, y1_res, instrument[:, :, None], W1.shape[1], cov_types)
+
+    # Fitted differential: y1 minus its residual from the full first stage
+    slope = first['coef'][:, 0]
+    identified = np.isfinite(slope)
+    instrument_res = instrument - (Q1 @ (Q1.T @ instrument.T)).T
+    fitted = y1[None, :] - (y1_res[None, :] - instrument_res * np.where(identified, slope, 0)[:, None])
+    n_batch = len(instrument)
+    X2 = np.concatenate([
+        np.ones((n_batch, n_iv, 1)),
+        fitted[:, :, None],
+        np.repeat(post3, len(caps), axis=0)[:, :, None],
+        np.repeat(posttmx, len(caps), axis=0)[:, :, None],
+        np.broadcast_to(np.column_stack(trend_iv) if trend_iv else np.empty((n_iv, 0)),
+                        (n_batch, n_iv, len(trend_iv))),
+    ], axis=-1)
+    second = pinv_fit(X2, np.broadcast_to(s['production'][iv], (n_batch, n_iv)), cov_types)
+    for key in ['coef'] + list(cov_types):
+        for values in (second[key] if key != 'coef' else [second['coef']]):
+            values[~identified] = np.nan
+
+    # Proper 2SLS of the same instrument definitions (trend controls only)
+    factor = exog_factor(W1)
+    engine = {cov_type: fit_iv(s['production'][iv], y1, W1, instrument[:, :, None],
+                               cov_type=cov_type, factor=factor) for cov_type in cov_types}
+
+    rows = []
+    for i, (d3, dt) in enumerate(date_pairs):
+        for j, (c3, ct) in enumerate(capacity_pairs):
+            b = i * len(caps) + j
+            price = second['coef'][b, 1]
+            for cov_type in cov_types:
+                did_se, did_p = did[cov_type]
+                first_se, first_p = first[cov_type]
+                second_se, second_p = second[cov_type]
+                rows.append({
+                    'start_year': start_year, 'end_year': end_year,
+                    'line3_start': d3, 'tmx_start': dt,
+                    'capacity_line3': c3, 'capacity_tmx': ct,
+                    'trend': trend, 'cov_type': cov_type,
+                    'n_panel': int(panel.sum()),
+                    'line3_did': did['coef'][i, 2], 'line3_did_se': did_se[i, 2], 'line3_did_p': did_p[i, 2],
+                    'tmx_did': did['coef'][i, 3], 'tmx_did_se': did_se[i, 3], 'tmx_did_p': did_p[i, 3],
+                    'n_2sls': int(n_iv),
+                    'first_slope': slope[b], 'first_slope_se': first_se[b, 0], 'first_slope_p': first_p[b, 0],
+                    'second_price': price, 'second_price_se': second_se[b, 1], 'second_price_p': second_p[b, 1],
+                    'second_full_rank': bool(second['rank'][b] == X2.shape[-1]),
+                    'via_price_line3': c3 * slope[b] / 100 * price,
+                    'via_price_tmx': ct * slope[b] / 100 * price,
+                    'iv_price': engine[cov_type]['params'][b, 0],
+                    'iv_price_se': engine[cov_type]['bse'][b, 0],
+                    'iv_price_p': engine[cov_type]['pvalues'][b, 0],
+                    'iv_first_f': engine[cov_type]['first_f'][b, 0],
+                    'iv_kp_f': engine[cov_type]['kp_f'][b],
+                    'iv_ar_p': engine[cov_type]['ar_p'][b],
+                    'iv_via_price_line3': c3 * slope[b] / 100 * engine[cov_type]['params'][b, 0],
+                    'iv_via_price_tmx': ct * slope[b] / 100 * engine[cov_type]['params'][b, 0],
+                })
+    return rows
+
+
+def _tasks(grid, max_batch):
+    by_sample = grid.groupby(['start_year', 'end_year', 'trend'], sort=False)
+    for (start_year, end_year, trend), specs in by_sample:
+        dates = list(dict.fromkeys(zip(specs['line3_start'], specs['tmx_start'])))
+        caps = list(dict.fromkeys(zip(specs['capacity_line3'], specs['capacity_tmx'])))
+        cov_types = list(dict.fromkeys(specs['cov_type']))
+        per_task = max(1, max_batch // len(caps))
+        for i in range(0, len(dates), per_task):
+            yield (start_year, end_year, trend, dates[i:i + per_task], caps, cov_types)
+
+
+def run_spec_grid(df_panel, df_alberta_full, grid, workers=1):
+    """
+    Estimate every spec in `grid` (from spec_grid) on a panel built over the
+    widest window. Returns one row per spec with the choices and the DiD,
+    first-stage, second-stage and via-price results.
+    """
+    alberta = (df_panel['province'] == 'Alberta').to_numpy()
+    prices = df_alberta_full.set_index(['year', 'month'])['wcs_wti_differential']
+    keys = pd.MultiIndex.from_arrays([df_panel['year'], df_panel['month']])
+    differential = np.where(alberta, prices.reindex(keys).to_numpy(dtype=float), np.nan)
+    shared = {
+        'year': df_panel['year'].to_numpy(),
+        't': (df_panel['year'].to_numpy() * 12 + df_panel['month'].to_numpy() - 1).astype(np.int64),
+        'treated': (df_panel['province'] == 'Alberta').to_numpy(dtype=float),
+        'alberta': alberta,
+        'production': df_panel['production_kbpd'].to_numpy(dtype=float),
+        'differential': differential,
+    }
+    n_cols = 9   # widest second-stage design
+    tasks = list(_tasks(grid, max(1, CHUNK_ELEMENTS // (len(df_panel) * n_cols))))
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1 or len(tasks) <= 1:
+        _init_worker(shared)
+        parts = [_fit_sample(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(shared,)) as pool:
+            parts = list(pool.map(_fit_sample, tasks))
+
+    results = pd.DataFrame([row for part in parts for row in part])
+    if results.empty:
+        return results
+    # Only the requested specs (a sample's dates x capacities product can be wider)
+    return grid.merge(results, on=DIMENSIONS, how='left')
+
+
+# ===========================
+# TABLE AND PLOT
+# ===========================
+
+def _date_text(date):
+    return f"{date[0]}-{date[1]:02d}"
+
+
+def write_spec_table(results, path=DEFAULT_TABLE):
+    """Write the results to SQLite (table 'specs', replaced) or to CSV by extension."""
+    table = results.assign(line3_start=results['line3_start'].map(_date_text),
+                           tmx_start=results['tmx_start'].map(_date_text))
+    if path.endswith('.csv'):
+        table.to_csv(path, index=False)
+        return path
+    with sqlite3.connect(path) as conn:
+        table.to_sql(TABLE_NAME, conn, if_exists='replace', index=False)
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{TABLE_NAME}_choices ON {TABLE_NAME} "
+                     f"({', '.join(DIMENSIONS)})")
+    return path
+
+
+def read_spec_table(path=DEFAULT_TABLE, where=None):
+    """Read the spec table back, optionally filtered by an SQL WHERE clause."""
+    if path.endswith('.csv'):
+        return pd.read_csv(path)
+    query = f"SELECT * FROM {TABLE_NAME}" + (f" WHERE {where}" if where else "")
+    with sqlite3.connect(path) as conn:
+        return pd.read_sql_query(query, conn)
+
+
+def plot_spec_curve(results, term='line3_did', path='spec_curve.png', alpha=0.05):
+    """Sorted estimates with 95% intervals above a panel marking each spec's choices."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from scipy import stats
+
+    df = results.dropna(subset=[term]).sort_values(term).reset_index(drop=True)
+    z = stats.norm.ppf(1 - alpha / 2)
+    varying = [d for d in DIMENSIONS if df[d].nunique() > 1]
+    labels = [(d, v) for d in varying for v in sorted(df[d].unique())]
+
+    fig, (top, bottom) = plt.subplots(2, 1, figsize=(14, 4 + 0.25 * len(labels)), sharex=True,
+                                      gridspec_kw={'height_ratios': [3, max(1, len(labels) / 6)]})
+    x = np.arange(len(df))
+    significant = df[f'{term}_p'] < alpha
+    top.fill_between(x, df[term] - z * df[f'{term}_se'], df[term] + z * df[f'{term}_se'],
+                     color='lightgray', label=f'{1 - alpha:.0%} interval')
+    top.scatter(x[significant], df.loc[significant, term], s=6, color='#2E86AB', label=f'p < {alpha}')
+    top.scatter(x[~significant], df.loc[~significant, term], s=6, color='#A23B72', label=f'p ≥ {alpha}')
+    top.axhline(0, color='black', linewidth=0.8)
+    top.set_ylabel(term)
+    top.set_title(f'Specification curve: {term} ({len(df):,} specifications)', fontweight='bold')
+    top.legend(loc='upper left')
+
+    for row, (dim, value) in enumerate(labels):
+        hits = x[(df[dim] == value).to_numpy()]
+        bottom.scatter(hits, np.full(len(hits), row), s=2, marker='|', color='black')
+    bottom.set_yticks(range(len(labels)))
+    bottom.set_yticklabels([f'{d}={_date_text(v) if isinstance(v, tuple) else v}' for d, v in labels],
+                           fontsize=7)
+    bottom.set_xlabel('Specification (sorted by estimate)')
+
+    plt.tight_layout()
+    plt.savefig(path, dpi=150, bbox_inches='tight')
+    plt.close(fig)
+    return path
@@ -0,0 +1,233 @@
+"""
+STAGE GRAPH WITH INCREMENTAL RE-EXECUTION
+=========================================
+
+The analysis is a fixed chain of stages (inputs -> panel -> DiD / 2SLS /
+emissions -> outputs). StageGraph records each stage's upstream stages, the
+run parameters it reads and the source files it depends on, and fingerprints
+every stage as
+
+    hash(stage name, stage version, its parameter values,
+         content of its source files, fingerprints of its upstream stages)
+
+A run only executes stages whose fingerprint has no stored artifact, so
+changing `decline_rate` re-runs emissions and outputs but loads the panel and
+the regressions as they are. Artifacts are kept in memory for the life of the
+graph and pickled under cache_dir for later processes.
+
+Stage functions receive upstream results and their parameters as keyword
+arguments:
+
+    graph.add('panel', make_panel, deps=['inputs'], params=['capacity_tmx'])
+    graph.run(['panel'], {'capacity_tmx': 890})
+
+Fingerprints cannot see code changes inside library functions; bump a stage's
+`version` when its logic changes.
+
+A stage that writes files (`outputs`) stores a digest of each one with its
+artifact. The cache hit is only taken while the files on disk still match, so
+a later run with other parameters that overwrote them makes the stage run
+again rather than leave that run's files behind.
+
+An optional observer (run_report.RunReport) is told about every stage: its
+measure(name) context wraps the cache load and the computation, and
+finish(name, status, fingerprint, inputs, result) follows either one.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+from contextlib import nullcontext
+
+from ingest_cache import file_digest
+
+DEFAULT_ARTIFACT_DIR = '.artifact_cache'
+KEEP_PER_STAGE = 8
+ARTIFACT_FORMAT = 2
+
+COMPUTED = 'computed'
+MEMORY = 'memory'
+DISK = 'disk'
+
+
+class Stage:
+    def __init__(self, name, func, deps=(), params=(), sources=(), outputs=(), version=1):
+        self.name = name
+        self.func = func
+        self.deps = list(deps)
+        self.params = list(params)
+        self.sources = list(sources)    # parameter names holding input file paths or lists of them (None = unused)
+        self.outputs = list(outputs)    # parameter names holding files the stage writes
+        self.version = version
+
+
+class StageGraph:
+    """Dependency graph of fingerprinted, cached analysis stages."""
+
+    def __init__(self, cache_dir=DEFAULT_ARTIFACT_DIR, persist=True, observer=None):
+        self.cache_dir = cache_dir
+        self.persist = persist
+        self.observer = observer
+        self.stages = {}
+        self.last_run = {}
+        self._memory = {}
+        self._digests = {}
+        if persist:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def add(self, name, func, deps=(), params=(), sources=(), outputs=(), version=1):
+        for dep in deps:
+            if dep not in self.stages:
+                raise ValueError(f"stage '{name}' depends on unknown stage '{dep}'")
+        self.stages[name] = Stage(name, func, deps, params, sources, outputs, version)
+        return self
+
+    # ---- fingerprints ----
+
+    def _source_digest(self, path):
+        st = os.stat(path)
+        stamp = (st.st_size, st.st_mtime_ns)
+        known = self._digests.get(path)
+        if known is None or known[0] != stamp:
+            known = (stamp, file_digest(path))
+            self._digests[path] = known
+        return known[1]
+
+    def fingerprints(self, params):
+        """Fingerprint of every stage for the given run parameters."""
+        prints = {}
+        for name, stage in self.stages.items():
+            h = hashlib.blake2b(digest_size=12)
+            h.update(f"{name}:{stage.version}:{ARTIFACT_FORMAT}".encode())
+            values = {p: params[p] for p in stage.params}
+            h.update(json.dumps(values, sort_keys=True, default=str).encode())
+            for p in stage.sources:
+                paths = params[p] if isinstance(params[p], (list, tuple)) else [params[p]]
+                for path in paths:
+                    if path is not None:
+                        h.update(self._source_digest(path).encode())
+            for dep in stage.deps:
+                h.update(prints[dep].encode())
+            prints[name] = h.hexdigest()
+        return prints
+
+    # ---- artifact storage ----
+
+    def _path(self, name, fingerprint):
+        return os.path.join(self.cache_dir, f"{name}-{fingerprint}.pkl")
+
+    def _load(self, name, fingerprint):
+        """(status, {'result', 'outputs'}) or (None, None)."""
+        if (name, fingerprint) in self._memory:
+            return MEMORY, self._memory[(name, fingerprint)]
+        if self.persist:
+            try:
+                with open(self._path(name, fingerprint), 'rb') as f:
+                    artifact = pickle.load(f)
+            except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+                return None, None
+            self._memory[(name, fingerprint)] = artifact
+            return DISK, artifact
+        return None, None
+
+    def _store(self, name, fingerprint, artifact):
+        self._memory[(name, fingerprint)] = artifact
+        if not self.persist:
+            return
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(artifact, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self._path(name, fingerprint))
+        self._prune(name)
+
+    def _prune(self, name):
+        prefix = f"{name}-"
+        files = [os.path.join(self.cache_dir, f) for f in os.listdir(self.cache_dir)
+                 if f.startswith(prefix) and f.endswith('.pkl')]
+        files.sort(key=os.path.getmtime, reverse=True)
+        for path in files[KEEP_PER_STAGE:]:
+            os.remove(path)
+
+    @staticmethod
+    def _output_digest(path):
+        """Digest of a written file, or of every file under a written directory; None if missing."""
+        if os.path.isfile(path):
+            return file_digest(path)
+        if not os.path.isdir(path):
+            return None
+        h = hashlib.blake2b(digest_size=16)
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for f in sorted(files):
+                full = os.path.join(root, f)
+                h.update(os.path.relpath(full, path).encode())
+                h.update(file_digest(full).encode())
+        return h.hexdigest()
+
+    def _output_digests(self, stage, params):
+        return {p: self._output_digest(params[p]) for p in stage.outputs}
+
+    def _outputs_current(self, stage, params, artifact):
+        """True when every file the stage wrote is still on disk as it wrote it."""
+        if not stage.outputs:
+            return True
+        current = self._output_digests(stage, params)
+        return None not in current.values() and current == artifact['outputs']
+
+    # ---- execution ----
+
+    def _measure(self, name):
+        return self.observer.measure(name) if self.observer else nullcontext()
+
+    def _finish(self, name, status, fingerprint, inputs, result):
+        self.last_run[name] = status
+        if self.observer:
+            self.observer.finish(name, status, fingerprint, inputs, result)
+
+    def run(self, targets, params):
+        """
+        Resolve the target stages and return {stage name: result} for the
+        targets. Upstream stages are only loaded or executed when a target
+        actually needs recomputing. self.last_run maps every touched stage to
+        'computed', 'memory' or 'disk'.
+        """
+        prints = self.fingerprints(params)
+        self.last_run = {}
+        results = {}
+
+        def resolve(name):
+            if name in results:
+                return results[name]
+            stage = self.stages[name]
+            fingerprint = prints[name]
+            with self._measure(name):
+                status, artifact = self._load(name, fingerprint)
+                if status is not None and not self._outputs_current(stage, params, artifact):
+                    status = None
+            if status is not None:
+                result = artifact['result']
+                self._finish(name, status, fingerprint, {}, result)
+                results[name] = result
+                return result
+
+            # Upstream stages resolve (and are measured) before this one starts
+            inputs = {dep: resolve(dep) for dep in stage.deps}
+            kwargs = {**inputs, **{p: params[p] for p in stage.params}}
+            with self._measure(name):
+                result = stage.func(**kwargs)
+                self._store(name, fingerprint, {'result': result,
+                                                'outputs': self._output_digests(stage, params)})
+            self._finish(name, COMPUTED, fingerprint, inputs, result)
+            results[name] = result
+            return result
+
+        return {name: resolve(name) for name in targets}
+
+    def clear(self):
+        self._memory.clear()
+        if self.persist:
+            for f in os.listdir(self.cache_dir):
+                if f.endswith('.pkl'):
+                    os.remove(os.path.join(self.cache_dir, f))
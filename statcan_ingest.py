@@ -0,0 +1,288 @@
+"""
+STATISTICS CANADA TABLE 25-10-0063-01 INGEST
+============================================
+
+Parses the monthly crude oil supply and disposition table into a tidy frame
+with one row per (geography, series, units, month). Two download formats are
+supported and produce identical frames:
+
+    read_statcan_wide  - the hand-trimmed "noSymbol" wide extract
+    read_statcan_long  - the full-table long-format CSV (25100063.csv),
+                         streamed in chunks with the filters pushed down
+    read_statcan       - sniffs the format and dispatches to one of the above
+
+Layout of the wide extract:
+    - a few title lines
+    - a "Geography" row naming each province block at its first column
+    - a header row: series label, "Units of measure", then one month per column
+      (the month sequence repeats for every geography block)
+    - data rows: series label (blank on unit continuation rows), units, values
+    - a blank line, then the symbol legend and footnotes
+
+Values are comma-formatted strings with ".." for unavailable periods. The
+whole value matrix is converted in one pass; no per-cell Python work.
+"""
+
+import csv
+import numbers
+
+import numpy as np
+import pandas as pd
+
+MONTH_FORMAT = '%B %Y'
+MISSING_SYMBOL = '..'
+
+# Long-format column names used by the full-table download
+LONG_DATE = 'REF_DATE'
+LONG_GEO = 'GEO'
+LONG_UOM = 'UOM'
+LONG_SCALAR = 'SCALAR_ID'
+LONG_VALUE = 'VALUE'
+LONG_CHUNKSIZE = 500_000
+
+TIDY_COLUMNS = ['geography', 'series', 'uom', 'date', 'year', 'month',
+                'value', 'value_per_day']
+
+
+def _read_wide_block(path):
+    """Return (geography_row, header_row, data_rows) as lists of strings."""
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.reader(f)
+        geography_row = None
+        header_row = None
+        data_rows = []
+        for row in reader:
+            if header_row is None:
+                if geography_row is None:
+                    if len(row) > 1 and row[1] == 'Geography':
+                        geography_row = row
+                    continue
+                header_row = row
+                continue
+            # The data block ends at the first blank line
+            if not any(cell.strip() for cell in row):
+                break
+            data_rows.append(row)
+
+    if geography_row is None or header_row is None:
+        raise ValueError(f"{path}: no 'Geography' header row found - not a 25-10-0063 wide extract")
+    return geography_row, header_row, data_rows
+
+
+def read_statcan_wide(path, dropna=True):
+    """
+    Parse a 25-10-0063-01 wide ("noSymbol") CSV into a tidy frame.
+
+    Columns: geography, series, uom, date, year, month, value, value_per_day.
+    `value_per_day` is `value` divided by the days in the reference month.
+    Rows whose value is ".." or empty are dropped unless dropna=False.
+    """
+    geography_row, header_row, data_rows = _read_wide_block(path)
+    n_cols = len(header_row)
+
+    # Province blocks: the geography name sits on the first column of its block
+    geo_labels = pd.Series(geography_row[2:n_cols] + [''] * (n_cols - len(geography_row)))
+    geo_labels = geo_labels.replace('', np.nan).ffill()
+
+    month_labels = pd.Series(header_row[2:])
+    dates = pd.to_datetime(month_labels, format=MONTH_FORMAT, errors='coerce')
+    keep_col = (dates.notna() & geo_labels.notna()).to_numpy()
+
+    # Pad ragged rows so the value matrix is rectangular
+    matrix = np.array([(row + [''] * n_cols)[:n_cols] for row in data_rows], dtype=object)
+    series = pd.Series(matrix[:, 0]).replace('', np.nan).ffill().to_numpy()
+    uom = matrix[:, 1]
+    values = matrix[:, 2:][:, keep_col]
+
+    n_rows, n_months = values.shape
+    dates = pd.DatetimeIndex(dates[keep_col])
+    geo_labels = geo_labels[keep_col].to_numpy()
+
+    flat = pd.Series(values.ravel(), dtype='string')
+    flat = flat.str.replace(',', '', regex=False).replace(MISSING_SYMBOL, pd.NA)
+    numeric = pd.to_numeric(flat, errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+
+    date_flat = np.tile(dates.values, n_rows)
+    tidy = pd.DataFrame({
+        'geography': pd.Categorical(np.tile(geo_labels, n_rows)),
+        'series': pd.Categorical(np.repeat(series, n_months)),
+        'uom': pd.Categorical(np.repeat(uom, n_months)),
+        'date': date_flat,
+        'year': np.tile(dates.year.to_numpy(), n_rows),
+        'month': np.tile(dates.month.to_numpy(), n_rows),
+        'value': numeric,
+    })
+    tidy['value_per_day'] = tidy['value'] / np.tile(dates.days_in_month.to_numpy(), n_rows)
+
+    if dropna:
+        tidy = tidy[tidy['value'].notna()].reset_index(drop=True)
+    return tidy[TIDY_COLUMNS]
+
+
+def _as_list(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return [value]
+    return list(value)
+
+
+def _month_bounds(start, end):
+    """
+    Normalise inclusive date-like bounds to 'YYYY-MM' strings for lexical
+    comparison. An integer (Python or NumPy) is a year: January for start,
+    December for end.
+    """
+    def key(value, int_month):
+        if value is None:
+            return None
+        if isinstance(value, numbers.Integral):
+            return f"{int(value):04d}-{int_month}"
+        return pd.Timestamp(value).strftime('%Y-%m')
+    return key(start, '01'), key(end, '12')
+
+
+def _filter_mask(geo, series, uom, month_key, geographies, series_filter, uoms, start, end):
+    """Boolean mask over aligned string arrays; all filters are optional."""
+    mask = np.ones(len(geo), dtype=bool)
+    if geographies is not None:
+        mask &= geo.isin(geographies).to_numpy()
+    if series_filter is not None:
+        mask &= series.isin(series_filter).to_numpy()
+    if uoms is not None:
+        mask &= uom.str.lower().isin([u.lower() for u in uoms]).to_numpy()
+    if start is not None:
+        mask &= (month_key >= start).to_numpy()
+    if end is not None:
+        mask &= (month_key <= end).to_numpy()
+    return mask
+
+
+def _long_header(path):
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        return next(csv.reader(f))
+
+
+def _long_series_column(header):
+    """The table dimension sits between DGUID and UOM (here 'Supply and disposition')."""
+    try:
+        lo = header.index('DGUID') + 1
+        hi = header.index(LONG_UOM)
+    except ValueError:
+        raise ValueError("not a StatsCan long-format table: missing DGUID/UOM columns")
+    if hi - lo != 1:
+        raise ValueError(f"expected one series dimension between DGUID and UOM, found {header[lo:hi]}")
+    return header[lo]
+
+
+def read_statcan_long(path, geographies=None, series=None, uom=None,
+                      start=None, end=None, chunksize=LONG_CHUNKSIZE, dropna=True):
+    """
+    Stream the full long-format 25-10-0063 table and return the tidy frame
+    produced by read_statcan_wide, restricted to the requested slice.
+
+    Filters (all optional):
+        geographies - GEO names, e.g. ['Alberta', 'Saskatchewan']
+        series      - 'Supply and disposition' members, e.g. 'Crude oil production'
+        uom         - units of measure, case-insensitive, e.g. 'Barrels'
+        start, end  - inclusive month bounds: anything pd.Timestamp accepts,
+                      or an int year
+
+    Only the needed columns are read, the filters are applied to every chunk
+    before anything is parsed further, and REF_DATE bounds are compared as
+    'YYYY-MM' strings, so peak memory is one chunk plus the matching rows.
+    """
+    header = _long_header(path)
+    series_col = _long_series_column(header)
+    geographies, series_filter, uoms = _as_list(geographies), _as_list(series), _as_list(uom)
+    start, end = _month_bounds(start, end)
+
+    usecols = [LONG_DATE, LONG_GEO, series_col, LONG_UOM, LONG_VALUE]
+    has_scalar = LONG_SCALAR in header
+    if has_scalar:
+        usecols.append(LONG_SCALAR)
+
+    kept = []
+    reader = pd.read_csv(path, usecols=usecols, dtype=str, chunksize=chunksize,
+                         encoding='utf-8-sig', keep_default_na=False)
+    for chunk in reader:
+        mask = _filter_mask(chunk[LONG_GEO], chunk[series_col], chunk[LONG_UOM],
+                            chunk[LONG_DATE].str.slice(0, 7), geographies,
+                            series_filter, uoms, start, end)
+        if mask.any():
+            kept.append(chunk[mask])
+
+    if kept:
+        rows = pd.concat(kept, ignore_index=True)
+    else:
+        rows = pd.DataFrame(columns=usecols, dtype=str)
+
+    dates = pd.to_datetime(rows[LONG_DATE].str.slice(0, 7), format='%Y-%m')
+    value = pd.to_numeric(rows[LONG_VALUE], errors='coerce').to_numpy(dtype='float64')
+    if has_scalar:
+        scalar = pd.to_numeric(rows[LONG_SCALAR], errors='coerce').fillna(0).to_numpy()
+        value = value * np.power(10.0, scalar)
+
+    tidy = pd.DataFrame({
+        'geography': pd.Categorical(rows[LONG_GEO]),
+        'series': pd.Categorical(rows[series_col]),
+        'uom': pd.Categorical(rows[LONG_UOM]),
+        'date': dates.to_numpy(),
+        'year': dates.dt.year.to_numpy(),
+        'month': dates.dt.month.to_numpy(),
+        'value': value,
+    })
+    tidy['value_per_day'] = tidy['value'] / dates.dt.days_in_month.to_numpy()
+
+    if dropna:
+        tidy = tidy[tidy['value'].notna()].reset_index(drop=True)
+    return tidy[TIDY_COLUMNS]
+
+
+def is_long_format(path):
+    """True for the full-table long download (header row starts with REF_DATE)."""
+    return _long_header(path)[:1] == [LONG_DATE]
+
+
+def read_statcan(path, geographies=None, series=None, uom=None,
+                 start=None, end=None, dropna=True):
+    """
+    Read either 25-10-0063 download format into the tidy frame, applying the
+    same optional filters as read_statcan_long.
+    """
+    if is_long_format(path):
+        return read_statcan_long(path, geographies=geographies, series=series, uom=uom,
+                                 start=start, end=end, dropna=dropna)
+
+    tidy = read_statcan_wide(path, dropna=dropna)
+    start, end = _month_bounds(start, end)
+    mask = _filter_mask(tidy['geography'].astype(str), tidy['series'].astype(str),
+                        tidy['uom'].astype(str), tidy['date'].dt.strftime('%Y-%m'),
+                        _as_list(geographies), _as_list(series), _as_list(uom),
+                        start, end)
+    tidy = tidy[mask].reset_index(drop=True)
+    for col in ('geography', 'series', 'uom'):
+        tidy[col] = tidy[col].cat.remove_unused_categories()
+    return tidy
+
+
+def production_kbpd(tidy, geography, start_year=None, end_year=None,
+                    series='Crude oil production', uom='Barrels'):
+    """
+    Monthly production in thousand barrels per day for one geography, in the
+    (year, month, production_kbpd, province) shape the panel builder expects.
+    """
+    mask = ((tidy['geography'] == geography) & (tidy['series'] == series)
+            & (tidy['uom'] == uom))
+    if start_year is not None:
+        mask &= tidy['year'] >= start_year
+    if end_year is not None:
+        mask &= tidy['year'] <= end_year
+
+    rows = tidy[mask].sort_values('date')
+    return pd.DataFrame({
+        'year': rows['year'].to_numpy(),
+        'month': rows['month'].to_numpy(),
+        'production_kbpd': rows['value_per_day'].to_numpy() / 1000,
+        'province': geography,
+    })
@@ -0,0 +1,269 @@
+"""
+STRUCTURAL BREAK SEARCH
+=======================
+
+Do the data break where the in-service dates say they should? A monthly series
+y_t (the Alberta-minus-Saskatchewan production gap, or the WCS-WTI
+differential) is fitted with regime regressors z_t (a level, or a level and a
+trend) that may change at unknown months:
+
+    y_t = z_t' b_j + u_t    for t in regime j
+
+    sup-F(1|0)   Quandt-Andrews: one break at the best month against none
+    sup-F(2|0)   Bai-Perron: the best pair of breaks (the global minimum of
+                 the total SSR) against none
+    F(2|1)       the best extra break in either regime of the one-break fit
+
+Every segment's SSR comes from cumulative sums of z z', z y and y^2, so SSR[i, j]
+for all O(T^2) segments is one batched solve. The one- and two-break searches
+are minima over sums of that table. Each regime keeps at least trim x T months.
+
+Monthly production and prices are strongly autocorrelated, and under iid
+critical values the sup-F tests would reject almost everywhere. p-values
+therefore come from a sieve bootstrap instead: AR(1) errors fitted to the
+residuals of the null model (no break for sup-F(1|0) and sup-F(2|0), the
+one-break fit for F(2|1)) with resampled innovations. The replications are
+extra columns of y and go through the same segment table.
+
+Break-date intervals follow Bai (1997) with regressors independent of the
+errors: the estimate +- c x LRV / (d'Qd) months, where d is the change in
+coefficients at the break, Q the mean of z z' over the two adjacent regimes,
+LRV the AR(1) long-run error variance and c = 7.7 / 11.0 / 20.0 for 90/95/99%.
+"""
+
+import numpy as np
+import pandas as pd
+
+from permutation_inference import CHUNK_ELEMENTS
+
+TRIM = 0.15
+REPS = 999
+MAX_RHO = 0.98
+REGIMES = ['level', 'trend']
+SERIES = {'gap': 'AB-SK production gap (kb/d)', 'differential': 'WCS-WTI differential ($/bbl)'}
+BAI_CRITICAL = {0.90: 7.7, 0.95: 11.0, 0.99: 20.0}
+PINV_RCOND = 1e-10
+
+
+# ===========================
+# SERIES
+# ===========================
+
+def break_series(df_panel, df_alberta_full):
+    """{name: (dates, y)} for the production gap and the differential."""
+    wide = df_panel.pivot_table(index='date', columns='province', values='production_kbpd').dropna()
+    prices = df_alberta_full.dropna(subset=['wcs_wti_differential']).sort_values('date')
+    return {
+        'gap': (pd.DatetimeIndex(wide.index), (wide['Alberta'] - wide['Saskatchewan']).to_numpy(dtype=float)),
+        'differential': (pd.DatetimeIndex(prices['date']), prices['wcs_wti_differential'].to_numpy(dtype=float)),
+    }
+
+
+def assumed_dates(df_panel):
+    """{label: first month in service} from the panel's post dummies."""
+    return {label: df_panel.loc[df_panel[dummy] == 1, 'date'].min()
+            for label, dummy in [('Line 3', 'line3_post'), ('TMX', 'tmx_post')]
+            if (df_panel[dummy] == 1).any()}
+
+
+def regime_design(T, regime='trend'):
+    """Per-regime regressors: a level, plus a trend scaled to [0, 1) for 'trend'."""
+    if regime == 'level':
+        return np.ones((T, 1))
+    if regime == 'trend':
+        return np.column_stack([np.ones(T), np.arange(T) / T])
+    raise ValueError(f"regime must be one of {REGIMES}")
+
+
+# ===========================
+# SEGMENT SSR TABLE
+# ===========================
+
+def segment_inverse(Z, min_length):
+    """Segments [i, j) with j - i >= min_length and the pseudo-inverse of their Z'Z."""
+    T, q = Z.shape
+    czz = np.concatenate([np.zeros((1, q, q)), np.cumsum(np.einsum('ti,tj->tij', Z, Z), axis=0)])
+    i, j = np.triu_indices(T + 1, k=min_length)
+    return i, j, np.linalg.pinv(czz[j] - czz[i], rcond=PINV_RCOND, hermitian=True)
+
+
+def segment_ssr(Z, Y, segments):
+    """
+    SSR of every segment for each column of Y (T, R) as a (T+1, T+1, R)
+    table; entry [i, j] is the fit on months i..j-1, inf for short segments.
+    """
+    T, q = Z.shape
+    i, j, zz_inv = segments
+    czy = np.concatenate([np.zeros((1, q, Y.shape[1])), np.cumsum(np.einsum('ti,tr->tir', Z, Y), axis=0)])
+    cyy = np.concatenate([np.zeros((1, Y.shape[1])), np.cumsum(Y * Y, axis=0)])
+    zy = czy[j] - czy[i]
+    table = np.full((T + 1, T + 1, Y.shape[1]), np.inf)
+    table[i, j] = np.maximum((cyy[j] - cyy[i]) - np.einsum('sir,sij,sjr->sr', zy, zz_inv, zy), 0)
+    return table
+
+
+def break_statistics(table, q):
+    """
+    sup-F(1|0), sup-F(2|0) and F(2|1) for each column of the table, with the
+    break months: tau (one break), tau1 < tau2 (two breaks) and extra (the
+    break F(2|1) adds to tau).
+    """
+    T = table.shape[0] - 1
+    cols = np.arange(table.shape[2])
+    ssr0 = table[0, T]
+
+    # Best split of [0, t) and of [t, T) for every t
+    left = table[0][:, None, :] + table                 # [s, t]: SSR(0, s) + SSR(s, t)
+    left_ssr, left_at = left.min(axis=0), left.argmin(axis=0)
+    right = table + table[:, T][None, :, :]             # [t, s]: SSR(t, s) + SSR(s, T)
+    right_ssr, right_at = right.min(axis=1), right.argmin(axis=1)
+
+    one = table[0] + table[:, T]
+    tau = one.argmin(axis=0)
+    ssr1 = one[tau, cols]
+
+    two = left_ssr + table[:, T]
+    tau2 = two.argmin(axis=0)
+    tau1 = left_at[tau2, cols]
+    ssr2 = two[tau2, cols]
+
+    split_left = left_ssr[tau, cols] + table[tau, T, cols]
+    split_right = table[0, tau, cols] + right_ssr[tau, cols]
+    ssr21 = np.minimum(split_left, split_right)
+    extra = np.where(split_left <= split_right, left_at[tau, cols], right_at[tau, cols])
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return {
+            'sup_f1': ((ssr0 - ssr1) / q) / (ssr1 / (T - 2 * q)),
+            'sup_f2': ((ssr0 - ssr2) / (2 * q)) / (ssr2 / (T - 3 * q)),
+            'f21': ((ssr1 - ssr21) / q) / (ssr21 / (T - 3 * q)),
+            'tau': tau, 'tau1': tau1, 'tau2': tau2, 'extra': extra,
+        }
+
+
+def search(Z, Y, segments):
+    """break_statistics over the columns of Y, in chunks that keep the table small."""
+    T = len(Z)
+    width = max(1, CHUNK_ELEMENTS // (T + 1) ** 2)
+    parts = [break_statistics(segment_ssr(Z, Y[:, c:c + width], segments), Z.shape[1])
+             for c in range(0, Y.shape[1], width)]
+    return {key: np.concatenate([p[key] for p in parts]) for key in parts[0]}
+
+
+# ===========================
+# PARTITIONS AND ERRORS
+# ===========================
+
+def partition_fit(Z, y, breaks):
+    """Fitted values, residuals and per-regime coefficients for the given breaks."""
+    bounds = [0] + sorted(int(b) for b in breaks) + [len(y)]
+    fitted = np.empty(len(y))
+    coefs = []
+    for s, e in zip(bounds[:-1], bounds[1:]):
+        b = np.linalg.lstsq(Z[s:e], y[s:e], rcond=None)[0]
+        fitted[s:e] = Z[s:e] @ b
+        coefs.append(b)
+    return fitted, y - fitted, coefs
+
+
+def ar1(u):
+    """(rho, centred innovations) of an AR(1) fitted to the residuals u."""
+    rho = float(np.clip(u[1:] @ u[:-1] / (u[:-1] @ u[:-1]), -MAX_RHO, MAX_RHO))
+    e = u[1:] - rho * u[:-1]
+    return rho, e - e.mean()
+
+
+def simulate_ar1(rho, innovations, T, reps, rng):
+    """(T, reps) AR(1) error paths built from resampled innovations."""
+    e = rng.choice(innovations, size=(T, reps))
+    u = np.empty((T, reps))
+    u[0] = e[0] / np.sqrt(1 - rho ** 2)    # stationary start
+    for t in range(1, T):
+        u[t] = rho * u[t - 1] + e[t]
+    return u
+
+
+def bootstrap(Z, y, breaks, segments, reps, rng):
+    """search() on reps draws of y* = fitted + AR(1) errors under the given breaks."""
+    fitted, resid, _ = partition_fit(Z, y, breaks)
+    rho, innovations = ar1(resid)
+    return search(Z, fitted[:, None] + simulate_ar1(rho, innovations, len(y), reps, rng), segments)
+
+
+def break_interval(Z, y, breaks, k, level=0.95):
+    """Bai (1997) half-width, in months, of the k-th break of a partition."""
+    _, resid, coefs = partition_fit(Z, y, breaks)
+    rho, innovations = ar1(resid)
+    lrv = innovations.var() / (1 - rho) ** 2
+    bounds = [0] + sorted(int(b) for b in breaks) + [len(y)]
+    block = Z[bounds[k]:bounds[k + 2]]
+    d = coefs[k + 1] - coefs[k]
+    return BAI_CRITICAL[level] * lrv / (d @ (block.T @ block / len(block)) @ d)
+
+
+# ===========================
+# TESTS
+# ===========================
+
+def structural_breaks(df_panel, df_alberta_full, series=tuple(SERIES), regime='trend', trim=TRIM,
+                      reps=REPS, level=0.95, seed=0):
+    """
+    Break tests and dates for each series.
+
+    One row per series, test and estimated break: series, test, statistic,
+    p_value (bootstrap), date (first month of the new regime), ci_low,
+    ci_high, nearest (the closest assumed in-service date) and months_off
+    (break minus that date). F(2|1) rows give the break it adds.
+    """
+    if level not in BAI_CRITICAL:
+        raise ValueError(f"level must be one of {sorted(BAI_CRITICAL)}")
+    rng = np.random.default_rng(seed)
+    events = assumed_dates(df_panel)
+    data = break_series(df_panel, df_alberta_full)
+
+    rows = []
+    for name in series:
+        dates, y = data[name]
+        T = len(y)
+        Z = regime_design(T, regime)
+        h = max(int(trim * T), Z.shape[1] + 1)
+        if T < 3 * h:
+            raise ValueError(f"{name}: {T} months is too short for two breaks with trim {trim}")
+        segments = segment_inverse(Z, h)
+        observed = search(Z, y[:, None], segments)
+        observed = {key: value[0] for key, value in observed.items()}
+
+        null = bootstrap(Z, y, [], segments, reps, rng)
+        alt = bootstrap(Z, y, [observed['tau']], segments, reps, rng)
+
+        def p_value(stat, draws):
+            return (1 + np.sum(draws >= stat)) / (reps + 1)
+
+        tests = [
+            ('sup-F(1|0)', observed['sup_f1'], p_value(observed['sup_f1'], null['sup_f1']),
+             [observed['tau']], [0]),
+            ('sup-F(2|0)', observed['sup_f2'], p_value(observed['sup_f2'], null['sup_f2']),
+             [observed['tau1'], observed['tau2']], [0, 1]),
+            ('F(2|1)', observed['f21'], p_value(observed['f21'], alt['f21']),
+             [observed['tau'], observed['extra']], [sorted([observed['tau'], observed['extra']]).index(observed['extra'])]),
+        ]
+        for test, stat, p, breaks, report in tests:
+            ordered = sorted(int(b) for b in breaks)
+            for k in report:
+                tau = ordered[k]
+                half = break_interval(Z, y, ordered, k, level)
+                low = dates[max(int(np.floor(tau - half)), 0)]
+                high = dates[min(int(np.ceil(tau + half)), T - 1)]
+                nearest, off = _nearest(dates[tau], events)
+                rows.append({'series': name, 'test': test, 'statistic': stat, 'p_value': p,
+                             'date': dates[tau], 'ci_low': low, 'ci_high': high,
+                             'nearest': nearest, 'months_off': off})
+    return pd.DataFrame(rows)
+
+
+def _nearest(date, events):
+    if not events:
+        return None, np.nan
+    offsets = {label: (date.year - d.year) * 12 + date.month - d.month for label, d in events.items()}
+    label = min(offsets, key=lambda key: abs(offsets[key]))
+    return label, offsets[label]
@@ -0,0 +1,225 @@
+"""
+SYNTHETIC STATSCAN / CER INPUTS
+===============================
+
+Writes input files of any size in the exact layouts the pipeline reads, so
+stages can be timed well beyond the shipped 2 provinces x 84 months:
+
+    statcan.csv     25-10-0063-01 wide "noSymbol" extract: title lines,
+                    the Geography row, repeated month blocks, one Cubic
+                    metres and one Barrels row per series, quoted
+                    comma-formatted values, ".." gaps, legend and footnotes
+    rail.xlsx       CER "Crude Oil Exports by Rail" workbook: title rows,
+                    the Year/Month header, newest month first with the year
+                    only on each year's first row, unit notes
+    prices.csv      daily WCS/WTI prints in the price_ingest layout, so the
+                    2SLS window grows with the months too
+
+The shape is (geographies, months, series). Alberta and Saskatchewan are
+always the first two geographies and 'Crude oil production' the first
+series, with Line 3 and TMX effects built into Alberta's production and the
+differential, so every stage has something to estimate. Months run back from
+December of END_YEAR. Alberta and Saskatchewan production is never "..";
+every other row has leading ".." runs and scattered gaps like the real table.
+
+SCALES maps a scale factor to a shape with that many times the value cells
+of the 1x file (2 x 108 x 6):
+
+    paths = generate_inputs('.benchmark_data/100x', *SCALES[100])
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from facility_emissions import BBL_PER_M3
+from pipeline_complete_analysis import END_YEAR, LINE3_START, TMX_START
+
+SCALES = {
+    1: (2, 108, 6),
+    100: (20, 540, 12),
+    10_000: (200, 1080, 60),
+}
+PANEL_GEOGRAPHIES = ['Alberta', 'Saskatchewan']
+SERIES_NAMES = [
+    'Crude oil production', 'Export to the United States', 'Export to other countries',
+    'Input to Canadian refineries', 'Inventory changes', 'Imports',
+    'Equivalent products production', 'Light and medium crude oil production',
+    'Heavy crude oil production', 'Crude bitumen production', 'Synthetic crude oil production',
+    'Condensate production',
+]
+GAP_RATE = 0.01
+
+STATCAN_TITLE = [
+    '﻿"Supply and disposition of crude oil and equivalent c 1"',
+    '"Frequency:\xa0Monthly"',
+    '"Table: 25-10-0063-01 (formerly CANSIM\xa0126-0003)"',
+    '"Release date: 2026-01-09"',
+    '"Geography: Canada, Geographical region of Canada, Province or territory"',
+    '""',
+    '""',
+    '',
+]
+STATCAN_FOOTER = [
+    '',
+    'Symbol legend:',
+    '.., not available for a specific reference period',
+    '',
+    '',
+    'Footnotes:',
+    '1,"Synthetic extract written by synthetic_inputs.py for benchmarking."',
+    '2,"Total supply could be calculated by adding Crude oil production, Equivalent products production, '
+    'and Imports. Total disposition could be calculated by adding Input to Canadian refineries, Exports, '
+    'and Inventory changes."',
+    '',
+    '"How to cite: Statistics Canada. Table 25-10-0063-01\xa0 Supply and disposition of crude oil and equivalent"',
+    'https://www150.statcan.gc.ca/t1/tbl1/en/tv.action?pid=2510006301',
+]
+RAIL_HEADER = ['Year', 'Month', 'Volume (m3)', 'Volume\n(m³ per day)', 'Volume (bbl)', 'Volume\n(bbl per day)']
+
+
+# ===========================
+# SHAPE
+# ===========================
+
+def month_range(months, end_year=END_YEAR):
+    """The last `months` month starts up to December of end_year."""
+    return pd.date_range(end=pd.Timestamp(year=end_year, month=12, day=1), periods=months, freq='MS')
+
+
+def geography_names(n):
+    return (PANEL_GEOGRAPHIES + [f'Region {i:03d}' for i in range(len(PANEL_GEOGRAPHIES) + 1, n + 1)])[:n]
+
+
+def series_names(n):
+    return (SERIES_NAMES + [f'Series {i:03d}' for i in range(len(SERIES_NAMES) + 1, n + 1)])[:n]
+
+
+def _events(dates):
+    line3 = (dates >= pd.Timestamp(year=LINE3_START[0], month=LINE3_START[1], day=1)).astype(float)
+    tmx = (dates >= pd.Timestamp(year=TMX_START[0], month=TMX_START[1], day=1)).astype(float)
+    return np.asarray(line3), np.asarray(tmx)
+
+
+def production_paths(dates, n_geographies, rng):
+    """(geographies, months) production in kb/d; Alberta gets the pipeline effects."""
+    t = np.arange(len(dates)) / 12
+    line3, tmx = _events(dates)
+    level = np.r_[2800.0, 450.0, rng.uniform(5, 300, max(n_geographies - 2, 0))][:n_geographies]
+    growth = np.r_[60.0, 2.0, rng.normal(0, 3, max(n_geographies - 2, 0))][:n_geographies]
+    kbpd = level[:, None] + growth[:, None] * (t - t[-1])[None, :]
+    kbpd += rng.normal(0, 0.02, kbpd.shape) * level[:, None]
+    kbpd[0] += 180 * line3 + 220 * tmx
+    return np.maximum(kbpd, 1.0)
+
+
+# ===========================
+# WRITERS
+# ===========================
+
+def _quoted(values):
+    return ','.join('".."' if v < 0 else f'"{v:,}"' for v in values)
+
+
+def write_statcan_wide(path, n_geographies, n_months, n_series, seed=0):
+    """25-10-0063-01 wide extract with the given shape; returns the path."""
+    rng = np.random.default_rng(seed)
+    dates = month_range(n_months)
+    days = dates.days_in_month.to_numpy()
+    geographies = geography_names(n_geographies)
+    production = production_paths(dates, n_geographies, rng)
+
+    month_labels = ','.join(f'"{d:%B %Y}"' for d in dates)
+    geography_row = ',"Geography",' + ','.join(f'"{g}"' + ',' * (n_months - 1) for g in geographies)
+    header = '"Supply and disposition 2","Units of measure",' + ','.join([month_labels] * n_geographies)
+
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write('\n'.join(STATCAN_TITLE + [geography_row, header]) + '\n')
+        for s, name in enumerate(series_names(n_series)):
+            share = 1.0 if s == 0 else rng.uniform(0.01, 0.6, (n_geographies, 1))
+            m3 = np.rint(production * share * days / BBL_PER_M3 * 1000).astype(np.int64)
+            # Leading ".." runs (series not yet collected) and scattered gaps
+            start = rng.integers(0, max(n_months // 4, 1), n_geographies)
+            gaps = (np.arange(n_months)[None, :] < start[:, None]) | (rng.random(m3.shape) < GAP_RATE)
+            if s == 0:
+                gaps[:len(PANEL_GEOGRAPHIES)] = False
+            m3[gaps] = -1
+            bbl = np.where(gaps, -1, np.rint(m3 * BBL_PER_M3).astype(np.int64))
+            f.write(f'"{name}","Cubic metres",{_quoted(m3.ravel())}\n')
+            f.write(f',"Barrels",{_quoted(bbl.ravel())}\n')
+        f.write('\n'.join(STATCAN_FOOTER) + '\n')
+    return path
+
+
+def write_rail_workbook(path, n_months, seed=0):
+    """CER rail export workbook over the same months, newest first; returns the path."""
+    from openpyxl import Workbook
+
+    rng = np.random.default_rng(seed + 1)
+    dates = month_range(n_months)
+    line3, tmx = _events(dates)
+    kbpd = np.maximum(150 + 60 * np.sin(np.arange(n_months) / 7) - 80 * line3 - 40 * tmx
+                      + rng.normal(0, 15, n_months), 5)
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('CrudeOilExportsByRail')
+    for _ in range(4):
+        ws.append([])
+    ws.append(['Canadian Crude Oil Exports by Rail - Monthly Data'] + [None] * 6
+              + ['Numbers last updated on 18 December 2025'])
+    ws.append([])
+    ws.append([])
+    ws.append([None] + RAIL_HEADER)
+    previous_year = None
+    for i in range(n_months - 1, -1, -1):
+        date, bbl_day = dates[i], kbpd[i] * 1000
+        bbl = bbl_day * date.days_in_month
+        year = date.year if date.year != previous_year else None
+        previous_year = date.year
+        ws.append([None, year, f'{date:%B}', bbl / BBL_PER_M3, bbl_day / BBL_PER_M3, bbl, bbl_day])
+    ws.append([None, 'm³ = Cubic metres\n\n\n'])
+    ws.append([None, 'bbl = Barrels'])
+    ws.append([])
+    ws.append([None, 'Notes'])
+    wb.save(path)
+    return path
+
+
+def write_price_file(path, n_months, seed=0):
+    """Daily WCS and WTI prints (timestamp, benchmark, price, volume) on weekdays; returns the path."""
+    rng = np.random.default_rng(seed + 2)
+    dates = month_range(n_months)
+    days = pd.bdate_range(dates[0], dates[-1] + pd.offsets.MonthEnd())
+    line3, tmx = _events(days)
+    wti = 60 + np.cumsum(rng.normal(0, 0.8, len(days)))
+    differential = np.maximum(22 - 6 * line3 - 5 * tmx + rng.normal(0, 3, len(days)), 1)
+    frame = pd.DataFrame({
+        'timestamp': np.concatenate([days, days]),
+        'benchmark': np.repeat(['WTI', 'WCS'], len(days)),
+        'price': np.round(np.concatenate([wti, wti - differential]), 2),
+        'volume': rng.integers(1_000, 50_000, 2 * len(days)),
+    })
+    frame.sort_values('timestamp', kind='stable').to_csv(path, index=False, date_format='%Y-%m-%d')
+    return path
+
+
+def generate_inputs(directory, n_geographies, n_months, n_series, seed=0):
+    """
+    All three files in `directory` (reused when already there). Returns a dict
+    of statcan, rail and prices paths plus the start_year/end_year window.
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = {'statcan': os.path.join(directory, 'statcan.csv'),
+             'rail': os.path.join(directory, 'rail.xlsx'),
+             'prices': os.path.join(directory, 'prices.csv')}
+    writers = {'statcan': lambda p: write_statcan_wide(p, n_geographies, n_months, n_series, seed),
+               'rail': lambda p: write_rail_workbook(p, n_months, seed),
+               'prices': lambda p: write_price_file(p, n_months, seed)}
+    for name, path in paths.items():
+        if not os.path.exists(path):
+            # Written under a temporary name so an interrupted run is not reused
+            root, ext = os.path.splitext(path)
+            os.replace(writers[name](f'{root}.partial{ext}'), path)
+    dates = month_range(n_months)
+    return {**paths, 'start_year': int(dates[0].year), 'end_year': int(dates[-1].year)}
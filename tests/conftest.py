@@ -0,0 +1,45 @@
+"""
+Shared fixtures: the analysis frames built from the shipped StatsCan and CER
+files, once per session and without touching the on-disk caches.
+"""
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pipeline_complete_analysis as pca  # noqa: E402
+# statsmodels puts its warnings on 'always' when imported; importing it here,
+# before any test, lets the filter below apply
+import statsmodels.api  # noqa: E402,F401
+
+
+def pytest_configure(config):
+    # The two-step second stage and the month fixed effects are rank-deficient by
+    # construction; the tests compare estimable terms only
+    config.addinivalue_line('filterwarnings', 'ignore:The design matrix is rank-deficient')
+
+
+@pytest.fixture(scope='session')
+def analysis():
+    """{'panel': (df_panel, df_alberta_full), 'did': model_did, 'iv': run_iv result}."""
+    params = pca.run_params(statcan=os.path.join(ROOT, pca.STATCAN_FILE), rail=os.path.join(ROOT, pca.RAIL_FILE))
+    return pca.build_graph(None, persist=False).run(['panel', 'did', 'iv'], params)
+
+
+@pytest.fixture(scope='session')
+def df_panel(analysis):
+    return analysis['panel'][0]
+
+
+@pytest.fixture(scope='session')
+def df_alberta_full(analysis):
+    return analysis['panel'][1]
+
+
+@pytest.fixture(scope='session')
+def df_2sls(analysis):
+    return analysis['iv']['data']
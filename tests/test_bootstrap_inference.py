@@ -0,0 +1,109 @@
+"""Bootstrap draws from cross-products against refits on the resampled data."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from bootstrap_inference import (DID_TERMS, FIRST_TERMS, SECOND_FIXED_TERMS, bootstrap_did, bootstrap_iv,
+                                 default_block_length, draw_weights)
+
+REPS = 40
+
+
+def _ols(y, X):
+    from statsmodels.regression.linear_model import OLS
+
+    return OLS(y, X).fit().params
+
+
+def _design(df, terms):
+    return np.column_stack([np.ones(len(df)) if t == 'const' else df[t].to_numpy(dtype=float) for t in terms])
+
+
+def _two_step(df):
+    """First-stage and second-stage coefficients by two explicit OLS fits."""
+    X1 = _design(df, FIRST_TERMS)
+    pi = _ols(df['wcs_wti_differential'].to_numpy(dtype=float), X1)
+    second = np.column_stack([_design(df, SECOND_FIXED_TERMS), X1 @ pi])
+    return pi, _ols(df['production_kbpd'].to_numpy(dtype=float), second)
+
+
+def _months(df):
+    return df['year'].to_numpy() * 12 + df['month'].to_numpy()
+
+
+def _block_sample(df, rng, block_length):
+    """One moving-block resample, row by row, from the rng stream block_counts uses."""
+    months = np.unique(_months(df))
+    n_blocks = len(months) - block_length + 1
+    starts = rng.integers(0, n_blocks, size=int(np.ceil(len(months) / block_length)))
+    picked = np.concatenate([months[s:s + block_length] for s in starts])
+    by_month = {m: rows for m, rows in df.groupby(_months(df))}
+    return pd.concat([by_month[m] for m in picked], ignore_index=True)
+
+
+def test_point_estimates_match_statsmodels(analysis, df_panel, df_2sls):
+    beta, _ = bootstrap_did(df_panel, reps=2)
+    np.testing.assert_allclose(beta, analysis['did'].params[DID_TERMS].to_numpy(), rtol=1e-8)
+
+    pi, beta, _, _ = bootstrap_iv(df_2sls, reps=2)
+    reference_pi, reference_beta = _two_step(df_2sls)
+    np.testing.assert_allclose(pi, reference_pi, rtol=1e-8)
+    np.testing.assert_allclose(beta, reference_beta, rtol=1e-8)
+    assert beta[-1] == pytest.approx(analysis['iv']['engine']['fit']['params'][0, 0], rel=1e-8)
+
+
+@pytest.mark.parametrize('weights', ['rademacher', 'webb'])
+def test_wild_did_draws_are_refits(df_panel, weights):
+    beta, draws = bootstrap_did(df_panel, 'wild', reps=REPS, weights=weights, seed=3)
+    assert draws.shape == (REPS, len(DID_TERMS))
+
+    X = _design(df_panel, DID_TERMS)
+    y = df_panel['production_kbpd'].to_numpy(dtype=float)
+    u = y - X @ beta
+    _, month = np.unique(_months(df_panel), return_inverse=True)
+    w = draw_weights(np.random.default_rng(3), (REPS, month.max() + 1), weights)
+    for r in range(0, REPS, 7):
+        np.testing.assert_allclose(draws[r], _ols(X @ beta + u * w[r, month], X), rtol=1e-6, atol=1e-6)
+
+
+def test_wild_iv_draws_are_refits(df_2sls):
+    pi, beta, pi_draws, beta_draws = bootstrap_iv(df_2sls, 'wild', reps=REPS, seed=4)
+    X1 = _design(df_2sls, FIRST_TERMS)
+    d_hat = X1 @ pi
+    fitted_y2 = np.column_stack([_design(df_2sls, SECOND_FIXED_TERMS), d_hat]) @ beta
+    u1 = df_2sls['wcs_wti_differential'].to_numpy(dtype=float) - d_hat
+    u2 = df_2sls['production_kbpd'].to_numpy(dtype=float) - fitted_y2
+    _, month = np.unique(_months(df_2sls), return_inverse=True)
+    w = draw_weights(np.random.default_rng(4), (REPS, month.max() + 1), 'webb')
+
+    for r in range(0, REPS, 7):
+        star = df_2sls.assign(wcs_wti_differential=d_hat + u1 * w[r, month],
+                              production_kbpd=fitted_y2 + u2 * w[r, month])
+        reference_pi, reference_beta = _two_step(star)
+        np.testing.assert_allclose(pi_draws[r], reference_pi, rtol=1e-6, atol=1e-8)
+        np.testing.assert_allclose(beta_draws[r], reference_beta, rtol=1e-6, atol=1e-8)
+
+
+def test_block_draws_are_refits(df_panel, df_2sls):
+    _, draws = bootstrap_did(df_panel, 'block', reps=REPS, seed=5)
+    rng = np.random.default_rng(5)
+    for r in range(REPS):
+        sample = _block_sample(df_panel, rng, default_block_length(len(np.unique(_months(df_panel)))))
+        if r % 7 == 0:
+            reference = _ols(sample['production_kbpd'].to_numpy(dtype=float), _design(sample, DID_TERMS))
+            np.testing.assert_allclose(draws[r], reference, rtol=1e-6, atol=1e-6)
+
+    _, _, pi_draws, beta_draws = bootstrap_iv(df_2sls, 'block', reps=REPS, seed=6)
+    rng = np.random.default_rng(6)
+    for r in range(REPS):
+        sample = _block_sample(df_2sls, rng, default_block_length(len(np.unique(_months(df_2sls)))))
+        if r % 7 == 0:
+            reference_pi, reference_beta = _two_step(sample)
+            np.testing.assert_allclose(pi_draws[r], reference_pi, rtol=1e-6, atol=1e-8)
+            np.testing.assert_allclose(beta_draws[r], reference_beta, rtol=1e-6, atol=1e-8)
+
+
+def test_two_province_clusters_are_refused(df_panel):
+    with pytest.raises(ValueError, match='only 2 clusters'):
+        bootstrap_did(df_panel, 'wild', reps=2, cluster='province')
@@ -0,0 +1,35 @@
+"""Event-study leads and lags against a statsmodels refit of the same design."""
+
+import numpy as np
+import pytest
+
+from event_study import control_design, event_columns, event_months, event_study
+
+
+def _ols(y, X, cov_type):
+    from statsmodels.regression.linear_model import OLS
+
+    return OLS(y, X).fit(cov_type=cov_type)
+
+
+@pytest.mark.parametrize('controls, cov_type, binning', [('month_fe', 'nonrobust', 'bin'),
+                                                         ('trend', 'HC1', 'bin'),
+                                                         ('trend', 'nonrobust', 'trim')])
+def test_event_study_matches_refit(df_panel, controls, cov_type, binning):
+    leads, lags = 6, 12
+    _, coefs, _ = event_study(df_panel, leads=(leads,), lags=(lags,), binning=(binning,),
+                              controls=controls, cov_type=cov_type)
+    D, labels = event_columns(df_panel, event_months(df_panel), leads, lags, binning)
+    C = control_design(df_panel, controls)
+    fit = _ols(df_panel['production_kbpd'].to_numpy(dtype=float), np.column_stack([C, D]), cov_type)
+
+    coefs = coefs.set_index(['event', 'rel_month'])
+    checked = 0
+    for j, (event, k, _) in enumerate(labels):
+        row = coefs.loc[(event, k)]
+        if np.isnan(row['estimate']):
+            continue
+        assert row['estimate'] == pytest.approx(fit.params[C.shape[1] + j], rel=1e-7, abs=1e-6)
+        assert row['se'] == pytest.approx(fit.bse[C.shape[1] + j], rel=1e-6)
+        checked += 1
+    assert checked > len(labels) // 2
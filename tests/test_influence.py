@@ -0,0 +1,79 @@
+"""Closed-form deletion estimates against brute-force refits without the deleted rows."""
+
+import numpy as np
+import pytest
+
+import pipeline_complete_analysis as pca
+from influence import influence_diagnostics
+
+
+@pytest.fixture(scope='module')
+def diagnostics(df_panel, df_alberta_full):
+    return influence_diagnostics(df_panel, df_alberta_full, pca.DID_REGRESSORS, pca.FIRST_STAGE_REGRESSORS,
+                                 pca.SECOND_STAGE_REGRESSORS, pca.IV_BASE_COLUMNS, pca.second_stage_transform,
+                                 iv_terms=pca.IV_TERMS, cov_type='HC1')
+
+
+def _refit(df_panel, df_alberta_full, keep_panel, keep_alberta):
+    """{(model, term): estimate} from statsmodels and fit_iv refits (as run_did/run_iv) on the kept rows."""
+    from iv_engine import fit_iv
+
+    did = pca.run_did(df_panel[keep_panel])
+    df_2sls = df_alberta_full[keep_alberta].dropna(subset=['wcs_wti_differential']).copy()
+    first = pca.fit_ols(df_2sls['wcs_wti_differential'], df_2sls[pca.FIRST_STAGE_REGRESSORS])
+    df_2sls['differential_predicted'] = first.fittedvalues
+    second = pca.fit_ols(df_2sls['production_kbpd'], df_2sls[pca.SECOND_STAGE_REGRESSORS])
+    exog = np.column_stack([np.ones(len(df_2sls)), df_2sls['time_trend']])
+    iv = fit_iv(df_2sls['production_kbpd'].to_numpy(dtype=float), df_2sls['wcs_wti_differential'].to_numpy(),
+                exog, df_2sls['pipeline_capacity_instrument'].to_numpy())
+    return {('did', 'line3_did'): did.params['line3_did'], ('did', 'tmx_did'): did.params['tmx_did'],
+            ('first', 'pipeline_capacity_instrument'): first.params['pipeline_capacity_instrument'],
+            ('second', 'differential_predicted'): second.params['differential_predicted'],
+            ('iv', 'wcs_wti_differential'): iv['params'][0, 0]}
+
+
+def _estimates(frame):
+    return {(m, t): e for m, t, e in zip(frame['model'], frame['term'], frame['loo_estimate'])}
+
+
+@pytest.mark.parametrize('date', ['2018-12-01', '2020-04-01', '2023-06-01'])
+def test_leave_one_month_out(diagnostics, df_panel, df_alberta_full, date):
+    rows, _ = diagnostics
+    date = np.datetime64(date)
+    alberta = rows[(rows['date'] == date) & (rows['province'] == 'Alberta')]
+    # Alberta's row of that month, left out of the DiD and both stages
+    keep_panel = ~((df_panel['date'] == date) & (df_panel['province'] == 'Alberta'))
+    keep_alberta = df_alberta_full['date'] != date
+    expected = _refit(df_panel, df_alberta_full, keep_panel, keep_alberta)
+    estimates = _estimates(alberta)
+    assert set(estimates) == set(expected)
+    for key, value in estimates.items():
+        assert value == pytest.approx(expected[key], rel=1e-7, abs=1e-9), key
+
+
+@pytest.mark.parametrize('year', [2019, 2020, 2024])
+def test_leave_one_year_out(diagnostics, df_panel, df_alberta_full, year):
+    _, groups = diagnostics
+    dropped = groups[(groups['kind'] == 'year') & (groups['group'].astype(str) == str(year))]
+    expected = _refit(df_panel, df_alberta_full, df_panel['year'] != year, df_alberta_full['year'] != year)
+    checked = 0
+    for key, value in _estimates(dropped).items():
+        if np.isnan(value):
+            continue
+        assert value == pytest.approx(expected[key], rel=1e-7, abs=1e-9), key
+        checked += 1
+    assert checked >= 3
+
+
+def test_two_step_term_is_marked_and_never_flagged(diagnostics):
+    rows, groups = diagnostics
+    two_step = rows[rows['model'] == 'second']
+    assert not two_step['identified'].any() and not two_step['flagged'].any()
+    assert rows.loc[rows['model'] == 'iv', 'identified'].all()
+    assert not groups.loc[groups['model'] == 'second', 'identified'].any()
+
+
+def test_leave_control_province_out_is_not_identified(diagnostics):
+    _, groups = diagnostics
+    sask = groups[(groups['kind'] == 'province') & (groups['group'] == 'Saskatchewan') & (groups['model'] == 'did')]
+    assert sask['loo_estimate'].isna().all()
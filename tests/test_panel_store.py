@@ -0,0 +1,54 @@
+"""write_panel / read_panel round trips."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from panel_store import compact_panel, read_panel, read_schema, write_panel
+
+
+def _expected(df, float32=False):
+    frame = compact_panel(df, float32)
+    return frame.sort_values(['province', 'year', 'month'], kind='stable').reset_index(drop=True)
+
+
+@pytest.fixture(params=['npy', 'parquet'])
+def engine(request):
+    if request.param != 'npy':
+        pytest.importorskip('pyarrow')
+    return request.param
+
+
+def test_round_trip(df_alberta_full, engine, tmp_path):
+    path = write_panel(df_alberta_full, str(tmp_path / 'alberta'), engine=engine)
+    assert read_schema(path)['rows'] == len(df_alberta_full)
+    expected = _expected(df_alberta_full)
+    pd.testing.assert_frame_equal(read_panel(path, mmap=False), expected)
+    mapped = read_panel(path)
+    for name in expected:
+        np.testing.assert_array_equal(np.asarray(mapped[name]), np.asarray(expected[name]))
+
+
+def test_filters_and_columns(df_panel, engine, tmp_path):
+    path = write_panel(df_panel, str(tmp_path / 'panel'), engine=engine)
+    expected = _expected(df_panel)
+    selected = read_panel(path, provinces=['Saskatchewan'], years=range(2021, 2023),
+                          columns=['province', 'year', 'month', 'production_kbpd'], mmap=False)
+    mask = (expected['province'] == 'Saskatchewan') & expected['year'].between(2021, 2022)
+    pd.testing.assert_frame_equal(selected, expected.loc[mask, list(selected.columns)].reset_index(drop=True),
+                                  check_categorical=False)
+    assert len(read_panel(path, years=[1999])) == 0
+
+
+def test_float32_measures(df_panel, tmp_path):
+    frame = read_panel(write_panel(df_panel, str(tmp_path / 'panel'), engine='npy', float32=True))
+    assert frame['production_kbpd'].dtype == np.float32
+    np.testing.assert_allclose(frame['production_kbpd'], _expected(df_panel)['production_kbpd'], rtol=1e-6)
+
+
+def test_rewrite_replaces_dataset(df_panel, tmp_path):
+    path = str(tmp_path / 'panel')
+    write_panel(df_panel, path, engine='npy')
+    write_panel(df_panel[df_panel['year'] == 2020], path, engine='npy')
+    assert set(read_panel(path)['year']) == {2020}
+    assert not [p for p in tmp_path.iterdir() if p.name.startswith('.panel-')]
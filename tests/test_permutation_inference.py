@@ -0,0 +1,70 @@
+"""Batched placebo fits against one statsmodels refit per placebo."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from permutation_inference import permutation_inference, placebo_assignments, placebo_dates
+
+
+def _ols(y, X):
+    from statsmodels.regression.linear_model import OLS
+
+    return OLS(y, np.column_stack([np.ones(len(y))] + X)).fit().params
+
+
+def _months(df):
+    return df['year'].to_numpy() * 12 + df['month'].to_numpy() - 1
+
+
+@pytest.mark.parametrize('event', ['line3', 'tmx'])
+def test_placebo_dates_match_refits(df_panel, event):
+    months, estimates = placebo_dates(df_panel, event)
+    assert len(months) > 10 and np.isfinite(estimates).all()
+
+    t = _months(df_panel)
+    df = df_panel[t < t[df_panel[f'{event}_post'].to_numpy() == 1].min()]
+    t = _months(df)
+    controls = [df[c].to_numpy(dtype=float) for c in ['treated', 'time_trend']]
+    if event == 'tmx':
+        controls += [df[c].to_numpy(dtype=float) for c in ['line3_post', 'line3_did']]
+    treated = df['treated'].to_numpy(dtype=float)
+    y = df['production_kbpd'].to_numpy(dtype=float)
+    for month, estimate in zip(months, estimates):
+        post = (t >= month).astype(float)
+        reference = _ols(y, controls + [post, post * treated])[-1]
+        assert estimate == pytest.approx(reference, rel=1e-7, abs=1e-7), month
+
+
+def test_chunks_and_workers_do_not_change_the_answer(df_panel):
+    _, serial = placebo_dates(df_panel, 'line3')
+    _, pooled = placebo_dates(df_panel, 'line3', chunk_size=7, workers=2)
+    np.testing.assert_allclose(pooled, serial, rtol=1e-12)
+
+
+def test_placebo_assignments_match_refits(df_panel):
+    # Four provinces: Saskatchewan's rows, shifted, stand in for two more
+    sask = df_panel[df_panel['province'] == 'Saskatchewan']
+    extra = [sask.assign(province=name, production_kbpd=sask['production_kbpd'] * scale + shift)
+             for name, scale, shift in [('Manitoba', 0.1, 5.0), ('Newfoundland and Labrador', 0.6, -40.0)]]
+    panel = pd.concat([df_panel] + extra, ignore_index=True)
+
+    combos, estimates = placebo_assignments(panel)
+    assert len(combos) == 3 and ('Alberta',) not in combos
+    y = panel['production_kbpd'].to_numpy(dtype=float)
+    controls = [panel[c].to_numpy(dtype=float) for c in ['line3_post', 'tmx_post', 'time_trend']]
+    for combo, estimate in zip(combos, estimates):
+        treated = panel['province'].isin(combo).to_numpy(dtype=float)
+        reference = _ols(y, controls + [treated, treated * controls[0], treated * controls[1]])
+        np.testing.assert_allclose(estimate, reference[-2:], rtol=1e-7)
+
+    summary, _ = permutation_inference(panel)
+    assert set(summary['mode']) == {'dates', 'assignments'}
+
+
+def test_actual_estimates_and_p_values(analysis, df_panel):
+    summary, distributions = permutation_inference(df_panel)
+    for row in summary.itertuples():
+        assert row.estimate == pytest.approx(analysis['did'].params[row.effect], rel=1e-8)
+        placebos = distributions[(row.effect, row.mode)]
+        assert row.p_value == (1 + np.sum(np.abs(placebos) >= abs(row.estimate))) / (1 + len(placebos))
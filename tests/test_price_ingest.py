@@ -0,0 +1,87 @@
+"""Streamed monthly differential against a pandas groupby on the raw prints."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from price_ingest import load_price_files
+
+
+def _prints(start, end, volume, seed):
+    """Several prints a day, WCS and WTI on different holidays, plus a benchmark to skip."""
+    rng = np.random.default_rng(seed)
+    days = pd.bdate_range(start, end)
+    rows = []
+    for name, level, holidays in [('WCS', 55.0, days[3::17]), ('WTI', 70.0, days[5::13]), ('Brent', 75.0, [])]:
+        for day in days.difference(holidays):
+            n = rng.integers(1, 5)
+            rows.append(pd.DataFrame({
+                'timestamp': day + pd.to_timedelta(np.sort(rng.uniform(9, 16, n)), unit='h'),
+                'benchmark': name if rng.uniform() < 0.5 else f' {name.lower()} ',
+                'price': level + rng.normal(0, 2, n),
+                'volume': rng.integers(1, 500, n).astype(float),
+            }))
+    prints = pd.concat(rows, ignore_index=True)
+    return prints if volume else prints.drop(columns='volume')
+
+
+def _reference(prints):
+    """Daily VW (or plain) price per benchmark, common days, then monthly statistics."""
+    prints = prints.assign(benchmark=prints['benchmark'].str.strip().str.upper(),
+                           date=pd.to_datetime(prints['timestamp']).dt.normalize())
+    prints = prints[prints['benchmark'].isin(['WCS', 'WTI'])]
+    if 'volume' not in prints:
+        prints = prints.assign(volume=0.0)
+    grouped = prints.assign(pv=prints['price'] * prints['volume']).groupby(['benchmark', 'date'])
+    sums = grouped[['price', 'pv', 'volume']].sum()
+    price = (sums['pv'] / sums['volume']).where(sums['volume'] > 0, grouped['price'].mean())
+    daily = pd.DataFrame({'price': price, 'volume': sums['volume']}).unstack('benchmark')
+    common = daily.dropna(subset=[('price', 'WCS'), ('price', 'WTI')])
+    differential = common[('price', 'WTI')] - common[('price', 'WCS')]
+    wcs_volume = common[('volume', 'WCS')]
+
+    month = [differential.index.year, differential.index.month]
+    out = pd.DataFrame({
+        'wcs_wti_differential': differential.groupby(month).mean(),
+        'differential_median': differential.groupby(month).median(),
+        'differential_vw': ((differential * wcs_volume).groupby(month).sum() / wcs_volume.groupby(month).sum()),
+        'trading_days': differential.groupby(month).size(),
+    })
+    out['differential_vw'] = out['differential_vw'].where(np.isfinite(out['differential_vw']))
+    days = daily.index
+    out['wcs_days'] = daily[('price', 'WCS')].notna().groupby([days.year, days.month]).sum()
+    out['wti_days'] = daily[('price', 'WTI')].notna().groupby([days.year, days.month]).sum()
+    return out.rename_axis(['year', 'month']).reset_index()
+
+
+@pytest.fixture
+def files(tmp_path):
+    first = _prints('2021-01-01', '2021-03-31', volume=True, seed=0)
+    second = _prints('2021-04-01', '2021-05-31', volume=False, seed=1)
+    first.to_csv(tmp_path / 'prices_q1.csv', index=False)
+    second.to_csv(tmp_path / 'prices_q2.csv', index=False)
+    return [str(tmp_path / 'prices_q1.csv'), str(tmp_path / 'prices_q2.csv')], [first, second]
+
+
+def test_monthly_matches_groupby(files):
+    paths, frames = files
+    monthly = load_price_files(paths, chunksize=97)
+    expected = pd.concat([_reference(f) for f in frames], ignore_index=True)
+    pd.testing.assert_frame_equal(monthly, expected, check_dtype=False, rtol=1e-10)
+    # Holidays differ, so some months lose days to the calendar alignment
+    assert (monthly['trading_days'] < monthly[['wcs_days', 'wti_days']].min(axis=1)).any()
+    # Files without volume have no volume-weighted differential
+    assert monthly.loc[monthly['month'] >= 4, 'differential_vw'].isna().all()
+    assert monthly.loc[monthly['month'] < 4, 'differential_vw'].notna().all()
+
+
+def test_chunking_and_file_order_do_not_matter(files):
+    paths, _ = files
+    pd.testing.assert_frame_equal(load_price_files(paths[::-1], chunksize=13), load_price_files(paths))
+
+
+def test_missing_columns_are_an_error(tmp_path):
+    path = tmp_path / 'prices.csv'
+    pd.DataFrame({'timestamp': ['2021-01-04'], 'price': [50.0]}).to_csv(path, index=False)
+    with pytest.raises(ValueError, match='benchmark'):
+        load_price_files(str(path))
@@ -0,0 +1,101 @@
+"""Rank-one updates, revisions and downdates against batch statsmodels fits."""
+
+import numpy as np
+import pytest
+
+import pipeline_complete_analysis as pca
+from recursive_ls import RowStore, load_stores, save_stores
+
+
+def _batch(y, X, cov_type):
+    from statsmodels.regression.linear_model import OLS
+
+    return OLS(y, X).fit(cov_type=cov_type)
+
+
+def _assert_matches(fit, reference):
+    np.testing.assert_allclose(fit['params'].to_numpy(), reference.params, rtol=1e-9)
+    np.testing.assert_allclose(fit['bse'].to_numpy(), reference.bse, rtol=1e-7)
+    assert fit['nobs'] == reference.nobs
+
+
+@pytest.mark.parametrize('cov_type', ['nonrobust', 'HC0', 'HC1'])
+def test_sync_add_revise_remove(df_panel, df_alberta_full, cov_type, tmp_path):
+    keys, X, y = pca.incremental_rows(df_panel, df_alberta_full)['did']
+    names = ['const'] + pca.DID_REGRESSORS
+    store = RowStore(names)
+    assert store.sync(keys[:-10], X[:-10], y[:-10]) == {'added': len(keys) - 10, 'revised': 0, 'removed': 0}
+
+    # A revised month, five new ones and three dropped from the front
+    y = y.copy()
+    y[40] += 25.0
+    keep = slice(3, len(keys) - 5)
+    counts = store.sync(keys[keep], X[keep], y[keep])
+    assert counts == {'added': 5, 'revised': 1, 'removed': 3}
+    _assert_matches(store.model.fit(cov_type), _batch(y[keep], X[keep], cov_type))
+
+    path = str(tmp_path / 'state.npz')
+    save_stores({'did': store}, path)
+    _assert_matches(load_stores(path)['did'].model.fit(cov_type), _batch(y[keep], X[keep], cov_type))
+
+
+def test_refresh_folds_in_new_and_revised_months(df_panel, df_alberta_full, analysis, tmp_path):
+    path = str(tmp_path / 'state.npz')
+    last = df_panel['date'] == df_panel['date'].max()
+    first = pca.refresh_incremental(df_panel[~last], df_alberta_full[df_alberta_full['date'] != df_panel['date'].max()],
+                                    path=path)
+    assert first['changes']['did']['added'] == (~last).sum()
+
+    revised = df_panel.copy()
+    revised.loc[(revised['year'] == 2020) & (revised['month'] == 4), 'production_kbpd'] -= 50.0
+    result = pca.refresh_incremental(revised, df_alberta_full, path=path)
+    assert result['changes']['did'] == {'added': 2, 'revised': 2, 'removed': 0}
+    assert result['changes']['first']['added'] == 1
+
+    reference = pca.run_did(revised)
+    np.testing.assert_allclose(result['did']['params'].to_numpy(), reference.params.to_numpy(), rtol=1e-9)
+    np.testing.assert_allclose(result['did']['bse'].to_numpy(), reference.bse.to_numpy(), rtol=1e-7)
+
+    iv = analysis['iv']
+    for term in ['const', 'pipeline_capacity_instrument', 'time_trend']:
+        assert result['first']['params'][term] == pytest.approx(iv['first'].params[term], rel=1e-9)
+    engine = iv['engine']['fit']
+    assert result['iv']['params']['wcs_wti_differential'] == pytest.approx(engine['params'][0, 0], rel=1e-9)
+    assert result['iv']['bse']['wcs_wti_differential'] == pytest.approx(engine['bse'][0, 0], rel=1e-7)
+    # The two-step price term is a combination of the dummies beside it
+    assert np.isnan(result['second']['params']['differential_predicted'])
+
+
+@pytest.mark.parametrize('cov_type', ['nonrobust', 'HC0', 'HC1'])
+def test_fit_iv_matches_engine(df_2sls, cov_type):
+    from iv_engine import fit_iv
+
+    columns = ['pipeline_capacity_instrument', 'time_trend', 'wcs_wti_differential']
+    X = np.column_stack([np.ones(len(df_2sls)), df_2sls[columns].to_numpy(dtype=float)])
+    y = df_2sls['production_kbpd'].to_numpy(dtype=float)
+    store = RowStore(['const'] + columns)
+    store.sync([str(i) for i in range(len(y))], X, y)
+    fit = store.model.fit_iv(['wcs_wti_differential'], ['const', 'time_trend'], ['pipeline_capacity_instrument'],
+                             cov_type)
+    reference = fit_iv(y, X[:, 3], X[:, [0, 2]], X[:, 1], cov_type=cov_type)
+    assert fit['params']['wcs_wti_differential'] == pytest.approx(reference['params'][0, 0], rel=1e-9)
+    np.testing.assert_allclose(fit['params'][['const', 'time_trend']], reference['exog_params'][0], rtol=1e-8)
+    assert fit['bse']['wcs_wti_differential'] == pytest.approx(reference['bse'][0, 0], rel=1e-8)
+    assert fit['pvalues']['wcs_wti_differential'] == pytest.approx(reference['pvalues'][0, 0], rel=1e-6)
+
+
+def test_all_zero_column_is_not_estimable(df_panel, df_alberta_full):
+    # Before TMX: its dummies are zero in every month held
+    early = df_panel['year'] <= 2023
+    keys, X, y = pca.incremental_rows(df_panel[early], df_alberta_full)['did']
+    names = ['const'] + pca.DID_REGRESSORS
+    store = RowStore(names)
+    store.sync(keys, X, y)
+    fit = store.model.fit('HC1')
+    assert fit['params'][['tmx_post', 'tmx_did']].isna().all()
+    assert fit['bse'][['tmx_post', 'tmx_did']].isna().all()
+
+    kept = [j for j, name in enumerate(names) if name not in ('tmx_post', 'tmx_did')]
+    reference = _batch(y, X[:, kept], 'HC1')
+    np.testing.assert_allclose(fit['params'].dropna().to_numpy(), reference.params, rtol=1e-9)
+    np.testing.assert_allclose(fit['bse'].dropna().to_numpy(), reference.bse, rtol=1e-7)
@@ -0,0 +1,46 @@
+"""Rolling, expanding and event-window DiD paths against statsmodels refits."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from rolling_did import EVENTS, REGRESSORS, effect_paths
+
+
+def _ols(y, X, cov_type):
+    from statsmodels.regression.linear_model import OLS
+
+    return OLS(y, X).fit(cov_type=cov_type)
+
+
+@pytest.mark.parametrize('cov_type', ['nonrobust', 'HC1'])
+def test_window_effects_match_refits(df_panel, cov_type):
+    paths = effect_paths(df_panel, kinds=('rolling', 'expanding', 'event'), lengths=(36, 60),
+                         half_widths=(12, 24), cov_type=cov_type)
+    windows = paths.drop_duplicates(['kind', 'length', 'start', 'end'])
+    # A spread of windows of every kind, so the check stays quick
+    windows = pd.concat([g.iloc[::max(len(g) // 4, 1)] for _, g in windows.groupby('kind')])
+    assert set(windows['kind']) == {'rolling', 'expanding', 'event'}
+
+    for w in windows.itertuples():
+        rows = df_panel[(df_panel['date'] >= w.start) & (df_panel['date'] <= w.end)]
+        window = paths[(paths['kind'] == w.kind) & (paths['length'] == w.length) & (paths['start'] == w.start)
+                       & (paths['end'] == w.end)].set_index('effect')
+        identified = [e for e in EVENTS if np.isfinite(window.loc[e, 'estimate'])]
+        dropped = {t for e in EVENTS if e not in identified for t in EVENTS[e]}
+        columns = [c for c in REGRESSORS if c not in dropped]
+        X = np.column_stack([np.ones(len(rows)), rows[columns].to_numpy(dtype=float)])
+        fit = _ols(rows['production_kbpd'].to_numpy(dtype=float), X, cov_type)
+        assert len(rows) == window['nobs'].iloc[0]
+        for effect in identified:
+            j = 1 + columns.index(effect)
+            assert window.loc[effect, 'estimate'] == pytest.approx(fit.params[j], rel=1e-8, abs=1e-8)
+            assert window.loc[effect, 'se'] == pytest.approx(fit.bse[j], rel=1e-6)
+
+
+def test_full_expanding_window_is_run_did(df_panel, analysis):
+    paths = effect_paths(df_panel, kinds=('expanding',), cov_type='HC1').set_index('effect')
+    last = paths[paths['end'] == paths['end'].max()]
+    for effect in EVENTS:
+        assert last.loc[effect, 'estimate'] == pytest.approx(analysis['did'].params[effect], rel=1e-9)
+        assert last.loc[effect, 'se'] == pytest.approx(analysis['did'].bse[effect], rel=1e-7)
@@ -0,0 +1,70 @@
+"""Cube lookups and interpolations against the script's functions run on the same scenario."""
+
+import os
+
+import pytest
+
+import pipeline_complete_analysis as pca
+from conftest import ROOT
+from scenario_service import ScenarioService, emissions_numbers, is_inference, iv_numbers
+
+GRID = {'start_year': [2018], 'end_year': [2024], 'line3_start': [(2021, 10)], 'tmx_start': [(2024, 5)],
+        'capacity_line3': [490.0, 590.0, 690.0], 'capacity_tmx': [490.0, 590.0, 690.0],
+        'base_intensity': [70.0, 75.0, 80.0], 'decline_rate': [0.01, 0.02, 0.03]}
+
+
+@pytest.fixture(scope='module')
+def inputs():
+    return pca.load_inputs(os.path.join(ROOT, pca.STATCAN_FILE), os.path.join(ROOT, pca.RAIL_FILE))
+
+
+@pytest.fixture(scope='module')
+def service(inputs, tmp_path_factory):
+    defaults = {'start_year': pca.START_YEAR, 'end_year': pca.END_YEAR, 'line3_start': pca.LINE3_START,
+                'tmx_start': pca.TMX_START, 'capacity_line3': float(pca.CAPACITY_LINE3),
+                'capacity_tmx': float(pca.CAPACITY_TMX), 'base_intensity': pca.BASE_INTENSITY,
+                'decline_rate': pca.DECLINE_RATE, 'constant_intensity': pca.CONSTANT_INTENSITY, 'cov_type': 'HC1'}
+    service = ScenarioService(inputs, defaults, grid=GRID, path=str(tmp_path_factory.mktemp('cube') / 'cube.pkl'))
+    yield service
+    service.close()
+
+
+def _exact_iv(inputs, capacity_line3, capacity_tmx):
+    panel = pca.build_panel(inputs['alberta'], inputs['sask'], inputs['prices'], inputs['rail'],
+                            capacity_line3=capacity_line3, capacity_tmx=capacity_tmx)
+    return iv_numbers(pca.run_iv(panel[1], capacity_line3, capacity_tmx, 'HC1'))
+
+
+def test_grid_point_is_the_exact_answer(service, inputs):
+    answer = service.query({'capacity_tmx': 490})
+    assert answer['source']['iv'] == 'lookup'
+    for name, value in _exact_iv(inputs, 590.0, 490.0).items():
+        assert answer['iv'][name] == pytest.approx(value, rel=1e-9), name
+
+
+def test_interpolation_leaves_inference_null(service, inputs):
+    answer = service.query({'capacity_line3': 540, 'capacity_tmx': 640})
+    assert answer['source']['iv'] == 'interpolated'
+    interpolated = answer['iv']
+    exact = _exact_iv(inputs, 540.0, 640.0)
+    inference = [name for name in exact if is_inference(name)]
+    assert {'iv_price_p', 'iv_price_se', 'kp_f', 'first_f', 'ar_p'} <= set(inference)
+    assert all(interpolated[name] is None for name in inference)
+
+    # Point estimates from the corners, the totals as products of them
+    assert interpolated['iv_price'] == pytest.approx(exact['iv_price'], rel=0.05)
+    for event in ['line3', 'tmx']:
+        narrowing = interpolated[f'capacity_{event}'] * interpolated['first_slope'] / 100
+        assert interpolated[f'diff_narrowing_{event}'] == pytest.approx(narrowing)
+        assert interpolated[f'prod_increase_via_price_{event}'] == pytest.approx(narrowing * interpolated['iv_price'])
+        assert interpolated[f'prod_increase_via_price_{event}'] == pytest.approx(
+            exact[f'prod_increase_via_price_{event}'], rel=0.05)
+
+
+def test_emissions_are_linear_in_base_intensity(service, inputs):
+    answer = service.query({'base_intensity': 72.5})
+    assert answer['source']['emissions'] == 'interpolated'
+    panel = pca.build_panel(inputs['alberta'], inputs['sask'], inputs['prices'], inputs['rail'])
+    exact = emissions_numbers(pca.compute_emissions(panel[1], 72.5, pca.DECLINE_RATE, pca.CONSTANT_INTENSITY))
+    for name in ['pre_emissions', 'line3_delta', 'tmx_delta', 'total_delta', 'const_total']:
+        assert answer['emissions'][name] == pytest.approx(exact[name], rel=1e-9)
@@ -0,0 +1,69 @@
+"""Grid rows against statsmodels fits of the same specification."""
+
+import numpy as np
+import pytest
+
+from spec_grid import COV_TYPES, TRENDS, run_spec_grid, spec_grid
+
+
+def _ols(y, X, cov_type):
+    from statsmodels.regression.linear_model import OLS
+
+    return OLS(y, X).fit(cov_type=cov_type)
+
+
+def _trend(t, treated, trend):
+    return {'none': [], 'linear': [t], 'by_province': [t] if treated is None else [t, t * treated],
+            'quadratic': [t, t ** 2]}[trend]
+
+
+@pytest.fixture(scope='module')
+def results(df_panel, df_alberta_full):
+    grid = spec_grid([2018, 2019], [2024], [(2021, 10), (2021, 6)], [(2024, 5)], [590.0], [590.0, 300.0],
+                     trends=TRENDS, cov_types=COV_TYPES)
+    return run_spec_grid(df_panel, df_alberta_full, grid)
+
+
+def test_every_spec_is_estimated(results):
+    assert len(results) == 2 * 2 * 2 * len(TRENDS) * len(COV_TYPES)
+    assert results[['line3_did', 'first_slope', 'iv_price']].notna().all().all()
+
+
+@pytest.mark.parametrize('trend', TRENDS)
+def test_rows_match_statsmodels(results, df_panel, df_alberta_full, trend):
+    from statsmodels.sandbox.regression.gmm import IV2SLS
+
+    for spec in results[results['trend'] == trend].iloc[::3].itertuples():
+        month = df_panel['year'] * 12 + df_panel['month'] - 1
+        rows = df_panel[(df_panel['year'] >= spec.start_year) & (df_panel['year'] <= spec.end_year)]
+        t = (month[rows.index] - month[rows.index].min()).to_numpy(dtype=float)
+        m = month[rows.index].to_numpy()
+        treated = rows['treated'].to_numpy(dtype=float)
+        post3 = (m >= spec.line3_start[0] * 12 + spec.line3_start[1] - 1).astype(float)
+        posttmx = (m >= spec.tmx_start[0] * 12 + spec.tmx_start[1] - 1).astype(float)
+
+        X = np.column_stack([np.ones(len(rows)), treated] + _trend(t, treated, trend)
+                            + [post3, posttmx, post3 * treated, posttmx * treated])
+        did = _ols(rows['production_kbpd'].to_numpy(dtype=float), X, spec.cov_type)
+        assert spec.n_panel == len(rows)
+        assert spec.line3_did == pytest.approx(did.params[-2], rel=1e-8)
+        assert spec.tmx_did_se == pytest.approx(did.bse[-1], rel=1e-6)
+        assert spec.tmx_did_p == pytest.approx(did.pvalues[-1], rel=1e-5, abs=1e-12)
+
+        differential = rows[['year', 'month']].merge(df_alberta_full[['year', 'month', 'wcs_wti_differential']],
+                                                     on=['year', 'month'], how='left')['wcs_wti_differential']
+        differential = differential.to_numpy(dtype=float)
+        alberta = (treated == 1) & np.isfinite(differential)
+        y1 = differential[alberta]
+        y2 = rows['production_kbpd'].to_numpy(dtype=float)[alberta]
+        z = (spec.capacity_line3 * post3 + spec.capacity_tmx * posttmx)[alberta]
+        exog = np.column_stack([np.ones(alberta.sum())] + _trend(t[alberta], None, trend))
+        first = _ols(y1, np.column_stack([exog, z]), spec.cov_type)
+        assert spec.n_2sls == alberta.sum()
+        assert spec.first_slope == pytest.approx(first.params[-1], rel=1e-8)
+        assert spec.first_slope_se == pytest.approx(first.bse[-1], rel=1e-6)
+
+        iv = IV2SLS(y2, np.column_stack([y1, exog]), np.column_stack([z, exog])).fit()
+        assert spec.iv_price == pytest.approx(iv.params[0], rel=1e-8)
+        if spec.cov_type == 'nonrobust':
+            assert spec.iv_price_se == pytest.approx(iv.bse[0], rel=1e-6)
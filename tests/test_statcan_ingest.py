@@ -0,0 +1,66 @@
+"""The long-format reader against the wide reader on the same table."""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import ROOT
+from statcan_ingest import is_long_format, read_statcan, read_statcan_long, read_statcan_wide
+
+WIDE = os.path.join(ROOT, '2510006301-noSymbol.csv')
+
+
+@pytest.fixture(scope='module')
+def long_path(tmp_path_factory):
+    """The shipped wide extract rewritten as a full-table long download, part of it scaled to thousands."""
+    tidy = read_statcan_wide(WIDE, dropna=False)
+    scaled = np.arange(len(tidy)) % 3 == 0
+    value = np.where(scaled, tidy['value'] / 1000, tidy['value'])
+    long = pd.DataFrame({
+        'REF_DATE': tidy['date'].dt.strftime('%Y-%m'),
+        'GEO': tidy['geography'].astype(str),
+        'DGUID': '2021A0002',
+        'Supply and disposition': tidy['series'].astype(str),
+        'UOM': tidy['uom'].astype(str),
+        'UOM_ID': 0,
+        'SCALAR_FACTOR': np.where(scaled, 'thousands', 'units'),
+        'SCALAR_ID': np.where(scaled, 3, 0),
+        'VECTOR': 'v0',
+        'VALUE': pd.Series(value).map(lambda v: '' if np.isnan(v) else repr(v)),
+        'STATUS': np.where(tidy['value'].isna(), '..', ''),
+    })
+    path = tmp_path_factory.mktemp('statcan') / '25100063.csv'
+    long.sample(frac=1, random_state=0).to_csv(path, index=False)
+    return str(path)
+
+
+def _sorted(tidy):
+    out = tidy.assign(**{c: tidy[c].astype(str) for c in ['geography', 'series', 'uom']})
+    return out.sort_values(['geography', 'series', 'uom', 'date']).reset_index(drop=True)
+
+
+@pytest.mark.parametrize('filters', [
+    {},
+    {'geographies': 'Alberta', 'series': 'Crude oil production', 'uom': 'barrels'},
+    {'geographies': ['Alberta', 'Saskatchewan'], 'start': 2018, 'end': '2021-06'},
+])
+def test_long_matches_wide(long_path, filters):
+    assert is_long_format(long_path) and not is_long_format(WIDE)
+    wide = _sorted(read_statcan(WIDE, **filters))
+    long = _sorted(read_statcan(long_path, **filters))
+    assert len(wide) > 0
+    pd.testing.assert_frame_equal(long, wide, check_dtype=False, rtol=1e-12)
+
+
+def test_missing_values_are_kept_on_request(long_path):
+    wide = _sorted(read_statcan_wide(WIDE, dropna=False))
+    long = _sorted(read_statcan(long_path, dropna=False))
+    pd.testing.assert_frame_equal(long, wide, check_dtype=False, rtol=1e-12)
+    assert len(long) > len(read_statcan(long_path))
+
+
+def test_chunks_do_not_change_the_frame(long_path):
+    pd.testing.assert_frame_equal(read_statcan_long(long_path, uom='Barrels', chunksize=97),
+                                  read_statcan_long(long_path, uom='Barrels'))
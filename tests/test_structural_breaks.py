@@ -0,0 +1,76 @@
+"""Break statistics from the segment table against a brute-force search over every partition."""
+
+import numpy as np
+import pytest
+
+from structural_breaks import (REGIMES, break_series, regime_design, search, segment_inverse,
+                               structural_breaks)
+
+
+def _ssr(Z, y, bounds):
+    total = 0.0
+    for s, e in zip(bounds[:-1], bounds[1:]):
+        b = np.linalg.lstsq(Z[s:e], y[s:e], rcond=None)[0]
+        total += ((y[s:e] - Z[s:e] @ b) ** 2).sum()
+    return total
+
+
+def _brute_force(Z, y, h):
+    """sup-F(1|0), sup-F(2|0), F(2|1) and their breaks, every partition refitted."""
+    T, q = Z.shape
+    ssr0 = _ssr(Z, y, [0, T])
+    ones = {t: _ssr(Z, y, [0, t, T]) for t in range(h, T - h + 1)}
+    tau = min(ones, key=ones.get)
+    twos = {(a, b): _ssr(Z, y, [0, a, b, T]) for a in range(h, T - 2 * h + 1) for b in range(a + h, T - h + 1)}
+    tau1, tau2 = min(twos, key=twos.get)
+    extras = {(a if b == tau else b): ssr for (a, b), ssr in twos.items() if tau in (a, b)}
+    extra = min(extras, key=extras.get)
+    return {
+        'sup_f1': ((ssr0 - ones[tau]) / q) / (ones[tau] / (T - 2 * q)),
+        'sup_f2': ((ssr0 - twos[tau1, tau2]) / (2 * q)) / (twos[tau1, tau2] / (T - 3 * q)),
+        'f21': ((ones[tau] - extras[extra]) / q) / (extras[extra] / (T - 3 * q)),
+        'tau': tau, 'tau1': tau1, 'tau2': tau2, 'extra': extra,
+    }
+
+
+def _simulated(T=60, seed=0):
+    rng = np.random.default_rng(seed)
+    y = rng.normal(0, 1, T)
+    y[20:] += 3.0
+    y[42:] -= 0.05 * np.arange(T - 42)
+    return y
+
+
+@pytest.mark.parametrize('regime', REGIMES)
+def test_search_matches_brute_force(df_panel, df_alberta_full, regime):
+    series = [_simulated()] + [y for _, y in break_series(df_panel, df_alberta_full).values()]
+    for y in series:
+        Z = regime_design(len(y), regime)
+        h = max(int(0.15 * len(y)), Z.shape[1] + 1)
+        got = search(Z, y[:, None], segment_inverse(Z, h))
+        for key, value in _brute_force(Z, y, h).items():
+            assert got[key][0] == pytest.approx(value, rel=1e-7), key
+
+
+def test_columns_are_independent_searches():
+    y = _simulated()
+    Z = regime_design(len(y), 'level')
+    segments = segment_inverse(Z, 9)
+    Y = np.column_stack([y, y[::-1], _simulated(seed=1)])
+    together = search(Z, Y, segments)
+    for c in range(Y.shape[1]):
+        alone = search(Z, Y[:, c:c + 1], segments)
+        for key in together:
+            assert together[key][c] == pytest.approx(alone[key][0], rel=1e-12)
+
+
+def test_report_uses_the_observed_statistics(df_panel, df_alberta_full):
+    table = structural_breaks(df_panel, df_alberta_full, series=('gap',), reps=19)
+    dates, y = break_series(df_panel, df_alberta_full)['gap']
+    Z = regime_design(len(y), 'trend')
+    expected = _brute_force(Z, y, max(int(0.15 * len(y)), 3))
+    rows = table.set_index('test')
+    assert rows.loc['sup-F(1|0)', 'statistic'] == pytest.approx(expected['sup_f1'], rel=1e-7)
+    assert rows.loc['sup-F(1|0)', 'date'] == dates[expected['tau']]
+    assert list(rows.loc['sup-F(2|0)', 'date']) == [dates[expected['tau1']], dates[expected['tau2']]]
+    assert ((table['p_value'] >= 1 / 20) & (table['p_value'] <= 1)).all()
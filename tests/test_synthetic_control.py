@@ -0,0 +1,111 @@
+"""Batched simplex fits and the placebo table against exhaustive solves and direct recomputation."""
+
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import pipeline_complete_analysis as pca
+from synthetic_control import fit_weights, project_simplex, synthetic_control, unit_matrix
+
+
+@pytest.fixture(scope='module')
+def unit_panel():
+    """Six producers from 2018 to 2024 in tidy StatsCan rows (the shipped file has two)."""
+    rng = np.random.default_rng(0)
+    months = pd.period_range('2018-01', '2024-12', freq='M')
+    common = np.cumsum(rng.normal(0, 20, len(months)))
+    frames = []
+    for unit, level in [('Alberta', 3500), ('Saskatchewan', 450), ('Newfoundland and Labrador', 250),
+                        ('British Columbia', 50), ('Manitoba', 40), ('Northwest Territories', 10)]:
+        kbpd = level + rng.uniform(0.2, 1.0) * common + rng.normal(0, 5, len(months))
+        frames.append(pd.DataFrame({'geography': unit, 'year': months.year, 'month': months.month,
+                                    'value_per_day': kbpd * 1000}))
+    return pca.build_unit_panel(pd.concat(frames, ignore_index=True))
+
+
+def _exact(Y_pre, target, allowed):
+    """Reference simplex least squares: the best feasible KKT solution over every support."""
+    best = np.inf
+    columns = np.flatnonzero(allowed)
+    for size in range(1, len(columns) + 1):
+        for support in itertools.combinations(columns, size):
+            X = Y_pre[:, support]
+            # min |target - X w|^2 subject to sum w = 1, by its KKT system
+            kkt = np.block([[2 * X.T @ X, np.ones((size, 1))], [np.ones((1, size)), np.zeros((1, 1))]])
+            w = np.linalg.lstsq(kkt, np.append(2 * X.T @ target, 1.0), rcond=None)[0][:size]
+            if np.all(w >= -1e-10):
+                best = min(best, ((target - X @ w) ** 2).sum())
+    return best
+
+
+def test_projection_matches_sort_formula():
+    rng = np.random.default_rng(0)
+    V = rng.normal(size=(50, 7))
+    mask = rng.uniform(size=V.shape) < 0.7
+    mask[:, 0] = True
+    W = project_simplex(V, mask)
+    assert np.all(W[~mask] == 0) and np.all(W >= 0)
+    np.testing.assert_allclose(W.sum(axis=1), 1)
+    for v, m, w in zip(V, mask, W):
+        # Duchi et al.: the projection is max(v - theta, 0) with theta from the sorted support
+        u = np.sort(v[m])[::-1]
+        css = np.cumsum(u)
+        rho = np.nonzero(u - (css - 1) / np.arange(1, len(u) + 1) > 0)[0][-1]
+        np.testing.assert_allclose(w[m], np.maximum(v[m] - (css[rho] - 1) / (rho + 1), 0), atol=1e-12)
+
+
+@pytest.mark.parametrize('fit', ['demeaned', 'level'])
+def test_every_fit_matches_exact(unit_panel, fit):
+    result = synthetic_control(unit_panel, fit=fit)
+    dates, units, Y = unit_matrix(unit_panel)
+    pre = dates < min(result['events'].values())
+    centre = Y[pre].mean(axis=0) if fit == 'demeaned' else np.zeros(len(units))
+    Yc = Y - centre
+    j_treated = units.index('Alberta')
+
+    paths = result['paths']
+    assert len(result['units']) == len(units)
+    for row in result['units'].itertuples():
+        j = units.index(row.unit)
+        # Alberta draws on every donor; a placebo on every other donor
+        allowed = np.isin(np.arange(len(units)), [j, j_treated], invert=True) | (
+            (j == j_treated) & (np.arange(len(units)) != j))
+        unit = paths[paths['unit'] == row.unit]
+        # The pre-period loss of the batched fit is the exact optimum
+        loss = ((unit['gap'].to_numpy()[pre]) ** 2).sum()
+        best = _exact(Yc[pre], Yc[pre, j], allowed)
+        assert loss == pytest.approx(best, rel=1e-6, abs=1e-8 * max(best, 1)), row.unit
+        assert row.pre_rmspe == pytest.approx(np.sqrt(loss / pre.sum()))
+
+    treated = result['units'].loc[~result['units']['placebo']]
+    assert len(treated) == 1
+    assert result['p_value'] == (result['units']['ratio'] >= treated['ratio'].iloc[0]).mean()
+    np.testing.assert_allclose(result['weights'].sum(), 1)
+    assert (result['weights'] >= 0).all()
+
+
+def test_weights_reproduce_the_synthetic_path(unit_panel):
+    result = synthetic_control(unit_panel)
+    dates, units, Y = unit_matrix(unit_panel)
+    pre = dates < min(result['events'].values())
+    w = result['weights'].reindex(units, fill_value=0.0).to_numpy()
+    centre = Y[pre].mean(axis=0)
+    synthetic = centre[units.index('Alberta')] + (Y - centre) @ w
+    alberta = result['paths'][result['paths']['unit'] == 'Alberta']
+    np.testing.assert_allclose(alberta['synthetic'], synthetic, rtol=1e-10)
+    np.testing.assert_allclose(alberta['actual'], Y[:, units.index('Alberta')])
+
+
+def test_batched_fits_are_independent():
+    rng = np.random.default_rng(1)
+    Y_pre = rng.normal(size=(40, 6))
+    targets = rng.normal(size=(3, 40))
+    mask = np.array([[1, 1, 1, 0, 0, 0], [0, 1, 1, 1, 1, 0], [1, 1, 1, 1, 1, 1]], dtype=bool)
+    together, _ = fit_weights(Y_pre, targets, mask)
+    for b in range(3):
+        alone, _ = fit_weights(Y_pre, targets[b:b + 1], mask[b:b + 1])
+        np.testing.assert_allclose(together[b], alone[0], atol=1e-6)
+        loss = ((targets[b] - Y_pre @ together[b]) ** 2).sum()
+        assert loss == pytest.approx(_exact(Y_pre, targets[b], mask[b]), rel=1e-6)
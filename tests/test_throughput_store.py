@@ -0,0 +1,93 @@
+"""Throughput store units, monthly resampling and instrument against pandas references."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from facility_emissions import BBL_PER_M3
+from throughput_store import build_store, capacity_instrument
+
+DAYS = pd.date_range('2021-01-01', '2021-03-31', freq='D')
+
+
+def _daily(seed=0):
+    """Two pipelines, three key points, in kb/d; a few days without reports."""
+    rng = np.random.default_rng(seed)
+    frames = []
+    for pipeline, point, level in [('Mainline', 'Gretna', 2500.0), ('Mainline', 'Kerrobert', 1800.0),
+                                   ('Trans Mountain', 'Westridge', 300.0)]:
+        capacity = np.full(len(DAYS), level)
+        frames.append(pd.DataFrame({'date': DAYS, 'pipeline': pipeline, 'key_point': point,
+                                    'throughput': capacity * rng.uniform(0.6, 1.0, len(DAYS)),
+                                    'capacity': capacity, 'apportionment': rng.uniform(0, 0.3, len(DAYS))}))
+    daily = pd.concat(frames, ignore_index=True)
+    daily.loc[rng.choice(len(daily), 20, replace=False), 'throughput'] = np.nan
+    return daily
+
+
+def _write(daily, path, unit, factor):
+    """The frame as a CER-style CSV with volumes in `unit` (kb/d times factor)."""
+    out = daily.rename(columns={'pipeline': 'Pipeline Name', 'key_point': 'Key Point', 'date': 'Date',
+                                'apportionment': 'Apportionment (%)'})
+    out[f'Throughput ({unit})'] = out.pop('throughput') * factor
+    out[f'Available Capacity ({unit})'] = out.pop('capacity') * factor
+    out['Apportionment (%)'] *= 100
+    out.to_csv(path, index=False)
+    return str(path)
+
+
+@pytest.mark.parametrize('unit, factor', [('kb/d', 1.0), ('bbl/d', 1000.0), ('m3/d', 1000 / BBL_PER_M3),
+                                          ('1000 m3/d', 1 / BBL_PER_M3)])
+def test_units_are_converted_to_kbpd(tmp_path, unit, factor):
+    daily = _daily()
+    store = build_store(_write(daily, tmp_path / 'daily.csv', unit, factor), str(tmp_path / 'store'))
+    _, series, views = store.slice()
+    for i, (pipeline, point) in enumerate(series.itertuples(index=False)):
+        rows = daily[(daily['pipeline'] == pipeline) & (daily['key_point'] == point)]
+        np.testing.assert_allclose(views['throughput'][i], rows['throughput'], rtol=1e-6)
+        np.testing.assert_allclose(views['capacity'][i], rows['capacity'], rtol=1e-6)
+        np.testing.assert_allclose(views['apportionment'][i], rows['apportionment'], rtol=1e-6)
+
+
+def test_monthly_matches_groupby(tmp_path):
+    daily = _daily(1)
+    monthly = build_store(_write(daily, tmp_path / 'daily.csv', 'kb/d', 1.0), str(tmp_path / 'store')).monthly()
+
+    daily['year'], daily['month'] = daily['date'].dt.year, daily['date'].dt.month
+    both = daily['throughput'].notna()
+    grouped = daily.groupby(['pipeline', 'key_point', 'year', 'month'])
+    expected = pd.DataFrame({
+        'throughput_kbpd': grouped['throughput'].mean(),
+        'capacity_kbpd': grouped['capacity'].mean(),
+        'utilization': (daily['throughput'].where(both).groupby([daily[k] for k in grouped.keys]).sum()
+                        / daily['capacity'].where(both).groupby([daily[k] for k in grouped.keys]).sum()),
+        'apportionment': grouped['apportionment'].mean(),
+        'days': grouped['throughput'].count(),
+    })
+    got = monthly.set_index(['pipeline', 'key_point', 'year', 'month']).sort_index()
+    pd.testing.assert_frame_equal(got, expected, check_dtype=False, check_names=False, rtol=1e-6)
+
+
+def test_instrument_takes_each_pipelines_trunk(tmp_path):
+    daily = _daily(2)
+    daily.loc[(daily['key_point'] == 'Westridge') & (daily['date'] >= '2021-03-01'), 'capacity'] = 890.0
+    monthly = build_store(_write(daily, tmp_path / 'daily.csv', 'kb/d', 1.0), str(tmp_path / 'store')).monthly()
+    totals = capacity_instrument(monthly)
+    # Gretna is the Mainline trunk; Westridge is TMX's only key point
+    np.testing.assert_allclose(totals['capacity_kbpd'], [2800.0, 2800.0, 3390.0], rtol=1e-6)
+    np.testing.assert_allclose(totals['added_capacity_kbpd'], [0.0, 0.0, 590.0], atol=1e-3)
+
+
+def test_capacity_column_is_required(tmp_path):
+    path = tmp_path / 'daily.csv'
+    _daily().drop(columns='capacity').rename(columns={'throughput': 'Throughput (kb/d)'}).to_csv(path, index=False)
+    with pytest.raises(ValueError, match='capacity'):
+        build_store(str(path), str(tmp_path / 'store'))
+
+
+def test_pipeline_without_capacity_is_an_error(tmp_path):
+    daily = _daily()
+    daily.loc[daily['pipeline'] == 'Trans Mountain', 'capacity'] = np.nan
+    monthly = build_store(_write(daily, tmp_path / 'daily.csv', 'kb/d', 1.0), str(tmp_path / 'store')).monthly()
+    with pytest.raises(ValueError, match="'Trans Mountain'"):
+        capacity_instrument(monthly)
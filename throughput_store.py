@@ -0,0 +1,299 @@
+"""
+CER KEY-POINT THROUGHPUT STORE
+==============================
+
+Daily throughput and capacity for every key point of the export pipelines
+(Mainline, Trans Mountain, Keystone, Express, ...) as an on-disk,
+memory-mapped array store, resampled to the monthly panel:
+
+    store/
+        meta.json               series (pipeline, key point), first day,
+                                number of days, fields, source digests
+        throughput.npy          (series, days) float32, kb/d, NaN = no report
+        capacity.npy            (series, days) float32, kb/d
+        apportionment.npy       (series, days) float32, share apportioned
+
+Input is CER open-data CSV, one row per key point, day and product or
+direction. Headers are matched loosely: date, pipeline / pipeline name, key
+point, throughput..., available capacity / capacity..., apportionment...
+(a share, or percent when the header says so). Capacity is required, since
+it is what the instrument is built from; apportionment is optional.
+Throughput and capacity headers must name their unit, one of UNITS (1000 m3/d,
+m3/d, kb/d, bbl/d), and are converted to kb/d; any other unit is an error.
+Rows for the same key point and day are summed for throughput; capacity and
+apportionment take the largest.
+
+The CSVs are streamed twice, once to find the series and the date range and
+once to fill the arrays, so memory use does not grow with the history. Series
+are sorted by pipeline, so each pipeline's key points are a contiguous block
+of rows. ThroughputStore.slice therefore returns plain views of the memmaps
+(no copy) for a date range and a pipeline.
+
+Monthly resampling reduces blocks of series with np.add.reduceat at month
+boundaries:
+
+    throughput_kbpd, capacity_kbpd   mean over the days reported
+    utilization                      sum throughput / sum capacity, over days
+                                     with both
+    apportionment                    mean apportioned share
+
+capacity_instrument turns that into the continuous instrument for the 2SLS,
+the observed export capacity added since the first month.
+"""
+
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from facility_emissions import BBL_PER_M3
+from ingest_cache import file_digest
+
+STORE_DIR = '.throughput_store'
+CHUNK_ROWS = 1_000_000
+BLOCK_SERIES = 4096
+META_FILE = 'meta.json'
+STORE_FORMAT = 2
+SERIES_KEYS = ['pipeline', 'key_point']
+FIELDS = ['throughput', 'capacity', 'apportionment']
+COMBINE = {'throughput': np.add, 'capacity': np.fmax, 'apportionment': np.fmax}
+# (unit pattern in the normalised header, factor to kb/d), most specific first
+UNITS = [
+    (r'(1000|thousand|e3)_?m3', BBL_PER_M3),
+    (r'm3', BBL_PER_M3 / 1000),
+    (r'(kb|kbd|kbpd|1000_bbl|thousand_bbl|1000_b)', 1.0),
+    (r'(bbl|b|bpd)', 1 / 1000),
+]
+
+
+# ===========================
+# CSV LAYOUT
+# ===========================
+
+def _normalise(label):
+    return re.sub(r'[^0-9a-z]+', '_', str(label).replace('³', '3').lower()).strip('_')
+
+
+def _unit_scale(path, column):
+    """Factor from a volume column's unit (in its header) to kb/d."""
+    name = _normalise(column)
+    for pattern, factor in UNITS:
+        if re.search(rf'(^|_){pattern}(_d|_day|_per_day|_d_|$)', name):
+            return factor
+    raise ValueError(f"{path}: unrecognised unit in column '{column}' "
+                     f"(use 1000 m3/d, m3/d, kb/d or bbl/d in the header)")
+
+
+def _layout(path):
+    """{field: source column} and {field: scale to kb/d} for one CSV."""
+    header = pd.read_csv(path, nrows=0).columns.tolist()
+    names = {_normalise(c): c for c in header}
+    columns, scale = {}, {}
+    for name, column in names.items():
+        if name == 'date':
+            columns['date'] = column
+        elif name in ('pipeline', 'pipeline_name'):
+            columns['pipeline'] = column
+        elif name == 'key_point':
+            columns['key_point'] = column
+        else:
+            field = next((f for f in FIELDS if name.startswith(f) or name.startswith('available_' + f)), None)
+            if field and field not in columns:
+                columns[field] = column
+                scale[field] = 1.0 if field == 'apportionment' else _unit_scale(path, column)
+    missing = [c for c in ['date'] + SERIES_KEYS + ['throughput', 'capacity'] if c not in columns]
+    if missing:
+        raise ValueError(f"{path}: throughput files need date, pipeline, key point, throughput and capacity "
+                         f"columns (missing {missing})")
+    if 'apportionment' in scale:
+        percent = '%' in columns['apportionment'] or 'percent' in _normalise(columns['apportionment'])
+        scale['apportionment'] = 0.01 if percent else 1.0
+    return columns, scale
+
+
+def _chunks(path, columns, chunksize):
+    reader = pd.read_csv(path, usecols=list(columns.values()), chunksize=chunksize,
+                         dtype={columns['pipeline']: 'category', columns['key_point']: 'category'})
+    for chunk in reader:
+        chunk = chunk.rename(columns={v: k for k, v in columns.items()})
+        chunk['day'] = pd.to_datetime(chunk['date']).to_numpy().astype('datetime64[D]').astype(np.int64)
+        yield chunk
+
+
+# ===========================
+# BUILD
+# ===========================
+
+def build_store(paths, directory, chunksize=CHUNK_ROWS):
+    """Stream the CSVs into a store directory; returns the opened ThroughputStore."""
+    paths = [paths] if isinstance(paths, str) else list(paths)
+    layouts = [_layout(p) for p in paths]
+
+    # Pass 1: series and date range
+    series, first, last = set(), None, None
+    for path, (columns, _) in zip(paths, layouts):
+        for chunk in _chunks(path, columns, chunksize):
+            series.update(zip(chunk['pipeline'].astype(str), chunk['key_point'].astype(str)))
+            first = min(first, chunk['day'].min()) if first is not None else chunk['day'].min()
+            last = max(last, chunk['day'].max()) if last is not None else chunk['day'].max()
+    if not series:
+        raise ValueError("no throughput rows")
+    series = sorted(series)
+    code = {s: i for i, s in enumerate(series)}
+    n_days = int(last - first + 1)
+
+    # Pass 2: fill the arrays in place on disk
+    os.makedirs(directory, exist_ok=True)
+    arrays = {f: np.lib.format.open_memmap(os.path.join(directory, f'{f}.npy'), mode='w+',
+                                           dtype=np.float32, shape=(len(series), n_days))
+              for f in FIELDS}
+    for array in arrays.values():
+        array[:] = np.nan
+    for path, (columns, scale) in zip(paths, layouts):
+        for chunk in _chunks(path, columns, chunksize):
+            rows = np.array([code[s] for s in zip(chunk['pipeline'].astype(str), chunk['key_point'].astype(str))])
+            days = chunk['day'].to_numpy() - first
+            for field, factor in scale.items():
+                values = pd.to_numeric(chunk[field], errors='coerce').to_numpy(dtype=float) * factor
+                ok = np.isfinite(values)
+                r, d, v = rows[ok], days[ok], values[ok].astype(np.float32)
+                target = arrays[field]
+                # First report of a cell replaces the NaN, later ones combine with it
+                if field == 'throughput':
+                    target[r, d] = np.where(np.isnan(target[r, d]), 0, target[r, d])
+                    np.add.at(target, (r, d), v)
+                else:
+                    COMBINE[field].at(target, (r, d), v)
+    for array in arrays.values():
+        array.flush()
+    del arrays
+
+    meta = {'format': STORE_FORMAT, 'series': [list(s) for s in series], 'first_day': int(first), 'n_days': n_days,
+            'fields': FIELDS, 'units': 'kb/d', 'sources': {os.path.abspath(p): file_digest(p) for p in paths}}
+    with open(os.path.join(directory, META_FILE), 'w') as f:
+        json.dump(meta, f)
+    return ThroughputStore(directory)
+
+
+def open_store(paths, directory=STORE_DIR, chunksize=CHUNK_ROWS):
+    """The store for these CSVs, rebuilt only when their contents or the store format changed."""
+    paths = [paths] if isinstance(paths, str) else list(paths)
+    try:
+        with open(os.path.join(directory, META_FILE)) as f:
+            meta = json.load(f)
+        sources = meta['sources'] if meta.get('format') == STORE_FORMAT else None
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        sources = None
+    if sources == {os.path.abspath(p): file_digest(p) for p in paths}:
+        return ThroughputStore(directory)
+    return build_store(paths, directory, chunksize)
+
+
+# ===========================
+# STORE
+# ===========================
+
+class ThroughputStore:
+    """Read-only view of a store directory; every field is a memmap."""
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, META_FILE)) as f:
+            meta = json.load(f)
+        self.directory = directory
+        self.series = pd.DataFrame(meta['series'], columns=SERIES_KEYS)
+        self.first_day = meta['first_day']
+        self.dates = pd.to_datetime(np.arange(self.first_day, self.first_day + meta['n_days']), unit='D')
+        self.fields = {f: np.load(os.path.join(directory, f'{f}.npy'), mmap_mode='r') for f in meta['fields']}
+
+    def rows(self, pipeline=None):
+        """Row slice of one pipeline's key points (all series when None)."""
+        if pipeline is None:
+            return slice(0, len(self.series))
+        hit = np.flatnonzero(self.series['pipeline'].to_numpy() == pipeline)
+        if not len(hit):
+            raise KeyError(f"no pipeline '{pipeline}' in the store")
+        return slice(int(hit[0]), int(hit[-1]) + 1)
+
+    def slice(self, start=None, end=None, pipeline=None):
+        """
+        (dates, series, {field: (series, days) view}) for days in [start, end]
+        and one pipeline. The arrays are views of the memmaps, not copies.
+        """
+        first = 0 if start is None else max(0, int(np.searchsorted(self.dates, pd.Timestamp(start))))
+        stop = len(self.dates) if end is None else int(np.searchsorted(self.dates, pd.Timestamp(end), side='right'))
+        rows = self.rows(pipeline)
+        return (self.dates[first:stop], self.series.iloc[rows].reset_index(drop=True),
+                {f: a[rows, first:stop] for f, a in self.fields.items()})
+
+    def monthly(self, pipeline=None, start=None, end=None, block=BLOCK_SERIES):
+        """Monthly means, utilization and apportionment per key point (long frame)."""
+        dates, series, views = self.slice(start, end, pipeline)
+        if not len(dates):
+            raise ValueError("no days in the requested range")
+        month = dates.year * 12 + dates.month - 1
+        bounds = np.flatnonzero(np.r_[True, np.diff(month) != 0])
+        months = month[bounds]
+        out = {k: np.empty((len(series), len(months))) for k in
+               ['throughput_kbpd', 'capacity_kbpd', 'utilization', 'apportionment', 'days']}
+        for s in range(0, len(series), block):
+            t = np.asarray(views['throughput'][s:s + block], dtype=float)
+            c = np.asarray(views['capacity'][s:s + block], dtype=float)
+            a = np.asarray(views['apportionment'][s:s + block], dtype=float)
+            both = np.isfinite(t) & np.isfinite(c)
+
+            def total(values, mask):
+                return np.add.reduceat(np.where(mask, values, 0), bounds, axis=1)
+
+            t_days = total(1.0, np.isfinite(t))
+            with np.errstate(divide='ignore', invalid='ignore'):
+                out['throughput_kbpd'][s:s + block] = total(t, np.isfinite(t)) / t_days
+                out['capacity_kbpd'][s:s + block] = total(c, np.isfinite(c)) / total(1.0, np.isfinite(c))
+                out['utilization'][s:s + block] = total(t, both) / total(c, both)
+                out['apportionment'][s:s + block] = total(a, np.isfinite(a)) / total(1.0, np.isfinite(a))
+            out['days'][s:s + block] = t_days
+
+        n = len(months)
+        frame = pd.DataFrame({
+            'pipeline': np.repeat(series['pipeline'].to_numpy(), n),
+            'key_point': np.repeat(series['key_point'].to_numpy(), n),
+            'year': np.tile(months // 12, len(series)),
+            'month': np.tile(months % 12 + 1, len(series)),
+        })
+        for key, values in out.items():
+            frame[key] = values.ravel()
+        frame['days'] = frame['days'].astype(np.int64)
+        return frame
+
+
+# ===========================
+# INSTRUMENT
+# ===========================
+
+def capacity_instrument(monthly, key_points=None):
+    """
+    Monthly observed export capacity and throughput summed over pipelines.
+
+    Each pipeline counts once, at key_points[pipeline] if given, else at its
+    key point with the highest mean capacity (the trunk, not a lateral).
+    added_capacity_kbpd is capacity minus the first month's, the continuous
+    counterpart of the step instrument. A pipeline with no capacity reported at
+    any key point is an error.
+    """
+    key_points = key_points or {}
+    picked = []
+    for pipeline, rows in monthly.groupby('pipeline', sort=False):
+        point = key_points.get(pipeline)
+        if point is None:
+            means = rows.groupby('key_point')['capacity_kbpd'].mean()
+            if means.isna().all():
+                raise ValueError(f"no capacity reported for pipeline '{pipeline}'")
+            point = means.idxmax()
+        picked.append(rows[rows['key_point'] == point])
+    totals = pd.concat(picked).groupby(['year', 'month'], sort=True).agg(
+        capacity_kbpd=('capacity_kbpd', 'sum'), throughput_kbpd=('throughput_kbpd', 'sum'),
+        apportionment=('apportionment', 'mean'))
+    totals['utilization'] = totals['throughput_kbpd'] / totals['capacity_kbpd']
+    totals['added_capacity_kbpd'] = totals['capacity_kbpd'] - totals['capacity_kbpd'].iloc[0]
+    return totals.reset_index()